@@ -43,6 +43,7 @@ try:
     db = DAL(db_string,
              check_reserved = check_reserved,
              pool_size = pool_size,
+             adapter_args = settings.get_database_adapter_args(),
              migrate_enabled = migrate,
              fake_migrate_all = fake_migrate,
              lazy_tables = not migrate,
@@ -58,7 +59,9 @@ db.set_folder("upload")
 # Sessions Storage
 if settings.get_base_session_db():
     # Store sessions in the database to avoid a locked session
-    session.connect(request, response, db)
+    session.connect(request, response, db,
+                    delta = settings.get_base_session_db_delta(),
+                    )
 elif settings.get_base_session_memcache():
     # Store sessions in Memcache
     from gluon.contrib.memcache import MemcacheClient
@@ -66,6 +69,10 @@ elif settings.get_base_session_memcache():
                                     [settings.get_base_session_memcache()])
     from gluon.contrib.memdb import MEMDB
     session.connect(request, response, db=MEMDB(cache.memcache))
+elif not settings.get_base_session_lock():
+    # Filesystem, but without locking the session file for the whole
+    # request, so that parallel Ajax requests do not wait for each other
+    session.connect(request, response, lock=False)
 #else:
     ## Default to filesystem
     # pass
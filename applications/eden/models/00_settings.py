@@ -22,6 +22,12 @@ s3.base_url = "%s/%s" % (settings.get_base_public_url(),
                          )
 s3.download_url = "%s/default/download" % s3.base_url
 
+# Cache-busting names for static files in URL()
+if settings.get_base_static_fingerprints():
+    from gluon.streamer import static_fingerprints
+    manifest = os.path.join(request.folder, "static", "fingerprints.json")
+    response.static_fingerprints = static_fingerprints(manifest)
+
 # -----------------------------------------------------------------------------
 # Client tests
 
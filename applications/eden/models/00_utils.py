@@ -211,8 +211,8 @@ def s3_rest_controller(prefix=None, resourcename=None, **attr):
 
     # Configure standard method handlers
     from s3 import S3Compose, S3Filter, S3GroupedItemsReport, S3HierarchyCRUD, \
-                   S3Importer, S3Map, S3Merge, S3MobileCRUD, S3Organizer, \
-                   S3OrgRoleManager, S3Profile, S3Report, S3Summary, \
+                   S3Importer, S3Map, S3MapTiles, S3Merge, S3MobileCRUD, \
+                   S3Organizer, S3OrgRoleManager, S3Profile, S3Report, S3Summary, \
                    S3TimePlot, S3XForms, S3Wizard, search_ac
     from s3db.cms import S3CMS
 
@@ -230,6 +230,7 @@ def s3_rest_controller(prefix=None, resourcename=None, **attr):
     set_handler("hierarchy", S3HierarchyCRUD)
     set_handler("import", S3Importer)
     set_handler("map", S3Map)
+    set_handler("tiles", S3MapTiles, transform=True) # For GeoJSON
     set_handler("mform", S3MobileCRUD, representation="json")
     set_handler("organize", S3Organizer)
     set_handler("profile", S3Profile)
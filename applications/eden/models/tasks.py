@@ -130,6 +130,39 @@ def gis_update_location_tree(feature, user_id=None):
     db.commit()
     return path
 
+# -----------------------------------------------------------------------------
+def gis_update_simplified(location_id, user_id=None):
+    """
+        Update the precomputed simplified geometries of a location
+            - will normally be done Asynchronously if there is a worker alive
+
+        @param location_id: the gis_location record ID
+        @param user_id: calling request's auth.user.id or None
+    """
+    if user_id:
+        # Authenticate
+        auth.s3_impersonate(user_id)
+    # Run the Task & return the result
+    gis.update_simplified([location_id])
+    db.commit()
+
+# -----------------------------------------------------------------------------
+def gis_spatial_index_rebuild(user_id=None):
+    """
+        Rebuild the spatial index of locations if it is incomplete
+            - queued when a spatial query finds the index incomplete
+
+        @param user_id: calling request's auth.user.id or None
+    """
+    if user_id:
+        # Authenticate
+        auth.s3_impersonate(user_id)
+    # Run the Task
+    S3SpatialIndex = s3base.S3SpatialIndex
+    if not S3SpatialIndex.complete():
+        S3SpatialIndex.rebuild()
+    db.commit()
+
 # -----------------------------------------------------------------------------
 # Org: always-enabled
 # -----------------------------------------------------------------------------
@@ -153,6 +186,8 @@ tasks = {"dummy": dummy,
          "maintenance": maintenance,
          "gis_download_kml": gis_download_kml,
          "gis_update_location_tree": gis_update_location_tree,
+         "gis_update_simplified": gis_update_simplified,
+         "gis_spatial_index_rebuild": gis_spatial_index_rebuild,
          "org_site_check": org_site_check,
          }
 
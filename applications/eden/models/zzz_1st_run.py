@@ -362,6 +362,12 @@ if len(pop_list) > 0:
         gis.update_location_tree()
         duration("Location Tree update completed", start)
 
+        if settings.get_gis_simplify_levels():
+            # Precompute simplified geometries
+            start = datetime.datetime.now()
+            gis.update_simplified()
+            duration("Simplified geometries update completed", start)
+
     # Countries are only editable by MapAdmin
     db(db.gis_location.level == "L0").update(owned_by_group=map_admin)
 
@@ -396,23 +402,12 @@ if len(pop_list) > 0:
     #
     info("\nCreating indexes...")
 
-    # Person Registry
-    tablename = "pr_person"
-    # Add extra indexes on search fields
+    # Indexes declared in the models, s3db.configure(tablename, indexes=[...])
     # Should work for our 3 supported databases: sqlite, MySQL & PostgreSQL
-    field = "first_name"
-    db.executesql("CREATE INDEX %s__idx on %s(%s);" % (field, tablename, field))
-    field = "middle_name"
-    db.executesql("CREATE INDEX %s__idx on %s(%s);" % (field, tablename, field))
-    field = "last_name"
-    db.executesql("CREATE INDEX %s__idx on %s(%s);" % (field, tablename, field))
+    s3db.migrate_all_indexes()
 
     # GIS
-    # Add extra index on search field
-    # Should work for our 3 supported databases: sqlite, MySQL & PostgreSQL
     tablename = "gis_location"
-    field = "name"
-    db.executesql("CREATE INDEX %s__idx on %s(%s);" % (field, tablename, field))
     if settings.get_gis_spatialdb():
         # Add Spatial Index (PostgreSQL-only currently)
         db.executesql("CREATE INDEX gis_location_gist on %s USING GIST (the_geom);" % tablename)
@@ -38,6 +38,7 @@ __all__ = ("AuthS3",
            )
 
 import datetime
+import hashlib
 import json
 #import re
 import time
@@ -5764,6 +5765,10 @@ class S3Permission:
     ALL = CREATE | READ | UPDATE | DELETE | REVIEW | APPROVE | PUBLISH
     NONE = 0x0000 # must be 0!
 
+    # Cross-request ACL cache
+    ACL_VERSION_KEY = "s3_acl_version"
+    ACL_CACHE_EXPIRE = 600
+
     PERMISSION_OPTS = OrderedDict((
         (CREATE, "CREATE"),
         (READ, "READ"),
@@ -5857,6 +5862,16 @@ class S3Permission:
         self.permission_cache = {}
         self.query_cache = {}
 
+        # Cross-request ACL cache
+        acl_cache = settings.get_security_acl_cache()
+        if acl_cache:
+            self.acl_cache = getattr(current.cache,
+                                     "ram" if acl_cache is True else acl_cache,
+                                     None)
+        else:
+            self.acl_cache = None
+        self.acl_version = None
+
         # Pages which never require permission:
         # Make sure that any data access via these pages uses
         # accessible_query explicitly!
@@ -5881,6 +5896,100 @@ class S3Permission:
         self.permission_cache = {}
         self.query_cache = {}
 
+    # -------------------------------------------------------------------------
+    def invalidate_acls(self, *args):
+        """
+            Invalidate the cross-request ACL cache, called whenever
+            ACLs are modified (table callback, accepts any arguments)
+        """
+
+        cache = self.acl_cache
+        if cache is not None:
+            # Drop the version token => a new one is generated upon next access
+            cache(self.ACL_VERSION_KEY, None)
+        self.acl_version = None
+
+    # -------------------------------------------------------------------------
+    def get_acl_version(self):
+        """
+            Get the current version of the ACLs, to key the cross-request
+            ACL cache; consists of a version token that is renewed whenever
+            ACLs are modified through the DAL, plus a fingerprint of the
+            permissions table to detect modifications by other processes
+            (if the cache model is not shared between processes)
+
+            Returns:
+                the version as string
+        """
+
+        version = self.acl_version
+        if version is None:
+
+            token = self.acl_cache(self.ACL_VERSION_KEY,
+                                   lambda: uuid4().hex,
+                                   time_expire = None,
+                                   )
+            table = self.table
+            modified_on = table.modified_on.max()
+            count = table.id.count()
+            row = current.db(table.id > 0).select(modified_on,
+                                                  count,
+                                                  ).first()
+
+            version = self.acl_version = "%s-%s-%s" % (token,
+                                                       row[modified_on],
+                                                       row[count],
+                                                       )
+        return version
+
+    # -------------------------------------------------------------------------
+    def select_acls(self, query, roles, c=None, f=None, t=None):
+        """
+            Retrieve ACL rules, using the cross-request ACL cache if
+            configured
+
+            Args:
+                query: the query for the ACL rules
+                roles: the roles (set of group IDs), for the cache key
+                c: the controller name, for the cache key
+                f: the function name, for the cache key
+                t: the tablename, for the cache key
+
+            Returns:
+                a list of Rows or Storages
+        """
+
+        table = self.table
+        fields = (table.group_id,
+                  table.controller,
+                  table.function,
+                  table.tablename,
+                  table.unrestricted,
+                  table.entity,
+                  table.uacl,
+                  table.oacl,
+                  )
+
+        select = lambda: current.db(query).select(cacheable=True, *fields)
+
+        cache = self.acl_cache
+        if cache is None:
+            return select()
+
+        key = "%s|%s|%s|%s|%s" % (self.get_acl_version(),
+                                  ",".join(str(r) for r in sorted(roles)),
+                                  c,
+                                  f,
+                                  t,
+                                  )
+        key = "s3_acl_%s" % hashlib.md5(key.encode("utf-8")).hexdigest()
+
+        rules = cache(key,
+                      lambda: select().as_list(),
+                      time_expire = self.ACL_CACHE_EXPIRE,
+                      )
+        return [Storage(rule) for rule in rules]
+
     # -------------------------------------------------------------------------
     def check_settings(self):
         """
@@ -5940,6 +6049,19 @@ class S3Permission:
                             )
             self.table = db[self.tablename]
 
+        table = self.table
+        if self.acl_cache is not None and \
+           not getattr(table, "_acl_cache_tracked", False):
+            # Invalidate cached ACLs whenever the table is written to
+            # (registered only once per table, even if define_table is
+            # called again by another S3Permission instance)
+            table._acl_cache_tracked = True
+            def invalidate(*args):
+                current.auth.permission.invalidate_acls()
+            table._after_insert.append(invalidate)
+            table._after_update.append(invalidate)
+            table._after_delete.append(invalidate)
+
     # -------------------------------------------------------------------------
     def create_indexes(self):
         """
@@ -7431,7 +7553,6 @@ class S3Permission:
             # No roles available (deny all)
             return acls
 
-        db = current.db
         table = self.table
 
         c = c or self.controller
@@ -7467,15 +7588,11 @@ class S3Permission:
         # Retrieve the ACLs
         if q is not None:
             query = q & query
-            rows = db(query).select(table.group_id,
-                                    table.controller,
-                                    table.function,
-                                    table.tablename,
-                                    table.unrestricted,
-                                    table.entity,
-                                    table.uacl,
-                                    table.oacl,
-                                    cacheable = True,
+            rows = self.select_acls(query,
+                                    roles,
+                                    c = c if page_restricted else None,
+                                    f = f if page_restricted else None,
+                                    t = t if self.use_tacls else None,
                                     )
         else:
             rows = []
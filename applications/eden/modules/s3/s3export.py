@@ -33,7 +33,10 @@
 
 __all__ = ("S3Exporter",)
 
+from io import StringIO
+
 from gluon import current
+from pydal._globals import THREAD_LOCAL
 
 from .s3codec import S3Codec
 
@@ -43,13 +46,22 @@ class S3Exporter:
         Exporter toolkit
     """
 
+    # Default number of records per chunk for streaming exports
+    CHUNKSIZE = 1000
+
     # -------------------------------------------------------------------------
-    def csv(self, resource):
+    def csv(self, resource, stream=None):
         """
             Export resource as CSV
 
             Args:
                 resource: the resource to export
+                stream: produce the output in chunks rather than building
+                        it in memory, True or the number of records per
+                        chunk (default: settings.base.stream_export)
+
+            Returns:
+                the CSV as str, or - if streaming - a generator of bytes
 
             Note:
                 Export does not include components!
@@ -68,9 +80,37 @@ class S3Exporter:
             response.headers["Content-Type"] = contenttype(".csv")
             response.headers["Content-disposition"] = "attachment; filename=%s" % filename
 
+        chunksize = self.chunksize(stream)
+        if chunksize:
+            return self.stream(self.csv_chunks(resource, chunksize))
+
         rows = resource.select(None, as_rows=True)
         return str(rows)
 
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def csv_chunks(resource, chunksize):
+        """
+            Generate the CSV export of a resource chunk by chunk
+
+            Args:
+                resource: the resource to export
+                chunksize: the number of records per chunk
+
+            Returns:
+                generator of bytes
+        """
+
+        header = True
+        for rows in resource.iterselect(None,
+                                        chunksize = chunksize,
+                                        as_rows = True,
+                                        ):
+            output = StringIO()
+            rows.export_to_csv_file(output, write_colnames=header)
+            header = False
+            yield output.getvalue().encode("utf-8")
+
     # -------------------------------------------------------------------------
     def json(self, resource,
              start = None,
@@ -79,6 +119,7 @@ class S3Exporter:
              orderby = None,
              represent = False,
              tooltip = None,
+             stream = None,
              ):
         """
             Export a resource as JSON
@@ -99,6 +140,17 @@ class S3Exporter:
                          to return a dict {k:tooltip} => used by
                          filterOptionsS3 to extract onhover-tooltips for
                          Ajax-update of options
+                stream: produce the output in chunks rather than building
+                        it in memory, True or the number of records per
+                        chunk (default: settings.base.stream_export)
+
+            Returns:
+                the JSON as str, or - if streaming - a generator of bytes
+
+            Note:
+                Streamed exports are always ordered by record ID, so
+                the export is only streamed if there is no orderby,
+                or if it orders by record ID
         """
 
         if fields is None:
@@ -113,7 +165,7 @@ class S3Exporter:
         if orderby is None:
             orderby = resource.get_config("orderby", None)
 
-        tooltip_function = None
+        tooltip_function = kname = vname = None
         if tooltip:
             if type(tooltip) is list:
                 tooltip = tooltip[-1]
@@ -132,13 +184,116 @@ class S3Exporter:
                 if tooltip not in fields:
                     fields.append(tooltip)
 
+        # Return as JSON
+        response = current.response
+        if response:
+            response.headers["Content-Type"] = "application/json"
+
+        chunksize = self.chunksize(stream)
+        if chunksize and self.ordered_by_id(resource, orderby):
+            chunks = self.json_chunks(resource,
+                                      fields,
+                                      chunksize,
+                                      start = start,
+                                      limit = limit,
+                                      represent = represent,
+                                      tooltip = tooltip,
+                                      tooltip_function = tooltip_function,
+                                      kname = kname,
+                                      vname = vname,
+                                      )
+            return self.stream(chunks)
+
         # Get the data
-        _rows = resource.select(fields,
-                                start = start,
-                                limit = limit,
-                                orderby = orderby,
-                                represent = represent,
-                                ).rows
+        rows = resource.select(fields,
+                               start = start,
+                               limit = limit,
+                               orderby = orderby,
+                               represent = represent,
+                               ).rows
+        rows = self.json_rows(resource,
+                              rows,
+                              tooltip,
+                              tooltip_function,
+                              kname,
+                              vname,
+                              )
+
+        from gluon.serializers import json as jsons
+        return jsons(rows)
+
+    # -------------------------------------------------------------------------
+    def json_chunks(self,
+                    resource,
+                    fields,
+                    chunksize,
+                    start = None,
+                    limit = None,
+                    represent = False,
+                    tooltip = None,
+                    tooltip_function = None,
+                    kname = None,
+                    vname = None,
+                    ):
+        """
+            Generate the JSON export of a resource chunk by chunk
+
+            Args:
+                resource: the resource to export from
+                fields: list of field selectors for fields to include
+                chunksize: the number of records per chunk
+                start: index of the first record to export
+                limit: maximum number of records to export
+                represent: whether values should be represented
+                tooltip: the tooltip field selector or expression
+                tooltip_function: the tooltip function
+                kname: the key field selector for the tooltip function
+                vname: the value field selector for the tooltip function
+
+            Returns:
+                generator of bytes
+        """
+
+        from gluon.serializers import json as jsons
+
+        yield b"["
+        separator = b""
+        for data in resource.iterselect(fields,
+                                        chunksize = chunksize,
+                                        start = start or 0,
+                                        limit = limit,
+                                        represent = represent,
+                                        ):
+            rows = self.json_rows(resource,
+                                  data.rows,
+                                  tooltip,
+                                  tooltip_function,
+                                  kname,
+                                  vname,
+                                  )
+            if rows:
+                # Serialize as list, and strip the brackets
+                yield separator + jsons(rows)[1:-1].encode("utf-8")
+                separator = b","
+        yield b"]"
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def json_rows(resource, _rows, tooltip, tooltip_function, kname, vname):
+        """
+            Convert extracted rows for JSON export, and add tooltips
+
+            Args:
+                resource: the resource
+                _rows: the rows extracted from the resource
+                tooltip: the tooltip field selector or expression
+                tooltip_function: the tooltip function
+                kname: the key field selector for the tooltip function
+                vname: the value field selector for the tooltip function
+
+            Returns:
+                list of dicts
+        """
 
         # Simplify to plain fieldnames for fields in this table
         tn = "%s." % resource.tablename
@@ -211,13 +366,82 @@ class S3Exporter:
                         if value:
                             row["_tooltip"] = s3_str(value)
 
-        # Return as JSON
-        response = current.response
-        if response:
-            response.headers["Content-Type"] = "application/json"
+        return rows
 
-        from gluon.serializers import json as jsons
-        return jsons(rows)
+    # -------------------------------------------------------------------------
+    @classmethod
+    def chunksize(cls, stream):
+        """
+            Determine the chunk size for a streaming export
+
+            Args:
+                stream: the stream parameter of the export method
+
+            Returns:
+                the number of records per chunk, or None for a
+                non-streaming export
+        """
+
+        if stream is None:
+            stream = current.deployment_settings.get_base_stream_export()
+        if not stream:
+            return None
+        if stream is True:
+            return cls.CHUNKSIZE
+        return max(int(stream), 1)
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def ordered_by_id(resource, orderby):
+        """
+            Check whether an export can be streamed with an orderby, i.e.
+            whether the orderby is the same as the order of the chunks
+
+            Args:
+                resource: the resource to export from
+                orderby: the ORDERBY expression
+
+            Returns:
+                True|False
+        """
+
+        if not orderby:
+            return True
+
+        pkey = resource._id
+        if isinstance(orderby, str):
+            return orderby.strip() in ("id", pkey.name, str(pkey))
+        else:
+            return str(orderby) == str(pkey)
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def stream(chunks):
+        """
+            Wrap a chunk generator for output, so that it can be sent to
+            the client chunk by chunk (e.g. returned from a controller)
+
+            Args:
+                chunks: the chunk generator
+
+            Returns:
+                generator of bytes
+
+            Note:
+                If iterated by the WSGI server, this happens after the
+                DB connection of the request has been closed; in this
+                case, the connection re-opened for the export is closed
+                again (or returned to the pool) at the end
+        """
+
+        adapter = current.db._adapter
+        detached = getattr(THREAD_LOCAL, adapter._connection_uname_, None) is None
+        try:
+            for chunk in chunks:
+                yield chunk
+        finally:
+            if detached:
+                adapter.close("commit")
 
     # -------------------------------------------------------------------------
     def pdf(self, *args, **kwargs):
@@ -30,6 +30,7 @@
 """
 
 import datetime
+import hashlib
 import sys
 from itertools import chain
 from uuid import uuid4
@@ -42,7 +43,7 @@ from gluon.languages import lazyT
 from s3dal import SQLCustomType
 from .s3datetime import S3DateTime
 from .s3navigation import S3ScriptItem
-from .s3utils import NONE, s3_str, S3MarkupStripper
+from .s3utils import NONE, s3_after_commit, s3_str, S3MarkupStripper
 from .s3validators import IS_ISO639_2_LANGUAGE_CODE, IS_ONE_OF, IS_UTC_DATE, IS_UTC_DATETIME
 from .s3widgets import S3CalendarWidget, S3DateWidget
 
@@ -210,6 +211,17 @@ class S3Represent:
                                  _lookup
     """
 
+    # Use the shared representation cache (settings.base.represent_cache):
+    # None = only if neither lookup_rows, represent_row nor link are
+    # overridden and labels are not a callable, True/False = always/never
+    shared_cache = None
+
+    # Expiry of shared cache entries (seconds)
+    SHARED_CACHE_EXPIRE = 3600
+
+    # Number of representations per shared cache entry
+    SHARED_CACHE_BUCKET = 256
+
     def __init__(self,
                  lookup = None,
                  key = None,
@@ -274,6 +286,8 @@ class S3Represent:
         self.slabels = None
         self.htemplate = None
 
+        self.scache = None
+
         # Attributes to simulate being a function for sqlhtml's count_expected_args()
         # Make sure we indicate only 1 position argument
         self.__code__ = Storage(co_argcount = 1)
@@ -643,8 +657,151 @@ class S3Represent:
         else:
             self.htemplate = "%s > %s"
 
+        # Shared cache
+        self.scache = self._shared_cache()
+
         self.setup = True
 
+    # -------------------------------------------------------------------------
+    def _shared_cache(self):
+        """
+            Get the cache to share representations across requests
+
+            Returns:
+                the cache model, or None if not configured or not
+                applicable for this renderer
+        """
+
+        table = self.table
+        if table is None or self.hierarchy or self.options is not None:
+            return None
+
+        if not getattr(table, "_represent_tracked", False):
+            # Changes to the lookup table would not invalidate the cache
+            return None
+
+        shared = self.shared_cache
+        if shared is None:
+            # Only if the representation depends on nothing but the row
+            cls = self.__class__
+            shared = not self.clabels and \
+                     all(getattr(cls, name) is getattr(S3Represent, name)
+                         for name in ("lookup_rows", "represent_row", "link"))
+        if not shared:
+            return None
+
+        return self.shared_cache_model()
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def shared_cache_model():
+        """
+            Get the cache model configured to share representations
+            across requests
+
+            Returns:
+                the cache model, or None if not configured
+        """
+
+        model = current.deployment_settings.get_base_represent_cache()
+        if not model:
+            return None
+
+        return getattr(current.cache, "ram" if model is True else model, None)
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def track(cls, table):
+        """
+            Add callbacks to a lookup table to invalidate shared cache
+            entries when records are updated or deleted; called once
+            per table when it is defined (S3Model.define_table), only
+            tracked tables share their representations
+
+            The version token is dropped both immediately and after
+            commit, so that concurrent requests can not cache the old
+            representations under the new token before the commit
+
+            Args:
+                table: the lookup table
+        """
+
+        if getattr(table, "_represent_tracked", False):
+            return
+        table._represent_tracked = True
+
+        key = "s3_represent_version_%s" % table._tablename
+
+        def drop():
+            cache = cls.shared_cache_model()
+            if cache is not None:
+                # Drop the version token => a new one is generated
+                # upon next access
+                cache(key, None)
+
+        def invalidate(*args):
+            drop()
+            s3_after_commit(key, drop)
+
+        table._after_update.append(invalidate)
+        table._after_delete.append(invalidate)
+
+    # -------------------------------------------------------------------------
+    def _shared_cache_prefix(self):
+        """
+            Get the prefix for shared cache keys, consisting of the current
+            version token of the lookup table, a fingerprint of this
+            renderer's configuration, and the current language
+
+            Returns:
+                the prefix (string)
+        """
+
+        table = self.table
+        tablename = table._tablename
+
+        version = self.scache("s3_represent_version_%s" % tablename,
+                              lambda: uuid4().hex,
+                              time_expire = None,
+                              )
+
+        labels = self.labels
+        if isinstance(labels, lazyT):
+            labels = labels.m
+        signature = "%s.%s|%s|%s|%s|%s|%s|%s|%s" % (self.__class__.__module__,
+                                                    self.__class__.__name__,
+                                                    self.key,
+                                                    self.fields,
+                                                    labels,
+                                                    self.translate,
+                                                    self.field_sep,
+                                                    s3_str(self.none),
+                                                    current.T.accepted_language,
+                                                    )
+        signature = hashlib.md5(signature.encode("utf-8")).hexdigest()
+
+        return "s3_represent_%s_%s_%s_" % (tablename, version, signature)
+
+    # -------------------------------------------------------------------------
+    def _shared_cache_bucket(self, key):
+        """
+            Get the shared cache bucket for a lookup key; consecutive
+            record IDs share a bucket, so that bulk lookups need only
+            few cache accesses
+
+            Args:
+                key: the lookup key
+
+            Returns:
+                the bucket name (string)
+        """
+
+        if isinstance(key, int):
+            return str(key // self.SHARED_CACHE_BUCKET)
+        else:
+            digest = hashlib.md5(s3_str(key).encode("utf-8")).hexdigest()
+            return "s%s" % digest[:2]
+
     # -------------------------------------------------------------------------
     def _lookup(self, values, rows=None):
         """
@@ -682,6 +839,28 @@ class S3Represent:
         if table is None or not lookup:
             return items
 
+        # Lookup values in the shared cache
+        scache = self.scache
+        if scache is not None:
+            prefix = self._shared_cache_prefix()
+            expire = self.SHARED_CACHE_EXPIRE
+            bucket = self._shared_cache_bucket
+            buckets = {}
+            for k in lookup:
+                b = bucket(k)
+                if b not in buckets:
+                    # One cache access per bucket, an empty bucket is
+                    # stored if not cached (=not one entry per miss)
+                    buckets[b] = scache(prefix + b, dict, time_expire=expire)
+                v = buckets[b].get(k)
+                if v is not None:
+                    items[keys.get(k, k)] = theset[k] = v
+            for k in list(lookup.keys()):
+                if k in theset:
+                    del lookup[k]
+            if not lookup:
+                return items
+
         if table and self.hierarchy:
             # Does the lookup table have a hierarchy?
             from .s3hierarchy import S3Hierarchy
@@ -760,6 +939,24 @@ class S3Represent:
                     lookup.pop(k, None)
                     items[keys.get(k, k)] = theset[k] = represent_row(row)
 
+            # Add the new representations to the shared cache
+            if scache is not None:
+                updates = {}
+                for k in rows:
+                    v = theset.get(k)
+                    if isinstance(v, lazyT):
+                        v = s3_str(v)
+                    elif not isinstance(v, str):
+                        # Not a plain string (e.g. HTML) => don't share
+                        continue
+                    b = bucket(k)
+                    if b not in updates:
+                        # Copy, as the cached dict may be shared
+                        updates[b] = dict(buckets.get(b) or {})
+                    updates[b][k] = v
+                for b, values in updates.items():
+                    scache(prefix + b, lambda values=values: values, time_expire=0)
+
         # Anything left gets set to default
         if lookup:
             for k in lookup:
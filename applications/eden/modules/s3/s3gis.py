@@ -32,8 +32,10 @@
 __all__ = ("S3GIS",
            "MAP2",
            "S3Map",
+           "S3MapTiles",
            "S3ExportPOI",
            "S3ImportPOI",
+           "S3SpatialIndex",
            )
 
 import datetime         # Needed for Feed Refresh checks & web2py version check
@@ -41,6 +43,7 @@ import json
 import os
 import re
 import sys
+import time
 #import logging
 
 from collections import OrderedDict
@@ -2075,6 +2078,12 @@ class S3GIS:
             query &= (table.deleted == False)
         # @ToDo: Check AAA (do this as a resource filter?)
 
+        if current.deployment_settings.get_gis_spatial_index():
+            # Pre-filter with the spatial index
+            index_query = S3SpatialIndex.query(*polygon.bounds)
+            if index_query is not None:
+                query &= index_query
+
         features = db(query).select(locations.wkt,
                                     locations.lat,
                                     locations.lon,
@@ -2327,6 +2336,16 @@ class S3GIS:
             empty = (locations.lat != None) & (locations.lon != None)
             query = deleted & empty & query
 
+            if settings.get_gis_spatial_index():
+                # Pre-filter with the spatial index
+                index_query = S3SpatialIndex.query(bbox["lon_min"],
+                                                   bbox["lat_min"],
+                                                   bbox["lon_max"],
+                                                   bbox["lat_max"],
+                                                   )
+                if index_query is not None:
+                    query = index_query & query
+
             if tablename:
                 # Lookup the resource
                 table = current.s3db[tablename]
@@ -2485,8 +2504,34 @@ class S3GIS:
                     else:
                         output[key] = [row.wkt]
         else:
+            left = None
+            level = S3GIS.simplify_level(tolerance) if geojson else None
+            if level is not None:
+                # Use precomputed simplified geometries where available
+                stable = current.s3db.gis_location_simplified
+                on = (stable.location_id == gtable.id) & \
+                     (stable.tolerance == level) & \
+                     (stable.decimals == settings.get_gis_precision())
+                rows = db(query & on).select(table.id,
+                                             stable.geojson,
+                                             )
+                for row in rows:
+                    key = row[tablename].id
+                    g = row["gis_location_simplified"].geojson
+                    if not join:
+                        # gis_location: always single
+                        output[key] = g
+                    elif key in output:
+                        output[key].append(g)
+                    else:
+                        output[key] = [g]
+                # Simplify only the others
+                left = stable.on(on)
+                query &= (stable.id == None)
+
             rows = db(query).select(table.id,
                                     gtable.wkt,
+                                    left = left,
                                     )
             simplify = S3GIS.simplify
             if geojson:
@@ -3301,10 +3346,11 @@ page.render('%(filename)s', {format: 'jpeg', quality: '100'});''' % \
         #    for row in rows:
         #        geojsons[row["gis_theme_data.id"]] = row.geojson
         #else:
-        rows = current.db(query).select(table.id,
-                                        gtable.level,
-                                        gtable.wkt,
-                                        )
+        db = current.db
+        rows = db(query).select(table.id,
+                                gtable.id,
+                                gtable.level,
+                                )
         simplify = S3GIS.simplify
         tolerance = {"L0": 0.01,
                      "L1": 0.005,
@@ -3313,12 +3359,35 @@ page.render('%(filename)s', {format: 'jpeg', quality: '100'});''' % \
                      "L4": 0.0003125,
                      "L5": 0.00015625,
                      }
+
+        # Use precomputed simplified geometries where available
+        levels = {}
+        for row in rows:
+            grow = row.gis_location
+            level = grow.level
+            if level in levels:
+                levels[level].append(grow.id)
+            else:
+                levels[level] = [grow.id]
+        simplified = {}
+        for level, location_ids in levels.items():
+            simplified.update(S3GIS.get_simplified(location_ids, tolerance[level]))
+
+        missing = set(row.gis_location.id for row in rows) - set(simplified)
+        if missing:
+            wkts = db(gtable.id.belongs(missing)).select(gtable.id,
+                                                         gtable.wkt,
+                                                         ).as_dict()
         for row in rows:
             grow = row.gis_location
-            # Simplify the polygon to reduce download size
-            geojson = simplify(grow.wkt,
-                               tolerance = tolerance[grow.level],
-                               output = "geojson")
+            location_id = grow.id
+            if location_id in simplified:
+                geojson = simplified[location_id]
+            else:
+                # Simplify the polygon to reduce download size
+                geojson = simplify(wkts[location_id]["wkt"],
+                                   tolerance = tolerance[grow.level],
+                                   output = "geojson")
             if geojson:
                 geojsons[row["gis_theme_data.id"]] = geojson
 
@@ -3866,6 +3935,9 @@ page.render('%(filename)s', {format: 'jpeg', quality: '100'});''' % \
             if "L2" in levels:
                 self.import_gadm1(ogr, "L2", countries=countries)
 
+            # Precompute the simplified geometries
+            self.update_simplified()
+
             current.log.debug("All done!")
 
         elif source == "gadmv1":
@@ -3882,6 +3954,9 @@ page.render('%(filename)s', {format: 'jpeg', quality: '100'});''' % \
             if "L2" in levels:
                 self.import_gadm2(ogr, "L2", countries=countries)
 
+            # Precompute the simplified geometries
+            self.update_simplified()
+
             current.log.debug("All done!")
 
         else:
@@ -6171,6 +6246,13 @@ page.render('%(filename)s', {format: 'jpeg', quality: '100'});''' % \
                 (table.lat_max >= lat_min) & \
                 (table.lon_min <= lon_max) & \
                 (table.lon_max >= lon_min)
+
+        if current.deployment_settings.get_gis_spatial_index():
+            # Pre-filter with the spatial index
+            index_query = S3SpatialIndex.query(lon_min, lat_min, lon_max, lat_max)
+            if index_query is not None:
+                query = index_query & query
+
         return query
 
     # -------------------------------------------------------------------------
@@ -6412,6 +6494,137 @@ page.render('%(filename)s', {format: 'jpeg', quality: '100'});''' % \
 
         return output
 
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def simplify_level(tolerance):
+        """
+            Find the precomputed simplification level to use for a
+            simplify tolerance
+
+            Args:
+                tolerance: the requested simplify tolerance
+
+            Returns:
+                the largest precomputed tolerance which is not greater
+                than the requested tolerance, or None if there is none
+        """
+
+        if not tolerance:
+            return None
+
+        levels = [level for level in current.deployment_settings.get_gis_simplify_levels()
+                  if level <= tolerance]
+
+        return max(levels) if levels else None
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def get_simplified(location_ids, tolerance, precision=None):
+        """
+            Look up precomputed simplified geometries of locations
+
+            Args:
+                location_ids: the gis_location record IDs
+                tolerance: the requested simplify tolerance
+                precision: the number of decimal places in the output
+
+            Returns:
+                dict {location_id: GeoJSON string}, only for locations
+                which have a precomputed geometry for the tolerance
+        """
+
+        level = S3GIS.simplify_level(tolerance)
+        if level is None or not location_ids:
+            return {}
+
+        if not precision:
+            precision = current.deployment_settings.get_gis_precision()
+
+        stable = current.s3db.gis_location_simplified
+        query = (stable.location_id.belongs(set(location_ids))) & \
+                (stable.tolerance == level) & \
+                (stable.decimals == precision)
+        rows = current.db(query).select(stable.location_id,
+                                        stable.geojson,
+                                        )
+
+        return {row.location_id: row.geojson for row in rows}
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def update_simplified(location_ids=None, refresh=False):
+        """
+            Precompute simplified geometries of location shapes at the
+            tolerances configured in settings.gis.simplify_levels
+
+            Args:
+                location_ids: the gis_location record IDs to update,
+                              None to update all locations
+                refresh: when updating all locations, also recompute
+                         the existing simplified geometries (otherwise
+                         only those missing are computed)
+
+            Note:
+                Called onaccept of locations (async) and after imports
+        """
+
+        settings = current.deployment_settings
+
+        levels = settings.get_gis_simplify_levels()
+        if not levels:
+            return
+
+        db = current.db
+        s3db = current.s3db
+
+        table = s3db.gis_location
+        stable = s3db.gis_location_simplified
+
+        left = None
+        query = (table.deleted == False) & \
+                (table.wkt != None) & \
+                (table.gis_feature_type != 1)
+
+        if location_ids is not None:
+            db(stable.location_id.belongs(location_ids)).delete()
+            query &= table.id.belongs(location_ids)
+        elif refresh:
+            db(stable.id > 0).delete()
+        else:
+            # Only locations without simplified geometries
+            left = stable.on(stable.location_id == table.id)
+            query &= (stable.id == None)
+
+        precision = settings.get_gis_precision()
+        simplify = S3GIS.simplify
+
+        rows = db(query).select(table.id, left=left)
+        ids = [row.id for row in rows]
+
+        # Process in chunks to limit the memory used for WKT
+        for index in range(0, len(ids), 100):
+            chunk = ids[index:index + 100]
+            rows = db(table.id.belongs(chunk)).select(table.id, table.wkt)
+            items = []
+            for row in rows:
+                wkt = row.wkt
+                if not wkt or wkt.startswith("POINT"):
+                    continue
+                for level in levels:
+                    geojson = simplify(wkt,
+                                       tolerance = level,
+                                       output = "geojson",
+                                       precision = precision,
+                                       )
+                    if geojson:
+                        items.append({"location_id": row.id,
+                                      "tolerance": level,
+                                      "decimals": precision,
+                                      "geojson": geojson,
+                                      })
+            if items:
+                stable.bulk_insert(items)
+
     # -------------------------------------------------------------------------
     def show_map(self,
                  id = "default_map",
@@ -6603,6 +6816,438 @@ page.render('%(filename)s', {format: 'jpeg', quality: '100'});''' % \
                    plugins = plugins,
                    )
 
+# =============================================================================
+class S3SpatialIndex:
+    """
+        Multi-level grid index of gis_location bounding boxes, for indexed
+        bbox, radius and polygon lookups on databases without spatial
+        extensions
+
+        Every location is registered in the cells of the finest grid level
+        where its bounding box spans no more than 2x2 cells (points go into
+        the finest level), so any bbox can be looked up with one indexed
+        range query per level.
+    """
+
+    # Finest grid level (cell size 360/2**level degrees)
+    MAX_LEVEL = 16
+
+    # Whether the index has been verified to be populated
+    populated = False
+
+    # Whether a rebuild has been queued by this process
+    rebuild_queued = False
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def bounds(row):
+        """
+            Get the bounding box of a location
+
+            Args:
+                row: the gis_location Row (or dict) with bounds and lat/lon
+
+            Returns:
+                tuple (lon_min, lat_min, lon_max, lat_max), or None if
+                the location has no coordinates
+        """
+
+        get = row.get
+
+        lat, lon = get("lat"), get("lon")
+        lon_min, lat_min = get("lon_min"), get("lat_min")
+        lon_max, lat_max = get("lon_max"), get("lat_max")
+
+        # Fall back to lat/lon where the bounds are missing
+        if lon_min is None or lon_max is None:
+            lon_min = lon_max = lon
+        if lat_min is None or lat_max is None:
+            lat_min = lat_max = lat
+        if lon_min is None or lat_min is None:
+            return None
+
+        lon_min, lon_max = sorted((float(lon_min), float(lon_max)))
+        lat_min, lat_max = sorted((float(lat_min), float(lat_max)))
+
+        return lon_min, lat_min, lon_max, lat_max
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def level(cls, lon_min, lat_min, lon_max, lat_max):
+        """
+            Determine the finest grid level where a bbox spans no more
+            than 2x2 cells
+
+            Args:
+                lon_min, lat_min, lon_max, lat_max: the bbox
+
+            Returns:
+                the grid level
+        """
+
+        import math
+
+        extent = max(lon_max - lon_min, lat_max - lat_min)
+        if extent <= 0:
+            return cls.MAX_LEVEL
+
+        level = int(math.floor(math.log(360.0 / extent, 2)))
+        return max(0, min(level, cls.MAX_LEVEL))
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def cells(level, lon_min, lat_min, lon_max, lat_max):
+        """
+            Get the range of grid cells covered by a bbox
+
+            Args:
+                level: the grid level
+                lon_min, lat_min, lon_max, lat_max: the bbox
+
+            Returns:
+                tuple of cell coordinates (x_min, y_min, x_max, y_max)
+        """
+
+        import math
+
+        size = 360.0 / (1 << level)
+        limit = (1 << level) - 1
+
+        def cell(value, offset):
+            return max(0, min(int(math.floor((value + offset) / size)), limit))
+
+        return (cell(lon_min, 180), cell(lat_min, 90),
+                cell(lon_max, 180), cell(lat_max, 90),
+                )
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def entries(cls, location_id, bounds):
+        """
+            Generate the index entries for a location
+
+            Args:
+                location_id: the gis_location record ID
+                bounds: the bbox of the location, as returned from bounds()
+
+            Returns:
+                list of dicts for bulk insert into gis_location_grid
+        """
+
+        if bounds is None:
+            return []
+
+        level = cls.level(*bounds)
+        x_min, y_min, x_max, y_max = cls.cells(level, *bounds)
+
+        return [{"location_id": location_id, "level": level, "x": x, "y": y}
+                for x in range(x_min, x_max + 1)
+                for y in range(y_min, y_max + 1)
+                ]
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def update(cls, location_id, row=None):
+        """
+            Update the index entries for a location
+
+            Args:
+                location_id: the gis_location record ID
+                row: the location Row/dict with bounds and lat/lon,
+                     will be looked up if not provided
+        """
+
+        db = current.db
+        s3db = current.s3db
+
+        table = s3db.gis_location
+        gtable = s3db.gis_location_grid
+
+        if row is None:
+            row = db(table.id == location_id).select(table.deleted,
+                                                     table.lat,
+                                                     table.lon,
+                                                     table.lat_min,
+                                                     table.lat_max,
+                                                     table.lon_min,
+                                                     table.lon_max,
+                                                     limitby = (0, 1),
+                                                     ).first()
+
+        db(gtable.location_id == location_id).delete()
+
+        if row and not row.get("deleted"):
+            items = cls.entries(location_id, cls.bounds(row))
+            if items:
+                gtable.bulk_insert(items)
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def update_many(cls, location_ids):
+        """
+            Update the index entries for multiple locations
+
+            Args:
+                location_ids: list of gis_location record IDs
+        """
+
+        if not location_ids:
+            return
+
+        db = current.db
+        s3db = current.s3db
+
+        table = s3db.gis_location
+        gtable = s3db.gis_location_grid
+
+        cls.remove(location_ids)
+
+        query = (table.id.belongs(location_ids)) & \
+                (table.deleted == False)
+        rows = db(query).select(table.id,
+                                table.lat,
+                                table.lon,
+                                table.lat_min,
+                                table.lat_max,
+                                table.lon_min,
+                                table.lon_max,
+                                )
+        entries = cls.entries
+        bounds = cls.bounds
+
+        items = []
+        for row in rows:
+            items.extend(entries(row.id, bounds(row)))
+        if items:
+            gtable.bulk_insert(items)
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def remove(location_id):
+        """
+            Remove locations from the index
+
+            Args:
+                location_id: the gis_location record ID, or a list
+                             of record IDs
+        """
+
+        gtable = current.s3db.gis_location_grid
+        if isinstance(location_id, (list, tuple, set)):
+            query = (gtable.location_id.belongs(location_id))
+        else:
+            query = (gtable.location_id == location_id)
+        current.db(query).delete()
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def register(cls, table):
+        """
+            Register DAL callbacks with the gis_location table to keep the
+            index in sync with all writes, including those which do not
+            go through onaccept/ondelete (e.g. import_geonames or
+            import_admin_areas, location tree updates)
+
+            Args:
+                table: the gis_location Table (called from on_define)
+        """
+
+        if getattr(table, "_spatial_index_tracked", False):
+            return
+        table._spatial_index_tracked = True
+
+        keys = {"lat", "lon",
+                "lat_min", "lat_max",
+                "lon_min", "lon_max",
+                "deleted",
+                }
+
+        def enabled():
+            return current.deployment_settings.get_gis_spatial_index()
+
+        def affected(dbset):
+            # Record the IDs before writing, as the query of the Set may
+            # no longer match afterwards (e.g. deleted == False)
+            rows = dbset.select(table.id)
+            dbset._spatial_index_ids = [row.id for row in rows]
+
+        def after_insert(row, record_id):
+            if enabled():
+                cls.update(record_id, row)
+
+        def before_update(dbset, row):
+            dbset._spatial_index_ids = None
+            if enabled() and any(fn in keys for fn in row):
+                affected(dbset)
+            return False
+
+        def after_update(dbset, row):
+            location_ids = getattr(dbset, "_spatial_index_ids", None)
+            if location_ids:
+                cls.update_many(location_ids)
+
+        def before_delete(dbset):
+            dbset._spatial_index_ids = None
+            if enabled():
+                affected(dbset)
+            return False
+
+        def after_delete(dbset):
+            location_ids = getattr(dbset, "_spatial_index_ids", None)
+            if location_ids:
+                cls.remove(location_ids)
+
+        table._after_insert.append(after_insert)
+        table._before_update.append(before_update)
+        table._after_update.append(after_update)
+        table._before_delete.append(before_delete)
+        table._after_delete.append(after_delete)
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def rebuild(cls):
+        """
+            Rebuild the index for all locations
+        """
+
+        db = current.db
+        s3db = current.s3db
+
+        table = s3db.gis_location
+        gtable = s3db.gis_location_grid
+
+        db(gtable.id > 0).delete()
+
+        rows = db(table.deleted == False).select(table.id,
+                                                 table.lat,
+                                                 table.lon,
+                                                 table.lat_min,
+                                                 table.lat_max,
+                                                 table.lon_min,
+                                                 table.lon_max,
+                                                 )
+        entries = cls.entries
+        bounds = cls.bounds
+
+        items = []
+        for row in rows:
+            items.extend(entries(row.id, bounds(row)))
+            if len(items) >= 1000:
+                gtable.bulk_insert(items)
+                items = []
+        if items:
+            gtable.bulk_insert(items)
+
+        cls.populated = True
+        cls.rebuild_queued = False
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def queue_rebuild(cls):
+        """
+            Queue a rebuild of the index as scheduler task (once per
+            process); without a worker, the index gets rebuilt by the
+            daily maintenance instead
+        """
+
+        if cls.rebuild_queued:
+            return
+
+        s3task = current.s3task
+        if s3task._is_alive():
+            s3task.run_async("gis_spatial_index_rebuild")
+            cls.rebuild_queued = True
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def complete(cls):
+        """
+            Check whether all indexable locations are in the index, i.e.
+            that it has been populated and no locations have been written
+            while the index was disabled
+
+            Returns:
+                True|False
+        """
+
+        db = current.db
+        s3db = current.s3db
+
+        table = s3db.gis_location
+        gtable = s3db.gis_location_grid
+
+        # Locations with coordinates, see bounds()
+        query = (table.deleted == False) & \
+                ((table.lat != None) | \
+                 ((table.lat_min != None) & (table.lat_max != None))) & \
+                ((table.lon != None) | \
+                 ((table.lon_min != None) & (table.lon_max != None)))
+        indexable = db(query).count()
+
+        count = gtable.location_id.count(distinct=True)
+        indexed = db(gtable.id > 0).select(count).first()[count]
+
+        return indexed == indexable
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def query(cls, lon_min, lat_min, lon_max, lat_max):
+        """
+            Construct a query for all locations whose index cells overlap
+            with a bbox; this is a pre-filter, i.e. the actual bounds of
+            the locations still need to be checked
+
+            Args:
+                lon_min, lat_min, lon_max, lat_max: the bbox
+
+            Returns:
+                the query, or None if the index can not narrow down
+                the selection (e.g. for a bbox spanning the whole world),
+                or if the index is incomplete (=callers fall back to a
+                plain bbox scan until it has been rebuilt)
+        """
+
+        if any(v is None for v in (lon_min, lat_min, lon_max, lat_max)):
+            return None
+        bounds = (float(lon_min), float(lat_min), float(lon_max), float(lat_max))
+        if bounds[0] > bounds[2] or bounds[1] > bounds[3]:
+            # Crossing the antimeridian
+            return None
+        if cls.level(*bounds) == 0:
+            return None
+
+        db = current.db
+        s3db = current.s3db
+
+        gtable = s3db.gis_location_grid
+        if not cls.populated:
+            # Verify the index when used for the first time (but never
+            # rebuild it here, as that would block the request)
+            s3 = current.response.s3
+            if s3.gis_spatial_index_incomplete:
+                return None
+            if not cls.complete():
+                s3.gis_spatial_index_incomplete = True
+                cls.queue_rebuild()
+                return None
+            cls.populated = True
+
+        query = None
+        for level in range(cls.MAX_LEVEL + 1):
+            x_min, y_min, x_max, y_max = cls.cells(level, *bounds)
+            q = (gtable.level == level)
+            if x_min == x_max:
+                q &= (gtable.x == x_min)
+            else:
+                q &= (gtable.x >= x_min) & (gtable.x <= x_max)
+            if y_min == y_max:
+                q &= (gtable.y == y_min)
+            else:
+                q &= (gtable.y >= y_min) & (gtable.y <= y_max)
+            query = q if query is None else query | q
+
+        return s3db.gis_location.id.belongs(db(query)._select(gtable.location_id))
+
 # =============================================================================
 class MAP(DIV):
     """
@@ -10029,6 +10674,722 @@ class S3Map(S3Method):
                                   )
         return map_widget
 
+# =============================================================================
+class S3MapTiles(S3Method):
+    """
+        Tile-scoped GeoJSON for feature resources, with server-side point
+        clustering, zoom-dependent simplification of shapes and an on-disk
+        tile cache
+
+        URL: /<controller>/<function>/tiles.geojson?z=<z>&x=<x>&y=<y>
+
+        Optional URL vars:
+            layer: the gis_layer_feature layer_id (to look up attr_fields)
+            attr: comma-separated list of attribute fields
+            cluster: the cluster distance in pixels (0 to disable clustering)
+    """
+
+    # Tile size in pixels
+    TILE_SIZE = 256
+
+    # Margin in pixels by which shapes extend beyond the tile when clipped
+    TILE_BUFFER = 8
+
+    # Maximum age of cached tiles in seconds (see cleanup)
+    CACHE_EXPIRE = 86400
+
+    # -------------------------------------------------------------------------
+    def apply_method(self, r, **attr):
+        """
+            Entry point for REST interface
+
+            Args:
+                r: the S3Request instance
+                attr: controller attributes for the request
+
+            Returns:
+                the GeoJSON tile
+        """
+
+        if r.http == "GET":
+            if r.representation == "geojson":
+                output = self.tile(r, **attr)
+            else:
+                r.error(415, current.ERROR.BAD_FORMAT)
+        else:
+            r.error(405, current.ERROR.BAD_METHOD)
+
+        return output
+
+    # -------------------------------------------------------------------------
+    def tile(self, r, **attr):
+        """
+            Produce a GeoJSON tile, from the tile cache if it is up-to-date
+
+            Args:
+                r: the S3Request instance
+                attr: controller attributes for the request
+
+            Returns:
+                the GeoJSON tile as JSON string
+        """
+
+        get_vars = r.get_vars
+
+        try:
+            z, x, y = [int(get_vars[k]) for k in ("z", "x", "y")]
+        except (KeyError, TypeError, ValueError):
+            r.error(400, current.ERROR.BAD_REQUEST)
+        if not 0 <= z <= 30 or not 0 <= x < (1 << z) or not 0 <= y < (1 << z):
+            r.error(400, current.ERROR.BAD_REQUEST)
+
+        try:
+            distance = int(get_vars.get("cluster", CLUSTER_DISTANCE))
+        except ValueError:
+            distance = CLUSTER_DISTANCE
+
+        resource = self.resource
+        tablename = resource.tablename
+
+        # Attribute fields
+        attr_fields = get_vars.get("attr")
+        if attr_fields:
+            attr_fields = attr_fields.split(",")
+        else:
+            layer_id = get_vars.get("layer")
+            if layer_id:
+                ftable = current.s3db.gis_layer_feature
+                layer = current.db(ftable.layer_id == layer_id).select(ftable.attr_fields,
+                                                                       limitby = (0, 1),
+                                                                       ).first()
+                if layer:
+                    attr_fields = layer.attr_fields
+        if not attr_fields:
+            attr_fields = []
+
+        response = current.response
+        response.headers["Content-Type"] = CONTENT_TYPES.get("geojson",
+                                                             "application/json")
+
+        # Look up the tile cache
+        path = self.cache_path(r, z, x, y)
+        modified = self.last_modified(resource.tablename)
+        if os.path.exists(path):
+            if modified is None or os.path.getmtime(path) > modified:
+                with open(path, "r") as cached:
+                    return cached.read()
+
+        output = json.dumps(self.features(resource, z, x, y,
+                                          attr_fields = attr_fields,
+                                          distance = distance,
+                                          ),
+                            separators = SEPARATORS,
+                            )
+
+        # Write to the tile cache
+        try:
+            folder = os.path.dirname(path)
+            if not os.path.exists(folder):
+                os.makedirs(folder, exist_ok=True)
+            tmp = "%s.%s" % (path, os.getpid())
+            with open(tmp, "w") as f:
+                f.write(output)
+            os.replace(tmp, path)
+        except (IOError, OSError):
+            current.log.error("S3MapTiles: could not write tile cache %s" % path)
+
+        return output
+
+    # -------------------------------------------------------------------------
+    def features(self, resource, z, x, y, attr_fields=None, distance=CLUSTER_DISTANCE):
+        """
+            Produce the features of a resource within a tile
+
+            Args:
+                resource: the S3Resource
+                z: the zoom level
+                x: the tile column
+                y: the tile row
+                attr_fields: list of field selectors for feature attributes
+                distance: the cluster distance in pixels (0 = no clustering)
+
+            Returns:
+                the GeoJSON FeatureCollection as dict
+
+            Note:
+                Shapes are clipped to the tile bounds (plus TILE_BUFFER)
+                if Shapely is installed; otherwise they are delivered
+                whole, which is still correct, but sends the same large
+                shapes with every tile they overlap
+        """
+
+        output = {"type": "FeatureCollection",
+                  "features": [],
+                  }
+
+        prefix = self.location_selector(resource)
+        if prefix is None:
+            # Can't display this resource on the Map
+            return output
+
+        settings = current.deployment_settings
+        precision = settings.get_gis_precision()
+
+        # Filter by overlap of the location bounds with the tile bounds
+        # (or by lat/lon for locations without bounds)
+        from .s3query import FS
+        west, south, east, north = self.tile_bounds(z, x, y)
+        lat, lon = FS("%slat" % prefix), FS("%slon" % prefix)
+        lat_min, lat_max = FS("%slat_min" % prefix), FS("%slat_max" % prefix)
+        lon_min, lon_max = FS("%slon_min" % prefix), FS("%slon_max" % prefix)
+        overlap = (lat_max >= south) & (lat_min <= north) & \
+                  (lon_max >= west) & (lon_min <= east)
+        no_bounds = (lat_min == None) | (lat_max == None) | \
+                    (lon_min == None) | (lon_max == None)
+        inside = (lat >= south) & (lat <= north) & \
+                 (lon >= west) & (lon <= east)
+        resource.add_filter(overlap | (no_bounds & inside))
+
+        # Points on the lower bounds belong to this tile, so that points
+        # on the tile edges are not rendered twice
+        def in_tile(lon, lat):
+            return west <= lon < east and south < lat <= north
+
+        selectors = [resource._id.name,
+                     "%slat" % prefix,
+                     "%slon" % prefix,
+                     "%sid" % prefix if prefix else "id",
+                     "%sgis_feature_type" % prefix,
+                     ]
+        colnames = [resource.resolve_selector(s).colname for s in selectors]
+        data = resource.select(selectors,
+                               limit = None,
+                               represent = False,
+                               )
+
+        # Zoom-dependent simplification tolerance (~1 pixel)
+        if settings.get_gis_simplify_tolerance():
+            tolerance = 360.0 / (self.TILE_SIZE << z)
+        else:
+            tolerance = 0
+
+        points = []
+        shapes = []
+        for row in data["rows"]:
+            record_id, lat, lon, location_id, feature_type = \
+                [row[colname] for colname in colnames]
+            if feature_type and str(feature_type) != "1":
+                shapes.append((record_id, lon, lat, location_id))
+            elif lat is not None and lon is not None and in_tile(lon, lat):
+                points.append((record_id, lon, lat))
+
+        features = []
+        if shapes:
+            # Use precomputed simplified geometries where available
+            location_ids = [shape[3] for shape in shapes]
+            geojsons = S3GIS.get_simplified(location_ids, tolerance, precision)
+
+            missing = set(location_ids) - set(geojsons)
+            if missing:
+                try:
+                    from shapely.wkt import loads as wkt_loads
+                except ImportError:
+                    # Render these shapes as points
+                    current.log.info("S3MapTiles", "Shapely not installed, rendering shapes as points")
+                else:
+                    gtable = current.s3db.gis_location
+                    rows = current.db(gtable.id.belongs(missing)).select(gtable.id,
+                                                                         gtable.wkt,
+                                                                         )
+                    simplify = S3GIS.simplify
+                    for row in rows:
+                        if row.wkt:
+                            geojsons[row.id] = simplify(row.wkt,
+                                                        tolerance = tolerance,
+                                                        output = "geojson",
+                                                        precision = precision,
+                                                        )
+
+            # Clip shapes to the tile bounds (plus a margin, so that
+            # outlines at the tile edges are not rendered)
+            try:
+                from shapely.geometry import box
+            except ImportError:
+                bbox = None
+            else:
+                margin = 360.0 / (self.TILE_SIZE << z) * self.TILE_BUFFER
+                bbox = box(west - margin, south - margin, east + margin, north + margin)
+
+            for record_id, lon, lat, location_id in shapes:
+                geojson = geojsons.get(location_id)
+                if geojson:
+                    geometry = json.loads(geojson)
+                    if bbox is not None:
+                        geometry = self.clip(geometry, bbox, precision)
+                        if geometry is None:
+                            continue
+                    features.append((record_id, geometry))
+                elif lat is not None and lon is not None and in_tile(lon, lat):
+                    points.append((record_id, lon, lat))
+
+        # Cluster the points
+        clusters = []
+        if distance > 0:
+            points, clusters = self.cluster(points, z, distance)
+        for record_id, lon, lat in points:
+            features.append((record_id, {"type": "Point",
+                                         "coordinates": [round(lon, precision),
+                                                         round(lat, precision),
+                                                         ],
+                                         }))
+
+        # Look up the attributes of all non-clustered features
+        attributes = self.attributes(resource.tablename,
+                                     [record_id for record_id, _ in features],
+                                     attr_fields,
+                                     )
+
+        append = output["features"].append
+        for record_id, geometry in features:
+            properties = {"id": record_id}
+            properties.update(attributes.get(record_id, {}))
+            append({"type": "Feature",
+                    "id": record_id,
+                    "geometry": geometry,
+                    "properties": properties,
+                    })
+        for lon, lat, count in clusters:
+            append({"type": "Feature",
+                    "geometry": {"type": "Point",
+                                 "coordinates": [round(lon, precision),
+                                                 round(lat, precision),
+                                                 ],
+                                 },
+                    "properties": {"cluster": True,
+                                   "count": count,
+                                   },
+                    })
+
+        return output
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def cluster(cls, points, z, distance=CLUSTER_DISTANCE):
+        """
+            Cluster points on a pixel grid
+
+            Args:
+                points: list of tuples (record_id, lon, lat)
+                z: the zoom level
+                distance: the grid size in pixels
+
+            Returns:
+                tuple (points, clusters), with the points that are not
+                part of a cluster, and a list of tuples (lon, lat, count)
+                for the clusters
+        """
+
+        import math
+
+        scale = float(cls.TILE_SIZE << z) / distance
+
+        cells = {}
+        for point in points:
+            lon, lat = point[1], point[2]
+            sin = math.sin(math.radians(max(min(lat, 85.0511), -85.0511)))
+            px = (lon + 180.0) / 360.0 * scale
+            py = (0.5 - math.log((1 + sin) / (1 - sin)) / (4 * math.pi)) * scale
+            key = (int(px), int(py))
+            if key in cells:
+                cells[key].append(point)
+            else:
+                cells[key] = [point]
+
+        single, clusters = [], []
+        for cell in cells.values():
+            count = len(cell)
+            if count < CLUSTER_THRESHOLD:
+                single.extend(cell)
+            else:
+                lon = sum(point[1] for point in cell) / count
+                lat = sum(point[2] for point in cell) / count
+                clusters.append((lon, lat, count))
+
+        return single, clusters
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def attributes(tablename, record_ids, attr_fields):
+        """
+            Look up the feature attributes
+
+            Args:
+                tablename: the tablename
+                record_ids: the record IDs
+                attr_fields: list of field selectors
+
+            Returns:
+                dict {record_id: {fieldname: value}}
+        """
+
+        if not attr_fields or not record_ids:
+            return {}
+
+        NONE = current.messages["NONE"]
+
+        resource = current.s3db.resource(tablename, id=record_ids)
+        pkey = resource._id.name
+
+        fields = list(attr_fields)
+        if pkey not in fields:
+            fields.insert(0, pkey)
+
+        data = resource.select(fields,
+                               limit = None,
+                               represent = True,
+                               raw_data = True,
+                               show_links = False,
+                               )
+
+        attr_cols = {}
+        for rfield in data["rfields"]:
+            if rfield.selector in attr_fields or rfield.fname in attr_fields:
+                ftype = rfield.ftype if rfield.field else None
+                attr_cols[rfield.colname] = (ftype, rfield.fname)
+
+        colname = str(resource._id)
+        output = {}
+        for row in data["rows"]:
+            attributes = {}
+            for fieldname, (ftype, fname) in attr_cols.items():
+                represent = row[fieldname]
+                if represent is None or represent in (NONE, ""):
+                    # Skip empty fields
+                    continue
+                if ftype in ("integer", "double", "float") and \
+                   not isinstance(represent, lazyT):
+                    # Attributes should be numbers not strings
+                    represent = row["_row"][fieldname]
+                else:
+                    represent = s3_str(represent)
+                attributes[fname] = represent
+            output[row["_row"][colname]] = attributes
+
+        return output
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def clip(geometry, bbox, precision):
+        """
+            Clip a shape to a bounding box
+
+            Args:
+                geometry: the GeoJSON geometry (dict)
+                bbox: the bounding box (Shapely Polygon)
+                precision: the number of decimal places for the output
+
+            Returns:
+                the clipped GeoJSON geometry (dict), or None if the shape
+                does not intersect with the bounding box
+
+            Note:
+                Requires Shapely; if clipping fails (e.g. invalid shape),
+                the geometry is returned unclipped
+        """
+
+        from shapely.geometry import mapping, shape
+
+        try:
+            geom = shape(geometry)
+            if bbox.contains(geom):
+                return geometry
+            clipped = geom.intersection(bbox)
+        except Exception:
+            current.log.error("S3MapTiles: could not clip shape: %s" % sys.exc_info()[1])
+            return geometry
+
+        if clipped.is_empty:
+            return None
+
+        def shrink(coords):
+            if isinstance(coords, (tuple, list)):
+                return [shrink(item) for item in coords]
+            return round(coords, precision)
+
+        def as_dict(item):
+            if "geometries" in item:
+                return {"type": item["type"],
+                        "geometries": [as_dict(g) for g in item["geometries"]],
+                        }
+            return {"type": item["type"],
+                    "coordinates": shrink(item["coordinates"]),
+                    }
+
+        return as_dict(mapping(clipped))
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def tile_bounds(z, x, y):
+        """
+            Get the bounds of a (Spherical Mercator) map tile
+
+            Args:
+                z: the zoom level
+                x: the tile column
+                y: the tile row
+
+            Returns:
+                tuple (lon_min, lat_min, lon_max, lat_max)
+        """
+
+        import math
+
+        n = float(1 << z)
+
+        def lat(row):
+            return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * row / n))))
+
+        return (x / n * 360.0 - 180.0,
+                lat(y + 1),
+                (x + 1) / n * 360.0 - 180.0,
+                lat(y),
+                )
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def location_selector(resource):
+        """
+            Find the selector prefix for the location of a resource
+
+            Args:
+                resource: the S3Resource
+
+            Returns:
+                the selector prefix for gis_location fields, or None if
+                the resource has no location reference
+        """
+
+        if resource.tablename == "gis_location":
+            return ""
+
+        context = resource.get_config("context")
+        if context and "location" in context:
+            return "(location)$"
+
+        table = resource.table
+        site_id = None
+        for fname in table.fields:
+            ftype = str(table[fname].type)
+            if ftype[:22] == "reference gis_location":
+                return "%s$" % fname
+            elif not site_id and ftype[:18] == "reference org_site":
+                site_id = fname
+        if site_id:
+            return "%s$location_id$" % site_id
+
+        return None
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def track(cls, table):
+        """
+            Add callbacks to a table to invalidate cached tiles when
+            records are written; called once per table when it is
+            defined (S3Model.define_table)
+
+            Args:
+                table: the Table
+        """
+
+        if getattr(table, "_tiles_tracked", False):
+            return
+        table._tiles_tracked = True
+
+        tablename = table._tablename
+
+        def invalidate(*args):
+            cls.invalidate(tablename)
+
+        table._after_insert.append(invalidate)
+        table._after_update.append(invalidate)
+        table._after_delete.append(invalidate)
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def invalidate(cls, tablename):
+        """
+            Mark the cached tiles of a table as outdated, by touching
+            its modification stamp in the tile cache; the stamp is
+            touched both immediately and after commit, so that tiles
+            cached by concurrent requests before the commit do not
+            survive it
+
+            Args:
+                tablename: the table name
+        """
+
+        path = cls.stamp_path(tablename)
+
+        def touch():
+            # No tile cache => nothing to invalidate
+            if os.path.isdir(os.path.dirname(path)):
+                try:
+                    with open(path, "a"):
+                        os.utime(path, None)
+                except (IOError, OSError):
+                    current.log.error("S3MapTiles: could not touch %s" % path)
+
+        touch()
+
+        from .s3utils import s3_after_commit
+        s3_after_commit("s3_map_tiles_%s" % tablename, touch)
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def stamp_path(cls, tablename):
+        """
+            Get the path of the modification stamp of a table
+
+            Args:
+                tablename: the table name
+
+            Returns:
+                the file path
+        """
+
+        return os.path.join(cls.cache_folder(), "%s.modified" % tablename)
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def last_modified(cls, tablename):
+        """
+            Get the last modification time of a table and gis_location,
+            for tile cache invalidation; uses the modification stamps
+            rather than querying the tables
+
+            Args:
+                tablename: the table name
+
+            Returns:
+                the modification time as POSIX timestamp
+                (or None if not available)
+        """
+
+        last = None
+        for tn in (tablename, "gis_location"):
+            try:
+                mtime = os.path.getmtime(cls.stamp_path(tn))
+            except OSError:
+                continue
+            if last is None or mtime > last:
+                last = mtime
+
+        return last
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def cache_folder():
+        """
+            Get the folder of the tile cache
+
+            Returns:
+                the folder path
+        """
+
+        return os.path.join(current.request.folder,
+                            "uploads",
+                            "gis_cache",
+                            "tiles",
+                            )
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def cache_path(cls, r, z, x, y):
+        """
+            Get the path of the cached tile for a request; the cache key
+            includes the controller and function (which can customise the
+            resource), the filter, the user and the language
+
+            Args:
+                r: the S3Request
+                z: the zoom level
+                x: the tile column
+                y: the tile row
+
+            Returns:
+                the file path
+        """
+
+        import hashlib
+
+        auth = current.auth
+        user_id = auth.user.id if auth.user else None
+
+        get_vars = r.get_vars
+        key_vars = sorted((k, str(v)) for k, v in get_vars.items()
+                          if k not in ("z", "x", "y", "_"))
+        key = json.dumps([key_vars, user_id, current.T.accepted_language])
+        key = hashlib.md5(key.encode("utf-8")).hexdigest()
+
+        return os.path.join(cls.cache_folder(),
+                            r.tablename,
+                            r.controller,
+                            r.function,
+                            str(z),
+                            str(x),
+                            "%s-%s.geojson" % (y, key),
+                            )
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def cleanup(cls, expire=None):
+        """
+            Remove outdated tiles from the tile cache, i.e. those older
+            than the last modification of their table, and those older
+            than the expiry time; to be run from maintenance tasks
+
+            Args:
+                expire: the maximum age of cached tiles in seconds,
+                        defaults to CACHE_EXPIRE
+
+            Returns:
+                the number of removed files
+        """
+
+        folder = cls.cache_folder()
+        if not os.path.isdir(folder):
+            return 0
+
+        if expire is None:
+            expire = cls.CACHE_EXPIRE
+        oldest = time.time() - expire
+
+        removed = 0
+        for tablename in os.listdir(folder):
+
+            table_folder = os.path.join(folder, tablename)
+            if not os.path.isdir(table_folder):
+                # Modification stamp
+                continue
+
+            limit = oldest
+            modified = cls.last_modified(tablename)
+            if modified:
+                limit = max(limit, modified)
+
+            for path, _, filenames in os.walk(table_folder):
+                for filename in filenames:
+                    filepath = os.path.join(path, filename)
+                    try:
+                        if os.path.getmtime(filepath) < limit:
+                            os.remove(filepath)
+                            removed += 1
+                    except OSError:
+                        # Removed or replaced concurrently
+                        continue
+
+        return removed
+
 # =============================================================================
 class S3ExportPOI(S3Method):
     """ Export point-of-interest resources for a location """
@@ -34,6 +34,7 @@ __all__ = ("S3Hierarchy",
            )
 
 import json
+import sys
 
 from gluon import DIV, FORM, LI, UL, current
 from gluon.storage import Storage
@@ -523,6 +524,7 @@ class S3Hierarchy:
                  represent = None,
                  filter = None,
                  leafonly = True,
+                 index = False,
                  ):
         """
             Args:
@@ -533,6 +535,11 @@ class S3Hierarchy:
                 filter: additional filter query for the table to
                         select the relevant subset
                 leafonly: filter strictly for leaf nodes
+                index: look up children, paths and descendants from the
+                       stored closure index rather than loading the full
+                       hierarchy (unless it is loaded anyway); lookups
+                       from the index ignore the subset, i.e. they are
+                       not subject to filter or authorization
         """
 
         self.tablename = tablename
@@ -543,6 +550,9 @@ class S3Hierarchy:
         self.filter = filter
         self.leafonly = leafonly
 
+        self.__index = index
+        self.__indexed = None
+
         self.__theset = None
         self.__flags = None
 
@@ -759,8 +769,21 @@ class S3Hierarchy:
         return
 
     # -------------------------------------------------------------------------
-    def save(self):
-        """ Save this hierarchy in s3_hierarchy """
+    def save(self, index=True):
+        """
+            Save this hierarchy in s3_hierarchy
+
+            Args:
+                index: also rebuild the closure index (can be skipped
+                       if the index has been patched incrementally, but
+                       is always rebuilt after the hierarchy has been
+                       re-read from the target table)
+
+            Note:
+                the closure index is rebuilt while holding a lock on the
+                s3_hierarchy record, so that concurrent requests rebuild
+                it one after another
+        """
 
         if not self.config:
             return
@@ -769,6 +792,8 @@ class S3Hierarchy:
         theset = self.theset
         if not self.__status("dbupdate"):
             return
+        if self.__status("reindex"):
+            index = True
 
         # Serialize the theset
         nodes_dict = {}
@@ -783,12 +808,19 @@ class S3Hierarchy:
                 "dirty": False,
                 "hierarchy": {"nodes": nodes_dict}
                 }
-
         # Get current entry
         htable = current.s3db.s3_hierarchy
-        row = current.db(htable.tablename == tablename).select(htable.id,
-                                                               limitby = (0, 1),
-                                                               ).first()
+        query = (htable.tablename == tablename)
+        for_update = index and \
+                     current.deployment_settings.get_database_type() != "sqlite"
+        row = current.db(query).select(htable.id,
+                                       limitby = (0, 1),
+                                       for_update = for_update,
+                                       ).first()
+
+        if index:
+            self.__rebuild_index()
+            data["indexed"] = True
 
         if row:
             # Update record
@@ -801,8 +833,63 @@ class S3Hierarchy:
         self.__status(dirty = False,
                       dbupdate = None,
                       dbstatus = True,
+                      pending = None,
+                      reindex = None,
                       )
 
+    # -------------------------------------------------------------------------
+    def __defer_save(self):
+        """
+            Save the hierarchy only once at the end of the request (rather
+            than after every update), right before the transaction is
+            committed; the stored hierarchy is marked as dirty until then,
+            so that it gets rebuilt upon next read if the transaction
+            is committed without saving it (e.g. in scheduler tasks)
+        """
+
+        flags = self.flags
+        if flags.get("pending"):
+            return
+        flags["pending"] = True
+
+        htable = current.s3db.s3_hierarchy
+        query = (htable.tablename == self.tablename) & \
+                (htable.dirty == False)
+        current.db(query).update(dirty = True)
+
+        response = current.response
+        if response is None or response.get("s3_hierarchy_commit"):
+            return
+        response.s3_hierarchy_commit = True
+
+        custom_commit = response.custom_commit
+        def commit(adapter):
+            if adapter is not None and adapter is current.db._adapter:
+                try:
+                    S3Hierarchy.save_pending()
+                except Exception:
+                    # Stored hierarchy remains dirty => rebuilt upon next read
+                    current.log.error("S3Hierarchy: saving failed: %s" % sys.exc_info()[1])
+            if custom_commit:
+                custom_commit(adapter)
+            elif adapter is not None:
+                adapter.commit()
+        response.custom_commit = commit
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def save_pending():
+        """
+            Save all hierarchies with deferred updates, called before the
+            transaction is committed at the end of the request
+        """
+
+        hierarchies = current.model["hierarchies"]
+        for tablename in list(hierarchies.keys()):
+            flags = hierarchies[tablename]["flags"]
+            if flags.pop("pending", None):
+                S3Hierarchy(tablename).save(index = False)
+
     # -------------------------------------------------------------------------
     @classmethod
     def dirty(cls, tablename):
@@ -890,14 +977,460 @@ class S3Hierarchy:
             add(n, parent_id=p, category=c)
 
         # Update status: memory is clean, db needs update
+        # - the closure index can not be patched, but must be rebuilt
         self.__status(dirty = False,
                       dbupdate = True,
+                      reindex = True,
                       )
 
         # Remove subset
         self.__roots = None
         self.__nodes = None
 
+    # -------------------------------------------------------------------------
+    def refresh(self, node_ids):
+        """
+            Update nodes from the target table after they have been
+            written, patching the stored hierarchy and its closure index
+            rather than rebuilding the hierarchy
+
+            Args:
+                node_ids: the node IDs (iterable), child nodes must
+                          precede their parents if both are deleted
+        """
+
+        if not self.config:
+            return
+
+        tablename = self.tablename
+
+        # Unique node IDs, retaining their order
+        node_ids = list(dict.fromkeys(n for n in node_ids if n))
+        if not node_ids:
+            return
+
+        theset = self.theset
+
+        # Read the current parent and category of the nodes
+        table = current.s3db[tablename]
+
+        pkey = self.pkey
+        fkey = self.fkey
+        ckey = self.ckey
+
+        fields = [pkey, fkey]
+        if ckey is not None:
+            fields.append(table[ckey])
+
+        if "deleted" in table:
+            query = (table.deleted == False)
+        else:
+            query = (table.id > 0)
+        if len(node_ids) == 1:
+            query &= (pkey == node_ids[0])
+        else:
+            query &= (pkey.belongs(node_ids))
+        rows = current.db(query).select(left = self.left,
+                                        *fields)
+
+        data = {}
+        for row in rows:
+            c = row[table[ckey]] if ckey else None
+            data[row[pkey]] = (row[fkey], c)
+
+        # Patch the hierarchy
+        updated = False
+        for node_id in node_ids:
+            if node_id in data:
+                parent_id, category = data[node_id]
+                success = self.__move(node_id, parent_id, category)
+            else:
+                success = self.__prune(node_id)
+            if success is None:
+                # Can not be patched => fall back to rebuild
+                self.dirty(tablename)
+                return
+            elif success:
+                updated = True
+
+        if updated:
+            self.__status(dbupdate = True)
+
+            # Remove subset
+            self.__roots = None
+            self.__nodes = None
+
+        if self.__status("dbupdate") and not self.__status("defer"):
+            # Updated, or re-read from the target table
+            self.__defer_save()
+
+    # -------------------------------------------------------------------------
+    def __move(self, node_id, parent_id, category):
+        """
+            Add a node to, or move a node within the hierarchy, and
+            update the closure index accordingly
+
+            Args:
+                node_id: the node ID
+                parent_id: the (new) parent node ID
+                category: the (new) category
+
+            Returns:
+                True if the hierarchy has been updated, False if the node
+                was unchanged, None if the update would lead to an
+                inconsistent hierarchy
+        """
+
+        theset = self.__theset
+
+        node = theset.get(node_id)
+        exists = node is not None
+        if exists:
+            if node["p"] == parent_id:
+                if node["c"] == category:
+                    return False
+                # Only the category has changed => no need to re-index
+                node["c"] = category
+                return True
+            subtree = self.__subtree(node_id)
+            if parent_id in subtree:
+                # Circular reference
+                return None
+        else:
+            subtree = {node_id: 0}
+
+        if parent_id and parent_id not in theset:
+            # Unknown parent node
+            return None
+
+        # Detach from the current parent
+        if exists and node["p"]:
+            parent = theset.get(node["p"])
+            if parent:
+                parent["s"].discard(node_id)
+
+        # Attach to the new parent
+        node = self.add(node_id, parent_id=parent_id, category=category)
+        node["c"] = category
+
+        if self.__status("reindex"):
+            # Closure index will be rebuilt anyway
+            return True
+
+        # Update the closure index
+        tablename = self.tablename
+        table = current.s3db.s3_hierarchy_closure
+
+        items = []
+        if exists:
+            # Remove the branch from its previous ancestors
+            branch = list(subtree)
+            query = (table.tablename == tablename) & \
+                    (table.descendant.belongs(branch)) & \
+                    (~(table.ancestor.belongs(branch)))
+            current.db(query).delete()
+        else:
+            items.append({"tablename": tablename,
+                          "ancestor": node_id,
+                          "descendant": node_id,
+                          "depth": 0,
+                          })
+
+        for ancestor_id, depth in self.__ancestors(node_id):
+            for descendant_id, offset in subtree.items():
+                items.append({"tablename": tablename,
+                              "ancestor": ancestor_id,
+                              "descendant": descendant_id,
+                              "depth": depth + offset,
+                              })
+        if items:
+            table.bulk_insert(items)
+
+        return True
+
+    # -------------------------------------------------------------------------
+    def __prune(self, node_id):
+        """
+            Remove a leaf node from the hierarchy, and from the closure
+            index
+
+            Args:
+                node_id: the node ID
+
+            Returns:
+                True if the node has been removed, False if the node was
+                not in the hierarchy, None if it could not be removed
+                because it still has child nodes
+        """
+
+        node = self.__theset.get(node_id)
+        if node is None:
+            return False
+        if node["s"]:
+            return None
+
+        self.remove(node_id)
+        if self.__status("reindex"):
+            # Closure index will be rebuilt anyway
+            return True
+
+        table = current.s3db.s3_hierarchy_closure
+        query = (table.tablename == self.tablename) & \
+                (table.descendant == node_id)
+        current.db(query).delete()
+
+        return True
+
+    # -------------------------------------------------------------------------
+    def __subtree(self, node_id):
+        """
+            Find all descendants of a node in the full hierarchy
+
+            Args:
+                node_id: the node ID
+
+            Returns:
+                dict {node_id: depth} including the node itself at depth 0
+        """
+
+        theset = self.__theset
+
+        subtree = {node_id: 0}
+        nodes = [node_id]
+        while nodes:
+            parent_id = nodes.pop()
+            depth = subtree[parent_id] + 1
+            node = theset.get(parent_id)
+            if not node:
+                continue
+            for child_id in node["s"]:
+                if child_id not in subtree:
+                    subtree[child_id] = depth
+                    nodes.append(child_id)
+        return subtree
+
+    # -------------------------------------------------------------------------
+    def __ancestors(self, node_id):
+        """
+            Find all ancestors of a node in the full hierarchy
+
+            Args:
+                node_id: the node ID
+
+            Returns:
+                list of tuples (ancestor_id, depth), starting with the
+                parent node at depth 1
+        """
+
+        theset = self.__theset
+
+        ancestors = []
+        seen = {node_id}
+
+        node = theset.get(node_id)
+        parent_id = node["p"] if node else None
+
+        depth = 0
+        while parent_id and parent_id not in seen:
+            depth += 1
+            ancestors.append((parent_id, depth))
+            seen.add(parent_id)
+            parent = theset.get(parent_id)
+            parent_id = parent["p"] if parent else None
+
+        return ancestors
+
+    # -------------------------------------------------------------------------
+    def __rebuild_index(self):
+        """ Rebuild the closure index for this hierarchy """
+
+        tablename = self.tablename
+        table = current.s3db.s3_hierarchy_closure
+
+        current.db(table.tablename == tablename).delete()
+
+        items = []
+        append = items.append
+        ancestors = self.__ancestors
+        for node_id in self.__theset:
+            append({"tablename": tablename,
+                    "ancestor": node_id,
+                    "descendant": node_id,
+                    "depth": 0,
+                    })
+            for ancestor_id, depth in ancestors(node_id):
+                append({"tablename": tablename,
+                        "ancestor": ancestor_id,
+                        "descendant": node_id,
+                        "depth": depth,
+                        })
+        if items:
+            table.bulk_insert(items)
+
+    # -------------------------------------------------------------------------
+    def __use_index(self):
+        """
+            Check whether lookups can use the closure index rather than
+            the full hierarchy
+
+            Returns:
+                True|False
+        """
+
+        if not self.__index or self.filter is not None or \
+           self.__theset is not None:
+            return False
+
+        indexed = self.__indexed
+        if indexed is None:
+
+            indexed = False
+            tablename = self.tablename
+
+            hierarchy = current.model["hierarchies"].get(tablename)
+            if hierarchy and hierarchy["nodes"] and \
+               not hierarchy["flags"].get("dirty"):
+                # Hierarchy is loaded anyway, so use that
+                pass
+            elif self.config:
+                htable = current.s3db.s3_hierarchy
+                query = (htable.tablename == tablename)
+                row = current.db(query).select(htable.dirty,
+                                               htable.indexed,
+                                               limitby = (0, 1),
+                                               ).first()
+                if row and row.indexed and not row.dirty:
+                    indexed = True
+
+            self.__indexed = indexed
+
+        return indexed
+
+    # -------------------------------------------------------------------------
+    def __lookup(self, node_id, ancestors=False, depth=None, inclusive=False):
+        """
+            Look up ancestors or descendants of nodes in the closure index
+
+            Args:
+                node_id: the node ID (or an iterable of node IDs)
+                ancestors: look up ancestors rather than descendants
+                depth: the depth of the relationship to look up
+                inclusive: include the node(s) themselves
+
+            Returns:
+                list of node IDs, ancestors ordered from the root
+        """
+
+        table = current.s3db.s3_hierarchy_closure
+
+        if ancestors:
+            key, lookup = table.descendant, table.ancestor
+        else:
+            key, lookup = table.ancestor, table.descendant
+
+        query = (table.tablename == self.tablename)
+        if isinstance(node_id, (set, list, tuple)):
+            node_ids = [n for n in node_id if n is not None]
+            if not node_ids:
+                return []
+            query &= (key.belongs(node_ids))
+        else:
+            query &= (key == node_id)
+        if depth is not None:
+            query &= (table.depth == depth)
+        elif not inclusive:
+            query &= (table.depth > 0)
+
+        rows = current.db(query).select(lookup,
+                                        orderby = ~table.depth,
+                                        )
+        return [row[lookup] for row in rows]
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def track(cls, tablename):
+        """
+            Register callbacks with a hierarchical table to update the
+            stored hierarchy incrementally whenever nodes are written,
+            takes effect when the table is instantiated (lazy tables)
+
+            Args:
+                tablename: the tablename
+
+            Note:
+                Link table hierarchies are not tracked, they must be
+                updated by the onaccept of the link table, using refresh()
+        """
+
+        config = current.s3db.get_config(tablename, "hierarchy")
+        if not config:
+            return
+        parent = config[0] if isinstance(config, tuple) else config
+        if parent and "." in parent:
+            return
+
+        db = current.db
+        if tablename not in db.tables:
+            return
+
+        lazy = db._LAZY_TABLES.get(tablename) if db._lazy_tables else None
+        if lazy:
+            # Register when the table gets instantiated
+            kwargs = lazy[2]
+            on_define = kwargs.get("on_define")
+            def define(table):
+                if on_define:
+                    on_define(table)
+                cls.__register(table)
+            kwargs["on_define"] = define
+        else:
+            cls.__register(db[tablename])
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def __register(cls, table):
+        """
+            Register the DAL callbacks for track()
+
+            Args:
+                table: the hierarchical Table
+        """
+
+        if getattr(table, "_hierarchy_tracked", False):
+            return
+        table._hierarchy_tracked = True
+
+        tablename = table._tablename
+
+        def after_insert(row, record_id):
+            h = cls(tablename)
+            if not h.config or h.link:
+                return
+            pkey = h.pkey.name
+            if pkey == table._id.name:
+                node_id = record_id
+            else:
+                node_id = row[pkey] if pkey in row else None
+            if node_id:
+                h.refresh([node_id])
+
+        def after_update(dbset, row):
+            h = cls(tablename)
+            if not h.config or h.link:
+                return
+            pkey = h.pkey
+            keys = {pkey.name, h.fkey.name, h.ckey, "deleted"}
+            if any(fn in keys for fn in row):
+                rows = dbset.select(pkey)
+                h.refresh([r[pkey] for r in rows])
+
+        def after_delete(dbset):
+            cls.dirty(tablename)
+
+        table._after_insert.append(after_insert)
+        table._after_update.append(after_update)
+        table._after_delete.append(after_delete)
+
     # -------------------------------------------------------------------------
     def __keys(self):
         """ Introspect the key fields in the hierarchical table """
@@ -924,6 +1457,9 @@ class S3Hierarchy:
 
             # Assume self-reference
             pkey = table._id
+            self.__link = None
+            self.__lkey = None
+            self.__left = None
 
             for field in table:
                 ftype = str(field.type)
@@ -1100,6 +1636,10 @@ class S3Hierarchy:
 
         tablename = self.tablename
 
+        if not cascade:
+            # Save the stored hierarchy only once at the end
+            self.__status(defer = True)
+
         total = 0
         for node_id in node_ids:
 
@@ -1110,6 +1650,7 @@ class S3Hierarchy:
                 if result is None:
                     if not cascade:
                         current.db.rollback()
+                        self.__status(defer = None, dirty = True)
                     return None
                 else:
                     total += result
@@ -1121,15 +1662,22 @@ class S3Hierarchy:
                                              )
             success = resource.delete(cascade = True)
             if success:
-                self.remove(node_id)
+                self.refresh([node_id])
                 total += 1
             else:
                 if not cascade:
                     current.db.rollback()
+                    self.__status(defer = None, dirty = True)
                 return None
 
-        if not cascade and total:
-            self.dirty(tablename)
+        if not cascade:
+            self.__status(defer = None)
+            if self.__status("dbupdate"):
+                self.save(index = False)
+
+            # Remove subset
+            self.__roots = None
+            self.__nodes = None
 
         return total
 
@@ -1307,6 +1855,9 @@ class S3Hierarchy:
                 The child nodes as Python set
         """
 
+        if category is DEFAULT and not classify and self.__use_index():
+            return set(self.__lookup(node_id, depth=1))
+
         nodes = self.nodes
         default = set()
 
@@ -1344,6 +1895,9 @@ class S3Hierarchy:
                 The path as list, starting at the root node
         """
 
+        if category is DEFAULT and not classify and self.__use_index():
+            return self.__lookup(node_id, ancestors=True, inclusive=True)
+
         nodes = self.nodes
 
         node = nodes.get(node_id)
@@ -1485,6 +2039,9 @@ class S3Hierarchy:
                 A set of node IDs (or tuples (id, category), respectively)
         """
 
+        if category is DEFAULT and not classify and self.__use_index():
+            return set(self.__lookup(node_id, inclusive=inclusive))
+
         result = set()
         findall = self.findall
         if isinstance(node_id, (set, list, tuple)):
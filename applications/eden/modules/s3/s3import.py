@@ -64,7 +64,7 @@ from gluon import current, redirect, URL, \
 from gluon.storage import Storage, Messages
 from gluon.tools import callback, fetch
 
-from s3dal import Field
+from s3dal import Field, Row
 from .s3datetime import s3_utc
 from .s3rest import S3Method, S3Request
 from .s3resource import S3Resource
@@ -3133,6 +3133,9 @@ class S3ImportJob():
         self.items = Storage()
         self.references = []
 
+        # Prefetched duplicate indexes {(tablename, deduplicator): index}
+        self.duplicates = {}
+
         self.job_table = None
         self.item_table = None
 
@@ -3727,6 +3730,73 @@ class S3ImportJob():
             item.lock = False
         return True
 
+    # -------------------------------------------------------------------------
+    def deduplicate(self):
+        """
+            Bulk-detect duplicates for all pending items before commit,
+            using the prefetch-method of the table deduplicators (where
+            available); custom deduplicators without prefetch-method
+            will still be called for each item individually
+
+            Note:
+                the prefetched index only saves the lookup for items
+                that match an existing record; items without prefetched
+                match are still looked up individually, as the matching
+                record may have been created after the prefetch (e.g. by
+                onaccept of other items, or by other processes)
+        """
+
+        get_config = current.s3db.get_config
+
+        UID = current.xml.UID
+        synchronise_uuids = current.response.s3.synchronise_uuids
+
+        # Group pending items by table
+        pending = {}
+        for item in self.items.values():
+            if item.id or item.table is None or \
+               not item.data or item.accepted is False:
+                continue
+            if UID in item.data and not synchronise_uuids:
+                # Item will be matched by UID only
+                continue
+            tablename = item.tablename
+            if tablename in pending:
+                pending[tablename].append(item)
+            else:
+                pending[tablename] = [item]
+
+        duplicates = self.duplicates
+        for tablename, items in pending.items():
+            deduplicator = get_config(tablename, "deduplicate")
+            prefetch = getattr(deduplicator, "prefetch", None)
+            if not callable(prefetch) or (tablename, deduplicator) in duplicates:
+                continue
+            index = prefetch(items[0].table, items)
+            if index is not None:
+                duplicates[(tablename, deduplicator)] = index
+
+    # -------------------------------------------------------------------------
+    def update_duplicates(self, item):
+        """
+            Update the prefetched duplicate indexes after an item has
+            been committed
+
+            Args:
+                item: the S3ImportItem
+        """
+
+        duplicates = self.duplicates
+        if not duplicates or not item.id:
+            return
+
+        tablename = item.tablename
+        for key in list(duplicates.keys()):
+            if key[0] == tablename:
+                deduplicator = key[1]
+                if not deduplicator.update_index(duplicates[key], item):
+                    del duplicates[key]
+
     # -------------------------------------------------------------------------
     def commit(self, ignore_errors=False, log_items=None):
         """
@@ -3748,6 +3818,9 @@ class S3ImportJob():
             self.resolve(item_id, import_list)
             if item_id not in import_list:
                 import_list.append(item_id)
+        # Bulk-detect duplicates
+        self.deduplicate()
+
         # Commit the items
         items = self.items
         count = 0
@@ -3767,6 +3840,8 @@ class S3ImportJob():
             if item.accepted is not False:
                 logged = False
                 success = item.commit(ignore_errors=ignore_errors)
+                if item.committed or item.method in (METHOD.DELETE, METHOD.MERGE):
+                    self.update_duplicates(item)
             else:
                 # Field validation failed
                 logged = True
@@ -4198,6 +4273,15 @@ class S3Duplicate:
         data = item.data
         table = item.table
 
+        # Use the prefetched index, if available
+        job = getattr(item, "job", None)
+        if job is not None and job.duplicates:
+            index = job.duplicates.get((table._tablename, self))
+            if index is not None:
+                duplicate = self.resolve(item, index)
+                if duplicate:
+                    return duplicate
+
         query = None
         error = "Invalid field for duplicate detection: %s (%s)"
 
@@ -4246,6 +4330,252 @@ class S3Duplicate:
         # For uses outside of imports:
         return duplicate
 
+    # -------------------------------------------------------------------------
+    def prefetch(self, table, items, chunk_size=500):
+        """
+            Bulk-lookup duplicates for a batch of import items, so that
+            the items can be matched without a query for each of them
+
+            Args:
+                table: the Table
+                items: the S3ImportItems to match
+                chunk_size: the maximum number of keys per query
+
+            Returns:
+                a Storage {matches: {key: [(record_id, secondary)]},
+                           ids: {record_id: key},
+                           },
+                or None if the items cannot be matched in bulk
+
+            Raises:
+                SyntaxError: if any of the query fields doesn't exist
+                             in the item table
+
+            Note:
+                items with incomplete primary keys (e.g. unresolved
+                references) are not prefetched, and will be matched
+                individually during commit
+        """
+
+        error = "Invalid field for duplicate detection: %s (%s)"
+
+        primary = list(self.primary)
+        secondary = list(self.secondary)
+        for fname in primary + secondary:
+            if fname not in table.fields:
+                raise SyntaxError(error % (fname, table))
+            if not self.batchable(table[fname]):
+                return None
+
+        # Collect the distinct primary keys
+        keys = set()
+        key = self.key
+        for item in items:
+            if item.data:
+                k = key(table, item.data, primary)
+                if k is not None:
+                    keys.add(k)
+        if not keys:
+            return None
+
+        index = Storage(matches = {k: [] for k in keys},
+                        ids = {},
+                        )
+
+        db = current.db
+        fields = [table._id] + [table[fname] for fname in primary + secondary]
+        ignore_case = self.ignore_case
+
+        keys = list(keys)
+        for i in range(0, len(keys), chunk_size):
+            chunk = keys[i:i + chunk_size]
+
+            query = None
+            for j, fname in enumerate(primary):
+                field = table[fname]
+                values = set(k[j] for k in chunk)
+                if ignore_case and str(field.type) in ("string", "text"):
+                    q = field.lower().belongs(values)
+                else:
+                    q = field.belongs(values)
+                query = q if query is None else query & q
+            if self.ignore_deleted and "deleted" in table.fields:
+                query &= (table.deleted == False)
+
+            rows = db(query).select(orderby = table._id, *fields)
+            for row in rows:
+                k = key(table, row, primary)
+                matches = index.matches.get(k)
+                if matches is not None:
+                    record_id = row[table._id]
+                    matches.append((record_id, key(table, row, secondary, True)))
+                    index.ids[record_id] = k
+
+        return index
+
+    # -------------------------------------------------------------------------
+    def resolve(self, item, index):
+        """
+            Match an import item against a prefetched index
+
+            Args:
+                item: the import item
+                index: the index (as returned from prefetch)
+
+            Returns:
+                The duplicate Row if match found, False if there is no
+                match, or None if the item cannot be matched with the index
+
+            Note:
+                no match in the index does not mean that there is no
+                match at all (the record could have been created after
+                the prefetch), so the caller must fall back to a query
+        """
+
+        data = item.data
+        table = item.table
+
+        key = self.key(table, data, self.primary)
+        if key is None or key not in index.matches:
+            return None
+
+        secondary = list(self.secondary)
+        values = self.key(table, data, secondary, True)
+        if values is None:
+            return None
+
+        duplicate = False
+        for record_id, svalues in index.matches[key]:
+            if svalues is None:
+                return None
+            for i, value in enumerate(values):
+                if data.get(secondary[i]) and svalues[i] != value:
+                    break
+            else:
+                duplicate = Row({table._id.name: record_id})
+                break
+
+        if duplicate:
+            # Match found: Update import item
+            item.id = duplicate[table._id]
+            if not data.deleted:
+                item.method = item.METHOD.UPDATE
+            if self.noupdate:
+                item.skip = True
+
+        return duplicate
+
+    # -------------------------------------------------------------------------
+    def update_index(self, index, item):
+        """
+            Update a prefetched index after an item has been committed,
+            so that subsequent items can be matched against records
+            created or changed by the same import job
+
+            Args:
+                index: the index (as returned from prefetch)
+                item: the committed import item
+
+            Returns:
+                False if the index can no longer be used, otherwise True
+        """
+
+        table = item.table
+        record_id = item.id
+        keys = index.matches
+
+        key = self.key(table, item.data, self.primary)
+        METHOD = item.METHOD
+
+        if item.method == METHOD.CREATE:
+            if key is None:
+                # Unknown key => can't tell which entries are affected
+                return False
+            matches = keys.get(key)
+            if matches is not None:
+                svalues = self.key(table, item.data, list(self.secondary), True)
+                matches.append((record_id, svalues))
+                index.ids[record_id] = key
+
+        elif item.method == METHOD.UPDATE:
+            # Invalidate the entries for both the previous and the
+            # new key => these will be matched individually again
+            for k in (index.ids.get(record_id), key):
+                if k is not None and k in keys:
+                    for match in keys.pop(k):
+                        index.ids.pop(match[0], None)
+
+        else:
+            # Deleted or merged
+            return False
+
+        return True
+
+    # -------------------------------------------------------------------------
+    def key(self, table, data, fields, partial=False):
+        """
+            Helper function to generate a normalized key from the values
+            of the given fields, for bulk-matching
+
+            Args:
+                table: the Table
+                data: the data (dict or Row)
+                fields: list of field names
+                partial: allow missing values (replaced by None)
+
+            Returns:
+                a tuple of normalized values, or None if any value is
+                missing or cannot be normalized
+        """
+
+        key = []
+        ignore_case = self.ignore_case
+
+        for fname in fields:
+            value = data.get(fname)
+            if value is None:
+                if partial:
+                    key.append(None)
+                    continue
+                return None
+
+            ftype = str(table[fname].type)
+            if ftype in ("string", "text"):
+                value = s3_str(value)
+                if ignore_case:
+                    value = value.lower()
+            elif ftype == "boolean":
+                value = bool(value)
+            elif ftype == "date":
+                if type(value) is not datetime.date:
+                    return None
+            else:
+                try:
+                    value = int(value)
+                except (ValueError, TypeError):
+                    return None
+            key.append(value)
+
+        return tuple(key)
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def batchable(field):
+        """
+            Check whether values of a field can be matched in bulk
+
+            Args:
+                field: the Field
+
+            Returns:
+                True|False
+        """
+
+        ftype = str(field.type)
+
+        return ftype in ("id", "string", "text", "integer", "bigint", "boolean", "date") or \
+               ftype[:10] == "reference "
+
     # -------------------------------------------------------------------------
     def match(self, field, value):
         """
@@ -29,8 +29,12 @@
 
 __all__ = ("S3Model",
            #"S3DynamicModel",
+           "S3IndexAdvisor",
            )
 
+import hashlib
+import re
+
 from collections import OrderedDict
 
 from gluon import current, IS_EMPTY_OR, IS_FLOAT_IN_RANGE, IS_INT_IN_RANGE, \
@@ -71,6 +75,10 @@ class S3Model:
     LOAD = "s3_model_load"
     DELETED = "deleted"
 
+    # Per-process index of the names defined in model modules,
+    # {prefix: (module, names, generic, globals)}, see names_index
+    INDEX = {}
+
     def __init__(self, module=None):
 
         self.cache = (current.cache.ram, 60)
@@ -248,64 +256,32 @@ class S3Model:
             except AttributeError:
                 pass
 
-        elif hasattr(models, prefix):
-            module = models.__dict__[prefix]
-
-            names = module.__all__
-            s3models = module.__dict__
-
-            if not db_only and tablename in names:
-                # A name defined at module level (e.g. a class)
-                s3db.classes[tablename] = (prefix, tablename)
-                found = s3models[tablename]
-            else:
-                # A name defined in an S3Model
-                generic = []
-                loaded = False
-                for n in names:
-                    model = s3models[n]
-                    if hasattr(model, "_s3model"):
-                        if hasattr(model, "names"):
-                            if tablename in model.names:
-                                model(prefix)
-                                loaded = True
-                                break
-                        else:
-                            generic.append(n)
-                if not loaded:
-                    for n in generic:
-                        s3models[n](prefix)
-
         else:
-            custom_models = current.deployment_settings.get_base_custom_models()
-            if prefix in custom_models:
-                # Use Web2Py's Custom Importer rather than importlib.import_module
-                parent = __import__("templates.%s" % custom_models[prefix], fromlist=[prefix])
-                module = parent.__dict__[prefix]
-                models.__dict__[prefix] = module
-
-                names = module.__all__
+            if hasattr(models, prefix):
+                module = models.__dict__[prefix]
+            else:
+                module = None
+                custom_models = current.deployment_settings.get_base_custom_models()
+                if prefix in custom_models:
+                    # Use Web2Py's Custom Importer rather than importlib.import_module
+                    parent = __import__("templates.%s" % custom_models[prefix], fromlist=[prefix])
+                    module = parent.__dict__[prefix]
+                    models.__dict__[prefix] = module
+
+            if module is not None:
+                names, generic, exported = cls.names_index(prefix, module)
                 s3models = module.__dict__
 
-                if not db_only and tablename in names:
+                if not db_only and tablename in exported:
                     # A name defined at module level (e.g. a class)
                     s3db.classes[tablename] = (prefix, tablename)
                     found = s3models[tablename]
                 else:
                     # A name defined in an S3Model
-                    generic = []
-                    loaded = False
-                    for n in names:
-                        model = s3models[n]
-                        if hasattr(model, "_s3model"):
-                            if hasattr(model, "names"):
-                                if tablename in model.names:
-                                    model(prefix)
-                                    loaded = True
-                                    break
-                            else:
-                                generic.append(n)
-                    if not loaded:
+                    n = names.get(tablename)
+                    if n:
+                        s3models[n](prefix)
+                    else:
                         for n in generic:
                             s3models[n](prefix)
 
@@ -324,6 +300,47 @@ class S3Model:
         else:
             return default
 
+    # -------------------------------------------------------------------------
+    @classmethod
+    def names_index(cls, prefix, module):
+        """
+            Look up the names defined by the models in a module; the index
+            is built once per process (and again if the module is reloaded)
+
+            Args:
+                prefix: the module prefix
+                module: the module
+
+            Returns:
+                tuple (names, generic, exported):
+                    - names: dict {name: name of the model class defining it}
+                    - generic: names of the model classes which do not
+                               declare their names
+                    - exported: set of all names exported by the module
+        """
+
+        index = cls.INDEX.get(prefix)
+        if index is None or index[0] is not module:
+
+            names = {}
+            generic = []
+
+            exported = module.__all__
+            s3models = module.__dict__
+            for n in exported:
+                model = s3models[n]
+                if hasattr(model, "_s3model"):
+                    if hasattr(model, "names"):
+                        for name in model.names:
+                            if name not in names:
+                                names[name] = n
+                    else:
+                        generic.append(n)
+
+            index = cls.INDEX[prefix] = (module, names, generic, set(exported))
+
+        return index[1:]
+
     # -------------------------------------------------------------------------
     @classmethod
     def get(cls, name, default=None):
@@ -463,8 +480,8 @@ class S3Model:
         s3.all_models_loaded = True
 
     # -------------------------------------------------------------------------
-    @staticmethod
-    def define_table(tablename, *fields, **args):
+    @classmethod
+    def define_table(cls, tablename, *fields, **args):
         """
             Same as db.define_table except that it does not repeat
             a table definition if the table is already defined.
@@ -474,6 +491,18 @@ class S3Model:
         if hasattr(db, tablename):
             table = getattr(db, tablename)
         else:
+            # Invalidate shared representations upon updates/deletes,
+            # and cached map tiles upon any writes
+            from .s3fields import S3Represent
+            from .s3gis import S3MapTiles
+            on_define = args.get("on_define")
+            def define(table):
+                S3Represent.track(table)
+                S3MapTiles.track(table)
+                if on_define:
+                    on_define(table)
+            args["on_define"] = define
+
             table = db.define_table(tablename, *fields, **args)
         return table
 
@@ -536,6 +565,12 @@ class S3Model:
         if tn not in config:
             config[tn] = {}
         config[tn].update(attr)
+
+        if attr.get("hierarchy"):
+            # Maintain the stored hierarchy incrementally
+            from .s3hierarchy import S3Hierarchy
+            S3Hierarchy.track(tn)
+
         return
 
     # -------------------------------------------------------------------------
@@ -579,6 +614,116 @@ class S3Model:
                 for k in keys:
                     table_config.pop(k, None)
 
+    # -------------------------------------------------------------------------
+    @classmethod
+    def index_definitions(cls, tablename):
+        """
+            Get the database indexes declared for a table, as
+            configure(tablename, indexes=[...]), where each item is
+                - a field name
+                - a tuple of field names (composite index)
+                - a dict {"fields": (field names),
+                          "name": index name (optional),
+                          "unique": True|False,
+                          "where": Query or function(table) returning
+                                   a Query for a partial index
+                          }
+
+            Args:
+                tablename: the table name
+
+            Returns:
+                list of index definitions for Table.migrate_indexes
+        """
+
+        indexes = cls.get_config(tablename, "indexes")
+        if not indexes:
+            return []
+
+        table = current.db[tablename]
+
+        definitions = []
+        for index in indexes:
+            if isinstance(index, dict):
+                definition = dict(index)
+            else:
+                definition = {"fields": index}
+            fields = definition["fields"]
+            if isinstance(fields, str):
+                fields = definition["fields"] = (fields,)
+
+            name = definition.get("name")
+            if not name:
+                name = "%s_%s__idx" % (tablename, "_".join(fields))
+                if len(name) > 60:
+                    # Exceeds the identifier length of MySQL/PostgreSQL
+                    digest = hashlib.md5(name.encode("utf-8")).hexdigest()
+                    name = "%s_%s__idx" % (name[:48], digest[:6])
+                definition["name"] = name
+
+            where = definition.get("where")
+            if callable(where):
+                definition["where"] = where(table)
+            definitions.append(definition)
+
+        return definitions
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def migrate_indexes(cls, tablename):
+        """
+            Create, re-create or drop the database indexes of a table to
+            match its configured indexes
+
+            Args:
+                tablename: the table name
+
+            Returns:
+                list of names of the indexes that have been created
+
+            Note:
+                commits each index, so this must not be used during
+                requests but only from zzz_1st_run.py and
+                static/scripts/tools/indexes.py (=migrate_all_indexes)
+        """
+
+        db = current.db
+        if tablename not in db:
+            return []
+        table = db[tablename]
+
+        indexes = cls.index_definitions(tablename)
+
+        # The previously created indexes are recorded by the migrator,
+        # so only changes get applied (or all indexes are dropped if
+        # none are declared any more)
+        fake_migrate = current.deployment_settings.get_base_fake_migrate()
+        return table.migrate_indexes(indexes, fake_migrate=fake_migrate)
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def migrate_all_indexes(cls):
+        """
+            Create, re-create or drop the database indexes of all tables
+            to match their configured indexes, see migrate_indexes
+
+            Returns:
+                dict {tablename: [names of the indexes that have been created]}
+        """
+
+        cls.load_all_models()
+
+        db = current.db
+        get_config = cls.get_config
+
+        created = {}
+        for tablename in db.tables:
+            if get_config(tablename, "indexes"):
+                names = cls.migrate_indexes(tablename)
+                if names:
+                    created[tablename] = names
+        return created
+
     # -------------------------------------------------------------------------
     @classmethod
     def add_custom_callback(cls, tablename, hook, cb, method=None):
@@ -2536,4 +2681,238 @@ class S3DynamicModel:
 
         return field
 
+# =============================================================================
+class S3IndexAdvisor:
+    """
+        Helper to suggest missing database indexes from a log of SQL
+        queries, e.g. a PostgreSQL server log with log_min_duration_statement
+        or the statements collected in db._timings
+
+        Usage (see static/scripts/tools/index_advisor.py):
+
+            advisor = S3IndexAdvisor()
+            advisor.read("/var/log/postgresql/postgresql-main.log")
+            for line in advisor.report():
+                print(line)
+    """
+
+    # Statement and duration in a PostgreSQL log line
+    PGLOG = re.compile(r"duration: ([0-9.]+) ms\s+(?:statement|execute [^:]*): (.*)$")
+
+    # String literals (removed before parsing)
+    LITERAL = re.compile(r"'(?:[^']|'')*'")
+
+    # Columns compared in WHERE or JOIN conditions
+    LEFT = re.compile(r'"?([A-Za-z_]\w*)"?\."?([A-Za-z_]\w*)"?\s*'
+                      r'(?:=|<>|!=|<=|>=|<|>|\bIN\b|\bIS\b|\bI?LIKE\b|\bBETWEEN\b)',
+                      re.I)
+    RIGHT = re.compile(r'(?:=|<>|!=|<=|>=|<|>)\s*"?([A-Za-z_]\w*)"?\."?([A-Za-z_]\w*)"?')
+
+    # Table aliases
+    ALIAS = re.compile(r'"?([A-Za-z_]\w*)"?\s+AS\s+"?([A-Za-z_]\w*)"?', re.I)
+
+    # Columns that are never worth an index of their own
+    SKIP = ("id", S3Model.DELETED)
+
+    def __init__(self):
+
+        # {(tablename, fieldname): [number of statements, duration (ms)]}
+        self.columns = {}
+        self.statements = 0
+
+    # -------------------------------------------------------------------------
+    def read(self, source):
+        """
+            Parse a query log
+
+            Args:
+                source: the file name, or a file-like object or any other
+                        iterable of lines, either plain SQL statements
+                        (one per line) or PostgreSQL log lines
+        """
+
+        if isinstance(source, str):
+            with open(source, "r") as log:
+                self.read(log)
+            return
+
+        pglog = self.PGLOG
+        for line in source:
+            match = pglog.search(line)
+            if match:
+                self.add(match.group(2), duration=float(match.group(1)))
+            else:
+                self.add(line)
+
+    # -------------------------------------------------------------------------
+    def add(self, sql, duration=None):
+        """
+            Add a statement
+
+            Args:
+                sql: the SQL statement
+                duration: the duration of the statement (in milliseconds)
+        """
+
+        sql = sql.strip()
+        if not sql.upper().startswith(("SELECT", "UPDATE", "DELETE", "WITH")):
+            return
+        sql = self.LITERAL.sub("?", sql)
+
+        aliases = dict((alias, tablename)
+                       for tablename, alias in self.ALIAS.findall(sql))
+
+        found = set()
+        for expr in (self.LEFT, self.RIGHT):
+            for tablename, fieldname in expr.findall(sql):
+                if fieldname in self.SKIP:
+                    continue
+                found.add((aliases.get(tablename, tablename), fieldname))
+        if not found:
+            return
+
+        self.statements += 1
+        columns = self.columns
+        for column in found:
+            if column in columns:
+                stats = columns[column]
+            else:
+                stats = columns[column] = [0, 0.0]
+            stats[0] += 1
+            if duration:
+                stats[1] += duration
+
+    # -------------------------------------------------------------------------
+    def suggest(self, min_count=1):
+        """
+            Get the columns that are used in query conditions, but not
+            indexed (neither in the database nor in the model)
+
+            Args:
+                min_count: the minimum number of statements using a column
+
+            Returns:
+                list of Storage(tablename, fieldname, count, duration, reference),
+                most expensive first
+        """
+
+        db = current.db
+
+        indexed = {}
+        suggestions = []
+        for (tablename, fieldname), (count, duration) in self.columns.items():
+            if count < min_count:
+                continue
+
+            reference = False
+            if tablename in db:
+                table = db[tablename]
+                if fieldname not in table.fields:
+                    continue
+                ftype = str(table[fieldname].type)
+                if ftype == "boolean":
+                    # Not selective enough
+                    continue
+                reference = ftype[:9] == "reference"
+
+            if tablename not in indexed:
+                indexed[tablename] = self.indexed(tablename)
+            if fieldname in indexed[tablename]:
+                continue
+
+            suggestions.append(Storage(tablename = tablename,
+                                       fieldname = fieldname,
+                                       count = count,
+                                       duration = duration,
+                                       reference = reference,
+                                       ))
+
+        suggestions.sort(key=lambda s: (s.duration, s.count), reverse=True)
+        return suggestions
+
+    # -------------------------------------------------------------------------
+    def report(self, min_count=1):
+        """
+            Get a human-readable list of suggestions
+
+            Args:
+                min_count: the minimum number of statements using a column
+
+            Returns:
+                list of lines (strings)
+        """
+
+        suggestions = self.suggest(min_count=min_count)
+        if not suggestions:
+            return ["No missing indexes found in %s statements" % self.statements]
+
+        output = []
+        tables = OrderedDict()
+        for s in suggestions:
+            output.append("%s.%s: %s statements, %.1f ms%s" % \
+                          (s.tablename,
+                           s.fieldname,
+                           s.count,
+                           s.duration,
+                           " (foreign key)" if s.reference else "",
+                           ))
+            tables.setdefault(s.tablename, []).append(s.fieldname)
+
+        output.append("")
+        output.append("Suggested index declarations:")
+        for tablename, fieldnames in tables.items():
+            output.append('configure("%s", indexes=%s)' % (tablename, fieldnames))
+
+        return output
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def indexed(tablename):
+        """
+            Get the leading columns of the existing (or declared) indexes
+            of a table
+
+            Args:
+                tablename: the table name
+
+            Returns:
+                set of field names
+        """
+
+        db = current.db
+
+        indexed = set()
+        if tablename in db:
+            for index in S3Model.index_definitions(tablename):
+                indexed.add(index["fields"][0])
+
+        engine = db._adapter.dbengine
+        try:
+            if engine == "sqlite":
+                for row in db.executesql('PRAGMA index_list("%s");' % tablename):
+                    info = db.executesql('PRAGMA index_info("%s");' % row[1])
+                    indexed |= set(r[2] for r in info if r[0] == 0)
+            elif engine == "postgres":
+                rows = db.executesql("SELECT a.attname FROM pg_index i "
+                                     "JOIN pg_class c ON c.oid=i.indrelid "
+                                     "JOIN pg_attribute a ON a.attrelid=c.oid "
+                                     "AND a.attnum=i.indkey[0] "
+                                     "WHERE c.relname=%s;",
+                                     placeholders = (tablename,),
+                                     )
+                indexed |= set(row[0] for row in rows)
+            elif engine == "mysql":
+                rows = db.executesql("SELECT column_name "
+                                     "FROM information_schema.statistics "
+                                     "WHERE table_schema=DATABASE() "
+                                     "AND table_name=%s AND seq_in_index=1;",
+                                     placeholders = (tablename,),
+                                     )
+                indexed |= set(row[0] for row in rows)
+        except Exception:
+            # Unknown table or no access to the catalog
+            db.rollback()
+
+        return indexed
+
 # END =========================================================================
@@ -1671,12 +1671,12 @@ class S3ResourceQuery:
         tablename = l.tablename
 
         # Connect to the hierarchy
-        hierarchy = S3Hierarchy(tablename)
+        hierarchy = S3Hierarchy(tablename, index=True)
         if hierarchy.config is None:
             # Reference to a hierarchical table?
             ktablename, key = s3_get_foreign_key(l)[:2]
             if ktablename:
-                hierarchy = S3Hierarchy(ktablename)
+                hierarchy = S3Hierarchy(ktablename, index=True)
         else:
             key = None
 
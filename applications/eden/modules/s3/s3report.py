@@ -51,7 +51,7 @@ from gluon.sqlhtml import OptionsWidget
 from gluon.storage import Storage
 from gluon.validators import IS_IN_SET, IS_EMPTY_OR
 
-from .s3query import FS
+from .s3query import FS, S3Joins
 from .s3rest import CONTENT_TYPES, S3Method
 from .s3utils import s3_flatlist, s3_has_foreign_key, s3_str, S3MarkupStripper, s3_represent_value
 from .s3xml import S3XMLFormat
@@ -1826,6 +1826,11 @@ class S3PivotTable:
 
         self.values = {}
 
+        self.numrecords = None
+        """ The total number of records, if the pivot table has been
+            aggregated in the database (self.records is None then)
+        """
+
         # Get the fields ------------------------------------------------------
         #
         tablename = resource.tablename
@@ -1854,6 +1859,12 @@ class S3PivotTable:
                 if axis in exclude_empty:
                     resource.add_filter(FS(axis) != None)
 
+        # Aggregate in the database where possible ----------------------------
+        #
+        if current.deployment_settings.get_ui_report_aggregate() and \
+           self._aggregate():
+            return
+
         # Retrieve the records ------------------------------------------------
         #
         data = resource.select(list(self.rfields.keys()), limit=None)
@@ -1936,7 +1947,7 @@ class S3PivotTable:
 
         items = self.records
         if items is None:
-            return 0
+            return self.numrecords or 0
         else:
             return len(self.records)
 
@@ -2774,6 +2785,305 @@ class S3PivotTable:
                                           )
         self.values[layer] = all_values
 
+    # -------------------------------------------------------------------------
+    def _aggregate(self):
+        """
+            Compute cells, headers and totals with a GROUP BY query in
+            the database instead of extracting and pivoting all records
+            in Python; only possible if the axes and facts are real fields
+            in the master table or in tables referenced by it (no virtual
+            fields, no list types, no component fields), and no fact uses
+            the "list" method
+
+            Returns:
+                True if the pivot table has been computed, False if the
+                caller needs to fall back to the Python pivot
+
+            Note:
+                the cells, rows and columns do not carry record IDs in
+                this case, i.e. pivot table cells can not be explored
+        """
+
+        resource = self.resource
+
+        rfields = self.rfields
+        rows, cols = self.rows, self.cols
+
+        aggregatable = self.aggregatable
+
+        # Check the axes
+        axes = []
+        for selector in (rows, cols):
+            if not selector:
+                axes.append(None)
+                continue
+            rfield = rfields.get(selector)
+            if not rfield or not aggregatable(resource, rfield):
+                return False
+            axes.append(rfield)
+
+        # Check the facts
+        NUMERIC = ("integer", "bigint", "double", "id")
+        for fact in self.facts:
+            method = fact.method
+            if method not in ("count", "sum", "avg", "min", "max"):
+                return False
+            rfield = rfields.get(fact.selector)
+            if not rfield or not aggregatable(resource, rfield):
+                return False
+            if method != "count" and rfield.ftype not in NUMERIC:
+                # Python aggregation ignores non-numeric values
+                return False
+
+        query = self.aggregate_query(resource)
+        if query is None:
+            return False
+
+        db = current.db
+        table = resource.table
+        tablename = table._tablename
+
+        # Joins for axes and facts
+        joins = S3Joins(tablename)
+        for rfield in axes:
+            if rfield:
+                joins.extend(rfield.left)
+        for fact in self.facts:
+            joins.extend(rfields[fact.selector].left)
+
+        # Aggregate expressions
+        count = table._id.count()
+        expressions = [count]
+        aggregates = []
+        for fact in self.facts:
+            field = rfields[fact.selector].field
+            method = fact.method
+            if method == "count":
+                items = (field.count(distinct=True),)
+            elif method in ("sum", "avg"):
+                items = (field.sum(), field.count())
+            elif method == "min":
+                items = (field.min(),)
+            else:
+                items = (field.max(),)
+            aggregates.append(items)
+            expressions.extend(items)
+
+        groupby = [rfield.field for rfield in axes if rfield]
+        data = db(query).select(*(groupby + expressions),
+                                groupby = groupby,
+                                left = joins.as_list(),
+                                )
+        if not data:
+            self.empty = True
+            self.numrecords = 0
+            return True
+
+        # Collect the partial aggregates per cell
+        rfield_rows, rfield_cols = axes
+        rvalues, cvalues = {}, {}
+        partials = {}
+        numrecords = 0
+        for row in data:
+
+            rvalue = rfield_rows.extract(row) if rfield_rows else None
+            if rvalue not in rvalues:
+                rvalues[rvalue] = len(rvalues)
+            cvalue = rfield_cols.extract(row) if rfield_cols else None
+            if cvalue not in cvalues:
+                cvalues[cvalue] = len(cvalues)
+
+            values = []
+            for fact, items in zip(self.facts, aggregates):
+                value = [self._number(row[item], rfields[fact.selector].ftype)
+                         for item in items]
+                values.append(value[0] if len(value) == 1 else value)
+            partials[(rvalues[rvalue], cvalues[cvalue])] = values
+            numrecords += row[count]
+
+        self.numrecords = numrecords
+
+        # Initialize columns and rows
+        if cols:
+            self.col = [Storage({"value": v}) for v in cvalues]
+        else:
+            self.col = [Storage({"value": None})]
+        self.numcols = numcols = len(self.col)
+
+        if rows:
+            self.row = [Storage({"value": v}) for v in rvalues]
+        else:
+            self.row = [Storage({"value": None})]
+        self.numrows = numrows = len(self.row)
+
+        self.cell = [[Storage(records=[]) for c in range(numcols)]
+                     for r in range(numrows)]
+        for header in self.row + self.col:
+            header.records = []
+
+        # Add the layers
+        combine = self._combine
+        for index, fact in enumerate(self.facts):
+
+            layer = fact.layer
+            method = fact.method
+            precision = self.precision.get(fact.selector)
+
+            row_values = [[] for r in range(numrows)]
+            col_values = [[] for c in range(numcols)]
+            for r in range(numrows):
+                for c in range(numcols):
+                    values = partials.get((r, c))
+                    value = [values[index]] if values else []
+                    self.cell[r][c][layer] = combine(method, value, precision)
+                    row_values[r].extend(value)
+                    col_values[c].extend(value)
+
+            for r in range(numrows):
+                self.row[r][layer] = combine(method, row_values[r], precision)
+            for c in range(numcols):
+                self.col[c][layer] = combine(method, col_values[c], precision)
+
+            all_values = [values[index] for values in partials.values()]
+            self.totals[layer] = combine(method, all_values, precision)
+            self.values[layer] = []
+
+        return True
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def aggregate_query(resource):
+        """
+            Get the filter query of a resource for aggregate queries, with
+            filter joins resolved into a subquery of master record IDs (so
+            that they can not multiply the master records)
+
+            Args:
+                resource: the S3Resource
+
+            Returns:
+                the Query, or None if the resource is a component or has
+                filters that can only be applied in Python (virtual or
+                extra filters)
+        """
+
+        if resource.parent or resource.linked:
+            return None
+
+        query = resource.get_query()
+        rfilter = resource.rfilter
+        if resource.get_filter() is not None or rfilter.get_extra_filters():
+            return None
+
+        table = resource.table
+        tablename = table._tablename
+
+        ijoins = S3Joins(tablename, rfilter.get_joins(left=False))
+        ljoins = S3Joins(tablename, rfilter.get_joins(left=True))
+        if ijoins or ljoins:
+            subquery = current.db(query)._select(table._id,
+                                                 join = ijoins.as_list(prefer=ljoins),
+                                                 left = ljoins.as_list(),
+                                                 )
+            query = table._id.belongs(subquery)
+
+        return query
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def aggregatable(resource, rfield):
+        """
+            Check whether a report field can be grouped or aggregated
+            in the database, i.e. whether it is a real, non-list field
+            which has at most one value per master record
+
+            Args:
+                resource: the S3Resource
+                rfield: the S3ResourceField
+        """
+
+        if rfield.field is None or rfield.ftype[:5] == "list:":
+            return False
+
+        context = resource.get_config("context")
+
+        selector = rfield.selector
+        while True:
+            head, tail = (selector.split("$", 1) + [None])[:2]
+            if "." in head:
+                alias, head = head.split(".", 1)
+                if alias not in ("~", resource.alias):
+                    # Component field
+                    return False
+            if head[:1] == "(" and head[-1:] == ")":
+                # Context selector => check the context path
+                expression = context.get(head[1:-1]) if context else None
+                if not isinstance(expression, str):
+                    return False
+                selector = "%s$%s" % (expression, tail) if tail else expression
+                continue
+            # Must only traverse foreign keys after the master table
+            return tail is None or "." not in tail and "(" not in tail
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def _number(value, ftype):
+        """
+            Convert an aggregate value returned by the database into the
+            Python type the Python pivot would produce for the field type
+
+            Args:
+                value: the value
+                ftype: the field type
+        """
+
+        if value is None or isinstance(value, (int, float)):
+            return value
+        try:
+            return float(value) if ftype == "double" else int(value)
+        except (TypeError, ValueError):
+            return value
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def _combine(method, values, precision=None):
+        """
+            Combine partial aggregates (as returned by the GROUP BY query)
+            into a cell value or total, using the same semantics as
+            S3PivotTableFact.compute
+
+            Args:
+                method: the aggregation method
+                values: the partial aggregates, i.e. numbers for "count",
+                        "min" and "max", lists [sum, number] for "sum"
+                        and "avg"
+                precision: limit the precision of the result to this
+                           number of decimals
+        """
+
+        if method == "count":
+            return sum(values)
+
+        if method in ("sum", "avg"):
+            total = sum(v[0] for v in values if v[0] is not None)
+            if method == "sum":
+                result = total
+            else:
+                number = sum(v[1] for v in values)
+                if not number:
+                    return 0.0
+                result = total / float(number)
+        else:
+            values = [v for v in values if v is not None]
+            if not values:
+                return None
+            result = min(values) if method == "min" else max(values)
+
+        if type(result) is float and precision is not None:
+            return round(result, precision)
+        else:
+            return result
+
     # -------------------------------------------------------------------------
     def _get_fields(self, fields=None):
         """
@@ -42,6 +42,7 @@ import sys
 from functools import reduce
 from io import StringIO
 from itertools import chain
+from operator import itemgetter
 
 try:
     from lxml import etree
@@ -537,6 +538,114 @@ class S3Resource:
         else:
             return data
 
+    # -------------------------------------------------------------------------
+    def iterselect(self,
+                   fields,
+                   chunksize = 1000,
+                   start = 0,
+                   limit = None,
+                   left = None,
+                   virtual = True,
+                   as_rows = False,
+                   represent = False,
+                   show_links = True,
+                   raw_data = False,
+                   ):
+        """
+            Extract data from this resource in chunks, to process large
+            numbers of records with constant memory use
+
+            Args:
+                fields: the fields to extract (selector strings)
+                chunksize: the maximum number of records per chunk
+                start: index of the first record
+                limit: maximum number of records
+                left: additional left joins required for filters
+                virtual: include mandatory virtual fields
+                as_rows: return the rows (don't extract)
+                represent: render field value representations
+                show_links: render links in representations
+                raw_data: include raw data in the result
+
+            Returns:
+                generator of S3ResourceData (or Rows if as_rows=True),
+                one per chunk
+
+            Note:
+                Records are extracted in primary key order, each chunk
+                continuing after the last record ID of the previous one
+                (rather than using an offset), so that every chunk is a
+                range query of similar cost
+            Note:
+                With virtual or extra filters, the matching records can
+                only be determined for the whole set, so those are
+                extracted in a single chunk
+        """
+
+        table = self.table
+        orderby = table._id
+
+        if self.rfilter is None:
+            self.build_query()
+        rfilter = self.rfilter
+
+        self.get_query()
+        if rfilter.get_filter() or rfilter.get_extra_filters():
+            data = self.select(fields,
+                               start = start,
+                               limit = limit,
+                               left = left,
+                               orderby = orderby,
+                               virtual = virtual,
+                               as_rows = as_rows,
+                               represent = represent,
+                               show_links = show_links,
+                               raw_data = raw_data,
+                               )
+            yield data
+            return
+
+        queries = rfilter.queries
+        last_id = None
+        remaining = limit
+        while remaining is None or remaining > 0:
+
+            size = chunksize if remaining is None else min(chunksize, remaining)
+
+            # Continue after the last record of the previous chunk
+            if last_id is not None:
+                queries.append(table._id > last_id)
+                rfilter.query = None
+            try:
+                data = S3ResourceData(self,
+                                      fields,
+                                      start = start,
+                                      limit = size,
+                                      left = left,
+                                      orderby = orderby,
+                                      virtual = virtual,
+                                      as_rows = as_rows,
+                                      represent = represent,
+                                      show_links = show_links,
+                                      raw_data = raw_data,
+                                      )
+            finally:
+                if last_id is not None:
+                    queries.pop()
+                    rfilter.query = None
+
+            page = data.page
+            if not page:
+                break
+            yield data.rows if as_rows else data
+            if len(page) < size:
+                break
+
+            last_id = page[-1]
+            start = 0
+            if remaining is not None:
+                remaining -= len(page)
+
     # -------------------------------------------------------------------------
     def insert(self, **fields):
         """
@@ -5015,6 +5124,13 @@ class S3ResourceData:
                     vf = table.virtualfields
                     osetattr(table, "virtualfields", [])
 
+                # Parse column-wise unless we return the Rows
+                attributes = {}
+                if not as_rows and not groupby:
+                    processor = self.processor()
+                    if processor:
+                        attributes["processor"] = processor
+
                 rows = db(master_query).select(join = master_ijoins,
                                                left = master_ljoins,
                                                distinct = distinct,
@@ -5023,7 +5139,8 @@ class S3ResourceData:
                                                limitby = limitby,
                                                orderby_on_limitby = orderby_on_limitby,
                                                cacheable = not as_rows,
-                                               *list(qfields.values()))
+                                               *list(qfields.values()),
+                                               **attributes)
 
                 # Restore virtual fields
                 if not virtual:
@@ -5189,6 +5306,9 @@ class S3ResourceData:
 
             self.rows = [results[record_id] for record_id in page]
 
+        # The IDs of the extracted records, in order
+        self.page = page
+
         if rname:
             # Restore referee name
             db._referee_name = rname
@@ -5682,10 +5802,15 @@ class S3ResourceData:
         # Retrieve the subtable rows
         # - can't use distinct with native JSON fields
         distinct = not any(f.type == "json" for f in sfields)
+        attributes = {}
+        processor = self.processor()
+        if processor:
+            attributes["processor"] = processor
         rows = current.db(query).select(left = sjoins,
                                         distinct = distinct,
                                         cacheable = True,
-                                        *sfields)
+                                        *sfields,
+                                        **attributes)
 
         # Extract and merge the data
         records = self.extract(rows,
@@ -5736,8 +5861,15 @@ class S3ResourceData:
                     return ogetattr(row, f)
             return getter
 
-        getkey = get(pkey)
-        getval = [get(c) for c in columns]
+        data = self.columns(rows, [pkey] + columns)
+        if data is not None:
+            # Columnar rows => iterate over the column values instead
+            rows = zip(*data)
+            getkey = itemgetter(0)
+            getval = [itemgetter(i + 1) for i in range(len(columns))]
+        else:
+            getkey = get(pkey)
+            getval = [get(c) for c in columns]
 
         from itertools import groupby
         for k, g in groupby(rows, key=getkey):
@@ -5955,15 +6087,61 @@ class S3ResourceData:
         x = set()
         seen = x.add
 
+        data = S3ResourceData.columns(rows, [pkey])
+        if data is not None:
+            # Columnar rows
+            rows = data[0]
+            getkey = lambda row_id: row_id
+        else:
+            getkey = lambda row: row[pkey]
+
         result = []
         append = result.append
         for row in rows:
-            row_id = row[pkey]
+            row_id = getkey(row)
             if row_id not in x:
                 seen(row_id)
                 append(row_id)
         return result
 
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def processor():
+        """
+            The processor to parse the rows of internal queries, if
+            configured to parse column-wise
+
+            Returns:
+                the processor (for select), or None for the default
+        """
+
+        if not current.deployment_settings.get_base_columnar_select():
+            return None
+        return getattr(current.db._adapter, "parse_columns", None)
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def columns(rows, colnames):
+        """
+            Get the values of columns from columnar Rows, without building
+            the Row objects
+
+            Args:
+                rows: the Rows
+                colnames: the column names
+
+            Returns:
+                list of lists of column values, or None if the Rows are not
+                columnar or do not contain all the columns
+        """
+
+        if getattr(rows, "columns", None) is None:
+            return None
+        available = rows.colnames
+        if not all(colname in available for colname in colnames):
+            return None
+        return [rows.column(colname) for colname in colnames]
+
     # -------------------------------------------------------------------------
     @staticmethod
     def getrows(rows, ids, pkey):
@@ -63,7 +63,8 @@ class S3Task:
     # -------------------------------------------------------------------------
     def __init__(self):
 
-        migrate = current.deployment_settings.get_base_migrate()
+        settings = current.deployment_settings
+        migrate = settings.get_base_migrate()
         tasks = current.response.s3.tasks
 
         # Instantiate Scheduler
@@ -77,6 +78,9 @@ class S3Task:
                                        tasks,
                                        migrate = migrate,
                                        #use_spawn = True # Possible subprocess method with Py3
+                                       pool_size = settings.get_base_scheduler_pool_size(),
+                                       pool_max_tasks = settings.get_base_scheduler_pool_max_tasks(),
+                                       pool_max_memory = settings.get_base_scheduler_pool_max_memory(),
                                        )
 
     # -------------------------------------------------------------------------
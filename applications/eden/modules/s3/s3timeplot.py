@@ -51,10 +51,12 @@ from gluon.html import DIV, FORM, INPUT, LABEL, SPAN, TAG, XML
 from gluon.validators import IS_IN_SET
 from gluon.sqlhtml import OptionsWidget, SQLFORM
 
+from s3dal import Expression
+
 from .s3datetime import s3_decode_iso_datetime, s3_utc
 from .s3rest import S3Method
-from .s3query import FS
-from .s3report import S3Report, S3ReportForm
+from .s3query import FS, S3Joins
+from .s3report import S3PivotTable, S3Report, S3ReportForm
 from .s3utils import s3_flatlist, s3_represent_value, s3_str, S3MarkupStripper
 
 tp_datetime = lambda year, *t: datetime.datetime(year, *t, tzinfo=dateutil.tz.tzutc())
@@ -1089,7 +1091,7 @@ class S3TimeSeries:
         if rfield.virtual:
 
             representations = []
-            append = representations.append()
+            append = representations.append
             stripper = S3MarkupStripper()
 
             represent = rfield.represent
@@ -1115,6 +1117,7 @@ class S3TimeSeries:
                                                  ).items()
             else:
                 representations = []
+                append = representations.append
                 for value in values:
                     append((value, s3_represent_value(field,
                                                       value,
@@ -1370,8 +1373,14 @@ class S3TimeSeries:
                     value += v
         event_frame.baseline = value
 
-        # Extract the records
-        data = resource.select(fields)
+        # Aggregate in the database where possible, otherwise
+        # extract the records
+        if current.deployment_settings.get_ui_timeplot_aggregate():
+            aggregated = self._aggregate()
+        else:
+            aggregated = False
+        if not aggregated:
+            data = resource.select(fields)
 
         # Remove the filter we just added
         rfilter = resource.rfilter
@@ -1379,6 +1388,9 @@ class S3TimeSeries:
         rfilter.query = None
         rfilter.transformed = None
 
+        if aggregated:
+            return None
+
         # Do we need to convert dates into datetimes?
         convert_start = True if event_start.ftype == "date" else False
         convert_end = True if event_start.ftype == "date" else False
@@ -1437,6 +1449,278 @@ class S3TimeSeries:
 
         return data
 
+    # -------------------------------------------------------------------------
+    def _aggregate(self):
+        """
+            Compute the aggregates for all periods of the event frame with
+            a GROUP BY query in the database, rather than extracting all
+            events and assigning them to periods in Python; only possible
+            if timestamps, axes and facts are real (non-list) fields of the
+            master table or tables referenced by it, and no fact uses a
+            slope
+
+            Events are grouped by their axis values and by the indexes of
+            the periods in which they start and end, so that every group
+            is either entirely current in a period or not at all.
+
+            Returns:
+                True if the event frame has been filled with aggregates,
+                False if the caller needs to fall back to extracting events
+        """
+
+        resource = self.resource
+        rfields_get = self.rfields.get
+
+        aggregatable = S3PivotTable.aggregatable
+
+        # Check timestamps and axes
+        event_start = rfields_get("event_start")
+        event_end = rfields_get("event_end")
+        for rfield in (event_start, event_end):
+            if rfield and (rfield.ftype not in ("date", "datetime") or
+                           not aggregatable(resource, rfield)):
+                return False
+        axes = []
+        for key in ("rows", "cols"):
+            rfield = rfields_get(key)
+            if rfield and not aggregatable(resource, rfield):
+                return False
+            axes.append(rfield)
+
+        # Check the facts
+        facts = self.facts
+        for fact in facts:
+            rfield = fact.base_rfield
+            if fact.slope_rfield or not rfield or \
+               not aggregatable(resource, rfield):
+                return False
+
+        query = S3PivotTable.aggregate_query(resource)
+        if query is None:
+            return False
+
+        db = current.db
+        expand = db._adapter.expand
+        table = resource.table
+
+        event_frame = self.event_frame
+        periods = list(event_frame)
+        if not periods:
+            return False
+        numperiods = len(periods)
+        ends = [period.end for period in periods]
+
+        # Index of the period in which the event starts
+        # (-1 if the event has no start date)
+        bucket = self._bucket
+        field = event_start.field
+        start_index = Expression(db,
+                                 "CASE WHEN %s THEN -1 ELSE %s END" %
+                                 (expand(field == None), bucket(field, ends)),
+                                 type = "integer",
+                                 )
+        groupby = [start_index]
+
+        # Index of the last period in which the event is current
+        # (-1 if the event ended before the event frame)
+        if event_end:
+            field = event_end.field
+            end_index = Expression(db,
+                                   "CASE WHEN %s = 0 THEN -1 ELSE %s END" %
+                                   (bucket(field, [periods[0].start]),
+                                    bucket(field, ends, inclusive=True),
+                                    ),
+                                   type = "integer",
+                                   )
+            groupby.append(end_index)
+        else:
+            end_index = None
+
+        # Grouping axes
+        joins = S3Joins(table._tablename)
+        for rfield in axes:
+            if rfield:
+                groupby.append(rfield.field)
+                joins.extend(rfield.left)
+
+        # Partial aggregates for each fact
+        aggregates = []
+        expressions = []
+        for fact in facts:
+            rfield = fact.base_rfield
+            joins.extend(rfield.left)
+            field = rfield.field
+            method = fact.method
+            if method in ("sum", "avg"):
+                items = (field.sum(), field.count())
+            elif method == "cumulate":
+                items = (field.sum(),)
+            else:
+                items = (getattr(field, method)(),)
+            aggregates.append(items)
+            expressions.extend(items)
+
+        rows = db(query).select(*(groupby + expressions),
+                                groupby = groupby,
+                                left = joins.as_list(),
+                                )
+
+        # Collect the event groups
+        rows_rfield, cols_rfield = axes
+        rows_keys = set()
+        cols_keys = set()
+        groups = []
+        for row in rows:
+
+            start = row[start_index]
+            if end_index is None:
+                # Events without end
+                end = numperiods
+            else:
+                end = row[end_index]
+                if end != -1:
+                    end = max(start, end)
+
+            rkey = ckey = None
+            if rows_rfield:
+                rkey = rows_rfield.extract(row)
+                rows_keys.add(rkey)
+            if cols_rfield:
+                ckey = cols_rfield.extract(row)
+                cols_keys.add(ckey)
+
+            values = [[row[item] for item in items] for items in aggregates]
+            groups.append((start, end, rkey, ckey, values))
+
+        self.rows_keys = rows_keys
+        self.cols_keys = cols_keys
+
+        # Compute the aggregates per period
+        cumulative = any(fact.method == "cumulate" for fact in facts)
+        combine = self._combine
+
+        def aggregate(items):
+            totals = []
+            for index, fact in enumerate(facts):
+                if fact.method == "cumulate":
+                    # All events which have started (with a start date)
+                    values = [group[4][index]
+                              for is_current, group in items if group[0] >= 0]
+                else:
+                    values = [group[4][index]
+                              for is_current, group in items if is_current]
+                totals.append(combine(fact.method, values))
+            return totals
+
+        periods_dict = event_frame.periods
+        for index, period in enumerate(periods):
+
+            # Current (and, if cumulative, previous) event groups
+            items = []
+            rgroups, cgroups, mgroups = {}, {}, {}
+            for group in groups:
+                start, end, rkey, ckey = group[:4]
+                if start > index:
+                    continue
+                is_current = end >= index
+                if not is_current and not cumulative:
+                    continue
+                item = (is_current, group)
+                items.append(item)
+                if rows_rfield:
+                    rgroups.setdefault(rkey, []).append(item)
+                if cols_rfield:
+                    cgroups.setdefault(ckey, []).append(item)
+                if rows_rfield and cols_rfield:
+                    mgroups.setdefault((rkey, ckey), []).append(item)
+
+            period.aggregates = (aggregate(items),
+                                 dict((k, aggregate(v)) for k, v in rgroups.items()),
+                                 dict((k, aggregate(v)) for k, v in cgroups.items()),
+                                 dict((k, aggregate(v)) for k, v in mgroups.items()),
+                                 )
+            periods_dict[period.start] = period
+
+        event_frame.empty = not groups
+        return True
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def _bucket(field, bounds, inclusive=False):
+        """
+            Build an SQL expression that finds the index of the first of
+            the bounds which is after the field value (or equal to it, if
+            inclusive), as binary search over the bounds
+
+            Args:
+                field: the date/datetime Field
+                bounds: list of datetimes, in ascending order
+                inclusive: include values equal to the bound
+
+            Returns:
+                the SQL expression (string), giving len(bounds) for NULL
+                values and values after the last bound
+        """
+
+        utc = dateutil.tz.tzutc()
+        midnight = datetime.time(0, 0)
+
+        values = []
+        for bound in bounds:
+            bound = bound.astimezone(utc).replace(tzinfo=None)
+            if field.type == "date":
+                # Dates are taken as midnight
+                date = bound.date()
+                if not inclusive and bound.time() != midnight:
+                    date += datetime.timedelta(days=1)
+                bound = date
+            values.append(bound)
+
+        expand = current.db._adapter.expand
+        def bisect(lo, hi):
+            if lo == hi:
+                return str(lo)
+            mid = (lo + hi) // 2
+            bound = values[mid]
+            query = field <= bound if inclusive else field < bound
+            return "CASE WHEN %s THEN %s ELSE %s END" % (expand(query),
+                                                         bisect(lo, mid),
+                                                         bisect(mid + 1, hi),
+                                                         )
+        return bisect(0, len(values))
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def _combine(method, values):
+        """
+            Combine the partial aggregates of event groups, using the same
+            semantics as S3TimeSeriesFact.aggregate
+
+            Args:
+                method: the aggregation method
+                values: the partial aggregates, lists [count] for "count",
+                        [sum] for "cumulate", [sum, count] for "sum" and
+                        "avg", and [min] or [max] for "min" and "max"
+        """
+
+        if method == "count":
+            return sum(v[0] for v in values)
+
+        elif method in ("sum", "cumulate"):
+            return sum(v[0] for v in values if v[0] is not None)
+
+        elif method == "avg":
+            number = sum(v[1] for v in values)
+            if number:
+                return sum(v[0] for v in values if v[0] is not None) / float(number)
+            return None
+
+        else:
+            values = [v[0] for v in values if v[0] is not None]
+            if not values:
+                return None
+            return min(values) if method == "min" else max(values)
+
     # -------------------------------------------------------------------------
     @staticmethod
     def default_timestamp(table, event_end=None):
@@ -2353,6 +2637,10 @@ class S3TimeSeriesPeriod:
         self.cols = None
         self.totals = None
 
+        # Aggregates computed in the database, a tuple
+        # (totals, rows, cols, matrix)
+        self.aggregates = None
+
     # -------------------------------------------------------------------------
     def _reset(self):
         """ Reset the event matrix """
@@ -2492,6 +2780,12 @@ class S3TimeSeriesPeriod:
         # Reset
         self._reset()
 
+        aggregates = self.aggregates
+        if aggregates is not None:
+            # Already aggregated in the database
+            self.totals, self.rows, self.cols, self.matrix = aggregates
+            return self.totals
+
         rows = self.rows = {}
         cols = self.cols = {}
         matrix = self.matrix = {}
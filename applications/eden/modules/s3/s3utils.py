@@ -68,6 +68,7 @@ __all__ = ("NONE",  # Consistency & RAD
            "URL2",
            "get_crud_string",
            "s3_addrow",
+           "s3_after_commit",
            "s3_avatar_represent",
            "s3_comments_represent",
            "s3_datatable_truncate",
@@ -1227,6 +1228,53 @@ def s3_yes_no_represent(value):
 # =============================================================================
 
 
+def s3_after_commit(key, callback):
+    """
+        Register a callback to be run once the current transaction has
+        been committed at the end of the request (chains into
+        response.custom_commit)
+
+        Args:
+            key: a unique key for the callback (registering the same
+                 key again replaces the callback)
+            callback: the callback function, takes no arguments
+
+        Note:
+            - callbacks are not run if the transaction is rolled back
+            - callbacks are only run by the end-of-request commit, not
+              by explicit db.commit() calls (e.g. in scheduler tasks)
+            - without a current response, the callback is run immediately
+    """
+
+    response = current.response
+    if response is None:
+        callback()
+        return
+
+    callbacks = response.get("s3_after_commit")
+    if callbacks is None:
+        callbacks = response.s3_after_commit = OrderedDict()
+
+        custom_commit = response.custom_commit
+        def commit(adapter):
+            if custom_commit:
+                custom_commit(adapter)
+            elif adapter is not None:
+                adapter.commit()
+            if adapter is not None and adapter is current.db._adapter:
+                for func in list(callbacks.values()):
+                    try:
+                        func()
+                    except Exception:
+                        current.log.error("s3_after_commit: %s" % sys.exc_info()[1])
+                callbacks.clear()
+        response.custom_commit = commit
+
+    callbacks[key] = callback
+
+# =============================================================================
+
+
 def s3_keep_messages():
     """
         Retain user messages from previous request - prevents the messages
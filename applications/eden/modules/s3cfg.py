@@ -1030,6 +1030,13 @@ class S3Config(Storage):
         return self.security.get("strict_ownership", True)
     def get_security_map(self):
         return self.security.get("map", False)
+    def get_security_acl_cache(self):
+        """
+            Cache model to share the ACLs retrieved for permission checks
+            across requests, e.g. "ram" (per-process) or "redis" (shared
+            between processes); default False (=cache per request only)
+        """
+        return self.security.get("acl_cache", False)
 
     # -------------------------------------------------------------------------
     # Base settings
@@ -1109,6 +1116,31 @@ class S3Config(Storage):
       """
         return self.base.get("bigtable", False)
 
+    def get_base_stream_export(self):
+        """
+            Stream CSV/JSON exports to the client in chunks rather than
+            building them in memory, for constant memory use with large
+            exports; True, or the number of records per chunk
+        """
+        return self.base.get("stream_export", False)
+
+    def get_base_represent_cache(self):
+        """
+            Cache model to share foreign key representations across
+            requests, e.g. "ram" (per-process, changes made by other
+            processes become visible after expiry) or "redis" (shared
+            between processes); default False (=cache per request only)
+        """
+        return self.base.get("represent_cache", False)
+
+    def get_base_columnar_select(self):
+        """
+            Parse the rows of (internal) data extraction queries column-wise,
+            building Row objects only where needed (faster for large selects);
+            default False (=parse row-wise)
+        """
+        return self.base.get("columnar_select", False)
+
     def get_base_cdn(self):
         """
             Should we use CDNs (Content Distribution Networks) to serve some common CSS/JS?
@@ -1148,6 +1180,28 @@ class S3Config(Storage):
         }
         return db_string % db_params
 
+    def get_base_scheduler_pool_size(self):
+        """
+            Number of persistent worker processes for the Scheduler to
+            execute tasks in (one at a time, keeping the modules imported
+            between tasks), 0 to start a new process for each task
+        """
+        return self.base.get("scheduler_pool_size", 0)
+
+    def get_base_scheduler_pool_max_tasks(self):
+        """
+            Number of tasks after which a persistent worker process of
+            the Scheduler gets replaced, 0 for never
+        """
+        return self.base.get("scheduler_pool_max_tasks", 100)
+
+    def get_base_scheduler_pool_max_memory(self):
+        """
+            Peak memory usage (MB) beyond which a persistent worker process
+            of the Scheduler gets replaced, 0 for never
+        """
+        return self.base.get("scheduler_pool_max_memory", 0)
+
     def get_base_session_db(self):
         """
             Should we store sessions in the database to avoid locking sessions on long-running requests?
@@ -1161,6 +1215,21 @@ class S3Config(Storage):
                 result = False
         return result
 
+    def get_base_session_db_delta(self):
+        """
+            Whether to store sessions in the database per key, so that
+            only the changed parts of a session get written
+        """
+        return self.base.get("session_db_delta", False)
+
+    def get_base_static_fingerprints(self):
+        """
+            Whether URL() should emit fingerprinted (cache-busting) names
+            for static files, from the manifest static/fingerprints.json
+            (built with static/scripts/tools/fingerprint.py)
+        """
+        return self.base.get("static_fingerprints", False)
+
     def get_base_session_memcache(self):
         """
             Should we store sessions in a Memcache service to allow sharing
@@ -1168,6 +1237,13 @@ class S3Config(Storage):
         """
         return self.base.get("session_memcache", False)
 
+    def get_base_session_lock(self):
+        """
+            Whether to lock file-based sessions for the duration of the
+            request (otherwise changes of concurrent requests are merged)
+        """
+        return self.base.get("session_lock", True)
+
     def get_base_solr_url(self):
         """
             URL to connect to solr server
@@ -1244,6 +1320,32 @@ class S3Config(Storage):
 
         return (db_type, db_string, self.database.get("pool_size", 30))
 
+    def get_database_adapter_args(self):
+        """
+            Adapter arguments for PyDAL (models/00_db.py)
+
+            - compile_cache: cache compiled SELECT statements by query
+                             structure (number of templates, or True)
+            - prepared_statements: execute cached SELECTs as prepared
+                                   statements (PostgreSQL with psycopg2,
+                                   requires compile_cache), True or the
+                                   maximum number of prepared statements
+                                   per connection
+
+            @return: dict of adapter arguments
+        """
+
+        adapter_args = {}
+
+        compile_cache = self.database.get("compile_cache", False)
+        if compile_cache:
+            adapter_args["compile_cache"] = compile_cache
+            prepared_statements = self.database.get("prepared_statements", False)
+            if prepared_statements:
+                adapter_args["prepared_statements"] = prepared_statements
+
+        return adapter_args
+
     def get_database_airegex(self):
         """
             Whether to instead of LIKE use REGEXP with groups of diacritic
@@ -1751,6 +1853,15 @@ class S3Config(Storage):
         """
         return self.gis.get("simplify_tolerance", 0.01)
 
+    def get_gis_simplify_levels(self):
+        """
+            Tolerances at which to precompute and store simplified
+            geometries of locations (empty tuple to disable)
+            - exports use the largest of these which is not greater
+              than the requested simplify tolerance
+        """
+        return self.gis.get("simplify_levels", ())
+
     def get_gis_precision(self):
         """
             Number of Decimal places to put in output
@@ -1769,6 +1880,15 @@ class S3Config(Storage):
         else:
             return self.gis.get("spatialdb", False)
 
+    def get_gis_spatial_index(self):
+        """
+            Maintain a grid index of location bounds for bbox, radius
+            and polygon queries (for databases without spatial extensions)
+        """
+        if self.get_gis_spatialdb():
+            return False
+        return self.gis.get("spatial_index", False)
+
     def get_gis_widget_catalogue_layers(self):
         """
             Should Map Widgets display Catalogue Layers?
@@ -2544,6 +2664,21 @@ class S3Config(Storage):
         """
         return self.ui.get("report_auto_submit", 800)
 
+    def get_ui_report_aggregate(self):
+        """
+            Compute pivot table reports with GROUP BY queries in the
+            database where possible (much faster for large data sets,
+            but pivot table cells can then not be explored)
+        """
+        return self.ui.get("report_aggregate", False)
+
+    def get_ui_timeplot_aggregate(self):
+        """
+            Compute time plot reports with GROUP BY queries in the
+            database where possible (much faster for large data sets)
+        """
+        return self.ui.get("timeplot_aggregate", False)
+
     def get_ui_report_timeout(self):
         """
             Time in milliseconds to wait for a Report's AJAX call to complete
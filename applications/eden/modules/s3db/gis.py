@@ -94,6 +94,8 @@ class LocationModel(S3Model):
     """
 
     names = ("gis_location",
+             "gis_location_grid",
+             "gis_location_simplified",
              #"gis_location_error",
              "gis_location_id",
              "gis_country_id",
@@ -302,6 +304,12 @@ class LocationModel(S3Model):
                                                          filter_opts = hierarchy_level_keys,
                                                          orderby = "gis_location.name",
                                                          ))),
+
+                 # Discard outdated simplified geometries synchronously
+                 table._before_update.append(self.gis_location_before_update),
+
+                 # Keep the spatial index in sync with all writes
+                 S3SpatialIndex.register(table),
                  ]
             )
 
@@ -376,9 +384,14 @@ class LocationModel(S3Model):
                                   },
                        deduplicate = self.gis_location_duplicate,
                        hierarchy = "parent",
+                       indexes = [# Name as created by indexes.py in earlier versions
+                                  {"fields": "name", "name": "name__idx"},
+                                  "parent",
+                                  ],
                        list_fields = list_fields,
                        list_orderby = "gis_location.name",
                        onaccept = self.gis_location_onaccept,
+                       ondelete = self.gis_location_ondelete,
                        onvalidation = self.gis_location_onvalidation,
                        )
 
@@ -419,6 +432,49 @@ class LocationModel(S3Model):
                             stdm_tenure = "location_id",
                             )
 
+        # ---------------------------------------------------------------------
+        # Location Grid
+        # - multi-level grid index of location bounding boxes, maintained
+        #   by S3SpatialIndex, for indexed bbox/radius/polygon lookups on
+        #   databases without spatial extensions
+        #
+        tablename = "gis_location_grid"
+        self.define_table(tablename,
+                          Field("location_id", "integer"),
+                          Field("level", "integer"),
+                          Field("x", "integer"),
+                          Field("y", "integer"),
+                          )
+
+        self.configure(tablename,
+                       indexes = [{"fields": ("level", "x", "y"),
+                                   "name": "gis_location_grid_cell_idx",
+                                   },
+                                  {"fields": "location_id",
+                                   "name": "gis_location_grid_location_idx",
+                                   },
+                                  ],
+                       )
+
+        # ---------------------------------------------------------------------
+        # Simplified Geometries
+        # - precomputed simplified variants of location shapes at
+        #   different tolerances, maintained by S3GIS.update_simplified,
+        #   to avoid simplifying large polygons for every export
+        #
+        tablename = "gis_location_simplified"
+        self.define_table(tablename,
+                          Field("location_id", "integer"),
+                          Field("tolerance", "double"),
+                          Field("decimals", "integer"),
+                          Field("geojson", "text"),
+                          )
+
+        self.configure(tablename,
+                       indexes = [("location_id", "tolerance", "decimals"),
+                                  ],
+                       )
+
         # ---------------------------------------------------------------------
         # Error
         # - needed for COT support
@@ -484,6 +540,56 @@ class LocationModel(S3Model):
                                      args = [feature],
                                      )
 
+            wkt = form_vars_get("wkt")
+            if wkt and not wkt.startswith("POINT") and \
+               current.deployment_settings.get_gis_simplify_levels():
+                # Update the simplified geometries (async if-possible)
+                # (skip during prepop)
+                current.s3task.run_async("gis_update_simplified",
+                                         args = [location_id],
+                                         )
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def gis_location_before_update(dbset, fields):
+        """
+            Before-update hook for GIS Locations: remove the simplified
+            geometries of all locations whose WKT is being changed, so
+            that no outdated shapes are served until they are recomputed
+            (covers also changes to points or clearing the WKT, and any
+            updates which don't go through onaccept)
+
+            Args:
+                dbset: the Set to update
+                fields: the fields to update
+
+            Returns:
+                False (i.e. never prevent the update)
+        """
+
+        if "wkt" in fields:
+            table = current.s3db.gis_location
+            stable = current.s3db.gis_location_simplified
+            query = stable.location_id.belongs(dbset._select(table.id))
+            current.db(query).delete()
+
+        return False
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def gis_location_ondelete(row):
+        """
+            On Delete for GIS Locations: remove the simplified geometries
+            of the location
+
+            Args:
+                row: the deleted gis_location Row
+        """
+
+        if current.deployment_settings.get_gis_simplify_levels():
+            stable = current.s3db.gis_location_simplified
+            current.db(stable.location_id == row.id).delete()
+
     # -------------------------------------------------------------------------
     @staticmethod
     def gis_location_onvalidation(form):
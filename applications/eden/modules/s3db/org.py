@@ -1056,6 +1056,10 @@ class OrganisationBranchModel(S3Model):
 
             org_update_affiliations("org_organisation_branch", link)
 
+            # Update the stored organisation hierarchy
+            if branch_id:
+                S3Hierarchy("org_organisation").refresh([branch_id])
+
             # Update the root organisation
             if link.deleted or \
                branch.root_organisation is None or \
@@ -1083,6 +1087,17 @@ class OrganisationBranchModel(S3Model):
         if record:
             org_update_affiliations("org_organisation_branch", record)
 
+            # Update the stored organisation hierarchy
+            if record.deleted and record.deleted_fk:
+                try:
+                    branch_id = json.loads(record.deleted_fk)["branch_id"]
+                except (ValueError, KeyError):
+                    branch_id = None
+            else:
+                branch_id = record.branch_id
+            if branch_id:
+                S3Hierarchy("org_organisation").refresh([branch_id])
+
 # =============================================================================
 class OrganisationCapacityModel(S3Model):
     """
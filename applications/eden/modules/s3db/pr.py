@@ -109,6 +109,7 @@ __all__ = (# Person Entities
            "pr_descendants",
            "pr_rebuild_path",
            "pr_role_rebuild_path",
+           "pr_rebuild_closure",
 
            # Helper for ImageLibrary
            "pr_image_modify",
@@ -150,6 +151,8 @@ class PersonEntityModel(S3Model):
 
     names = ("pr_pentity",
              "pr_affiliation",
+             "pr_affiliation_closure",
+             "pr_affiliation_closure_status",
              "pr_person_user",
              "pr_role",
              "pr_role_types",
@@ -417,6 +420,7 @@ class PersonEntityModel(S3Model):
 
         # Resource configuration
         configure(tablename,
+                  onaccept = self.pr_role_onaccept,
                   onvalidation = self.pr_role_onvalidation,
                   )
 
@@ -472,6 +476,41 @@ class PersonEntityModel(S3Model):
                   ondelete = self.pr_affiliation_ondelete,
                   )
 
+        # ---------------------------------------------------------------------
+        # Affiliation Closure
+        # - index of all ancestor/descendant pairs in the OU hierarchy,
+        #   with the shortest distance between them, maintained by
+        #   pr_update_closure, for single-query lookups of ancestors
+        #   and descendants
+        #
+        tablename = "pr_affiliation_closure"
+        define_table(tablename,
+                     Field("ancestor", "integer"),
+                     Field("descendant", "integer"),
+                     Field("depth", "integer"),
+                     )
+
+        configure(tablename,
+                  indexes = [{"fields": ("ancestor", "descendant"),
+                              "unique": True,
+                              },
+                             "descendant",
+                             ],
+                  )
+
+        # ---------------------------------------------------------------------
+        # Affiliation Closure Status
+        # - single record, whether the closure has been built, also
+        #   locked to serialize writes to the closure (pr_closure_lock)
+        #
+        tablename = "pr_affiliation_closure_status"
+        define_table(tablename,
+                     Field("built", "boolean",
+                           default = False,
+                           ),
+                     Field("timestmp", "datetime"),
+                     )
+
         # ---------------------------------------------------------------------
         # Pass names back to global scope (s3.*)
         #
@@ -675,6 +714,21 @@ class PersonEntityModel(S3Model):
                     form_vars["path"] = None
                 current.s3db.pr_role_rebuild_path(role_id, clear=True)
 
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def pr_role_onaccept(form):
+        """
+            Update the affiliation closure for the affiliates of a role
+            if the role type or the role entity have changed
+
+            Args:
+                form: the CRUD form
+        """
+
+        role_id = form.vars.id
+        if role_id:
+            pr_update_role_closure(role_id)
+
     # -------------------------------------------------------------------------
     @staticmethod
     def pr_pentity_onaccept(form):
@@ -945,6 +999,15 @@ class PersonModel(S3Model):
                                       ],
                        list_layout = pr_PersonListLayout(),
                        extra_fields = ["date_of_birth"],
+                       indexes = [# Names as created by indexes.py in earlier versions
+                                  {"fields": "first_name", "name": "first_name__idx"},
+                                  {"fields": "middle_name", "name": "middle_name__idx"},
+                                  {"fields": "last_name", "name": "last_name__idx"},
+                                  "location_id",
+                                  {"fields": "realm_entity",
+                                   "where": lambda table: table.deleted == False,
+                                   },
+                                  ],
                        main = "first_name",
                        extra = "last_name",
                        onaccept = self.pr_person_onaccept,
@@ -9643,6 +9706,8 @@ def pr_define_role(pe_id,
             s3db.pr_role_rebuild_path(duplicate.id, clear=True)
         duplicate.update_record(**data)
         record_id = duplicate.id
+        if duplicate.role_type != role_type:
+            pr_update_role_closure(record_id)
     else:
         record_id = rtable.insert(**data)
     return record_id
@@ -9886,8 +9951,7 @@ def pr_get_path(pe_id):
 def pr_get_ancestors(pe_id):
     """
         Find all ancestor entities of a person entity in the OU hierarchy
-        (performs a path lookup where paths are available, otherwise rebuilds
-        paths).
+        (performs a lookup in the affiliation closure, nearest first).
 
         Args:
             pe_id: the person entity ID
@@ -9896,32 +9960,13 @@ def pr_get_ancestors(pe_id):
             list of PE IDs (as strings)
     """
 
-    s3db = current.s3db
-    atable = s3db.pr_affiliation
-    rtable = s3db.pr_role
-    query = (atable.deleted != True) & \
-            (atable.role_id == rtable.id) & \
-            (atable.pe_id == pe_id) & \
-            (rtable.deleted != True) & \
-            (rtable.role_type == OU)
-
-    roles = current.db(query).select(rtable.id,
-                                     rtable.pe_id,
-                                     rtable.path,
-                                     rtable.role_type)
-    paths = []
-    append = paths.append
-    for role in roles:
-        path = S3MultiPath([role.pe_id])
-        if role.path is None:
-            ppath = pr_role_rebuild_path(role)
-        else:
-            ppath = S3MultiPath(role.path)
-        path.extend(role.pe_id, ppath, cut=pe_id)
-        append(path)
-    ancestors = S3MultiPath.all_nodes(paths)
+    table = pr_affiliation_closure()
+    query = (table.descendant == pe_id)
+    rows = current.db(query).select(table.ancestor,
+                                    orderby = table.depth,
+                                    )
 
-    return ancestors
+    return [str(row.ancestor) for row in rows]
 
 # =============================================================================
 def pr_instance_type(pe_id):
@@ -10030,52 +10075,36 @@ def pr_ancestors(entities):
     if not entities:
         return Storage()
 
-    s3db = current.s3db
-    atable = s3db.pr_affiliation
-    rtable = s3db.pr_role
-    query = (atable.deleted != True) & \
-            (atable.role_id == rtable.id) & \
-            (atable.pe_id.belongs(entities)) & \
-            (rtable.deleted != True) & \
-            (rtable.role_type == OU)
-    rows = current.db(query).select(rtable.id,
-                                    rtable.pe_id,
-                                    rtable.path,
-                                    rtable.role_type,
-                                    atable.pe_id)
+    table = pr_affiliation_closure()
+    query = (table.descendant.belongs(entities))
+    rows = current.db(query).select(table.ancestor,
+                                    table.descendant,
+                                    orderby = table.depth,
+                                    )
+
     ancestors = Storage([(pe_id, []) for pe_id in entities])
-    r = rtable._tablename
-    a = atable._tablename
     for row in rows:
-        pe_id = row[a].pe_id
-        paths = ancestors[pe_id]
-        role = row[r]
-        path = S3MultiPath([role.pe_id])
-        if role.path is None:
-            ppath = pr_role_rebuild_path(role)
-        else:
-            ppath = S3MultiPath(role.path)
-        path.extend(role.pe_id, ppath, cut=pe_id)
-        paths.append(path)
-    for pe_id in ancestors:
-        ancestors[pe_id] = S3MultiPath.all_nodes(ancestors[pe_id])
+        ancestors[row.descendant].append(str(row.ancestor))
     return ancestors
 
 # =============================================================================
 def pr_descendants(pe_ids, skip=None, root=True, exclude_persons=True):
     """
         Find descendant entities of a person entity in the OU hierarchy
-        (performs a real search, not a path lookup), grouped by root PE
+        (performs a lookup in the affiliation closure), grouped by root PE
 
         Args:
             pe_ids: set/list of pe_ids
-            skip: list of person entity IDs to skip during
-                  descending (internal)
-            root: this is the top-node (internal)
+            skip: list of person entity IDs to skip (internal)
+            root: this is the top-node (internal, obsolete)
             exclude_persons: exclude pr_person records
 
         Returns:
             dict of lists of descendant PEs per root PE
+
+        Note:
+            Even if exclude_persons is False, only the immediate person
+            affiliates are included, not those of descendant OUs
     """
 
     if skip is None:
@@ -10086,67 +10115,37 @@ def pr_descendants(pe_ids, skip=None, root=True, exclude_persons=True):
         return {}
 
     s3db = current.s3db
-    rtable = s3db.pr_role
-    atable = s3db.pr_affiliation
-    r = rtable._tablename
-    a = atable._tablename
-
-    q = (rtable.pe_id.belongs(pe_ids)) \
-        if len(pe_ids) > 1 else (rtable.pe_id == list(pe_ids)[0])
-
-    query = (q & (rtable.role_type == OU) & (rtable.deleted != True)) & \
-            ((atable.role_id == rtable.id) & (atable.deleted != True))
-
-    fields = [rtable.pe_id,
-              atable.pe_id,
-              ]
-
-    if exclude_persons:
-        etable = s3db.pr_pentity
-        e = etable._tablename
-        query &= (etable.pe_id == atable.pe_id)
-        fields.append(etable.instance_type)
+    table = pr_affiliation_closure()
+    etable = s3db.pr_pentity
 
-    rows = current.db(query).select(*fields)
+    if len(pe_ids) > 1:
+        query = (table.ancestor.belongs(pe_ids))
+    else:
+        query = (table.ancestor == list(pe_ids)[0])
+    left = etable.on(etable.pe_id == table.descendant)
+    rows = current.db(query).select(table.ancestor,
+                                    table.descendant,
+                                    table.depth,
+                                    etable.instance_type,
+                                    left = left,
+                                    orderby = table.depth,
+                                    )
 
-    nodes = set()
-    ogetattr = object.__getattribute__
+    c = table._tablename
+    e = etable._tablename
 
     result = {}
-
-    skip.update(pe_ids)
     for row in rows:
-
-        parent = ogetattr(ogetattr(row, r), "pe_id")
-        child = ogetattr(ogetattr(row, a), "pe_id")
-        if exclude_persons:
-            instance_type = ogetattr(ogetattr(row, e), "instance_type")
-            if instance_type != "pr_person":
-                if parent not in result:
-                    result[parent] = []
-                result[parent].append(child)
+        instance_type = row[e].instance_type
+        if instance_type == "pr_person" or instance_type is None:
+            if exclude_persons or row[c].depth != 1:
+                continue
+        closure = row[c]
+        parent = closure.ancestor
+        if parent in result:
+            result[parent].append(closure.descendant)
         else:
-            if parent not in result:
-                result[parent] = []
-            result[parent].append(child)
-        if child not in skip:
-            nodes.add(child)
-
-    if nodes:
-        descendants = pr_descendants(nodes, skip=skip, root=False)
-        for child, nodes in descendants.items():
-            for parent, children in result.items():
-                if child in children:
-                    for node in nodes:
-                        if node not in children:
-                            children.append(node)
-    if root:
-        for child, nodes in result.items():
-            for parent, children in result.items():
-                if child in children:
-                    for node in nodes:
-                        if node not in children and node != parent:
-                            children.append(node)
+            result[parent] = [closure.descendant]
 
     return result
 
@@ -10154,14 +10153,13 @@ def pr_descendants(pe_ids, skip=None, root=True, exclude_persons=True):
 def pr_get_descendants(pe_ids, entity_types=None, skip=None, ids=True):
     """
         Find descendant entities of a person entity in the OU hierarchy
-        (performs a real search, not a path lookup).
+        (performs a lookup in the affiliation closure).
 
         Args:
             pe_ids: person entity ID or list of PE IDs
             entity_types: optional filter to a specific entity_type
             ids: whether to return a list of pe ids or nodes (internal)
-            skip: list of person entity IDs to skip during
-                  descending (internal)
+            skip: list of person entity IDs to skip (internal)
 
         Returns:
             list of PE-IDs
@@ -10172,42 +10170,28 @@ def pr_get_descendants(pe_ids, entity_types=None, skip=None, ids=True):
     if type(pe_ids) is not set:
         pe_ids = set(pe_ids) \
                  if isinstance(pe_ids, (list, tuple)) else {pe_ids}
+    if skip:
+        pe_ids -= set(skip)
+        if not pe_ids:
+            return [] if ids else set()
 
     db = current.db
     s3db = current.s3db
     etable = s3db.pr_pentity
-    rtable = db.pr_role
-    atable = db.pr_affiliation
-
-    if skip is None:
-        skip = set()
-    skip.update(pe_ids)
+    table = pr_affiliation_closure()
 
     if len(pe_ids) > 1:
-        q = (rtable.pe_id.belongs(pe_ids))
+        query = (table.ancestor.belongs(pe_ids))
     else:
-        q = (rtable.pe_id == list(pe_ids)[0])
-
-    query = ((rtable.deleted != True) & q & (rtable.role_type == OU)) & \
-            ((atable.deleted != True) & (atable.role_id == rtable.id))
+        query = (table.ancestor == list(pe_ids)[0])
 
     if entity_types is not None:
-        query &= (etable.pe_id == atable.pe_id)
+        query &= (etable.pe_id == table.descendant)
         rows = db(query).select(etable.pe_id, etable.instance_type)
         result = {(r.pe_id, r.instance_type) for r in rows}
-        node_ids = {i for i, t in result if i not in skip}
     else:
-        rows = db(query).select(atable.pe_id)
-        result = {r.pe_id for r in rows}
-        node_ids = {i for i in result if i not in skip}
-    # Recurse
-    if node_ids:
-        descendants = pr_get_descendants(node_ids,
-                                         skip = skip,
-                                         entity_types = entity_types,
-                                         ids = False,
-                                         )
-        result.update(descendants)
+        rows = db(query).select(table.descendant)
+        result = {r.descendant for r in rows}
 
     if ids:
         if entity_types is not None:
@@ -10253,6 +10237,10 @@ def pr_rebuild_path(pe_id, clear=False):
         if role.path is None:
             pr_role_rebuild_path(role, clear=clear)
 
+    if clear:
+        # Affiliations have changed
+        pr_update_closure(pe_id)
+
 # =============================================================================
 def pr_role_rebuild_path(role_id, skip=None, clear=False):
     """
@@ -10326,6 +10314,296 @@ def pr_role_rebuild_path(role_id, skip=None, clear=False):
 
     return path
 
+# =============================================================================
+def pr_affiliation_closure():
+    """
+        Get the affiliation closure table, building the closure if
+        it has never been built (e.g. after migration)
+
+        Returns:
+            the pr_affiliation_closure Table
+    """
+
+    if not pr_closure_built():
+        # Another request may have built it in the meantime
+        if not pr_closure_lock().built:
+            pr_rebuild_closure()
+        current.response.s3.pr_affiliation_closure_built = True
+    return current.s3db.pr_affiliation_closure
+
+# =============================================================================
+def pr_closure_built():
+    """
+        Check whether the affiliation closure has been built, the
+        status is read only once per request
+
+        Returns:
+            True|False
+    """
+
+    s3 = current.response.s3
+    if not s3.pr_affiliation_closure_built:
+        table = current.s3db.pr_affiliation_closure_status
+        query = (table.built == True)
+        row = current.db(query).select(table.id, limitby=(0, 1)).first()
+        s3.pr_affiliation_closure_built = bool(row)
+
+    return s3.pr_affiliation_closure_built
+
+# =============================================================================
+def pr_closure_lock():
+    """
+        Lock the affiliation closure status, to serialize writes to the
+        affiliation closure until the end of the transaction (SQLite
+        serializes writes anyway, so no explicit lock there)
+
+        Returns:
+            the pr_affiliation_closure_status Row
+    """
+
+    db = current.db
+    table = current.s3db.pr_affiliation_closure_status
+
+    for_update = current.deployment_settings.get_database_type() != "sqlite"
+
+    def status():
+        return db(table.id > 0).select(table.id,
+                                       table.built,
+                                       limitby = (0, 1),
+                                       orderby = table.id,
+                                       for_update = for_update,
+                                       ).first()
+    row = status()
+    if not row:
+        table.insert(built = False)
+        # Concurrent inserts all lock the first record
+        row = status()
+
+    return row
+
+# =============================================================================
+def pr_ou_parents(pe_ids=None):
+    """
+        Look up the immediate OU ancestors of person entities
+
+        Args:
+            pe_ids: the person entity IDs, None for all entities
+
+        Returns:
+            dict {pe_id: set of parent pe_ids}
+    """
+
+    s3db = current.s3db
+    rtable = s3db.pr_role
+    atable = s3db.pr_affiliation
+
+    query = (rtable.deleted != True) & \
+            (rtable.role_type == OU) & \
+            (atable.role_id == rtable.id) & \
+            (atable.deleted != True)
+    if pe_ids is not None:
+        if len(pe_ids) == 1:
+            query &= (atable.pe_id == list(pe_ids)[0])
+        else:
+            query &= (atable.pe_id.belongs(pe_ids))
+    rows = current.db(query).select(rtable.pe_id,
+                                    atable.pe_id,
+                                    )
+
+    r = rtable._tablename
+    a = atable._tablename
+
+    parents = {}
+    for row in rows:
+        child = row[a].pe_id
+        if child in parents:
+            parents[child].add(row[r].pe_id)
+        else:
+            parents[child] = {row[r].pe_id}
+    return parents
+
+# =============================================================================
+def pr_compute_closure(pe_ids, parents, known=None):
+    """
+        Compute the ancestors of person entities in the OU hierarchy
+
+        Args:
+            pe_ids: the person entity IDs
+            parents: dict {pe_id: set of parent pe_ids}, must contain
+                     all entities the ancestors of which are not known
+            known: dict {pe_id: {ancestor: depth}} of entities the
+                   ancestors of which are known
+
+        Returns:
+            dict {pe_id: {ancestor: depth}}
+    """
+
+    known = dict(known) if known else {}
+    visiting = set()
+
+    def ancestors(pe_id):
+        if pe_id in known:
+            return known[pe_id]
+        if pe_id in visiting:
+            # Circular affiliation
+            return {}
+        visiting.add(pe_id)
+        found = {}
+        for parent in parents.get(pe_id, ()):
+            if parent == pe_id:
+                continue
+            found[parent] = 1
+            for ancestor, depth in ancestors(parent).items():
+                if ancestor == pe_id:
+                    continue
+                if ancestor not in found or found[ancestor] > depth + 1:
+                    found[ancestor] = depth + 1
+        visiting.discard(pe_id)
+        known[pe_id] = found
+        return found
+
+    return {pe_id: ancestors(pe_id) for pe_id in pe_ids}
+
+# =============================================================================
+def pr_rebuild_closure():
+    """
+        Rebuild the affiliation closure for the entire OU hierarchy
+    """
+
+    status = pr_closure_lock()
+
+    table = current.s3db.pr_affiliation_closure
+    current.db(table.id > 0).delete()
+
+    parents = pr_ou_parents()
+    closure = pr_compute_closure(list(parents), parents)
+
+    pr_store_closure(closure)
+
+    # Remember that the closure has been built
+    status.update_record(built = True,
+                         timestmp = current.request.utcnow,
+                         )
+    current.response.s3.pr_affiliation_closure_built = True
+
+# =============================================================================
+def pr_update_closure(pe_id):
+    """
+        Update the affiliation closure after the OU affiliations of
+        person entities have changed; only the closure of the entities
+        and their descendants is recomputed
+
+        Args:
+            pe_id: the person entity ID, or a list|set of IDs
+    """
+
+    db = current.db
+    table = current.s3db.pr_affiliation_closure
+
+    if not pr_closure_lock().built:
+        pr_rebuild_closure()
+        return
+
+    if isinstance(pe_id, (list, tuple, set)):
+        pe_ids = set(pe_id)
+    else:
+        pe_ids = {pe_id}
+
+    # The entities and their descendants
+    # - descendants do not change when ancestors change
+    rows = db(table.ancestor.belongs(pe_ids)).select(table.descendant)
+    pe_ids |= {row.descendant for row in rows}
+
+    # The current parents of all these entities
+    parents = pr_ou_parents(pe_ids)
+
+    # The ancestors of all other parents are unaffected
+    others = set()
+    for items in parents.values():
+        others |= items
+    others -= pe_ids
+    known = {parent: {} for parent in others}
+    if others:
+        rows = db(table.descendant.belongs(others)).select(table.ancestor,
+                                                           table.descendant,
+                                                           table.depth,
+                                                           )
+        for row in rows:
+            known[row.descendant][row.ancestor] = row.depth
+
+    closure = pr_compute_closure(pe_ids, parents, known=known)
+
+    db(table.descendant.belongs(pe_ids)).delete()
+    pr_store_closure(closure)
+
+# =============================================================================
+def pr_update_role_closure(role_id):
+    """
+        Update the affiliation closure for the affiliates of a role whose
+        OU parents have changed (i.e. after a change of the role type or
+        the role entity), in a single update
+
+        Args:
+            role_id: the pr_role record ID
+    """
+
+    db = current.db
+    s3db = current.s3db
+
+    atable = s3db.pr_affiliation
+    query = (atable.role_id == role_id) & \
+            (atable.deleted != True)
+    rows = db(query).select(atable.pe_id)
+    pe_ids = {row.pe_id for row in rows}
+    if not pe_ids:
+        return
+
+    if pr_closure_built():
+        # Compare the current OU parents of the affiliates with their
+        # parents in the closure (=ancestors at depth 1)
+        parents = pr_ou_parents(pe_ids)
+
+        table = s3db.pr_affiliation_closure
+        query = (table.descendant.belongs(pe_ids)) & \
+                (table.depth == 1)
+        rows = db(query).select(table.ancestor,
+                                table.descendant,
+                                )
+        stored = {}
+        for row in rows:
+            descendant = row.descendant
+            if descendant in stored:
+                stored[descendant].add(row.ancestor)
+            else:
+                stored[descendant] = {row.ancestor}
+
+        pe_ids = {pe_id for pe_id in pe_ids
+                  if parents.get(pe_id, set()) - {pe_id} != stored.get(pe_id, set())
+                  }
+
+    if pe_ids:
+        pr_update_closure(pe_ids)
+
+# =============================================================================
+def pr_store_closure(closure):
+    """
+        Write a computed closure into the affiliation closure table
+
+        Args:
+            closure: dict {pe_id: {ancestor: depth}}
+    """
+
+    items = []
+    append = items.append
+    for pe_id, ancestors in closure.items():
+        for ancestor, depth in ancestors.items():
+            append({"ancestor": ancestor,
+                    "descendant": pe_id,
+                    "depth": depth,
+                    })
+    if items:
+        current.s3db.pr_affiliation_closure.bulk_insert(items)
+
 # -----------------------------------------------------------------------------
 def pr_image_modify(image_file,
                     image_name,
@@ -611,21 +611,50 @@ class S3HierarchyModel(S3Model):
     """ Model for stored object hierarchies """
 
     names = ("s3_hierarchy",
+             "s3_hierarchy_closure",
              )
 
     def model(self):
 
+        define_table = self.define_table
+
         # ---------------------------------------------------------------------
         # Stored Object Hierarchy
         #
         tablename = "s3_hierarchy"
-        self.define_table(tablename,
-                          Field("tablename", length=64),
-                          Field("dirty", "boolean",
-                                default = False,
-                                ),
-                          Field("hierarchy", "json"),
-                          *S3MetaFields.timestamps())
+        define_table(tablename,
+                     Field("tablename", length=64),
+                     Field("dirty", "boolean",
+                           default = False,
+                           ),
+                     # Whether the closure index is up-to-date
+                     Field("indexed", "boolean",
+                           default = False,
+                           ),
+                     Field("hierarchy", "json"),
+                     *S3MetaFields.timestamps())
+
+        # ---------------------------------------------------------------------
+        # Closure Index of Stored Object Hierarchies
+        # - one entry per pair of node and ancestor (including the node
+        #   itself at depth 0) to look up paths and descendants of nodes
+        #   without loading the full hierarchy
+        #
+        tablename = "s3_hierarchy_closure"
+        define_table(tablename,
+                     Field("tablename", length=64),
+                     Field("ancestor", "integer"),
+                     Field("descendant", "integer"),
+                     Field("depth", "integer"),
+                     )
+
+        self.configure(tablename,
+                       indexes = [{"fields": ("tablename", "ancestor", "descendant"),
+                                   "unique": True,
+                                   },
+                                  ("tablename", "descendant"),
+                                  ],
+                       )
 
         # ---------------------------------------------------------------------
         # Return global names to s3.*
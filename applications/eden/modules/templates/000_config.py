@@ -43,6 +43,9 @@ settings.base.template = "SAFIRE"
 # settings.database.password = "password"
 # Uncomment to use a different pool size
 # settings.database.pool_size = 30
+# Uncomment to cache compiled SELECT statements (and to execute them as prepared statements on PostgreSQL)
+# settings.database.compile_cache = True
+# settings.database.prepared_statements = True
 # Do we have a spatial DB available? (currently supports PostGIS. Spatialite to come.)
 # settings.gis.spatialdb = True
 
@@ -169,9 +172,31 @@ settings.auth.hmac_key = "akeytochange"
 # SOLR server for Full-Text Search
 # settings.base.solr_url = "http://127.0.0.1:8983/solr/"
 
+# Store sessions in the database (MySQL/PostgreSQL only), and write only
+# the changed keys of a session rather than the whole session
+# settings.base.session_db = True
+# settings.base.session_db_delta = True
+
+# Fingerprint static file names in URLs, so that they can be cached forever
+# (requires static/fingerprints.json, see static/scripts/tools/fingerprint.py)
+# settings.base.static_fingerprints = True
+
 # Memcache server to allow sharing of sessions across instances
 # settings.base.session_memcache = '127.0.0.1:11211'
 
+# Do not lock file-based sessions for the whole request, so that parallel
+# Ajax requests from the same client do not have to wait for each other
+# settings.base.session_lock = False
+
+# Execute scheduled tasks in persistent worker processes which keep the
+# modules imported between tasks, replacing each process after a number of tasks
+# settings.base.scheduler_pool_size = 1
+# settings.base.scheduler_pool_max_tasks = 100
+
+# Parse the rows of large data extraction queries (e.g. for exports
+# and pivot tables) column-wise, building Row objects only where needed
+# settings.base.columnar_select = True
+
 # UI options
 # Should user be prompted to save before navigating away?
 # settings.ui.navigate_away_confirm = False
@@ -7,6 +7,8 @@ import time
 from gluon import current
 from gluon.settings import global_settings
 
+from s3 import S3MapTiles
+
 # =============================================================================
 class Daily():
     """ Daily Maintenance Tasks """
@@ -46,6 +48,9 @@ class Daily():
                 except:
                     pass
 
+        # Cleanup GeoJSON tile cache
+        S3MapTiles.cleanup()
+
         # Cleanup Uploaded Import Spreadsheets
         week_past = now - datetime.timedelta(weeks = 1)
 
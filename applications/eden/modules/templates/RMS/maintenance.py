@@ -7,7 +7,7 @@ import time
 from gluon import current, URL
 from gluon.settings import global_settings
 
-from s3 import s3_str, S3DateTime
+from s3 import s3_str, S3DateTime, S3MapTiles
 from .controllers import inv_operators_for_sites
 
 # =============================================================================
@@ -49,6 +49,9 @@ class Daily():
                 except:
                     pass
 
+        # Cleanup GeoJSON tile cache
+        S3MapTiles.cleanup()
+
         # Cleanup Uploaded Import Spreadsheets
         week_past = now - datetime.timedelta(weeks = 1)
 
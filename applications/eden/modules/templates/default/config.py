@@ -29,6 +29,16 @@ def config(settings):
     # Uncomment this to prefer scalability-optimized strategies globally
     #settings.base.bigtable = True
 
+    # Uncomment this to stream CSV/JSON exports in chunks (constant memory use)
+    #settings.base.stream_export = True
+
+    # Uncomment this to share foreign key representations across requests
+    #settings.base.represent_cache = "ram"
+
+    # Uncomment this to parse extracted rows column-wise rather than row-by-row
+    # (faster for large selects)
+    #settings.base.columnar_select = True
+
     # Theme (folder to use for views/layout.html)
     #settings.base.theme = "default"
 
@@ -332,8 +342,12 @@ def config(settings):
     #settings.gis.scaleline = False
     # Uncomment to hide the GeoNames search box
     #settings.gis.search_geonames = False
+    # Uncomment to maintain a grid index for spatial queries on databases without spatial extensions
+    #settings.gis.spatial_index = True
     # Uncomment to modify the Simplify Tolerance
     #settings.gis.simplify_tolerance = 0.001
+    # Uncomment to precompute simplified geometries of locations at these tolerances
+    #settings.gis.simplify_levels = (0.001, 0.01, 0.1)
     # Uncomment this for highly-zoomed maps showing buildings
     #settings.gis.precision = 5
     # Uncomment to Hide the Toolbar from the main Map
@@ -408,6 +422,11 @@ def config(settings):
     #settings.ui.autocomplete_min_chars = 2
     #settings.ui.filter_auto_submit = 800
     #settings.ui.report_auto_submit = 800
+    # Uncomment to compute pivot table reports in the database where possible
+    # (faster for large data sets, but report cells can not be explored)
+    #settings.ui.report_aggregate = True
+    # Uncomment to compute time plot reports in the database where possible
+    #settings.ui.timeplot_aggregate = True
     # Enable this for a UN-style deployment
     #settings.ui.cluster = True
     # Enable this to use the label 'Camp' instead of 'Shelter'
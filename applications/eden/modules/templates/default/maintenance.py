@@ -7,6 +7,8 @@ import time
 from gluon import current
 from gluon.settings import global_settings
 
+from s3 import S3MapTiles, S3SpatialIndex
+
 # =============================================================================
 class Daily():
     """ Daily Maintenance Tasks """
@@ -46,4 +48,12 @@ class Daily():
                 except:
                     pass
 
+        # Cleanup GeoJSON tile cache
+        S3MapTiles.cleanup()
+
+        # Rebuild the spatial index if it is incomplete
+        if current.deployment_settings.get_gis_spatial_index() and \
+           not S3SpatialIndex.complete():
+            S3SpatialIndex.rebuild()
+
 # END =========================================================================
@@ -15,6 +15,7 @@ from .s3model import *
 from .s3msg import *
 from .s3navigation import *
 from .s3query import *
+from .s3report import *
 from .s3resource import *
 from .s3rest import *
 from .s3sync import *
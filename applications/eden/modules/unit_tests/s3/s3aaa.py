@@ -1003,14 +1003,20 @@ class ACLManagementTests(unittest.TestCase):
     # -------------------------------------------------------------------------
     def setUp(self):
 
-        # Stash security policy
-        self.policy = current.deployment_settings.get_security_policy()
+        settings = current.deployment_settings
+
+        # Stash security policy and ACL cache setting
+        self.policy = settings.get_security_policy()
+        self.acl_cache = settings.get_security_acl_cache()
 
     # -------------------------------------------------------------------------
     def tearDown(self):
 
-        # Restore security policy
-        current.deployment_settings.security.policy = self.policy
+        settings = current.deployment_settings
+
+        # Restore security policy and ACL cache setting
+        settings.security.policy = self.policy
+        settings.security.acl_cache = self.acl_cache
         auth = current.auth
         auth.permission = S3Permission(auth)
 
@@ -1162,6 +1168,59 @@ class ACLManagementTests(unittest.TestCase):
                 del table[acl_id]
             auth.s3_delete_role(group_id)
 
+    # -------------------------------------------------------------------------
+    def testACLCache(self):
+        """ Test cross-request ACL cache and invalidation """
+
+        auth = current.auth
+        settings = current.deployment_settings
+
+        settings.security.policy = 4
+        settings.security.acl_cache = "ram"
+
+        group_id = auth.s3_create_role("Test Role", uid="TEST")
+
+        assertEqual = self.assertEqual
+        assertNotEqual = self.assertNotEqual
+
+        try:
+            p = auth.permission = S3Permission(auth)
+            p.define_table()
+            assertNotEqual(p.acl_cache, None)
+
+            p.update_acl(group_id, c="pr", f="person", uacl=p.READ, oacl=p.READ)
+
+            realms = {group_id: None}
+            acls = p.applicable_acls(p.READ, realms, c="pr", f="person")
+            assertEqual(acls, {"ANY": (p.READ, p.READ)})
+            version = p.get_acl_version()
+
+            # Next request: ACLs from cache
+            p = auth.permission = S3Permission(auth)
+            p.define_table()
+            acls = p.applicable_acls(p.READ, realms, c="pr", f="person")
+            assertEqual(acls, {"ANY": (p.READ, p.READ)})
+            assertEqual(p.get_acl_version(), version)
+
+            # Modifying ACLs invalidates the cache
+            p.update_acl(group_id, c="pr", f="person", uacl=p.ALL, oacl=p.ALL)
+            assertNotEqual(p.get_acl_version(), version)
+
+            p = auth.permission = S3Permission(auth)
+            p.define_table()
+            acls = p.applicable_acls(p.READ, realms, c="pr", f="person")
+            assertEqual(acls, {"ANY": (p.ALL, p.ALL)})
+
+            # Callbacks are registered only once
+            table = p.table
+            callbacks = len(table._after_update)
+            p = auth.permission = S3Permission(auth)
+            p.define_table()
+            assertEqual(len(table._after_update), callbacks)
+
+        finally:
+            auth.s3_delete_role(group_id)
+
 # =============================================================================
 class HasPermissionTests(unittest.TestCase):
     """ Test permission check method """
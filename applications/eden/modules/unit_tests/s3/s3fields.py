@@ -170,6 +170,88 @@ class S3RepresentTests(unittest.TestCase):
         self.assertTrue(isinstance(result, lazyT))
         self.assertEqual(result, current.T(self.name1))
 
+    # -------------------------------------------------------------------------
+    def testSharedCache(self):
+        """ Test cross-request representation cache and invalidation """
+
+        settings = current.deployment_settings
+
+        assertEqual = self.assertEqual
+
+        response = current.response
+        custom_commit = response.custom_commit
+        after_commit = response.get("s3_after_commit")
+
+        represent_cache = settings.get_base_represent_cache()
+        settings.base.represent_cache = "ram"
+        try:
+            r = S3Represent(lookup="org_organisation")
+            assertEqual(r.bulk([self.id1, self.id2])[self.id2], self.name2)
+            assertEqual(r.queries, 1)
+
+            # Representations are shared in buckets (=one entry for both)
+            bucket = r._shared_cache_bucket
+            if bucket(self.id1) == bucket(self.id2):
+                prefix = "s3_represent_org_organisation_"
+                entries = [k for k in current.cache.ram.storage.keys()
+                           if k.startswith(prefix)]
+                assertEqual(len(entries), 1)
+
+            # Misses are not cached
+            r = S3Represent(lookup="org_organisation")
+            r(self.id2 + 1000000)
+            r = S3Represent(lookup="org_organisation")
+            r(self.id2 + 1000000)
+            assertEqual(r.queries, 1)
+
+            # New renderer (=next request) gets the cached representations
+            r = S3Represent(lookup="org_organisation")
+            assertEqual(r(self.id1), self.name1)
+            assertEqual(r.bulk([self.id1, self.id2])[self.id2], self.name2)
+            assertEqual(r.queries, 0)
+
+            # Different configuration => separate cache entries
+            r = S3Represent(lookup="org_organisation", fields=["name", "id"])
+            assertEqual(r(self.id1), "%s %s" % (self.name1, self.id1))
+            assertEqual(r.queries, 1)
+
+            # Updating the lookup table invalidates the cache
+            otable = current.s3db.org_organisation
+            current.db(otable.id == self.id1).update(name="Renamed Organisation")
+            r = S3Represent(lookup="org_organisation")
+            assertEqual(r(self.id1), "Renamed Organisation")
+            assertEqual(r.queries, 1)
+
+            # ...and again after commit (entries cached by concurrent
+            # requests before the commit are dropped)
+            callbacks = response.s3_after_commit
+            self.assertIn("s3_represent_version_org_organisation", callbacks)
+            for callback in callbacks.values():
+                callback()
+            r = S3Represent(lookup="org_organisation")
+            r(self.id1)
+            assertEqual(r.queries, 1)
+
+            # Custom lookups are not shared by default
+            class CustomRepresent(S3Represent):
+                def lookup_rows(self, key, values, fields=None):
+                    return super(CustomRepresent, self).lookup_rows(key,
+                                                                    values,
+                                                                    fields = [key.table.name],
+                                                                    )
+            r = CustomRepresent(lookup="org_organisation")
+            r(self.id2)
+            r = CustomRepresent(lookup="org_organisation")
+            r(self.id2)
+            assertEqual(r.queries, 1)
+        finally:
+            settings.base.represent_cache = represent_cache
+            response.custom_commit = custom_commit
+            response.s3_after_commit = after_commit
+            # Records are rolled back => drop the cached representations
+            current.cache.ram("s3_represent_version_org_organisation", None)
+
+    # -------------------------------------------------------------------------
     def testRowsPrecedence(self):
 
         # Check that rows get preferred over values
@@ -5,8 +5,11 @@
 # To run this script use:
 # python web2py.py -S eden -M -R applications/eden/modules/unit_tests/s3/s3gis.py
 
-import unittest
 import datetime
+import os
+import shutil
+import time
+import unittest
 from gluon import *
 from gluon.storage import Storage
 from s3 import *
@@ -810,12 +813,617 @@ class S3NoGisConfigTests(unittest.TestCase):
         xml = map.xml()
         self.assertTrue(b"Map cannot display without GIS config!" in xml)
 
+# =============================================================================
+class S3SpatialIndexTests(unittest.TestCase):
+    """ Tests for the grid index of location bounds """
+
+    # -------------------------------------------------------------------------
+    def setUp(self):
+
+        current.auth.override = True
+
+        settings = current.deployment_settings
+        self.spatial_index = settings.gis.get("spatial_index")
+
+        table = current.s3db.gis_location
+
+        # Random points and boxes in a test region (incl. the meridian)
+        import random
+        rand = random.Random(4321)
+        location_ids = []
+        for i in range(200):
+            lon = rand.uniform(-2.0, 2.0)
+            lat = rand.uniform(50.0, 52.0)
+            if i % 4:
+                size = 0
+            else:
+                size = rand.choice((0.001, 0.05, 0.3, 1.5))
+            location_id = table.insert(name = "SpatialIndexTest%s" % i,
+                                       lat = lat,
+                                       lon = lon,
+                                       lat_min = lat - size,
+                                       lat_max = lat + size,
+                                       lon_min = lon - size,
+                                       lon_max = lon + size,
+                                       )
+            location_ids.append(location_id)
+        self.location_ids = location_ids
+
+        S3SpatialIndex.rebuild()
+
+    # -------------------------------------------------------------------------
+    def tearDown(self):
+
+        current.deployment_settings.gis.spatial_index = self.spatial_index
+        current.auth.override = False
+        current.db.rollback()
+
+    # -------------------------------------------------------------------------
+    def lookup(self, bbox, spatial_index):
+        """
+            Look up the test locations within a bbox
+
+            Args:
+                bbox: the bbox (lon_min, lat_min, lon_max, lat_max)
+                spatial_index: whether to use the spatial index
+
+            Returns:
+                set of location IDs
+        """
+
+        current.deployment_settings.gis.spatial_index = spatial_index
+
+        table = current.s3db.gis_location
+        query = current.gis.query_features_by_bbox(*bbox) & \
+                (table.name.like("SpatialIndexTest%"))
+        rows = current.db(query).select(table.id)
+
+        return set(row.id for row in rows)
+
+    # -------------------------------------------------------------------------
+    @staticmethod
+    def indexed(bbox):
+        """
+            Look up the locations whose index cells overlap with a bbox
+
+            Args:
+                bbox: the bbox (lon_min, lat_min, lon_max, lat_max)
+
+            Returns:
+                set of location IDs
+        """
+
+        table = current.s3db.gis_location
+        query = S3SpatialIndex.query(*bbox)
+        if query is None:
+            return set()
+        rows = current.db(query).select(table.id)
+
+        return set(row.id for row in rows)
+
+    # -------------------------------------------------------------------------
+    def testQuery(self):
+        """ Test that bbox queries with the index give the same result """
+
+        assertEqual = self.assertEqual
+
+        for bbox in ((-1.0, 50.5, 1.0, 51.5),
+                     (-0.01, 51.0, 0.01, 51.02),
+                     (0.5, 50.2, 0.6, 50.3),
+                     (-3.0, 49.0, 3.0, 53.0),
+                     (10.0, 10.0, 11.0, 11.0),
+                     (-180.0, -90.0, 180.0, 90.0),
+                     ):
+            expected = self.lookup(bbox, False)
+            actual = self.lookup(bbox, True)
+            assertEqual(actual, expected)
+
+        # Verify that the index narrows down the selection
+        query = S3SpatialIndex.query(0.5, 50.2, 0.6, 50.3)
+        self.assertNotEqual(query, None)
+        rows = current.db(query).select(current.s3db.gis_location.id)
+        self.assertTrue(0 < len(rows) < len(self.location_ids))
+
+    # -------------------------------------------------------------------------
+    def testUpdate(self):
+        """ Test updating and removing index entries """
+
+        assertTrue = self.assertTrue
+        assertFalse = self.assertFalse
+
+        table = current.s3db.gis_location
+        location_id = self.location_ids[1]
+
+        bbox = (10.0, 10.0, 11.0, 11.0)
+        assertFalse(location_id in self.lookup(bbox, True))
+
+        # Move the location into the bbox
+        current.db(table.id == location_id).update(lat = 10.5,
+                                                   lon = 10.5,
+                                                   lat_min = 10.5,
+                                                   lat_max = 10.5,
+                                                   lon_min = 10.5,
+                                                   lon_max = 10.5,
+                                                   )
+        S3SpatialIndex.update(location_id)
+        assertTrue(location_id in self.lookup(bbox, True))
+
+        # Remove the location from the index
+        S3SpatialIndex.remove(location_id)
+        assertFalse(location_id in self.lookup(bbox, True))
+
+    # -------------------------------------------------------------------------
+    def testSync(self):
+        """ Test that the index follows all writes to gis_location """
+
+        assertTrue = self.assertTrue
+        assertFalse = self.assertFalse
+
+        current.deployment_settings.gis.spatial_index = True
+
+        db = current.db
+        table = current.s3db.gis_location
+
+        bbox = (10.0, 10.0, 11.0, 11.0)
+
+        # Insert (bypassing onaccept)
+        location_id = table.insert(name = "SpatialIndexTestSync",
+                                   lat = 10.5,
+                                   lon = 10.5,
+                                   )
+        assertTrue(location_id in self.indexed(bbox))
+
+        # Move out of the bbox
+        db(table.id == location_id).update(lat = 20.5, lon = 20.5)
+        assertFalse(location_id in self.indexed(bbox))
+
+        # Move back in, updating the bounds only
+        db(table.id == location_id).update(lat_min = 10.2,
+                                           lat_max = 10.8,
+                                           lon_min = 10.2,
+                                           lon_max = 10.8,
+                                           )
+        assertTrue(location_id in self.indexed(bbox))
+
+        # Soft-delete, with a query that no longer matches afterwards
+        query = (table.name == "SpatialIndexTestSync") & \
+                (table.deleted == False)
+        db(query).update(deleted = True)
+        assertFalse(location_id in self.indexed(bbox))
+
+        # Restore, then delete
+        db(table.id == location_id).update(deleted = False)
+        assertTrue(location_id in self.indexed(bbox))
+        db(table.id == location_id).delete()
+        gtable = current.s3db.gis_location_grid
+        assertFalse(db(gtable.location_id == location_id).count())
+
+    # -------------------------------------------------------------------------
+    def testIncomplete(self):
+        """ Test that an incomplete index is not used until rebuilt """
+
+        settings = current.deployment_settings
+        table = current.s3db.gis_location
+
+        # Location written while the index is disabled
+        settings.gis.spatial_index = False
+        location_id = table.insert(name = "SpatialIndexTestIncomplete",
+                                   lat = 10.5,
+                                   lon = 10.5,
+                                   )
+        self.assertFalse(S3SpatialIndex.complete())
+
+        # Verified again on first use => not used, and not rebuilt
+        s3 = current.response.s3
+        S3SpatialIndex.populated = False
+        bbox = (10.0, 10.0, 11.0, 11.0)
+        try:
+            self.assertEqual(S3SpatialIndex.query(*bbox), None)
+            self.assertFalse(S3SpatialIndex.complete())
+
+            # Queries fall back to a plain bbox scan
+            for box in (bbox, (-1.0, 50.5, 1.0, 51.5)):
+                self.assertEqual(self.lookup(box, True), self.lookup(box, False))
+
+            # Used again after rebuild
+            S3SpatialIndex.rebuild()
+            self.assertTrue(location_id in self.indexed(bbox))
+        finally:
+            S3SpatialIndex.populated = False
+            s3.gis_spatial_index_incomplete = None
+
+# =============================================================================
+class S3MapTilesTests(unittest.TestCase):
+    """ Tests for tile-scoped GeoJSON """
+
+    # -------------------------------------------------------------------------
+    def setUp(self):
+
+        current.auth.override = True
+
+        table = current.s3db.gis_location
+
+        # A dense group of points, two separate points, and a polygon
+        for i in range(5):
+            table.insert(name = "MapTilesTest",
+                         lat = 51.5 + i * 0.0001,
+                         lon = 1.1 + i * 0.0001,
+                         )
+        table.insert(name = "MapTilesTest", lat = 51.2, lon = 1.3)
+        table.insert(name = "MapTilesTest", lat = 51.8, lon = 0.9)
+        table.insert(name = "MapTilesTest",
+                     lat = 51.45,
+                     lon = 1.55,
+                     wkt = "POLYGON ((1.5 51.4, 1.6 51.4, 1.6 51.5, 1.5 51.5, 1.5 51.4))",
+                     )
+
+    # -------------------------------------------------------------------------
+    def tearDown(self):
+
+        current.auth.override = False
+        current.db.rollback()
+
+    # -------------------------------------------------------------------------
+    def testTileBounds(self):
+        """ Test computation of tile bounds """
+
+        assertAlmostEqual = self.assertAlmostEqual
+
+        lon_min, lat_min, lon_max, lat_max = S3MapTiles.tile_bounds(0, 0, 0)
+        assertAlmostEqual(lon_min, -180.0)
+        assertAlmostEqual(lon_max, 180.0)
+        assertAlmostEqual(lat_min, -85.0511, places=4)
+        assertAlmostEqual(lat_max, 85.0511, places=4)
+
+        lon_min, lat_min, lon_max, lat_max = S3MapTiles.tile_bounds(1, 1, 0)
+        assertAlmostEqual(lon_min, 0.0)
+        assertAlmostEqual(lat_min, 0.0)
+
+    # -------------------------------------------------------------------------
+    def testCluster(self):
+        """ Test clustering of points """
+
+        points = [(1, 10.0, 10.0), (2, 10.001, 10.001), (3, 20.0, 20.0)]
+
+        single, clusters = S3MapTiles.cluster(points, 5)
+        self.assertEqual([p[0] for p in single], [3])
+        self.assertEqual(len(clusters), 1)
+        lon, lat, count = clusters[0]
+        self.assertEqual(count, 2)
+        self.assertAlmostEqual(lon, 10.0005)
+
+        # At high zoom, points are no longer clustered
+        single, clusters = S3MapTiles.cluster(points, 18)
+        self.assertEqual(len(single), 3)
+        self.assertEqual(clusters, [])
+
+    # -------------------------------------------------------------------------
+    def testFeatures(self):
+        """ Test features of a tile """
+
+        assertEqual = self.assertEqual
+
+        def features(z, x, y, distance):
+            resource = current.s3db.resource("gis_location",
+                                             filter = FS("name") == "MapTilesTest",
+                                             )
+            tile = S3MapTiles().features(resource, z, x, y,
+                                         attr_fields = ["name"],
+                                         distance = distance,
+                                         )
+            assertEqual(tile["type"], "FeatureCollection")
+            return tile["features"]
+
+        # Tile containing all points
+        result = features(7, 64, 42, 20)
+        clusters = [f for f in result if f["properties"].get("cluster")]
+        assertEqual(len(clusters), 1)
+        assertEqual(clusters[0]["properties"]["count"], 5)
+        single = [f for f in result if not f["properties"].get("cluster")]
+        assertEqual(len(single), 3)
+        for feature in single:
+            assertEqual(feature["properties"]["name"], "MapTilesTest")
+
+        # Without clustering
+        result = features(7, 64, 42, 0)
+        assertEqual(len(result), 8)
+
+        # Tile outside the test region
+        result = features(7, 0, 0, 20)
+        assertEqual(result, [])
+
+    # -------------------------------------------------------------------------
+    def testFeaturesOverlap(self):
+        """ Test that shapes are selected by overlap with the tile """
+
+        table = current.s3db.gis_location
+
+        # Polygon with its centroid in the neighbouring tile (7, 63, 42)
+        location_id = table.insert(name = "MapTilesTestOverlap",
+                                   gis_feature_type = 3,
+                                   lat = 51.45,
+                                   lon = -0.25,
+                                   lat_min = 51.4,
+                                   lat_max = 51.5,
+                                   lon_min = -1.0,
+                                   lon_max = 0.5,
+                                   wkt = "POLYGON ((-1.0 51.4, 0.5 51.4, 0.5 51.5, -1.0 51.5, -1.0 51.4))",
+                                   )
+
+        for x, expected in ((62, []), (63, [location_id]), (64, [location_id])):
+            resource = current.s3db.resource("gis_location",
+                                             filter = FS("name") == "MapTilesTestOverlap",
+                                             )
+            S3MapTiles().features(resource, 7, x, 42, distance=0)
+
+            # Verify the selection (the rendering of the shape depends
+            # on Shapely or precomputed simplified geometries)
+            rows = resource.select(["id"], limit=None, as_rows=True)
+            self.assertEqual([row.id for row in rows], expected)
+
+    # -------------------------------------------------------------------------
+    def testClip(self):
+        """ Test clipping of shapes to the tile bounds """
+
+        try:
+            from shapely.geometry import box
+        except ImportError:
+            self.skipTest("Shapely not installed")
+
+        assertEqual = self.assertEqual
+
+        bbox = box(0, 0, 1, 1)
+        polygon = {"type": "Polygon",
+                   "coordinates": [[[0.5, 0.5], [2, 0.5], [2, 2], [0.5, 2], [0.5, 0.5]]],
+                   }
+
+        clipped = S3MapTiles.clip(polygon, bbox, 4)
+        assertEqual(clipped["type"], "Polygon")
+        for lon, lat in clipped["coordinates"][0]:
+            self.assertTrue(0.5 <= lon <= 1 and 0.5 <= lat <= 1)
+
+        # Shapes inside the bounding box remain unchanged
+        inside = {"type": "Polygon",
+                  "coordinates": [[[0.2, 0.2], [0.4, 0.2], [0.4, 0.4], [0.2, 0.2]]],
+                  }
+        self.assertIs(S3MapTiles.clip(inside, bbox, 4), inside)
+
+        # Shapes outside the bounding box are dropped
+        outside = {"type": "Polygon",
+                   "coordinates": [[[3, 3], [4, 3], [4, 4], [3, 3]]],
+                   }
+        self.assertIsNone(S3MapTiles.clip(outside, bbox, 4))
+
+    # -------------------------------------------------------------------------
+    def testInvalidate(self):
+        """ Test invalidation of cached tiles upon writes """
+
+        response = current.response
+        custom_commit = response.custom_commit
+        callbacks = response.get("s3_after_commit")
+
+        folder = S3MapTiles.cache_folder()
+        created = not os.path.exists(folder)
+        if created:
+            os.makedirs(folder)
+        stamp = S3MapTiles.stamp_path("gis_location")
+
+        try:
+            past = time.time() - 3600
+            if os.path.exists(stamp):
+                os.utime(stamp, (past, past))
+
+            current.s3db.gis_location.insert(name = "MapTilesTestInvalidate")
+
+            # Stamp touched immediately, and again after commit
+            modified = S3MapTiles.last_modified("org_office")
+            self.assertTrue(modified is not None and modified > past)
+            self.assertIn("s3_map_tiles_gis_location", response.s3_after_commit)
+        finally:
+            response.custom_commit = custom_commit
+            response.s3_after_commit = callbacks
+            if created:
+                shutil.rmtree(folder, ignore_errors=True)
+
+    # -------------------------------------------------------------------------
+    def testCachePath(self):
+        """ Test that tiles are cached per controller and function """
+
+        r1 = Storage(controller = "gis",
+                     function = "location",
+                     tablename = "gis_location",
+                     get_vars = Storage(),
+                     )
+        r2 = Storage(r1, controller = "org")
+
+        path1 = S3MapTiles.cache_path(r1, 7, 64, 42)
+        path2 = S3MapTiles.cache_path(r2, 7, 64, 42)
+        self.assertNotEqual(path1, path2)
+
+    # -------------------------------------------------------------------------
+    def testCleanup(self):
+        """ Test eviction of outdated tiles from the tile cache """
+
+        folder = os.path.join(S3MapTiles.cache_folder(),
+                              "gis_location",
+                              "gis",
+                              "cleanup_test",
+                              )
+        if not os.path.exists(folder):
+            os.makedirs(folder)
+
+        outdated = os.path.join(folder, "outdated.geojson")
+        recent = os.path.join(folder, "recent.geojson")
+        for path in (outdated, recent):
+            with open(path, "w") as f:
+                f.write("{}")
+
+        # Cached before the last modification of gis_location
+        past = time.time() - 86400 * 365 * 50
+        os.utime(outdated, (past, past))
+
+        # Recent enough unless expired
+        future = time.time() + 3600
+        os.utime(recent, (future, future))
+
+        try:
+            S3MapTiles.cleanup()
+            self.assertFalse(os.path.exists(outdated))
+            self.assertTrue(os.path.exists(recent))
+
+            S3MapTiles.cleanup(expire=-7200)
+            self.assertFalse(os.path.exists(recent))
+        finally:
+            shutil.rmtree(folder, ignore_errors=True)
+
+# =============================================================================
+class S3SimplifiedGeometryTests(unittest.TestCase):
+    """ Tests for precomputed simplified geometries """
+
+    WKT = "POLYGON ((1.5 51.4, 1.6 51.4, 1.6 51.5, 1.5 51.5, 1.5 51.4))"
+
+    # -------------------------------------------------------------------------
+    def setUp(self):
+
+        current.auth.override = True
+
+        settings = current.deployment_settings
+        self.simplify_levels = settings.gis.get("simplify_levels")
+        self.simplify_tolerance = settings.gis.get("simplify_tolerance")
+        settings.gis.simplify_levels = (0.001, 0.01, 0.1)
+        settings.gis.simplify_tolerance = 0.05
+
+        s3db = current.s3db
+        table = s3db.gis_location
+        stable = s3db.gis_location_simplified
+
+        precision = settings.get_gis_precision()
+
+        location_ids = []
+        for i in range(3):
+            location_id = table.insert(name = "SimplifiedTest%s" % i,
+                                       gis_feature_type = 3,
+                                       lat = 51.45,
+                                       lon = 1.55,
+                                       wkt = self.WKT,
+                                       )
+            for level in (0.001, 0.01, 0.1):
+                stable.insert(location_id = location_id,
+                              tolerance = level,
+                              decimals = precision,
+                              geojson = '{"level":%s}' % level,
+                              )
+            location_ids.append(location_id)
+        self.location_ids = location_ids
+
+    # -------------------------------------------------------------------------
+    def tearDown(self):
+
+        settings = current.deployment_settings
+        settings.gis.simplify_levels = self.simplify_levels
+        settings.gis.simplify_tolerance = self.simplify_tolerance
+
+        current.auth.override = False
+        current.db.rollback()
+
+    # -------------------------------------------------------------------------
+    def testSimplifyLevel(self):
+        """ Test selection of the precomputed level """
+
+        assertEqual = self.assertEqual
+
+        simplify_level = S3GIS.simplify_level
+
+        assertEqual(simplify_level(0.05), 0.01)
+        assertEqual(simplify_level(0.01), 0.01)
+        assertEqual(simplify_level(0.5), 0.1)
+        assertEqual(simplify_level(0.0005), None)
+        assertEqual(simplify_level(0), None)
+
+    # -------------------------------------------------------------------------
+    def testGetSimplified(self):
+        """ Test lookup of precomputed geometries """
+
+        location_ids = self.location_ids
+
+        geojsons = S3GIS.get_simplified(location_ids, 0.002)
+        self.assertEqual(set(geojsons), set(location_ids))
+        for geojson in geojsons.values():
+            self.assertEqual(geojson, '{"level":0.001}')
+
+        # Other precision
+        precision = current.deployment_settings.get_gis_precision() + 1
+        geojsons = S3GIS.get_simplified(location_ids, 0.002, precision)
+        self.assertEqual(geojsons, {})
+
+    # -------------------------------------------------------------------------
+    def testGetLocations(self):
+        """ Test that exports use the precomputed geometries """
+
+        gtable = current.s3db.gis_location
+        query = gtable.id.belongs(self.location_ids)
+
+        output = S3GIS.get_locations(gtable, query, join=False, geojson=True)
+        self.assertEqual(set(output), set(self.location_ids))
+        for geojson in output.values():
+            self.assertEqual(geojson, '{"level":0.01}')
+
+    # -------------------------------------------------------------------------
+    def testDiscardOutdated(self):
+        """ Test that WKT updates discard the simplified geometries """
+
+        db = current.db
+        s3db = current.s3db
+
+        table = s3db.gis_location
+        stable = s3db.gis_location_simplified
+
+        location_ids = self.location_ids
+        query = stable.location_id.belongs(location_ids)
+
+        # Updates which do not change the WKT keep the geometries
+        db(table.id == location_ids[0]).update(name = "SimplifiedTest")
+        self.assertEqual(db(query).count(), 9)
+
+        # Changing the WKT discards them, also when turning into a point
+        db(table.id == location_ids[0]).update(wkt = "POINT (1.55 51.45)")
+        self.assertEqual(db(query).count(), 6)
+        self.assertFalse(db(stable.location_id == location_ids[0]).count())
+
+        # Clearing the WKT discards them
+        db(table.id.belongs(location_ids[1:])).update(wkt = None)
+        self.assertEqual(db(query).count(), 0)
+
+    # -------------------------------------------------------------------------
+    def testUpdateSimplified(self):
+        """ Test computation of simplified geometries """
+
+        try:
+            from shapely.wkt import loads as wkt_loads
+        except ImportError:
+            self.skipTest("Shapely not installed")
+
+        stable = current.s3db.gis_location_simplified
+
+        location_id = self.location_ids[0]
+        S3GIS.update_simplified([location_id])
+
+        rows = current.db(stable.location_id == location_id).select(stable.tolerance,
+                                                                    stable.geojson,
+                                                                    )
+        self.assertEqual(len(rows), 3)
+        for row in rows:
+            self.assertTrue(row.geojson.startswith('{"type":'))
+
 # =============================================================================
 if __name__ == "__main__":
 
     run_suite(
         S3LocationTreeTests,
         S3NoGisConfigTests,
+        S3SpatialIndexTests,
+        S3MapTilesTests,
+        S3SimplifiedGeometryTests,
         )
 
 # END ========================================================================
@@ -376,6 +376,209 @@ class S3HierarchyTests(unittest.TestCase):
             # Cleanup
             db(table.uuid.like("HIERARCHY1-4%")).delete()
 
+    # -------------------------------------------------------------------------
+    def testIncrementalUpdate(self):
+        """ Test incremental update of the stored hierarchy and index """
+
+        uids = self.uids
+
+        assertTrue = self.assertTrue
+        assertFalse = self.assertFalse
+        assertEqual = self.assertEqual
+
+        db = current.db
+        table = db.test_hierarchy
+        hierarchies = current.model["hierarchies"]
+        response = current.response
+
+        # Load and save the hierarchy
+        h = S3Hierarchy("test_hierarchy")
+        h.dirty("test_hierarchy")
+        assertTrue(uids["HIERARCHY1-1"] in h.theset)
+        h.save()
+
+        custom_commit = response.custom_commit
+        try:
+            # Add a node => should be added without rebuild
+            node_id = table.insert(uuid = "HIERARCHY1-1-3",
+                                   name = "Type 1-1-3",
+                                   category = "Cat 2",
+                                   parent = uids["HIERARCHY1-1"],
+                                   )
+            h = S3Hierarchy("test_hierarchy")
+            assertFalse(h.flags.get("dirty"))
+            assertTrue(node_id in h.theset[uids["HIERARCHY1-1"]]["s"])
+            assertEqual(h.theset[node_id]["c"], "Cat 2")
+
+            # Look up from the closure index
+            S3Hierarchy.save_pending()
+            hierarchies.pop("test_hierarchy", None)
+            h = S3Hierarchy("test_hierarchy", index=True)
+            assertEqual(h.path(node_id), [uids["HIERARCHY1"],
+                                          uids["HIERARCHY1-1"],
+                                          node_id,
+                                          ])
+            assertTrue(node_id in h.children(uids["HIERARCHY1-1"]))
+            assertTrue(node_id in h.findall(uids["HIERARCHY1"]))
+
+            # Move the node
+            db(table.id == node_id).update(parent = uids["HIERARCHY2-1"])
+            S3Hierarchy.save_pending()
+            hierarchies.pop("test_hierarchy", None)
+            h = S3Hierarchy("test_hierarchy", index=True)
+            assertEqual(h.path(node_id), [uids["HIERARCHY2"],
+                                          uids["HIERARCHY2-1"],
+                                          node_id,
+                                          ])
+            assertFalse(node_id in h.findall(uids["HIERARCHY1"]))
+            assertTrue(node_id in h.findall(uids["HIERARCHY2"]))
+
+            # Stored hierarchy has been updated too
+            h = S3Hierarchy("test_hierarchy")
+            assertEqual(h.theset[node_id]["p"], uids["HIERARCHY2-1"])
+
+            # Remove the node
+            db(table.id == node_id).update(deleted = True)
+            h = S3Hierarchy("test_hierarchy")
+            assertFalse(node_id in h.theset)
+            S3Hierarchy.save_pending()
+            hierarchies.pop("test_hierarchy", None)
+            h = S3Hierarchy("test_hierarchy", index=True)
+            assertEqual(h.path(node_id), [])
+            assertFalse(node_id in h.findall(uids["HIERARCHY2"]))
+        finally:
+            # Cleanup
+            response.custom_commit = custom_commit
+            response.s3_hierarchy_commit = None
+            db(table.uuid == "HIERARCHY1-1-3").delete()
+
+    # -------------------------------------------------------------------------
+    def testReadDirty(self):
+        """ Test that reading a dirty hierarchy does not save it """
+
+        uids = self.uids
+
+        assertTrue = self.assertTrue
+        assertFalse = self.assertFalse
+        assertEqual = self.assertEqual
+
+        db = current.db
+        s3db = current.s3db
+        response = current.response
+        hierarchies = current.model["hierarchies"]
+
+        table = db.test_hierarchy
+        htable = s3db.s3_hierarchy
+        ctable = s3db.s3_hierarchy_closure
+        query = (htable.tablename == "test_hierarchy")
+        cquery = (ctable.tablename == "test_hierarchy")
+
+        S3Hierarchy.dirty("test_hierarchy")
+        closure = db(cquery).count()
+
+        custom_commit = response.custom_commit
+        try:
+            # Reading rebuilds the hierarchy in memory only
+            h = S3Hierarchy("test_hierarchy")
+            assertTrue(uids["HIERARCHY1-1"] in h.theset)
+            row = db(query).select(htable.dirty, limitby=(0, 1)).first()
+            assertTrue(row.dirty)
+            assertEqual(db(cquery).count(), closure)
+            assertTrue(response.custom_commit is custom_commit)
+
+            # Writing saves the hierarchy and rebuilds the closure index
+            node_id = table.insert(uuid = "HIERARCHY1-1-RD",
+                                   name = "Type 1-1-RD",
+                                   parent = uids["HIERARCHY1-1"],
+                                   )
+            h = S3Hierarchy("test_hierarchy")
+            assertTrue(node_id in h.theset)
+            S3Hierarchy.save_pending()
+            row = db(query).select(htable.dirty,
+                                   htable.indexed,
+                                   limitby = (0, 1),
+                                   ).first()
+            assertFalse(row.dirty)
+            assertTrue(row.indexed)
+
+            # No duplicate closure entries
+            rows = db(cquery).select(ctable.ancestor, ctable.descendant)
+            pairs = [(row.ancestor, row.descendant) for row in rows]
+            assertEqual(len(pairs), len(set(pairs)))
+
+            hierarchies.pop("test_hierarchy", None)
+            h = S3Hierarchy("test_hierarchy", index=True)
+            assertEqual(h.path(node_id), [uids["HIERARCHY1"],
+                                          uids["HIERARCHY1-1"],
+                                          node_id,
+                                          ])
+        finally:
+            # Cleanup
+            response.custom_commit = custom_commit
+            response.s3_hierarchy_commit = None
+            db(table.uuid == "HIERARCHY1-1-RD").delete()
+
+    # -------------------------------------------------------------------------
+    def testDeferredSave(self):
+        """ Test that the stored hierarchy is saved once at commit """
+
+        uids = self.uids
+
+        assertTrue = self.assertTrue
+        assertFalse = self.assertFalse
+
+        db = current.db
+        s3db = current.s3db
+        response = current.response
+
+        table = db.test_hierarchy
+        htable = s3db.s3_hierarchy
+        query = (htable.tablename == "test_hierarchy")
+
+        # Load and save the hierarchy
+        h = S3Hierarchy("test_hierarchy")
+        h.dirty("test_hierarchy")
+        assertTrue(uids["HIERARCHY1-1"] in h.theset)
+
+        custom_commit = response.custom_commit
+        try:
+            # Add some nodes
+            node_ids = []
+            for i in range(3):
+                node_ids.append(table.insert(uuid = "HIERARCHY1-1-DS%s" % i,
+                                             name = "Type 1-1-DS%s" % i,
+                                             parent = uids["HIERARCHY1-1"],
+                                             ))
+            h = S3Hierarchy("test_hierarchy")
+            for node_id in node_ids:
+                assertTrue(node_id in h.theset)
+
+            # Stored hierarchy not yet saved, but marked as dirty
+            row = db(query).select(htable.dirty,
+                                   htable.hierarchy,
+                                   limitby = (0, 1),
+                                   ).first()
+            assertTrue(row.dirty)
+            assertFalse(str(node_ids[0]) in row.hierarchy["nodes"])
+
+            # Saving is hooked into the commit at the end of the request
+            assertTrue(response.custom_commit is not custom_commit)
+
+            # Save before commit
+            S3Hierarchy.save_pending()
+            row = db(query).select(htable.dirty,
+                                   htable.hierarchy,
+                                   limitby = (0, 1),
+                                   ).first()
+            assertFalse(row.dirty)
+            for node_id in node_ids:
+                assertTrue(str(node_id) in row.hierarchy["nodes"])
+        finally:
+            # Cleanup
+            response.custom_commit = custom_commit
+            response.s3_hierarchy_commit = None
+            db(table.uuid.like("HIERARCHY1-1-DS%")).delete()
+
     # -------------------------------------------------------------------------
     def testCategory(self):
         """ Test node category lookup """
@@ -532,6 +532,131 @@ class DuplicateDetectionTests(unittest.TestCase):
         assertEqual(item.id, None)
         assertEqual(item.method, item.METHOD.CREATE)
 
+    # -------------------------------------------------------------------------
+    def testPrefetch(self):
+        """ Test bulk-matching with prefetched index """
+
+        assertEqual = self.assertEqual
+        assertTrue = self.assertTrue
+
+        db = current.db
+        table = db.dedup_test
+
+        deduplicate = S3Duplicate(primary=("name",),
+                                  secondary=("secondary",),
+                                  )
+
+        job = self.job
+        ids = self.ids
+
+        # Dummy items for testing
+        data = (Storage(name="test0"),
+                Storage(name="Test2", secondary="secondaryX"),
+                Storage(name="test4", secondary="secondaryX"),
+                Storage(name="Test"),
+                )
+        items = []
+        for values in data:
+            item = S3ImportItem(job)
+            item.table = table
+            item.tablename = "dedup_test"
+            item.method = item.METHOD.CREATE
+            item.data = values
+            items.append(item)
+
+        index = deduplicate.prefetch(table, items)
+        assertTrue(index is not None)
+        assertEqual(len(index.matches), 4)
+        job.duplicates[("dedup_test", deduplicate)] = index
+
+        # Match the items against the index
+        for item in items:
+            deduplicate(item)
+
+        assertEqual(items[0].id, ids["TEST0"])
+        assertEqual(items[0].method, item.METHOD.UPDATE)
+        assertEqual(items[1].id, ids["TEST2"])
+        assertEqual(items[1].method, item.METHOD.UPDATE)
+        assertEqual(items[2].id, None)
+        assertEqual(items[2].method, item.METHOD.CREATE)
+        assertEqual(items[3].id, None)
+        assertEqual(items[3].method, item.METHOD.CREATE)
+
+        # Register a newly created record
+        item = items[3]
+        item.id = table.insert(**item.data)
+        assertTrue(deduplicate.update_index(index, item))
+
+        # Subsequent items are matched against the new record
+        item = S3ImportItem(job)
+        item.table = table
+        item.tablename = "dedup_test"
+        item.method = item.METHOD.CREATE
+        item.data = Storage(name="TEST")
+
+        deduplicate(item)
+        assertEqual(item.id, items[3].id)
+        assertEqual(item.method, item.METHOD.UPDATE)
+
+        # Deletion invalidates the index
+        item.method = item.METHOD.DELETE
+        self.assertFalse(deduplicate.update_index(index, item))
+
+        db.rollback()
+
+    # -------------------------------------------------------------------------
+    def testPrefetchCommit(self):
+        """ Test matching of records created during the commit of a job """
+
+        assertEqual = self.assertEqual
+
+        auth = current.auth
+        db = current.db
+        s3db = current.s3db
+
+        table = db.dedup_test
+
+        def onaccept(form):
+            # Create another record, not through the import job
+            record_id = form.vars.id
+            row = db(table.id == record_id).select(table.name,
+                                                   limitby = (0, 1),
+                                                   ).first()
+            if row and row.name == "Creator":
+                table.insert(name="Created", secondary="onaccept")
+
+        s3db.configure("dedup_test",
+                       deduplicate = S3Duplicate(),
+                       onaccept = onaccept,
+                       )
+
+        xmlstr = """
+<s3xml>
+    <resource name="dedup_test">
+        <data field="name">Creator</data>
+    </resource>
+    <resource name="dedup_test">
+        <data field="name">Created</data>
+        <data field="secondary">imported</data>
+    </resource>
+</s3xml>"""
+
+        auth.override = True
+        try:
+            tree = etree.ElementTree(etree.fromstring(xmlstr))
+            resource = s3db.resource("dedup_test")
+            resource.import_xml(tree)
+
+            # The second item has been matched with the record created
+            # by the onaccept of the first, rather than being imported twice
+            rows = db(table.name == "Created").select(table.secondary)
+            assertEqual(len(rows), 1)
+            assertEqual(rows.first().secondary, "imported")
+        finally:
+            auth.override = False
+            s3db.clear_config("dedup_test")
+            db.rollback()
+
     # -------------------------------------------------------------------------
     def testExceptions(self):
         """ Test S3Duplicate exceptions for nonexistent fields """
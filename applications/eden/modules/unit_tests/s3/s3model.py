@@ -8,20 +8,237 @@
 import datetime
 import unittest
 
-from gluon import current, IS_EMPTY_OR, IS_FLOAT_IN_RANGE, IS_INT_IN_RANGE, IS_IN_SET, IS_NOT_EMPTY
+from gluon import current, Field, IS_EMPTY_OR, IS_FLOAT_IN_RANGE, IS_INT_IN_RANGE, IS_IN_SET, IS_NOT_EMPTY
 from gluon.languages import lazyT
 from gluon.storage import Storage
 
 from s3.s3fields import s3_meta_fields
-from s3.s3model import DYNAMIC_PREFIX, S3DynamicModel
+from s3.s3model import DYNAMIC_PREFIX, S3DynamicModel, S3IndexAdvisor, S3Model
 from s3.s3validators import IS_NOT_ONE_OF, IS_ONE_OF, IS_UTC_DATE, IS_UTC_DATETIME
 
 from unit_tests import run_suite
 
 # =============================================================================
 class S3ModelTests(unittest.TestCase):
+    """ Tests for S3Model """
 
-    pass
+    # -------------------------------------------------------------------------
+    def testNamesIndex(self):
+        """ Test the index of names defined by the models of a module """
+
+        assertEqual = self.assertEqual
+
+        module = current.models.supply
+        names, generic, exported = S3Model.names_index("supply", module)
+
+        # Names map to the model defining them
+        assertEqual(names["supply_catalog"], "SupplyModel")
+        assertEqual(names["supply_item_alt"], "SupplyAltItemModel")
+        self.assertNotIn("supply_item_represent", exported)
+        self.assertIn("SupplyModel", exported)
+        assertEqual(generic, [])
+
+        # Index is built once per module
+        index = S3Model.names_index("supply", module)
+        self.assertIs(index[0], names)
+
+        # Index is rebuilt if the module changes
+        S3Model.INDEX["supply"] = (object(), {}, [], set())
+        index = S3Model.names_index("supply", module)
+        assertEqual(index[0], names)
+        self.assertIs(S3Model.INDEX["supply"][0], module)
+
+    # -------------------------------------------------------------------------
+    def testTableLookup(self):
+        """ Test lookup of tables and names through the index """
+
+        s3db = current.s3db
+
+        table = s3db.table("supply_item_alt")
+        self.assertEqual(table._tablename, "supply_item_alt")
+
+        # Module-level names
+        self.assertIs(s3db.table("supply_item_entity_id", db_only=True), None)
+        self.assertIs(s3db.supply_ItemRepresent,
+                      current.models.supply.supply_ItemRepresent)
+
+# =============================================================================
+class S3IndexTests(unittest.TestCase):
+    """ Tests for declarative database indexes and the index advisor """
+
+    TABLENAME = "idxtest_record"
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def setUpClass(cls):
+
+        s3db = current.s3db
+
+        s3db.define_table(cls.TABLENAME,
+                          Field("name"),
+                          Field("code"),
+                          Field("category", "integer"),
+                          *s3_meta_fields())
+
+        current.db.commit()
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def tearDownClass(cls):
+
+        db = current.db
+
+        current.s3db.clear_config(cls.TABLENAME)
+        db[cls.TABLENAME].drop()
+        db.commit()
+
+    # -------------------------------------------------------------------------
+    def tearDown(self):
+
+        current.s3db.clear_config(self.TABLENAME, "indexes")
+
+    # -------------------------------------------------------------------------
+    def indexes(self):
+        """ Get the indexes of the test table in the database """
+
+        db = current.db
+
+        if db._adapter.dbengine != "sqlite":
+            self.skipTest("Database introspection only for SQLite")
+
+        query = "SELECT name FROM sqlite_master WHERE type='index' AND tbl_name='%s';"
+        return set(row[0] for row in db.executesql(query % self.TABLENAME))
+
+    # -------------------------------------------------------------------------
+    def testIndexDefinitions(self):
+        """ Test normalization of index declarations """
+
+        s3db = current.s3db
+        tablename = self.TABLENAME
+
+        assertEqual = self.assertEqual
+
+        s3db.configure(tablename,
+                       indexes = ["name",
+                                  ("category", "code"),
+                                  {"fields": "code",
+                                   "name": "code__idx",
+                                   "unique": True,
+                                   "where": lambda table: table.deleted == False,
+                                   },
+                                  ],
+                       )
+
+        definitions = s3db.index_definitions(tablename)
+        assertEqual(len(definitions), 3)
+
+        index = definitions[0]
+        assertEqual(index["name"], "idxtest_record_name__idx")
+        assertEqual(index["fields"], ("name",))
+
+        index = definitions[1]
+        assertEqual(index["name"], "idxtest_record_category_code__idx")
+        assertEqual(index["fields"], ("category", "code"))
+
+        index = definitions[2]
+        assertEqual(index["name"], "code__idx")
+        self.assertTrue(index["unique"])
+        assertEqual(str(index["where"]), str(current.db[tablename].deleted == False))
+
+        # Overlong names are shortened
+        s3db.configure(tablename,
+                       indexes = [("name", "code", "category", "created_on", "modified_on")],
+                       )
+        name = s3db.index_definitions(tablename)[0]["name"]
+        self.assertTrue(len(name) <= 60)
+        self.assertTrue(name.endswith("__idx"))
+
+    # -------------------------------------------------------------------------
+    def testMigrateIndexes(self):
+        """ Test creation and removal of declared indexes """
+
+        s3db = current.s3db
+        tablename = self.TABLENAME
+
+        assertIn = self.assertIn
+        assertNotIn = self.assertNotIn
+
+        existing = self.indexes()
+
+        settings = current.deployment_settings
+        migrate = settings.base.get("migrate")
+        settings.base.migrate = True
+        try:
+            # Configuring indexes never creates them during the request
+            s3db.configure(tablename,
+                           indexes = ["name",
+                                      {"fields": ("category", "code"),
+                                       "where": lambda table: table.deleted == False,
+                                       },
+                                      ],
+                           )
+        finally:
+            settings.base.migrate = migrate
+        self.assertEqual(self.indexes(), existing)
+
+        # Indexes are created by migrate_indexes
+        created = s3db.migrate_indexes(tablename)
+        self.assertEqual(len(created), 2)
+        indexes = self.indexes()
+        assertIn("idxtest_record_name__idx", indexes)
+        assertIn("idxtest_record_category_code__idx", indexes)
+
+        # Unchanged declaration => nothing created
+        self.assertEqual(s3db.migrate_indexes(tablename), [])
+
+        # Removed declaration => index dropped
+        s3db.configure(tablename, indexes=["code"])
+        s3db.migrate_indexes(tablename)
+        indexes = self.indexes()
+        assertIn("idxtest_record_code__idx", indexes)
+        assertNotIn("idxtest_record_name__idx", indexes)
+        assertNotIn("idxtest_record_category_code__idx", indexes)
+
+        # No more declarations => all dropped
+        s3db.configure(tablename, indexes=[])
+        s3db.migrate_indexes(tablename)
+        self.assertEqual(self.indexes(), existing)
+
+    # -------------------------------------------------------------------------
+    def testIndexAdvisor(self):
+        """ Test index suggestions from a query log """
+
+        s3db = current.s3db
+        tablename = self.TABLENAME
+
+        assertEqual = self.assertEqual
+
+        s3db.configure(tablename, indexes=["code"])
+
+        advisor = S3IndexAdvisor()
+        advisor.read(['SELECT "idxtest_record"."id" FROM "idxtest_record" '
+                      'WHERE (("idxtest_record"."category" = 3) AND '
+                      '("idxtest_record"."deleted" = \'F\'));',
+                      'LOG:  duration: 25.500 ms  statement: SELECT r.name '
+                      'FROM idxtest_record AS r WHERE (r.category IN (1,2)) '
+                      'AND (r.code = \'x.y\');',
+                      "INSERT INTO idxtest_record (name) VALUES ('a.b');",
+                      ])
+        assertEqual(advisor.statements, 2)
+
+        suggestions = advisor.suggest()
+        assertEqual(len(suggestions), 1)
+
+        suggestion = suggestions[0]
+        assertEqual(suggestion.tablename, tablename)
+        assertEqual(suggestion.fieldname, "category")
+        assertEqual(suggestion.count, 2)
+        assertEqual(suggestion.duration, 25.5)
+
+        self.assertEqual(advisor.suggest(min_count=3), [])
+
+        report = advisor.report()
+        self.assertIn('configure("%s", indexes=[\'category\'])' % tablename, report)
 
 # =============================================================================
 class S3SuperEntityTests(unittest.TestCase):
@@ -1091,7 +1308,8 @@ class S3DynamicComponentTests(unittest.TestCase):
 if __name__ == "__main__":
 
     run_suite(
-        #S3ModelTests,
+        S3ModelTests,
+        S3IndexTests,
         S3SuperEntityTests,
         S3DynamicModelTests,
         S3DynamicComponentTests,
@@ -0,0 +1,240 @@
+# -*- coding: utf-8 -*-
+#
+# S3Report Unit Tests
+#
+# To run this script use:
+# python web2py.py -S eden -M -R applications/eden/modules/unit_tests/s3/s3report.py
+#
+import unittest
+
+from gluon import current, Field
+from s3.s3fields import s3_meta_fields
+from s3.s3query import FS
+from s3.s3report import S3PivotTable, S3PivotTableFact
+
+from unit_tests import run_suite
+
+# =============================================================================
+class S3PivotTableAggregateTests(unittest.TestCase):
+    """ Tests for database-side aggregation of pivot tables """
+
+    category_data = ("Alpha", "Beta", "Gamma")
+
+    record_data = (
+        # name, category, status, value, weight
+        ("PT1", 0, "A", 3, 1.5),
+        ("PT2", 0, "B", 4, None),
+        ("PT3", 1, "A", None, 2.25),
+        ("PT4", 1, "A", 7, 0.5),
+        ("PT5", None, "B", 2, 4.0),
+        ("PT6", 2, None, 5, 1.0),
+        ("PT7", 0, "A", 3, 3.5),
+    )
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def setUpClass(cls):
+
+        s3db = current.s3db
+
+        s3db.define_table("pt_category",
+                          Field("name"),
+                          *s3_meta_fields())
+
+        s3db.define_table("pt_record",
+                          Field("name"),
+                          Field("category_id", "reference pt_category"),
+                          Field("status"),
+                          Field("value", "integer"),
+                          Field("weight", "double"),
+                          *s3_meta_fields())
+
+        ctable = s3db.pt_category
+        category_ids = [ctable.insert(name=name) for name in cls.category_data]
+
+        table = s3db.pt_record
+        for name, category, status, value, weight in cls.record_data:
+            table.insert(name = name,
+                         category_id = category_ids[category]
+                                       if category is not None else None,
+                         status = status,
+                         value = value,
+                         weight = weight,
+                         )
+
+        # Define a virtual field
+        table.code = Field.Method("code", lambda row: row["pt_record.id"] % 2)
+
+        current.db.commit()
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def tearDownClass(cls):
+
+        db = current.db
+
+        db.pt_record.drop()
+        db.pt_category.drop()
+        db.commit()
+
+    # -------------------------------------------------------------------------
+    def setUp(self):
+
+        current.auth.override = True
+
+        settings = current.deployment_settings
+        self.report_aggregate = settings.ui.get("report_aggregate")
+
+    # -------------------------------------------------------------------------
+    def tearDown(self):
+
+        settings = current.deployment_settings
+        settings.ui.report_aggregate = self.report_aggregate
+
+        current.auth.override = False
+
+    # -------------------------------------------------------------------------
+    def pivottable(self, rows, cols, facts, aggregate=False, query=None):
+        """
+            Generate a pivot table for pt_record
+
+            Args:
+                rows: the rows selector
+                cols: the cols selector
+                facts: the fact expressions
+                aggregate: whether to aggregate in the database
+                query: filter query for the resource
+        """
+
+        current.deployment_settings.ui.report_aggregate = aggregate
+
+        resource = current.s3db.resource("pt_record")
+        if query is not None:
+            resource.add_filter(query)
+
+        facts = S3PivotTableFact.parse(facts)
+        return S3PivotTable(resource, rows, cols, facts)
+
+    # -------------------------------------------------------------------------
+    def assertPivotEqual(self, expected, actual):
+        """
+            Verify that two pivot tables have the same headers,
+            cell values and totals (order of rows/cols is irrelevant)
+
+            Args:
+                expected: the pivot table computed in Python
+                actual: the pivot table computed in the database
+        """
+
+        assertEqual = self.assertEqual
+
+        assertEqual(expected.empty, actual.empty)
+        assertEqual(len(expected), len(actual))
+        if expected.empty:
+            return
+
+        layers = [fact.layer for fact in expected.facts]
+
+        def headers(pt, dim):
+            return dict((h.value, (i, [h[l] for l in layers]))
+                        for i, h in enumerate(pt.row if dim == "row" else pt.col))
+
+        erows, arows = headers(expected, "row"), headers(actual, "row")
+        ecols, acols = headers(expected, "col"), headers(actual, "col")
+        assertEqual(set(erows), set(arows))
+        assertEqual(set(ecols), set(acols))
+
+        for rvalue in erows:
+            assertEqual(erows[rvalue][1], arows[rvalue][1])
+            for cvalue in ecols:
+                ecell = expected.cell[erows[rvalue][0]][ecols[cvalue][0]]
+                acell = actual.cell[arows[rvalue][0]][acols[cvalue][0]]
+                for layer in layers:
+                    assertEqual(ecell[layer], acell[layer])
+        for cvalue in ecols:
+            assertEqual(ecols[cvalue][1], acols[cvalue][1])
+
+        for layer in layers:
+            assertEqual(expected.totals[layer], actual.totals[layer])
+
+    # -------------------------------------------------------------------------
+    def testAggregate(self):
+        """ Test database aggregation produces the same pivot table """
+
+        facts = ["count(id)",
+                 "count(status)",
+                 "sum(value)",
+                 "avg(value)",
+                 "min(weight)",
+                 "max(weight)",
+                 "avg(weight)",
+                 ]
+
+        for rows, cols in (("category_id", "status"),
+                           ("status", None),
+                           (None, "category_id$name"),
+                           ):
+            expected = self.pivottable(rows, cols, facts)
+            actual = self.pivottable(rows, cols, facts, aggregate=True)
+
+            # Verify that the pivot tables were computed as expected
+            self.assertNotEqual(expected.records, None)
+            self.assertEqual(actual.records, None)
+
+            self.assertPivotEqual(expected, actual)
+
+            # Verify that the pivot table can be rendered as JSON
+            output = actual.json()
+            self.assertEqual(len(output["cells"]), actual.numrows)
+
+    # -------------------------------------------------------------------------
+    def testAggregateFiltered(self):
+        """ Test database aggregation with a filter on a joined table """
+
+        facts = ["count(id)", "sum(value)"]
+        query = FS("category_id$name").belongs(("Alpha", "Gamma"))
+
+        expected = self.pivottable("status", "category_id", facts, query=query)
+        actual = self.pivottable("status", "category_id", facts,
+                                 aggregate = True,
+                                 query = query,
+                                 )
+        self.assertEqual(actual.records, None)
+        self.assertEqual(len(actual), 4)
+        self.assertPivotEqual(expected, actual)
+
+        # No matching records
+        query = FS("name") == "PT0"
+        actual = self.pivottable("status", "category_id", facts,
+                                 aggregate = True,
+                                 query = query,
+                                 )
+        self.assertTrue(actual.empty)
+        self.assertEqual(len(actual), 0)
+
+    # -------------------------------------------------------------------------
+    def testFallback(self):
+        """ Test fallback to Python pivot where aggregation is impossible """
+
+        assertNotEqual = self.assertNotEqual
+
+        # Virtual field axis
+        pt = self.pivottable("code", "category_id", "count(id)", aggregate=True)
+        assertNotEqual(pt.records, None)
+
+        # List method
+        pt = self.pivottable("status", None, "list(name)", aggregate=True)
+        assertNotEqual(pt.records, None)
+
+        # Non-numeric values for numeric method
+        pt = self.pivottable("status", None, "min(name)", aggregate=True)
+        assertNotEqual(pt.records, None)
+
+# =============================================================================
+if __name__ == "__main__":
+
+    run_suite(
+        S3PivotTableAggregateTests,
+    )
+
+# END ========================================================================
@@ -2517,6 +2517,131 @@ class ResourceSelectTests(unittest.TestCase):
         # - returns all matching record ids, however
         assertEqual(len(data.ids), numitems)
 
+    # -------------------------------------------------------------------------
+    def testIterSelect(self):
+        """ Test chunked selection """
+
+        s3db = current.s3db
+
+        assertEqual = self.assertEqual
+
+        query = FS("status") == "A"
+        resource = s3db.resource("select_master", filter=query)
+
+        expected = resource.select(["id", "name"], orderby="select_master.id").rows
+
+        # Chunks cover all matching records, in order of record IDs
+        chunks = list(resource.iterselect(["id", "name"], chunksize=2))
+        assertEqual([len(data.rows) for data in chunks], [2, 2, 1])
+        rows = [row for data in chunks for row in data.rows]
+        assertEqual(rows, expected)
+
+        # Resource filter not affected
+        assertEqual(len(resource.select(["id"]).rows), len(expected))
+
+        # Start and limit
+        chunks = resource.iterselect(["id", "name"],
+                                     chunksize = 2,
+                                     start = 1,
+                                     limit = 3,
+                                     )
+        rows = [row for data in chunks for row in data.rows]
+        assertEqual(rows, expected[1:4])
+
+        # As rows
+        chunks = list(resource.iterselect(None, chunksize=3, as_rows=True))
+        assertEqual([len(rows) for rows in chunks], [3, 2])
+
+        # Virtual filter => single chunk
+        query = FS("code") == "A"
+        resource = s3db.resource("select_master", filter=query)
+        chunks = list(resource.iterselect(["id", "status"], chunksize=2))
+        assertEqual(len(chunks), 1)
+        assertEqual(chunks[0].ids, [row["select_master.id"] for row in expected])
+
+    # -------------------------------------------------------------------------
+    def testStreamExport(self):
+        """ Test streaming CSV/JSON export """
+
+        s3db = current.s3db
+
+        assertEqual = self.assertEqual
+
+        from s3.s3export import S3Exporter
+        from gluon.serializers import loads_json
+
+        exporter = S3Exporter()
+
+        query = FS("status") == "B"
+        resource = s3db.resource("select_master", filter=query)
+
+        # CSV
+        output = exporter.csv(resource, stream=False)
+        chunks = list(exporter.csv(resource, stream=2))
+        assertEqual(len(chunks), 2)
+        assertEqual(b"".join(chunks).decode("utf-8"), output)
+
+        # JSON
+        fields = ["id", "name"]
+        output = exporter.json(resource, fields=fields, stream=False)
+        chunks = list(exporter.json(resource, fields=fields, stream=2))
+        assertEqual(loads_json(b"".join(chunks).decode("utf-8")),
+                    loads_json(output))
+
+        # Ordered by record ID => streamed
+        table = resource.table
+        chunks = list(exporter.json(resource,
+                                    fields = fields,
+                                    orderby = table.id,
+                                    stream = 2,
+                                    ))
+        assertEqual(len(chunks), 4)
+
+        # Other orderby => not streamed, but ordered
+        orderby = ~table.name
+        output = exporter.json(resource, fields=fields, orderby=orderby, stream=2)
+        self.assertTrue(isinstance(output, str))
+        expected = exporter.json(resource, fields=fields, orderby=orderby, stream=False)
+        assertEqual(output, expected)
+        names = [item["name"] for item in loads_json(output)]
+        assertEqual(names, sorted(names, reverse=True))
+
+    # -------------------------------------------------------------------------
+    def testSelectColumnar(self):
+        """ Test selection with column-wise row parsing """
+
+        s3db = current.s3db
+        settings = current.deployment_settings
+
+        assertEqual = self.assertEqual
+
+        fields = ["id", "name", "status", "code"]
+        orderby = "select_master.name"
+
+        def select(**attr):
+            resource = s3db.resource("select_master",
+                                     filter = FS("status") != "C",
+                                     )
+            data = resource.select(fields, orderby=orderby, **attr)
+            return data.rows, data.ids, data.numrows
+
+        columnar_select = settings.get_base_columnar_select()
+        try:
+            settings.base.columnar_select = False
+            expected = [select(),
+                        select(represent=True),
+                        select(start=2, limit=3, count=True, getids=True),
+                        ]
+
+            settings.base.columnar_select = True
+            assertEqual(select(), expected[0])
+            assertEqual(select(represent=True), expected[1])
+            assertEqual(select(start=2, limit=3, count=True, getids=True),
+                        expected[2],
+                        )
+        finally:
+            settings.base.columnar_select = columnar_select
+
 # =============================================================================
 class ResourceLazyVirtualFieldsSupportTests(unittest.TestCase):
     """ Test support for lazy virtual fields """
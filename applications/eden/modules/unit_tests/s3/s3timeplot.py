@@ -12,7 +12,8 @@ import dateutil.tz
 
 from gluon import *
 from s3.s3timeplot import *
-from s3.s3timeplot import tp_datetime
+from s3.s3timeplot import S3TimeSeries, S3TimeSeriesEvent, S3TimeSeriesEventFrame, \
+                          S3TimeSeriesFact, S3TimeSeriesPeriod, tp_datetime
 from s3.s3query import FS
 
 from unit_tests import run_suite
@@ -1326,7 +1327,7 @@ class DtParseTests(unittest.TestCase):
         assertRaises = self.assertRaises
         assertEqual = self.assertEqual
 
-        ts = TimeSeries
+        ts = S3TimeSeries
         start = datetime.datetime(2014, 1, 3, 11, 30)
 
         result = ts.dtparse(">+1 year", start=start)
@@ -1785,6 +1786,161 @@ class TimeSeriesTests(unittest.TestCase):
         else:
             return False
 
+# =============================================================================
+class TimeSeriesAggregateTests(unittest.TestCase):
+    """ Tests for database-side aggregation of S3TimeSeries """
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def setUpClass(cls):
+
+        db = current.db
+
+        db.define_table("tp_agg_category",
+                        Field("name"),
+                        )
+        db.define_table("tp_agg_events",
+                        Field("event_start", "datetime"),
+                        Field("event_end", "datetime"),
+                        Field("start_date", "date"),
+                        Field("end_date", "date"),
+                        Field("category_id", "reference tp_agg_category"),
+                        Field("event_type"),
+                        Field("parameter1", "integer"),
+                        Field("parameter2", "double"),
+                        )
+
+        ctable = db.tp_agg_category
+        categories = [ctable.insert(name=name) for name in ("A", "B")]
+
+        table = db.tp_agg_events
+        generator = random.Random(1234)
+        for i in range(60):
+            start = datetime.datetime(2011, 1, 1) + \
+                    datetime.timedelta(days = generator.randint(0, 730),
+                                       hours = generator.choice((0, 0, 6, 18)),
+                                       )
+            if i % 5 == 0:
+                end = None
+            else:
+                end = start + datetime.timedelta(days=generator.randint(0, 200))
+            table.insert(event_start = start if i % 7 else None,
+                         event_end = end,
+                         start_date = start.date() if i % 7 else None,
+                         end_date = end.date() if end else None,
+                         category_id = generator.choice(categories + [None]),
+                         event_type = generator.choice(("X", "Y", "Z")),
+                         parameter1 = generator.choice((None, 1, 2, 3, 5)),
+                         parameter2 = generator.choice((None, 0.5, 1.5, 2.0)),
+                         )
+
+    # -------------------------------------------------------------------------
+    @classmethod
+    def tearDownClass(cls):
+
+        db = current.db
+        db.tp_agg_events.drop()
+        db.tp_agg_category.drop()
+
+    # -------------------------------------------------------------------------
+    def setUp(self):
+
+        current.auth.override = True
+
+        settings = current.deployment_settings
+        self.timeplot_aggregate = settings.ui.get("timeplot_aggregate")
+
+    # -------------------------------------------------------------------------
+    def tearDown(self):
+
+        settings = current.deployment_settings
+        settings.ui.timeplot_aggregate = self.timeplot_aggregate
+
+        current.auth.override = False
+
+    # -------------------------------------------------------------------------
+    def timeseries(self, aggregate, **attr):
+        """
+            Generate a time series for tp_agg_events, returns the
+            event frame and the JSON data
+
+            Args:
+                aggregate: whether to aggregate in the database
+                attr: keyword arguments for S3TimeSeries
+        """
+
+        current.deployment_settings.ui.timeplot_aggregate = aggregate
+
+        resource = current.s3db.resource("tp_agg_events")
+        ts = S3TimeSeries(resource, **attr)
+
+        return ts.event_frame, ts.as_dict()
+
+    # -------------------------------------------------------------------------
+    def testAggregate(self):
+        """ Test database aggregation produces the same time series """
+
+        assertEqual = self.assertEqual
+
+        facts = ["count(id)",
+                 "count(parameter2)",
+                 "sum(parameter1)",
+                 "avg(parameter2)",
+                 "min(parameter1)",
+                 "max(parameter2)",
+                 ]
+        cumulate = ["sum(parameter1)", "cumulate(parameter1)"]
+
+        for event_start, event_end in (("event_start", "event_end"),
+                                       ("start_date", "end_date"),
+                                       ("event_start", None),
+                                       ):
+            for slots in ("weeks", "months", "3 months"):
+                for fact_expr in (facts, cumulate):
+                    for rows, cols in ((None, None),
+                                       ("event_type", None),
+                                       ("event_type", "category_id$name"),
+                                       ):
+                        attr = {"event_start": event_start,
+                                "event_end": event_end,
+                                "start": "2011-03-01",
+                                "end": "2013-01-01",
+                                "slots": slots,
+                                "rows": rows,
+                                "cols": cols,
+                                "facts": S3TimeSeriesFact.parse(fact_expr),
+                                }
+
+                        ef, expected = self.timeseries(False, **attr)
+                        assertEqual(ef.periods and
+                                    list(ef.periods.values())[0].aggregates, None)
+
+                        attr["facts"] = S3TimeSeriesFact.parse(fact_expr)
+                        ef, actual = self.timeseries(True, **attr)
+                        self.assertNotEqual(list(ef.periods.values())[0].aggregates, None)
+
+                        assertEqual(expected, actual)
+
+    # -------------------------------------------------------------------------
+    def testFallback(self):
+        """ Test fallback to event extraction where aggregation is impossible """
+
+        facts = [S3TimeSeriesFact("cumulate",
+                                  None,
+                                  slope = "parameter1",
+                                  interval = "months",
+                                  )]
+        ef = self.timeseries(True,
+                             event_start = "event_start",
+                             event_end = "event_end",
+                             start = "2011-03-01",
+                             end = "2013-01-01",
+                             slots = "months",
+                             facts = facts,
+                             )[0]
+        for period in ef.periods.values():
+            self.assertEqual(period.aggregates, None)
+
 # =============================================================================
 class FactParserTests(unittest.TestCase):
     """ Tests for S3TimeSeriesFact parser """
@@ -1910,6 +2066,7 @@ if __name__ == "__main__":
         EventFrameTests,
         DtParseTests,
         TimeSeriesTests,
+        TimeSeriesAggregateTests,
         FactParserTests,
     )
 
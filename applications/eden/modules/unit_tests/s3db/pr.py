@@ -144,11 +144,140 @@ class PRTests(unittest.TestCase):
         users = s3db.pr_realm_users(None)
         self.assertTrue(all([u in users for u in all_users]))
 
+    # -------------------------------------------------------------------------
+    def testAffiliationClosure(self):
+        """ Test maintenance of the affiliation closure """
+
+        db = current.db
+        s3db = current.s3db
+
+        otable = s3db.org_organisation
+        org3 = Storage(name = "Test PR Organisation 3")
+        org3_id = otable.insert(**org3)
+        org3.update(id = org3_id)
+        s3db.update_super(otable, org3)
+        org3 = s3db.pr_get_pe_id("org_organisation", org3_id)
+
+        org1 = self.org1
+        org2 = self.org2
+
+        table = s3db.pr_affiliation_closure
+        def closure():
+            query = table.descendant.belongs((org1, org2, org3))
+            rows = db(query).select(table.ancestor,
+                                    table.descendant,
+                                    table.depth,
+                                    )
+            return {(row.ancestor, row.descendant, row.depth) for row in rows}
+
+        # Chain org1 => org2 => org3
+        s3db.pr_add_affiliation(org1, org2, role="Test Branches")
+        s3db.pr_add_affiliation(org2, org3, role="Test Branches")
+
+        self.assertEqual(s3db.pr_get_ancestors(org3), [str(org2), str(org1)])
+        self.assertEqual(s3db.pr_get_ancestors(org2), [str(org1)])
+        self.assertEqual(set(s3db.pr_get_descendants(org1)), {org2, org3})
+        self.assertEqual(set(s3db.pr_descendants([org1])[org1]), {org2, org3})
+        self.assertEqual(closure(), {(org1, org2, 1),
+                                     (org2, org3, 1),
+                                     (org1, org3, 2),
+                                     })
+
+        # Incremental update gives the same result as a full rebuild
+        s3db.pr_rebuild_closure()
+        self.assertEqual(closure(), {(org1, org2, 1),
+                                     (org2, org3, 1),
+                                     (org1, org3, 2),
+                                     })
+
+        # Removing the link removes the indirect ancestor too
+        s3db.pr_remove_affiliation(org1, org2, role="Test Branches")
+        self.assertEqual(s3db.pr_get_ancestors(org3), [str(org2)])
+        self.assertEqual(s3db.pr_get_descendants(org1), [])
+        self.assertEqual(closure(), {(org2, org3, 1)})
+
+    # -------------------------------------------------------------------------
+    def testRoleClosure(self):
+        """ Test update of the affiliation closure after role edits """
+
+        db = current.db
+        s3db = current.s3db
+
+        otable = s3db.org_organisation
+        org3 = Storage(name = "Test PR Organisation 3")
+        org3_id = otable.insert(**org3)
+        org3.update(id = org3_id)
+        s3db.update_super(otable, org3)
+        org3 = s3db.pr_get_pe_id("org_organisation", org3_id)
+
+        org1 = self.org1
+        org2 = self.org2
+
+        role_id = s3db.pr_add_affiliation(org1, org2, role="Test Branches")
+        onaccept = s3db.get_config("pr_role", "onaccept")
+
+        rtable = s3db.pr_role
+        table = s3db.pr_affiliation_closure
+        def closure():
+            query = (table.descendant == org2)
+            rows = db(query).select(table.id,
+                                    table.ancestor,
+                                    table.depth,
+                                    )
+            return {(row.id, row.ancestor, row.depth) for row in rows}
+
+        # Role unchanged => closure not rewritten
+        before = closure()
+        self.assertEqual({item[1:] for item in before}, {(org1, 1)})
+        onaccept(Storage(vars = Storage(id = role_id)))
+        self.assertEqual(closure(), before)
+
+        # Role entity changed => closure updated
+        db(rtable.id == role_id).update(pe_id = org3)
+        onaccept(Storage(vars = Storage(id = role_id)))
+        self.assertEqual({item[1:] for item in closure()}, {(org3, 1)})
+
+        # Role type changed => no longer an OU ancestor
+        db(rtable.id == role_id).update(role_type = 9)
+        onaccept(Storage(vars = Storage(id = role_id)))
+        self.assertEqual(closure(), set())
+
+    # -------------------------------------------------------------------------
+    def testAffiliationClosureStatus(self):
+        """ Test that the affiliation closure is built only once """
+
+        db = current.db
+        s3db = current.s3db
+        s3 = current.response.s3
+
+        org1 = self.org1
+        org2 = self.org2
+        s3db.pr_add_affiliation(org1, org2, role="Test Branches")
+
+        table = s3db.pr_affiliation_closure
+        stable = s3db.pr_affiliation_closure_status
+        query = (table.descendant == org2)
+
+        # Not built yet => lookup builds the closure
+        db(stable.id > 0).delete()
+        db(table.id > 0).delete()
+        s3.pr_affiliation_closure_built = None
+        self.assertEqual(s3db.pr_get_ancestors(org2), [str(org1)])
+        self.assertTrue(s3.pr_affiliation_closure_built)
+        self.assertFalse(db(stable.built == True).isempty())
+
+        # Built => an empty closure is not rebuilt on lookup
+        db(table.id > 0).delete()
+        s3.pr_affiliation_closure_built = None
+        self.assertEqual(s3db.pr_get_ancestors(org2), [])
+        self.assertTrue(db(query).isempty())
+
     # -------------------------------------------------------------------------
     def tearDown(self):
 
         current.db.rollback()
         current.auth.override = False
+        current.response.s3.pr_affiliation_closure_built = None
 
 # =============================================================================
 class PersonDeduplicateTests(unittest.TestCase):
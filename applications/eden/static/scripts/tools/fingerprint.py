@@ -0,0 +1,26 @@
+#
+# Script to fingerprint the static files
+#
+# - writes static/fingerprints.json, which maps every static file to a hash
+#   of its contents; with settings.base.static_fingerprints = True, URL()
+#   then emits names like scripts/S3/s3.ui.locationselector.0123456789.js
+#   which are served with immutable cache headers
+#
+# - designed to be run within the web2py environment
+#   cd /path/to/web2py
+#   python web2py.py -S eden -R applications/eden/static/scripts/tools/fingerprint.py
+#
+# - run after build.sahana.py (and after compressing files into .gz/.br),
+#   as part of the upgrade cycle for instances
+#
+# - where a web server serves the static folder directly, it must map
+#   fingerprinted names back to the files, e.g. for nginx:
+#   rewrite "^(/eden/static/.+)\.[0-9a-f]{10}(\.\w+)$" $1$2 break;
+#
+
+import os
+
+from gluon.streamer import build_fingerprints
+
+fingerprints = build_fingerprints(os.path.join(request.folder, "static"))
+print("Fingerprinted %s static files" % len(fingerprints))
@@ -0,0 +1,37 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Script to suggest missing database indexes from a query log
+#
+# - the log can be a PostgreSQL server log (with log_min_duration_statement
+#   to capture slow statements and their duration), or a file with one SQL
+#   statement per line
+#
+# Run as:
+#   python web2py.py --no-banner -S eden -M -R applications/eden/static/scripts/tools/index_advisor.py -A /path/to/query.log [min_count]
+#
+# - suggested indexes can be declared in the model with
+#   s3db.configure(tablename, indexes=[...]), and then be created
+#   with indexes.py
+#
+
+import sys
+
+# Parse Arguments
+# argv[0] is the script name
+try:
+    logfile = sys.argv[1]
+except IndexError:
+    print("No query log supplied")
+    sys.exit(2)
+try:
+    min_count = int(sys.argv[2])
+except (IndexError, ValueError):
+    min_count = 1
+
+s3db.load_all_models()
+
+advisor = s3base.S3IndexAdvisor()
+advisor.read(logfile)
+for line in advisor.report(min_count=min_count):
+    print(line)
@@ -1,6 +1,9 @@
 #
 # Script to create database Indexes
 #
+# - creates (or drops) the indexes declared in the models with
+#   s3db.configure(tablename, indexes=[...]), see S3Model.migrate_indexes
+#
 # - should work for our 3 supported databases: sqlite, MySQL & PostgreSQL
 #
 # - designed to be run within the web2py environment
@@ -8,32 +11,11 @@
 #   python web2py.py -S eden -M -R applications/eden/static/scripts/tools/indexes.py
 #
 # - normally run from fabfile.py as part of the upgrade cycle for instances
+#   (new instances get the indexes from zzz_1st_run.py)
 #
 
-tablename = "pr_person"
-field = "first_name"
-try:
-    db.executesql("CREATE INDEX %s__idx on %s(%s);" % (field, tablename, field))
-except:
-    # Index already present
-    pass
-field = "middle_name"
-try:
-    db.executesql("CREATE INDEX %s__idx on %s(%s);" % (field, tablename, field))
-except:
-    # Index already present
-    pass
-field = "last_name"
-try:
-    db.executesql("CREATE INDEX %s__idx on %s(%s);" % (field, tablename, field))
-except:
-    # Index already present
-    pass
+created = s3db.migrate_all_indexes()
+for tablename in sorted(created):
+    print("%s: created %s" % (tablename, ", ".join(created[tablename])))
 
-tablename = "gis_location"
-field = "name"
-try:
-    db.executesql("CREATE INDEX %s__idx on %s(%s);" % (field, tablename, field))
-except:
-    # Index already present
-    pass
+db.commit()
@@ -29,6 +29,8 @@ import random
 import hashlib
 import datetime
 import tempfile
+import threading
+import types
 from gluon import recfile
 from collections import defaultdict
 from collections import OrderedDict
@@ -40,6 +42,8 @@ except ImportError:
     have_settings = False
 
 from pydal.contrib import portalocker
+from pydal._globals import THREAD_LOCAL
+from pydal.base import BaseAdapter
 from gluon._compat import pickle, thread, to_bytes, to_native, hashlib_md5
 
 try:
@@ -75,6 +79,104 @@ __all__ = ['Cache', 'lazy_cache']
 DEFAULT_TIME_EXPIRE = 300
 
 
+class SingleFlight(object):
+    """
+    Lets the threads of this process that need the same value wait for a
+    single computation of it, rather than computing it all at the same
+    time (e.g. when a frequently used cache entry expires)
+    """
+
+    class Call(object):
+        def __init__(self):
+            self.event = threading.Event()
+            self.value = None
+            self.error = None
+
+    def __init__(self):
+        self.lock = thread.allocate_lock()
+        self.calls = {}
+
+    def begin(self, key):
+        """
+        Registers a computation of key, unless one is in progress
+
+        Returns:
+            tuple (call, leader), leader being True if the caller
+            has to do the computation
+        """
+        with self.lock:
+            call = self.calls.get(key)
+            if call is not None:
+                return call, False
+            call = self.calls[key] = self.Call()
+            return call, True
+
+    def run(self, key, call, f):
+        try:
+            call.value = f()
+        except BaseException as e:
+            call.error = e
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call.event.set()
+
+    def __call__(self, key, f):
+        """
+        Returns f(), or the result of the computation of key in progress
+        """
+        call, leader = self.begin(key)
+        if leader:
+            self.run(key, call, f)
+        else:
+            call.event.wait()
+        if call.error is not None:
+            raise call.error
+        return call.value
+
+    def in_background(self, key, f):
+        """
+        Computes f() in a background thread (with a copy of the current
+        context), unless a computation of key is in progress
+
+        The database connections are thread-local: those opened by f
+        in the thread are committed and closed (or given back to the
+        pool) when it is done.
+
+        Returns:
+            True if a thread has been started
+        """
+        call, leader = self.begin(key)
+        if not leader:
+            return False
+        from gluon.globals import current
+        context = dict(current.__dict__)
+        dbs = [db for group in getattr(THREAD_LOCAL, '_pydal_db_instances_', {}).values()
+               for db in group]
+
+        def refresh():
+            current.__dict__.update(context)
+            try:
+                self.run(key, call, f)
+                if call.error is not None:
+                    logger.error('error refreshing %s in background: %s',
+                                 key, call.error)
+            finally:
+                for db in dbs:
+                    try:
+                        db._adapter.close('commit')
+                    except Exception:
+                        logger.exception('error closing %s', db)
+                # databases instantiated by f
+                BaseAdapter.close_all_instances('commit')
+        t = threading.Thread(target=refresh)
+        t.daemon = True
+        t.start()
+        return True
+
+single_flight = SingleFlight()
+
+
 class CacheAbstract(object):
     """
     Abstract class for cache implementations.
@@ -161,6 +263,228 @@ class CacheAbstract(object):
         return
 
 
+class RamStorage(object):
+    """
+    The storage of `CacheInRam` for an application.
+
+    Keys are spread over several stripes, each one an ordered dict (in
+    least recently used order) with its own lock, so that threads looking
+    up different keys do not wait for each other.
+
+    Items are tuples (time, value, time_expire, size).
+    """
+
+    def __init__(self, stats=None, stripes=16):
+        self.stats = stats if stats is not None else new_ram_stats()
+        self.stripes = [OrderedDict() for i in range(stripes)]
+        self.locks = [thread.allocate_lock() for i in range(stripes)]
+        self.sizes = [0] * stripes
+        self.sweep_lock = thread.allocate_lock()
+        self.last_sweep = time.time()
+        self.max_entries = None
+        self.max_bytes = None
+        self.sweep_interval = None
+
+    def _stripe(self, key):
+        return hash(key) % len(self.stripes)
+
+    @staticmethod
+    def sizeof(value):
+        """
+        Estimated size of a value, including the items of the built-in
+        containers (dict, list, tuple, set) it consists of, each object
+        counted once; other objects are counted without the objects they
+        refer to, so the estimate is approximate
+        """
+        getsizeof = sys.getsizeof
+        containers = (list, tuple, set, frozenset)
+        seen = set()
+        stack = [value]
+        size = 0
+        while stack:
+            obj = stack.pop()
+            if id(obj) in seen:
+                continue
+            seen.add(id(obj))
+            try:
+                size += getsizeof(obj)
+            except TypeError:
+                continue
+            if isinstance(obj, dict):
+                stack.extend(obj.keys())
+                stack.extend(obj.values())
+            elif isinstance(obj, containers):
+                stack.extend(obj)
+        return size
+
+    def get(self, key, default=None):
+        """
+        Gets an item, marking it as the most recently used
+        """
+        i = self._stripe(key)
+        stripe = self.stripes[i]
+        with self.locks[i]:
+            item = stripe.pop(key, None)
+            if item is None:
+                return default
+            stripe[key] = item
+        return item
+
+    def set(self, key, value, now=None, time_expire=None):
+        """
+        Stores a value, evicting the least recently used items of its
+        stripe beyond the limits
+        """
+        now = time.time() if now is None else now
+        size = self.sizeof(value) if self.max_bytes else 0
+        i = self._stripe(key)
+        stripe = self.stripes[i]
+        stats = self.stats
+        with self.locks[i]:
+            old = stripe.pop(key, None)
+            if old is not None:
+                self.sizes[i] -= old[3]
+            stripe[key] = (now, value, time_expire, size)
+            self.sizes[i] += size
+            nstripes = len(self.stripes)
+            max_entries = self.max_entries
+            if max_entries:
+                max_entries = max(1, -(-max_entries // nstripes))
+            max_bytes = self.max_bytes
+            if max_bytes:
+                max_bytes = max(1, -(-max_bytes // nstripes))
+            while len(stripe) > 1 and (
+                    max_entries and len(stripe) > max_entries or
+                    max_bytes and self.sizes[i] > max_bytes):
+                self.sizes[i] -= stripe.popitem(last=False)[1][3]
+                stats['evictions'] += 1
+        if self.sweep_interval and now - self.last_sweep > self.sweep_interval:
+            self.sweep(now)
+
+    def sweep(self, now=None):
+        """
+        Removes the items that expired (according to the time_expire
+        they were stored with)
+        """
+        if not self.sweep_lock.acquire(False):
+            # another thread is sweeping
+            return
+        try:
+            now = time.time() if now is None else now
+            self.last_sweep = now
+            expired = 0
+            for i, stripe in enumerate(self.stripes):
+                with self.locks[i]:
+                    for key, item in list(stripe.items()):
+                        dt = item[2]
+                        if dt and dt > 0 and item[0] < now - dt:
+                            del stripe[key]
+                            self.sizes[i] -= item[3]
+                            expired += 1
+            self.stats['expired'] += expired
+        finally:
+            self.sweep_lock.release()
+
+    def increment(self, key, value=1):
+        """
+        Increments the value of a key (or sets it if not present)
+        """
+        i = self._stripe(key)
+        stripe = self.stripes[i]
+        with self.locks[i]:
+            item = stripe.pop(key, None)
+            if item is not None:
+                try:
+                    value = item[1] + value
+                except BaseException:
+                    stripe[key] = item
+                    raise
+                self.sizes[i] -= item[3]
+            stripe[key] = (time.time(), value, None, 0)
+        return value
+
+    def pop(self, key, default=None):
+        i = self._stripe(key)
+        with self.locks[i]:
+            item = self.stripes[i].pop(key, default)
+            if item is not default:
+                self.sizes[i] -= item[3]
+        return item
+
+    def popitem(self, last=True):
+        """
+        Removes the most (or least) recently used item of the stripe
+        holding the newest (or oldest) items
+        """
+        candidates = []
+        for i, stripe in enumerate(self.stripes):
+            with self.locks[i]:
+                if stripe:
+                    key = next(reversed(stripe) if last else iter(stripe))
+                    candidates.append((stripe[key][0], i))
+        if not candidates:
+            raise KeyError('popitem(): cache is empty')
+        i = (max if last else min)(candidates)[1]
+        with self.locks[i]:
+            key, item = self.stripes[i].popitem(last=last)
+            self.sizes[i] -= item[3]
+        self.stats['evictions'] += 1
+        return key, item
+
+    def clear(self):
+        for i, stripe in enumerate(self.stripes):
+            with self.locks[i]:
+                stripe.clear()
+                self.sizes[i] = 0
+
+    def __getitem__(self, key):
+        item = self.get(key)
+        if item is None:
+            raise KeyError(key)
+        return item
+
+    def __setitem__(self, key, item):
+        self.set(key, item[1], now=item[0])
+
+    def __delitem__(self, key):
+        if self.pop(key) is None:
+            raise KeyError(key)
+
+    def __contains__(self, key):
+        return key in self.stripes[self._stripe(key)]
+
+    def __len__(self):
+        return sum(len(stripe) for stripe in self.stripes)
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def keys(self):
+        keys = []
+        for i, stripe in enumerate(self.stripes):
+            with self.locks[i]:
+                keys.extend(stripe.keys())
+        return keys
+
+    def items(self):
+        items = []
+        for i, stripe in enumerate(self.stripes):
+            with self.locks[i]:
+                items.extend(stripe.items())
+        return items
+
+    iteritems = items
+
+    @property
+    def size(self):
+        return sum(self.sizes)
+
+
+def new_ram_stats():
+    return {'hit_total': 0, 'misses': 0, 'evictions': 0, 'expired': 0,
+            'entries': 0, 'bytes': 0}
+
+
 class CacheInRam(CacheAbstract):
     """
     Ram based caching
@@ -168,6 +492,13 @@ class CacheInRam(CacheAbstract):
     This is implemented as global (per process, shared by all threads)
     dictionary.
     A mutex-lock mechanism avoid conflicts.
+
+    The cache of an application can be bounded in number of entries or
+    size (evicting the least recently used ones) and swept of expired
+    entries, see `configure`. `stats[application]` holds the counters
+    of hits, misses, evictions and expired entries, as well as the
+    number of entries and their size (estimated when max_bytes is set).
+    Counters are not locked, so they are approximate under concurrency.
     """
 
     locker = thread.allocate_lock()
@@ -177,7 +508,7 @@ class CacheInRam(CacheAbstract):
     def __init__(self, request=None):
         self.initialized = False
         self.request = request
-        self.storage = OrderedDict() if HAVE_PSUTIL else {}
+        self.storage = RamStorage()
         self.app = request.application if request else ''
 
     def initialize(self):
@@ -187,16 +518,43 @@ class CacheInRam(CacheAbstract):
             self.initialized = True
         self.locker.acquire()
         if self.app not in self.meta_storage:
+            self.stats[self.app] = new_ram_stats()
             self.storage = self.meta_storage[self.app] = \
-                OrderedDict() if HAVE_PSUTIL else {}
-            self.stats[self.app] = {'hit_total': 0, 'misses': 0}
+                RamStorage(self.stats[self.app])
         else:
             self.storage = self.meta_storage[self.app]
         self.locker.release()
 
+    def configure(self, max_entries=None, max_bytes=None, sweep_interval=None):
+        """
+        Sets the limits of the cache of the application (for all requests
+        in this process), e.g. in a model::
+
+            cache.ram.configure(max_entries=10000, sweep_interval=300)
+
+        Args:
+            max_entries(int): the maximum number of entries
+            max_bytes(int): the maximum size of the cached values, as
+                estimated by RamStorage.sizeof (approximate: includes the
+                items of built-in containers, but not the objects that
+                other objects refer to)
+            sweep_interval(int): remove the expired entries every that
+                many seconds, entries expire according to the time_expire
+                they were stored with
+        """
+        self.initialize()
+        storage = self.storage
+        storage.max_entries = max_entries
+        storage.max_bytes = max_bytes
+        storage.sweep_interval = sweep_interval
+
+    def update_stats(self):
+        stats = self.stats[self.app]
+        stats['entries'] = len(self.storage)
+        stats['bytes'] = self.storage.size
+
     def clear(self, regex=None):
         self.initialize()
-        self.locker.acquire()
         storage = self.storage
         if regex is None:
             storage.clear()
@@ -204,13 +562,13 @@ class CacheInRam(CacheAbstract):
             self._clear(storage, regex)
 
         if self.app not in self.stats:
-            self.stats[self.app] = {'hit_total': 0, 'misses': 0}
-
-        self.locker.release()
+            self.stats[self.app] = new_ram_stats()
+        self.update_stats()
 
     def __call__(self, key, f,
                  time_expire=DEFAULT_TIME_EXPIRE,
-                 destroyer=None):
+                 destroyer=None,
+                 stale=False):
         """
         Attention! cache.ram does not copy the cached object.
         It just stores a reference to it. Turns out the deepcopying the object
@@ -223,48 +581,61 @@ class CacheInRam(CacheAbstract):
 
         Anyway. You can deepcopy explicitly in the function generating the value
         to be cached.
+
+        Concurrent calls for a missing or expired key wait for the one
+        calling `f`. With `stale=True` an expired value is returned right
+        away, while `f` is called in a background thread to refresh it.
         """
         self.initialize()
 
         dt = time_expire
         now = time.time()
+        storage = self.storage
+        stats = self.stats[self.app]
 
-        self.locker.acquire()
-        item = self.storage.get(key, None)
-        if item and f is None:
-            del self.storage[key]
-            if destroyer:
-                destroyer(item[1])
-        self.stats[self.app]['hit_total'] += 1
-        self.locker.release()
+        if f is None:
+            item = storage.pop(key)
+        else:
+            item = storage.get(key)
+        stats['hit_total'] += 1
 
         if f is None:
+            if item and destroyer:
+                destroyer(item[1])
+            self.update_stats()
             return None
         if item and (dt is None or item[0] > now - dt):
             return item[1]
-        elif item and (item[0] < now - dt) and destroyer:
-            destroyer(item[1])
-        value = f()
 
-        self.locker.acquire()
-        self.storage[key] = (now, value)
-        self.stats[self.app]['misses'] += 1
-        if HAVE_PSUTIL and self.max_ram_utilization is not None and random.random() < 0.10:
-            remove_oldest_entries(self.storage, percentage=self.max_ram_utilization)
-        self.locker.release()
-        return value
+        def compute(old=None):
+            if old is not None:
+                latest = storage.get(key)
+                if latest is not None and latest is not old:
+                    # refreshed by an earlier flight, which also
+                    # destroyed the old value
+                    return latest[1]
+            value = f()
+            storage.set(key, value, now=now, time_expire=dt)
+            stats['misses'] += 1
+            if HAVE_PSUTIL and self.max_ram_utilization is not None and random.random() < 0.10:
+                remove_oldest_entries(storage, percentage=self.max_ram_utilization)
+            self.update_stats()
+            if old and destroyer:
+                # the expired value is no longer in use
+                destroyer(old[1])
+            return value
+
+        if item and stale and dt > 0:
+            single_flight.in_background((self.app, key),
+                                        lambda: compute(item))
+            return item[1]
+        # only the leader of the flight destroys the expired value
+        return single_flight((self.app, key), lambda: compute(item))
 
     def increment(self, key, value=1):
         self.initialize()
-        self.locker.acquire()
-        try:
-            if key in self.storage:
-                value = self.storage[key][1] + value
-            self.storage[key] = (time.time(), value)
-        except BaseException as e:
-            self.locker.release()
-            raise e
-        self.locker.release()
+        value = self.storage.increment(key, value)
+        self.update_stats()
         return value
 
 
@@ -279,6 +650,11 @@ class CacheOnDisk(CacheAbstract):
     slower than `CacheInRam`
 
     Values stored in disk cache must be pickable.
+
+    With many keys, the 'sqlite' engine keeps them in a few SQLite files
+    instead (see `SQLiteStorage`), e.g. in a model::
+
+        cache.disk = CacheOnDisk(request, engine='sqlite', max_entries=50000)
     """
 
     class PersistentStorage(object):
@@ -402,10 +778,212 @@ class CacheOnDisk(CacheAbstract):
             except KeyError:
                 return default
 
-    def __init__(self, request=None, folder=None):
+        def clear(self, regex=None):
+            """
+            Removes all keys matching the regex (or all keys)
+            """
+            if regex is None:
+                keys = self
+            else:
+                r = re.compile(regex)
+                keys = (key for key in self if r.match(key))
+            for key in keys:
+                self.acquire(key)
+                try:
+                    del self[key]
+                except KeyError:
+                    pass
+                self.release(key)
+
+    class SQLiteStorage(object):
+        """
+        Implements a key based thread/process-safe storage in a few SQLite
+        databases (shards) in WAL mode, rather than one file per key.
+
+        Keys are indexed, so that clearing keys with a common prefix does
+        not need to go through all of them, and the number of entries can
+        be bounded (the least recently used ones are evicted).
+        """
+
+        atime_resolution = 60  # seconds between updates of the access time
+
+        def __init__(self, folder, shards=4, max_entries=None, timeout=30):
+            self.folder = folder
+            self.shards = max(1, shards)
+            self.max_entries = max_entries
+            self.timeout = timeout
+            self.local = threading.local()
+            # Mutex for each key, used by CacheOnDisk to compute
+            # a value only once per process
+            self.file_locks = defaultdict(thread.allocate_lock)
+
+        def connection(self, shard):
+            """
+            The connection of this thread to a shard
+            """
+            connections = getattr(self.local, 'connections', None)
+            if connections is None:
+                connections = self.local.connections = {}
+            db = connections.get(shard)
+            if db is None:
+                import sqlite3
+                filename = os.path.join(self.folder, 'cache.%s.sqlite' % shard)
+                db = sqlite3.connect(filename, timeout=self.timeout,
+                                     isolation_level=None,
+                                     check_same_thread=False)
+                db.text_factory = str
+                db.execute('PRAGMA journal_mode=WAL')
+                db.execute('PRAGMA synchronous=NORMAL')
+                db.execute('CREATE TABLE IF NOT EXISTS cache '
+                           '(key TEXT PRIMARY KEY, value BLOB, atime REAL)')
+                db.execute('CREATE INDEX IF NOT EXISTS cache_atime '
+                           'ON cache (atime)')
+                connections[shard] = db
+            return db
+
+        def shard(self, key):
+            """
+            The connection to the shard holding a key
+            """
+            if self.shards == 1:
+                return self.connection(0)
+            digest = hashlib_md5(key).hexdigest()
+            return self.connection(int(digest[:8], 16) % self.shards)
+
+        def acquire(self, key):
+            self.file_locks[key].acquire()
+
+        def release(self, key):
+            self.file_locks[key].release()
+
+        def _load(self, db, key):
+            row = db.execute('SELECT value, atime FROM cache WHERE key=?',
+                             (key,)).fetchone()
+            if row is None:
+                raise KeyError(key)
+            return pickle.loads(bytes(row[0])), row[1]
+
+        def _store(self, db, key, value):
+            db.execute('INSERT OR REPLACE INTO cache (key, value, atime) '
+                       'VALUES (?, ?, ?)',
+                       (key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL),
+                        time.time()))
+
+        def evict(self, db):
+            """
+            Removes the least recently used entries beyond max_entries
+            """
+            limit = int(self.max_entries / self.shards) or 1
+            count = db.execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+            if count > limit:
+                db.execute('DELETE FROM cache WHERE key IN (SELECT key FROM '
+                           'cache ORDER BY atime LIMIT ?)', (count - limit,))
+
+        def __setitem__(self, key, value):
+            db = self.shard(key)
+            self._store(db, key, value)
+            if self.max_entries and random.random() < 0.10:
+                self.evict(db)
+
+        def __getitem__(self, key):
+            db = self.shard(key)
+            value, atime = self._load(db, key)
+            now = time.time()
+            if self.max_entries and atime < now - self.atime_resolution:
+                db.execute('UPDATE cache SET atime=? WHERE key=?', (now, key))
+            return value
+
+        def __contains__(self, key):
+            return self.shard(key).execute(
+                'SELECT 1 FROM cache WHERE key=?', (key,)).fetchone() is not None
+
+        def __delitem__(self, key):
+            cursor = self.shard(key).execute('DELETE FROM cache WHERE key=?',
+                                             (key,))
+            if not cursor.rowcount:
+                raise KeyError(key)
+
+        def __iter__(self):
+            for shard in range(self.shards):
+                db = self.connection(shard)
+                for row in db.execute('SELECT key FROM cache').fetchall():
+                    yield row[0]
+
+        def safe_apply(self, key, function, default_value=None):
+            """
+            Safely apply a function to the value of a key in storage and set
+            the return value of the function to it.
+
+            Return the result of applying the function.
+            """
+            db = self.shard(key)
+            db.execute('BEGIN IMMEDIATE')
+            try:
+                try:
+                    timestamp, value = self._load(db, key)[0]
+                except KeyError:
+                    value = default_value
+                new_value = function(value)
+                self._store(db, key, (time.time(), new_value))
+            except:
+                db.execute('ROLLBACK')
+                raise
+            db.execute('COMMIT')
+            return new_value
+
+        def keys(self):
+            return list(self.__iter__())
+
+        def get(self, key, default=None):
+            try:
+                return self[key]
+            except KeyError:
+                return default
+
+        def clear(self, regex=None):
+            """
+            Removes all keys matching the regex (or all keys), using the
+            index to find the keys starting with its literal prefix
+            """
+            for shard in range(self.shards):
+                db = self.connection(shard)
+                if regex is None:
+                    db.execute('DELETE FROM cache')
+                    continue
+                pattern = regex[1:] if regex.startswith('^') else regex
+                prefix = re.match(r'[^.^$*+?{}\\\[\]|()]*', pattern).group()
+                if pattern[len(prefix):len(prefix) + 1] in ('*', '?', '{'):
+                    # the last character is optional
+                    prefix = prefix[:-1]
+                if '|' in pattern:
+                    prefix = ''
+                if prefix:
+                    keys = db.execute('SELECT key FROM cache WHERE '
+                                      'key >= ? AND key < ?',
+                                      (prefix, prefix + u'\uffff')).fetchall()
+                else:
+                    keys = db.execute('SELECT key FROM cache').fetchall()
+                r = re.compile(regex)
+                keys = [(key,) for key, in keys if r.match(key)]
+                if keys:
+                    db.executemany('DELETE FROM cache WHERE key=?', keys)
+
+    def __init__(self, request=None, folder=None, engine=None, **attributes):
+        """
+        Args:
+            request: the global request object
+            folder: the folder to store the cache in, defaults to the
+                cache folder of the application
+            engine: the storage engine, None for one file per key,
+                'sqlite' for `SQLiteStorage`
+            attributes: parameters for the storage engine, e.g. shards
+                and max_entries for 'sqlite'
+        """
         self.initialized = False
         self.request = request
         self.folder = folder
+        self.engine = engine
+        self.attributes = attributes
         self.storage = None
 
     def initialize(self):
@@ -424,11 +1002,24 @@ class CacheOnDisk(CacheAbstract):
         if not os.path.exists(folder):
             os.mkdir(folder)
 
-        self.storage = CacheOnDisk.PersistentStorage(folder)
+        if self.engine == 'sqlite':
+            self.storage = CacheOnDisk.SQLiteStorage(folder, **self.attributes)
+        elif self.engine is None:
+            self.storage = CacheOnDisk.PersistentStorage(folder)
+        else:
+            raise SyntaxError('Unknown cache engine: %s' % self.engine)
 
     def __call__(self, key, f,
-                 time_expire=DEFAULT_TIME_EXPIRE):
+                 time_expire=DEFAULT_TIME_EXPIRE,
+                 stale=False):
+        """
+        Concurrent calls (in this process) for a missing or expired key
+        wait for the one calling `f`. With `stale=True` an expired value
+        is returned right away, while `f` is called in a background thread
+        to refresh it.
+        """
         self.initialize()
+        storage = self.storage
 
         def inc_hit_total(v):
             v['hit_total'] += 1
@@ -438,55 +1029,53 @@ class CacheOnDisk(CacheAbstract):
             v['misses'] += 1
             return v
 
+        def update_stats(function):
+            storage.acquire(CacheAbstract.cache_stats_name)
+            try:
+                storage.safe_apply(CacheAbstract.cache_stats_name, function,
+                                   default_value={'hit_total': 0, 'misses': 0})
+            finally:
+                storage.release(CacheAbstract.cache_stats_name)
+
         dt = time_expire
-        self.storage.acquire(key)
-        self.storage.acquire(CacheAbstract.cache_stats_name)
-        item = self.storage.get(key)
-        self.storage.safe_apply(CacheAbstract.cache_stats_name, inc_hit_total,
-                                default_value={'hit_total': 0, 'misses': 0})
+        storage.acquire(key)
+        try:
+            item = storage.get(key)
+            update_stats(inc_hit_total)
 
-        if item and f is None:
-            del self.storage[key]
+            if f is None:
+                if item:
+                    del storage[key]
+                return None
 
-        if f is None:
-            self.storage.release(CacheAbstract.cache_stats_name)
-            self.storage.release(key)
-            return None
+            now = time.time()
 
-        now = time.time()
+            if item and ((dt is None) or (item[0] > now - dt)):
+                return item[1]
+            if not (item and stale and dt > 0):
+                # the key stays locked, so other threads wait for the value
+                value = f()
+                storage[key] = (now, value)
+                update_stats(inc_misses)
+                return value
+        finally:
+            storage.release(key)
 
-        if item and ((dt is None) or (item[0] > now - dt)):
-            value = item[1]
-        else:
+        def refresh():
+            value = f()
+            storage.acquire(key)
             try:
-                value = f()
-            except:
-                self.storage.release(CacheAbstract.cache_stats_name)
-                self.storage.release(key)
-                raise
-            self.storage[key] = (now, value)
-            self.storage.safe_apply(CacheAbstract.cache_stats_name, inc_misses,
-                                    default_value={'hit_total': 0, 'misses': 0})
+                storage[key] = (time.time(), value)
+            finally:
+                storage.release(key)
+            update_stats(inc_misses)
 
-        self.storage.release(CacheAbstract.cache_stats_name)
-        self.storage.release(key)
-        return value
+        single_flight.in_background((self.storage.folder, key), refresh)
+        return item[1]
 
     def clear(self, regex=None):
         self.initialize()
-        storage = self.storage
-        if regex is None:
-            keys = storage
-        else:
-            r = re.compile(regex)
-            keys = (key for key in storage if r.match(key))
-        for key in keys:
-            storage.acquire(key)
-            try:
-                del storage[key]
-            except KeyError:
-                pass
-            storage.release(key)
+        self.storage.clear(regex)
 
     def increment(self, key, value=1):
         self.initialize()
@@ -496,8 +1085,38 @@ class CacheOnDisk(CacheAbstract):
         return value
 
 
+def single_flight_call(cache_model, key, f, time_expire, stale=False):
+    """
+    Calls a cache model, making sure that concurrent callers in this
+    process wait for a single call of f also with cache models that do not
+    provide such a protection themselves (e.g. memcache)
+
+    Args:
+        cache_model: the cache model
+        key: the cache key
+        f: the function computing the value
+        time_expire: the expiration of the cache in seconds
+        stale: return expired values while refreshing them in the
+            background (only supported by cache.ram and cache.disk)
+    """
+    if isinstance(cache_model, (CacheInRam, CacheOnDisk)):
+        if stale:
+            return cache_model(key, f, time_expire, stale=True)
+        return cache_model(key, f, time_expire)
+    elif isinstance(cache_model, types.FunctionType):
+        # e.g. Cache.with_prefix, nothing to tell them apart
+        return cache_model(key, f, time_expire)
+    from gluon.globals import current
+    request = getattr(current, 'request', None)
+    flight_key = (getattr(request, 'application', None),
+                  type(cache_model).__name__, key)
+    return cache_model(key,
+                       lambda: single_flight(flight_key, f),
+                       time_expire)
+
+
 class CacheAction(object):
-    def __init__(self, func, key, time_expire, cache, cache_model):
+    def __init__(self, func, key, time_expire, cache, cache_model, stale=False):
         self.__name__ = func.__name__
         self.__doc__ = func.__doc__
         self.func = func
@@ -505,6 +1124,7 @@ class CacheAction(object):
         self.time_expire = time_expire
         self.cache = cache
         self.cache_model = cache_model
+        self.stale = stale
 
     def __call__(self, *a, **b):
         if not self.key:
@@ -515,9 +1135,10 @@ class CacheAction(object):
         cache_model = self.cache_model
         if not cache_model or isinstance(cache_model, str):
             cache_model = getattr(self.cache, cache_model or 'ram')
-        return cache_model(key2,
-                           lambda a=a, b=b: self.func(*a, **b),
-                           self.time_expire)
+        return single_flight_call(cache_model, key2,
+                                  lambda a=a, b=b: self.func(*a, **b),
+                                  self.time_expire,
+                                  stale=self.stale)
 
 
 class Cache(object):
@@ -628,7 +1249,8 @@ class Cache(object):
                         cache_key = prefix + cache_key
                     try:
                         # action returns something
-                        rtn = cache_model(cache_key, lambda: func(), time_expire=time_expire)
+                        rtn = single_flight_call(cache_model, cache_key,
+                                                 lambda: func(), time_expire)
                         http, status = None, current.response.status
                     except HTTP as e:
                         # action raises HTTP (can still be valid)
@@ -679,7 +1301,8 @@ class Cache(object):
     def __call__(self,
                  key=None,
                  time_expire=DEFAULT_TIME_EXPIRE,
-                 cache_model=None):
+                 cache_model=None,
+                 stale=False):
         """
         Decorator function that can be used to cache any function/method.
 
@@ -693,6 +1316,9 @@ class Cache(object):
                 refresh.
             cache_model(str): can be "ram", "disk" or other (like "memcache").
                 Defaults to "ram"
+            stale(bool): once expired, keep returning the cached value
+                while it gets refreshed in a background thread (only
+                with "ram" and "disk")
 
         When the function `f` is called, web2py tries to retrieve
         the value corresponding to `key` from the cache if the
@@ -712,7 +1338,8 @@ class Cache(object):
         """
 
         def tmp(func, cache=self, cache_model=cache_model):
-            return CacheAction(func, key, time_expire, self, cache_model)
+            return CacheAction(func, key, time_expire, self, cache_model,
+                               stale=stale)
         return tmp
 
     @staticmethod
@@ -31,6 +31,8 @@ from pydal.contrib import portalocker
 from pickle import Pickler, MARK, DICT, EMPTY_DICT
 # from types import DictionaryType
 import datetime
+import logging
+import marshal
 import re
 import os
 import sys
@@ -56,6 +58,8 @@ except ImportError:
 
 __all__ = ['Request', 'Response', 'Session']
 
+logger = logging.getLogger("web2py")
+
 current = threading.local()  # thread-local storage for request-scope globals
 
 css_template = '<link href="%s" rel="stylesheet" type="text/css" />'
@@ -805,11 +809,15 @@ class Session(Storage):
     - session_db_record_id
     - session_db_table
     - session_db_unique_key
+    - session_db_data_table  : table of the per-key session data (delta)
+    - session_db_values      : {key: serialized value} as loaded
 
     if session in file:
 
     - session_file
     - session_filename
+    - session_lock           : False if the file is read without lock
+    - session_file_data      : the file content read (without lock)
     """
 
     REGEX_SESSION_FILE = r'^(?:[\w-]+/)?[\w.-]+$'
@@ -825,7 +833,9 @@ class Session(Storage):
                 check_client=False,
                 cookie_key=None,
                 cookie_expires=None,
-                compression_level=None
+                compression_level=None,
+                lock=True,
+                delta=False
                 ):
         """
         Used in models, allows to customize Session handling
@@ -848,6 +858,19 @@ class Session(Storage):
             cookie_expires: sets the expiration of the cookie
             compression_level(int): 0-9, sets zlib compression on the data
                 before the encryption
+            lock(bool): for file sessions, with False the session file is
+                not locked for the duration of the request, so that
+                concurrent requests of the same client do not wait for
+                each other. The file is read under a brief shared lock,
+                and changes are saved under a brief exclusive lock; if
+                the file has been changed by another request meanwhile,
+                the changes are merged per key, and the save is rejected
+                if both requests changed the same key (keys starting with
+                "_", like form keys, are overwritten instead)
+            delta(bool): for sessions in db, store each key of the session
+                in a separate record of a "<tablename>_<masterapp>_data"
+                table, so that only the keys which have changed are
+                written (instead of the whole pickled session)
         """
         request = request or current.request
         response = response or current.response
@@ -900,8 +923,13 @@ class Session(Storage):
 
         # else if we are supposed to use file based sessions
         elif response.session_storage_type == 'file':
+            if not lock:
+                # Release the file opened by an earlier connect
+                self._close(response)
             response.session_new = False
             response.session_file = None
+            response.session_lock = lock
+            response.session_file_data = None
             # check if the session_id points to a valid sesion filename
             if response.session_id:
                 if not re.match(self.REGEX_SESSION_FILE, response.session_id):
@@ -913,11 +941,20 @@ class Session(Storage):
                     try:
                         response.session_file = \
                             recfile.open(response.session_filename, 'rb+')
-                        portalocker.lock(response.session_file,
-                                         portalocker.LOCK_EX)
-                        response.session_locked = True
-                        self.update(pickle.load(response.session_file))
-                        response.session_file.seek(0)
+                        if lock:
+                            portalocker.lock(response.session_file,
+                                             portalocker.LOCK_EX)
+                            response.session_locked = True
+                            self.update(pickle.load(response.session_file))
+                            response.session_file.seek(0)
+                        else:
+                            portalocker.lock(response.session_file,
+                                             portalocker.LOCK_SH)
+                            response.session_locked = True
+                            data = response.session_file.read()
+                            self._close(response)
+                            self.update(pickle.loads(data))
+                            response.session_file_data = data
                         oc = response.session_filename.split('/')[-1].split('-')[0]
                         if check_client and response.session_client != oc:
                             raise Exception("cookie attack")
@@ -966,6 +1003,31 @@ class Session(Storage):
                 )
                 table = db[tname]  # to allow for lazy table
             response.session_db_table = table
+            dtable = None
+            if delta:
+                dname = tname + '_data'
+                dtable = db.get(dname, None)
+                if dtable is None:
+                    db.define_table(
+                        dname,
+                        Field('session_id', 'reference %s' % tname,
+                              ondelete='CASCADE'),
+                        Field('name', length=255),
+                        Field('value', 'blob'),
+                        migrate=table_migrate,
+                    )
+                    dtable = db[dname]
+                    if dname in db._migrated:
+                        # One record per key and session, created along
+                        # with the table (not in every request)
+                        dtable.migrate_indexes([
+                            {'name': '%s_key_idx' % dname,
+                             'fields': ['session_id', 'name'],
+                             'unique': True,
+                             }])
+                response.session_db_values = {}
+                response.session_db_changes = None
+            response.session_db_data_table = dtable
             if response.session_id:
                 # Get session data out of the database
                 try:
@@ -982,8 +1044,13 @@ class Session(Storage):
                         # rows[0].update_record(locked=True)
                         # Unpickle the data
                         try:
-                            session_data = pickle.loads(row['session_data'])
-                            self.update(session_data)
+                            if dtable is not None and not row['session_data']:
+                                self._load_from_db_data(response, record_id)
+                            elif row['session_data']:
+                                session_data = pickle.loads(row['session_data'])
+                                self.update(session_data)
+                            # else: stored per key while delta was
+                            # enabled => start with an empty session
                             response.session_new = False
                         except:
                             record_id = None
@@ -1014,8 +1081,9 @@ class Session(Storage):
                 response.cookies[response.session_id_name]['expires'] = \
                     cookie_expires.strftime(FMT)
 
-        session_pickled = pickle.dumps(self, pickle.HIGHEST_PROTOCOL)
-        response.session_hash = hashlib.md5(session_pickled).hexdigest()
+        if not response.session_db_data_table:
+            session_pickled = pickle.dumps(self, pickle.HIGHEST_PROTOCOL)
+            response.session_hash = hashlib.md5(session_pickled).hexdigest()
 
         if self.flash:
             (response.flash, self.flash) = (self.flash, None)
@@ -1156,6 +1224,10 @@ class Session(Storage):
             if response.session_id:
                 (record_id, sep, unique_key) = response.session_id.partition(':')
                 if record_id.isdigit() and long(record_id) > 0:
+                    dtable = response.session_db_data_table
+                    if dtable:
+                        dtable._db(dtable.session_id == record_id).delete()
+                        response.session_db_values = {}
                     table._db(table.id == record_id).delete()
         Storage.clear(self)
 
@@ -1213,6 +1285,9 @@ class Session(Storage):
                 if item not in internal:
                     return False
             return True
+        if response.session_db_data_table:
+            changed, removed = self._db_data_changes(response)
+            return not changed and not removed
         session_pickled = pickle.dumps(self, pickle.HIGHEST_PROTOCOL)
         response.session_pickled = session_pickled
         session_hash = hashlib.md5(session_pickled).hexdigest()
@@ -1240,7 +1315,12 @@ class Session(Storage):
         else:
             unique_key = response.session_db_unique_key
 
-        session_pickled = response.session_pickled or pickle.dumps(self, pickle.HIGHEST_PROTOCOL)
+        dtable = response.session_db_data_table
+        if dtable:
+            # Data are stored per key
+            session_pickled = None
+        else:
+            session_pickled = response.session_pickled or pickle.dumps(self, pickle.HIGHEST_PROTOCOL)
 
         dd = dict(locked=0,
                   client_ip=response.session_client,
@@ -1255,10 +1335,108 @@ class Session(Storage):
             response.session_id = '%s:%s' % (record_id, unique_key)
             response.session_db_unique_key = unique_key
             response.session_db_record_id = record_id
+            if dtable:
+                # New record => store all keys
+                response.session_db_values = {}
+                response.session_db_changes = None
+        if dtable:
+            self._store_db_data(response, record_id)
 
         self.save_session_id_cookie()
         return True
 
+    @staticmethod
+    def _dumps_value(value):
+        """
+        Serializes a session value: marshal for builtin types (faster and
+        more compact), otherwise pickle; tagged with b'M' or b'P'
+        """
+        try:
+            return b'M' + marshal.dumps(value)
+        except ValueError:
+            return b'P' + pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+    @staticmethod
+    def _loads_value(data):
+        """
+        Deserializes a session value serialized with _dumps_value
+        """
+        data = to_bytes(data)
+        if data[:1] == b'M':
+            return marshal.loads(data[1:])
+        return pickle.loads(data[1:])
+
+    def _load_from_db_data(self, response, record_id):
+        """
+        Loads the per-key session data (delta)
+        """
+        dtable = response.session_db_data_table
+        values = {}
+        rows = dtable._db(dtable.session_id == record_id).select(
+            dtable.name, dtable.value)
+        for row in rows:
+            data = to_bytes(row.value)
+            self[row.name] = self._loads_value(data)
+            values[row.name] = data
+        response.session_db_values = values
+
+    def _db_data_changes(self, response):
+        """
+        Determines which keys have been changed or removed since the
+        session was loaded, by comparing the serialized values
+
+        Returns:
+            tuple ({key: serialized value}, [removed keys])
+        """
+        if response.session_db_changes is not None:
+            return response.session_db_changes
+        values = response.session_db_values or {}
+        changed = {}
+        for key, value in iteritems(dict(self)):
+            data = self._dumps_value(value)
+            if values.get(key) != data:
+                changed[key] = data
+        removed = [key for key in values if key not in self]
+        response.session_db_changes = (changed, removed)
+        return changed, removed
+
+    def _store_db_data(self, response, record_id):
+        """
+        Writes the changed keys of the session (delta); keys are updated
+        first and only inserted if not present yet, and if a concurrent
+        request of the same session has inserted the key meanwhile (unique
+        index), it is updated instead
+        """
+        dtable = response.session_db_data_table
+        db = dtable._db
+        adapter = db._adapter
+        # Postgres aborts the transaction upon failure => savepoint
+        savepoint = adapter.dbengine == 'postgres'
+        values = response.session_db_values or {}
+        changed, removed = self._db_data_changes(response)
+        session_query = (dtable.session_id == record_id)
+        for key, data in iteritems(changed):
+            query = session_query & (dtable.name == key)
+            if not db(query).update(value=data):
+                if savepoint:
+                    adapter.execute('SAVEPOINT web2py_session_data;')
+                try:
+                    dtable.insert(session_id=record_id, name=key, value=data)
+                except adapter.driver.IntegrityError:
+                    if savepoint:
+                        adapter.execute('ROLLBACK TO SAVEPOINT web2py_session_data;')
+                    db(query).update(value=data)
+                else:
+                    if savepoint:
+                        adapter.execute('RELEASE SAVEPOINT web2py_session_data;')
+            values[key] = data
+        if removed:
+            db(session_query & dtable.name.belongs(removed)).delete()
+            for key in removed:
+                del values[key]
+        response.session_db_values = values
+        response.session_db_changes = None
+
     def _try_store_in_cookie_or_file(self, request, response):
         if response.session_storage_type == 'file':
             return self._try_store_in_file(request, response)
@@ -1274,6 +1452,11 @@ class Session(Storage):
                 # self.clear_session_cookies()
                 return False
             else:
+                if response.session_file_data is not None and not response.session_new:
+                    # Read without lock => check and merge concurrent changes
+                    stored = self._store_merged_in_file(response)
+                    if stored is not None:
+                        return stored
                 if response.session_new or not response.session_file:
                     # Tests if the session sub-folder exists, if not, create it
                     session_folder = os.path.dirname(response.session_filename)
@@ -1291,6 +1474,87 @@ class Session(Storage):
             self._close(response)
             self.save_session_id_cookie()
 
+    def _store_merged_in_file(self, response):
+        """
+        Saves a session that was read without lock: compares the current
+        file content with the content read in connect (compare-and-swap),
+        and merges the changes of this request into the file if it has
+        been changed by another request meanwhile
+
+        Returns:
+            True if the session was saved, False on conflict, None if
+            the file does not exist (any more)
+        """
+        try:
+            response.session_file = recfile.open(response.session_filename, 'rb+')
+        except IOError:
+            return None
+        portalocker.lock(response.session_file, portalocker.LOCK_EX)
+        response.session_locked = True
+
+        data = response.session_file.read()
+        if data == response.session_file_data:
+            # Unchanged since connect
+            session_pickled = response.session_pickled or \
+                pickle.dumps(self, pickle.HIGHEST_PROTOCOL)
+        else:
+            try:
+                theirs = pickle.loads(data)
+            except Exception:
+                theirs = {}
+            original = pickle.loads(response.session_file_data)
+            merged = self._merge(original, dict(self), theirs)
+            if merged is None:
+                logger.warning("session %s changed by concurrent request, "
+                               "changes rejected" % response.session_id)
+                return False
+            session_pickled = pickle.dumps(Session(merged), pickle.HIGHEST_PROTOCOL)
+
+        response.session_file.seek(0)
+        response.session_file.write(session_pickled)
+        response.session_file.truncate()
+        response.session_file_data = session_pickled
+        return True
+
+    @staticmethod
+    def _merge(original, mine, theirs):
+        """
+        Merges the changes from original to mine into theirs, key by key
+
+        Returns:
+            the merged dict, or None if both mine and theirs changed
+            the same key (except for keys starting with "_")
+        """
+        def dumps(value):
+            return pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+        merged = dict(theirs)
+        for key in set(original) | set(mine):
+            if key not in mine:
+                mine_value = None
+            else:
+                mine_value = dumps(mine[key])
+            if key not in original:
+                original_value = None
+            else:
+                original_value = dumps(original[key])
+            if mine_value == original_value:
+                # Not changed by this request
+                continue
+            if not key.startswith('_') and key in theirs:
+                theirs_value = dumps(theirs[key])
+                if theirs_value != original_value and theirs_value != mine_value:
+                    return None
+            elif not key.startswith('_') and original_value is not None:
+                # Deleted by the other request, changed by this one
+                if mine_value is not None:
+                    return None
+            if mine_value is None:
+                merged.pop(key, None)
+            else:
+                merged[key] = mine[key]
+        return merged
+
     def _unlock(self, response):
         if response and response.session_file and response.session_locked:
             try:
@@ -333,6 +333,16 @@ def URL(a=None,
             from gluon.globals import current
             if hasattr(current, 'response'):
                 response = current.response
+                # add content fingerprint to file name
+                fingerprints = response.static_fingerprints
+                if fingerprints:
+                    fingerprint = fingerprints.get('/'.join([function] + [str(x) for x in args]))
+                    if fingerprint:
+                        from gluon.streamer import fingerprinted_name
+                        if args:
+                            args = list(args[:-1]) + [fingerprinted_name(str(args[-1]), fingerprint)]
+                        else:
+                            function = fingerprinted_name(function, fingerprint)
                 if response.static_version and response.static_version_urls:
                     args = [function] + args
                     function = '_' + str(response.static_version)
@@ -84,6 +84,7 @@ from gluon.globals import Request, Response, Session
 from gluon.compileapp import build_environment, run_models_in, \
     run_controller_in, run_view_in
 from gluon.contenttype import contenttype
+from gluon.streamer import unfingerprint
 from pydal.base import BaseAdapter
 from gluon.validators import CRYPT
 from gluon.html import URL, xmlescape
@@ -313,11 +314,12 @@ def wsgibase(environ, responder):
                 response.status = env.web2py_status_code or response.status
 
                 if static_file:
+                    static_file, fingerprint = unfingerprint(static_file)
                     if eget('QUERY_STRING', '').startswith('attachment'):
                         response.headers['Content-Disposition'] \
                             = 'attachment'
-                    if version:
-                        response.headers['Cache-Control'] = 'max-age=315360000'
+                    if version or fingerprint:
+                        response.headers['Cache-Control'] = 'max-age=315360000, immutable'
                         response.headers[
                             'Expires'] = 'Thu, 31 Dec 2037 23:59:59 GMT'
                     response.stream(static_file, request=request)
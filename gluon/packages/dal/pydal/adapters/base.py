@@ -1,3 +1,7 @@
+import copy
+import datetime
+import decimal
+import itertools
 import re
 import sys
 import types
@@ -11,6 +15,7 @@ from .._compat import (
     hashlib_md5,
     integer_types,
     basestring,
+    long,
 )
 from .._globals import IDENTITY
 from ..connection import ConnectionPool
@@ -31,6 +36,7 @@ from ..objects import (
     Expression,
     Query,
     Rows,
+    ColumnRows,
     IterRows,
     LazySet,
     LazyReferenceGetter,
@@ -49,6 +55,35 @@ CALLABLETYPES = (
     types.BuiltinMethodType,
 )
 
+#: types of literal values which can be part of a compiled SELECT
+CONSTANTTYPES = (
+    basestring,
+    integer_types,
+    float,
+    decimal.Decimal,
+    datetime.date,
+    datetime.time,
+    type(None),
+)
+
+REGEX_PLACEHOLDER = re.compile("\x00(\\d+)\x00")
+
+
+class NotCompilable(Exception):
+    pass
+
+
+class Placeholder(object):
+    """Marks a parameter slot when compiling a SELECT into a template"""
+
+    __slots__ = ("marker",)
+
+    def __init__(self, index):
+        self.marker = "\x00%d\x00" % index
+
+    def __str__(self):
+        return self.marker
+
 
 class BaseAdapter(with_metaclass(AdapterMeta, ConnectionPool)):
     dbengine = "None"
@@ -258,21 +293,46 @@ class BaseAdapter(with_metaclass(AdapterMeta, ConnectionPool)):
         fields_virtual,
         fields_lazy,
     ):
+        #: parse the values, then build the Row
+        values = []
+        append = values.append
+        for j in range(len(colnames)):
+            value = row[j]
+            tmp = tmps[j]
+            #: do we have a real column?
+            if tmp:
+                field = tmp[3]
+                value = self.parse_value(value, tmp[5], tmp[4], blob_decode)
+                if field.filter_out:
+                    value = field.filter_out(value)
+            else:
+                #: fields[j] may be None if only 'colnames' was specified in db.executesql()
+                f_itype, ftype = (
+                    fields[j] and [fields[j]._itype, fields[j].type] or [None, None]
+                )
+                value = self.parse_value(value, f_itype, ftype, blob_decode)
+            append(value)
+        return self._build_row(
+            values, tmps, fields, colnames, cacheable, fields_virtual, fields_lazy
+        )
+
+    def _build_row(
+        self, values, tmps, fields, colnames, cacheable, fields_virtual, fields_lazy
+    ):
+        """
+        Builds a Row from the parsed values of a record
+        """
         new_row = defaultdict(self.db.Row)
         extras = self.db.Row()
         #: let's loop over columns
         for (j, colname) in enumerate(colnames):
-            value = row[j]
+            value = values[j]
             tmp = tmps[j]
             tablename = None
             #: do we have a real column?
             if tmp:
                 (tablename, fieldname, table, field, ft, fit) = tmp
                 colset = new_row[tablename]
-                #: parse value
-                value = self.parse_value(value, fit, ft, blob_decode)
-                if field.filter_out:
-                    value = field.filter_out(value)
                 colset[fieldname] = value
                 #! backward compatibility
                 if ft == "id" and fieldname != "id" and "id" not in table.fields:
@@ -287,11 +347,6 @@ class BaseAdapter(with_metaclass(AdapterMeta, ConnectionPool)):
                         )
             #: otherwise we set the value in extras
             else:
-                #: fields[j] may be None if only 'colnames' was specified in db.executesql()
-                f_itype, ftype = (
-                    fields[j] and [fields[j]._itype, fields[j].type] or [None, None]
-                )
-                value = self.parse_value(value, f_itype, ftype, blob_decode)
                 extras[colname] = value
                 if not fields[j]:
                     new_row[colname] = value
@@ -375,12 +430,123 @@ class BaseAdapter(with_metaclass(AdapterMeta, ConnectionPool)):
                     pass
         return rowsobj
 
-    def iterparse(self, sql, fields, colnames, blob_decode=True, cacheable=False):
+    def parse_columns(self, rows, fields, colnames, blob_decode=True, cacheable=False):
+        """
+        Alternative processor for select(), parses the values column by
+        column (resolving the parser of each column only once) and returns
+        a ColumnRows object which builds the Row objects only when accessed::
+
+            rows = db(query).select(processor=db._adapter.parse_columns)
+            names = rows.column(db.person.name)
+
+        Falls back to parse() for tables with old style virtual fields
+        """
+        (fields_virtual, fields_lazy, tmps) = self._parse_expand_colnames(fields)
+        for table, virtual_fields in fields_virtual.values():
+            if getattr(table, "virtualfields", None):
+                return self.parse(rows, fields, colnames, blob_decode, cacheable)
+        if rows:
+            columns = [
+                self._parse_column(values, tmps[j], fields[j], blob_decode)
+                for j, values in enumerate(zip(*rows))
+            ]
+        else:
+            columns = [[] for colname in colnames]
+
+        def build(values):
+            return self._build_row(
+                values, tmps, fields, colnames, cacheable, fields_virtual, fields_lazy
+            )
+
+        return ColumnRows(
+            self.db,
+            colnames=colnames,
+            rawrows=rows,
+            fields=fields,
+            columns=columns,
+            build=build,
+        )
+
+    def _parse_column(self, values, tmp, field, blob_decode):
+        """
+        Parses all values of a column, returns a list
+        """
+        if tmp:
+            field_itype, field_type = tmp[5], tmp[4]
+        elif field:
+            field_itype, field_type = field._itype, field.type
+        else:
+            field_itype = field_type = None
+        parse = self._column_parser(field_itype, field_type, blob_decode)
+        values = parse(values) if parse else list(values)
+        filter_out = tmp[3].filter_out if tmp else None
+        if filter_out:
+            values = [filter_out(value) for value in values]
+        return values
+
+    def _column_parser(self, field_itype, field_type, blob_decode):
+        """
+        Returns a function to parse all values of a column at once
+        (same results as parse_value), or None if the values of the
+        column need no parsing
+        """
+        if PY2:
+            parse_value = self.parse_value
+            return lambda values: [
+                parse_value(value, field_itype, field_type, blob_decode)
+                for value in values
+            ]
+        if isinstance(field_type, SQLCustomType):
+            decoder = field_type.decoder
+            return lambda values: [decoder(value) for value in values]
+        if not isinstance(field_type, str):
+            return None
+        if field_type == "blob" and not blob_decode:
+            return None
+        parser = self.parser
+        wrapper = parser.registered.get(field_itype)
+        if not hasattr(wrapper, "f"):
+            # default parser returns the value as-is
+            return None
+        f = wrapper.f
+        # extras depend on the field type only
+        extras = wrapper.extra(parser, field_type) if hasattr(wrapper, "extra") else {}
+        return lambda values: [
+            None if value is None else f(parser, value, **extras) for value in values
+        ]
+
+    def iterparse(
+        self,
+        sql,
+        fields,
+        colnames,
+        blob_decode=True,
+        cacheable=False,
+        stream=False,
+        fetch_size=None,
+    ):
         """
         Iterator to parse one row at a time.
         It doesn't support the old style virtual fields
         """
-        return IterRows(self.db, sql, fields, colnames, blob_decode, cacheable)
+        return IterRows(
+            self.db,
+            sql,
+            fields,
+            colnames,
+            blob_decode,
+            cacheable,
+            stream=stream,
+            fetch_size=fetch_size,
+        )
+
+    def server_side_cursor(self, fetch_size=None):
+        """
+        Returns a cursor which fetches the rows of a result set from the
+        server on demand (rather than buffering the whole result set in
+        the client), or None if the driver does not support it
+        """
+        return None
 
     def adapt(self, value):
         return value
@@ -418,7 +584,15 @@ class SQLAdapter(BaseAdapter):
     # [Note - gi0baro] can_select_for_update should be deprecated and removed
     can_select_for_update = True
     execution_handlers = []
+    # multi-row INSERT ... RETURNING support for bulk_insert
+    bulk_insert_returning = False
+    bulk_insert_size = 500
     migrator_cls = Migrator
+    # compiled SELECT templates, shared by all adapter instances
+    compile_cache_size = 1000
+    _compile_cache = {}
+    # dialect operators whose right operand becomes a template parameter
+    compile_param_ops = ("eq", "ne", "lt", "lte", "gt", "gte")
 
     def __init__(self, *args, **kwargs):
         super(SQLAdapter, self).__init__(*args, **kwargs)
@@ -427,6 +601,10 @@ class SQLAdapter(BaseAdapter):
         self.execution_handlers = list(self.db.execution_handlers)
         if self.db._debug:
             self.execution_handlers.insert(0, DebugHandler)
+        compile_cache = self.adapter_args.get("compile_cache", False)
+        if compile_cache is True:
+            compile_cache = self.compile_cache_size
+        self.compile_cache = compile_cache
 
     def test_connection(self):
         self.execute("SELECT 1;")
@@ -434,6 +612,8 @@ class SQLAdapter(BaseAdapter):
     def represent(self, obj, field_type):
         if isinstance(obj, (Expression, Field)):
             return str(obj)
+        if isinstance(obj, Placeholder):
+            return obj.marker
         return super(SQLAdapter, self).represent(obj, field_type)
 
     def adapt(self, obj):
@@ -669,6 +849,201 @@ class SQLAdapter(BaseAdapter):
         cacheable=None,
         processor=None,
         cte_collector=None,
+    ):
+        args = (
+            left,
+            join,
+            distinct,
+            orderby,
+            groupby,
+            having,
+            limitby,
+            orderby_on_limitby,
+            for_update,
+        )
+        if self.compile_cache and not outer_scoped and cte_collector is None:
+            try:
+                key, params = self._compile_select_key(query, fields, args)
+            except NotCompilable:
+                pass
+            else:
+                return self._compiled_select(key, params, query, fields, args)
+        return self._build_select(query, fields, *args, outer_scoped=outer_scoped,
+                                  cte_collector=cte_collector)
+
+    def _compile_select_key(self, query, fields, args):
+        """
+        Returns the cache key of a compiled SELECT and the parameters
+        of the query, raises NotCompilable if the SELECT can't be cached
+        """
+        params = []
+        key = (
+            self.__class__,
+            self.dialect.__class__,
+            self._compile_key(query, params),
+            tuple(self._compile_key(f) for f in fields),
+        ) + tuple(self._compile_key(arg) for arg in args)
+        return key, params
+
+    def _compiled_select(self, key, params, query, fields, args):
+        """
+        Returns colnames and SQL of a SELECT from the compile cache, or
+        compiles the SELECT and adds it to the cache
+        """
+        literals = [self.expand(value, ftype) for value, ftype in params]
+        cache = self._compile_cache
+        compiled = cache.get(key)
+        if compiled is not None:
+            colnames, texts, slots = compiled
+            sql = texts[0] + "".join(
+                literals[slot] + texts[i + 1] for i, slot in enumerate(slots)
+            )
+            return list(colnames), sql
+        colnames, sql = self._build_select(query, fields, *args)
+        # compile again with placeholders for the parameters
+        marked = self._compile_mark(query, itertools.count())
+        colnames_, template = self._build_select(marked, fields, *args)
+        tokens = REGEX_PLACEHOLDER.split(template)
+        texts, slots = tokens[0::2], [int(slot) for slot in tokens[1::2]]
+        # only cache the template if it reproduces this SELECT
+        if colnames_ == colnames and sorted(slots) == list(range(len(params))):
+            filled = texts[0] + "".join(
+                literals[slot] + texts[i + 1] for i, slot in enumerate(slots)
+            )
+            if filled == sql:
+                if len(cache) >= self.compile_cache:
+                    cache.clear()
+                cache[key] = (tuple(colnames), texts, slots)
+        return colnames, sql
+
+    def _compile_opname(self, op):
+        if isinstance(op, str):
+            return op
+        if getattr(op, "__self__", None) is self.dialect:
+            return op.__name__
+        raise NotCompilable
+
+    def _compile_slot(self, opname, first, second):
+        """
+        Returns the number of parameter slots for the right operand
+        of an operator, or None if it can't be parametrized
+        """
+        if (
+            second is None
+            or not isinstance(first, Expression)
+            or first.type in ("json", "jsonb")
+        ):
+            return None
+        if opname in self.compile_param_ops:
+            if isinstance(second, CONSTANTTYPES):
+                return 1
+        elif opname == "belongs" and isinstance(second, (list, tuple, set)):
+            if second and all(
+                v is not None and isinstance(v, CONSTANTTYPES) for v in second
+            ):
+                return len(second)
+        return None
+
+    def _compile_key(self, obj, params=None):
+        """
+        Returns a hashable key for the SQL generated from obj, with the
+        values of parameter slots appended to params (if not None)
+        """
+        if isinstance(obj, Field):
+            table = obj._table
+            if not isinstance(table, Table) or self._has_common_filter(table):
+                raise NotCompilable
+            return ("F", obj.tablename, obj.name, obj._rname, self._type_key(obj.type))
+        if isinstance(obj, (Expression, Query)):
+            opname = self._compile_opname(obj.op)
+            first, second = obj.first, obj.second
+            fkey = self._compile_key(first, params)
+            slots = None
+            if params is not None:
+                slots = self._compile_slot(opname, first, second)
+            if slots is None:
+                skey = self._compile_key(second, params)
+            elif opname == "belongs":
+                params.extend((v, first.type) for v in second)
+                skey = ("P", slots)
+            else:
+                params.append((second, first.type))
+                # value truthiness can affect the SQL in some dialects
+                skey = ("P", second.__class__, bool(second))
+            okey = None
+            if obj.optional_args:
+                okey = tuple(
+                    (k, self._compile_key(v))
+                    for k, v in sorted(obj.optional_args.items())
+                    if k != "query_env"
+                )
+            return (
+                opname,
+                self._type_key(getattr(obj, "type", None)),
+                fkey,
+                skey,
+                okey,
+            )
+        if isinstance(obj, CONSTANTTYPES):
+            return (obj.__class__, obj)
+        if isinstance(obj, (list, tuple, set)):
+            return (obj.__class__, tuple(self._compile_key(v) for v in obj))
+        if isinstance(obj, Table):
+            if self._has_common_filter(obj):
+                raise NotCompilable
+            return ("T", obj._tablename, obj._dalname, obj._rname)
+        raise NotCompilable
+
+    def _compile_mark(self, obj, index):
+        """
+        Returns a copy of a query with placeholders in all parameter slots,
+        in the same order as collected by _compile_key
+        """
+        if isinstance(obj, Field) or not isinstance(obj, (Expression, Query)):
+            return obj
+        opname = self._compile_opname(obj.op)
+        first, second = obj.first, obj.second
+        first_ = self._compile_mark(first, index)
+        slots = self._compile_slot(opname, first, second)
+        if slots is None:
+            second_ = self._compile_mark(second, index)
+        elif opname == "belongs":
+            second_ = [Placeholder(next(index)) for v in second]
+        else:
+            second_ = Placeholder(next(index))
+        if first_ is first and second_ is second:
+            return obj
+        obj = copy.copy(obj)
+        obj.first, obj.second = first_, second_
+        return obj
+
+    @staticmethod
+    def _type_key(field_type):
+        if isinstance(field_type, SQLCustomType):
+            return ("custom", field_type.type, field_type.native)
+        return field_type
+
+    def _has_common_filter(self, table):
+        return (
+            table._common_filter is not None
+            or self.db._request_tenant in table.fields
+        )
+
+    def _build_select(
+        self,
+        query,
+        fields,
+        left=False,
+        join=False,
+        distinct=False,
+        orderby=False,
+        groupby=False,
+        having=False,
+        limitby=False,
+        orderby_on_limitby=True,
+        for_update=False,
+        outer_scoped=[],
+        cte_collector=None,
     ):
         if cte_collector is None:
             cte_collector = dict(
@@ -908,9 +1283,19 @@ class SQLAdapter(BaseAdapter):
         return self._select_aux(sql, fields, attributes, colnames)
 
     def iterselect(self, query, fields, attributes):
+        attributes = dict(attributes)
+        stream = attributes.pop("stream", False)
+        fetch_size = attributes.pop("fetch_size", None)
         colnames, sql = self._select_wcols(query, fields, **attributes)
         cacheable = attributes.get("cacheable", False)
-        return self.iterparse(sql, fields, colnames, cacheable=cacheable)
+        return self.iterparse(
+            sql,
+            fields,
+            colnames,
+            cacheable=cacheable,
+            stream=stream,
+            fetch_size=fetch_size,
+        )
 
     def _count(self, query, distinct=None):
         tablemap = self.tables(query)
@@ -936,8 +1321,58 @@ class SQLAdapter(BaseAdapter):
         self.execute(self._count(query, distinct))
         return self.cursor.fetchone()[0]
 
-    def bulk_insert(self, table, items):
-        return [self.insert(table, item) for item in items]
+    def can_bulk_insert(self, table):
+        return (
+            self.bulk_insert_returning
+            and hasattr(table, "_id")
+            and not hasattr(table, "_primarykey")
+            and not hasattr(table, "_on_insert_error")
+        )
+
+    def _insert_many(self, table, fields, items):
+        return self.dialect.insert_many(
+            table._rname,
+            ",".join(f._rname for f in fields),
+            [",".join(self.expand(v, f.type) for f, v in item) for item in items],
+            table._id._rname,
+        )
+
+    def lastrowids(self, table, count):
+        return [long(row[0]) for row in self.cursor.fetchall()]
+
+    def _bulk_insert_batch(self, table, items):
+        if len(items) == 1 or not items[0]:
+            return [self.insert(table, item) for item in items]
+        fields = [f for f, v in items[0]]
+        self.execute(self._insert_many(table, fields, items))
+        ids = self.lastrowids(table, len(items))
+        rv = []
+        for id in ids:
+            rid = Reference(id)
+            (rid._table, rid._record) = (table, None)
+            rv.append(rid)
+        return rv
+
+    def bulk_insert(self, table, items, batch_size=None):
+        if not self.can_bulk_insert(table):
+            return [self.insert(table, item) for item in items]
+        batch_size = batch_size or self.adapter_args.get(
+            "bulk_insert_size", self.bulk_insert_size
+        )
+        ids = []
+        batch, key = [], None
+        for item in items:
+            # multi-row inserts require the same columns in every row
+            item = sorted(item, key=lambda el: el[0].name)
+            k = tuple(f.name for f, v in item)
+            if batch and (k != key or len(batch) >= batch_size):
+                ids.extend(self._bulk_insert_batch(table, batch))
+                batch = []
+            key = k
+            batch.append(item)
+        if batch:
+            ids.extend(self._bulk_insert_batch(table, batch))
+        return ids
 
     def create_table(self, *args, **kwargs):
         return self.migrator.create_table(*args, **kwargs)
@@ -946,6 +1381,9 @@ class SQLAdapter(BaseAdapter):
         super(SQLAdapter, self)._drop_table_cleanup(table)
         if table._dbt:
             self.migrator.file_delete(table._dbt)
+            ifile = self.migrator.index_file(table)
+            if self.migrator.file_exists(ifile):
+                self.migrator.file_delete(ifile)
             self.migrator.log("success!\n", table)
 
     def drop_table(self, table, mode=""):
@@ -448,7 +448,7 @@ class GoogleDatastore(NoSQLAdapter):
         rid._table, rid._record, rid._gaekey = table, None, key
         return rid
 
-    def bulk_insert(self, table, items):
+    def bulk_insert(self, table, items, batch_size=None):
         parsed_items = []
         for item in items:
             dfields = dict((f.name, self.represent(v, f.type)) for f, v in item)
@@ -23,6 +23,7 @@ class MySQL(SQLAdapter):
 
     def _initialize_(self):
         super(MySQL, self)._initialize_()
+        self._autoinc_step = None
         ruri = self.uri.split("://", 1)[1]
         m = re.match(self.REGEX_URI, ruri)
         if not m:
@@ -70,6 +71,44 @@ class MySQL(SQLAdapter):
         self.execute("SET FOREIGN_KEY_CHECKS=1;")
         self.execute("SET sql_mode='NO_BACKSLASH_ESCAPES';")
 
+    def server_side_cursor(self, fetch_size=None):
+        # unbuffered cursors: the connection can not be used for other
+        # queries until the result set has been consumed or the cursor closed
+        if self.driver_name in ("MySQLdb", "pymysql"):
+            return self.connection.cursor(self.driver.cursors.SSCursor)
+        return None
+
+    @property
+    def bulk_insert_returning(self):
+        # multi-row inserts generate consecutive ids unless the server
+        # uses interleaved auto-increment locking (lock mode 2)
+        if self._autoinc_step is None:
+            self.execute(
+                "SELECT @@innodb_autoinc_lock_mode, @@auto_increment_increment;"
+            )
+            mode, step = self.cursor.fetchone()
+            self._autoinc_step = int(step) if int(mode) != 2 else 0
+        return self._autoinc_step > 0
+
+    def _insert_many(self, table, fields, items):
+        return self.dialect.insert_many(
+            table._rname,
+            ",".join(f._rname for f in fields),
+            [",".join(self.expand(v, f.type) for f, v in item) for item in items],
+        )
+
+    def _bulk_insert_batch(self, table, items):
+        if items and any(f is table._id for f, v in items[0]):
+            # explicit ids can not be derived from LAST_INSERT_ID()
+            return [self.insert(table, item) for item in items]
+        return super(MySQL, self)._bulk_insert_batch(table, items)
+
+    def lastrowids(self, table, count):
+        # LAST_INSERT_ID() is the id of the first row of a multi-row insert
+        first = self.cursor.lastrowid
+        step = self._autoinc_step
+        return [first + i * step for i in range(count)]
+
     def distributed_transaction_begin(self, key):
         self.execute("XA START;")
 
@@ -91,6 +130,7 @@ class MySQL(SQLAdapter):
 class Cubrid(MySQL):
     dbengine = "cubrid"
     drivers = ("cubriddb",)
+    bulk_insert_returning = False
 
     def _initialize_(self):
         super(Cubrid, self)._initialize_()
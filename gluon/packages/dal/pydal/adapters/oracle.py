@@ -229,6 +229,14 @@ class Oracle(SQLAdapter):
             rows = [row[:-1] for row in rows]
         return super(Oracle, self).parse(rows, fields, colnames, blob_decode, cacheable)
 
+    def parse_columns(self, rows, fields, colnames, blob_decode=True, cacheable=False):
+        if len(rows) and len(rows[0]) == len(fields) + 1 and type(rows[0][-1]) == int:
+            # paging has added a trailing rownum column to be discarded
+            rows = [row[:-1] for row in rows]
+        return super(Oracle, self).parse_columns(
+            rows, fields, colnames, blob_decode, cacheable
+        )
+
 
 _trigger_sql = """
     CREATE OR REPLACE TRIGGER %(trigger_name)s BEFORE INSERT ON %(tablename)s FOR EACH ROW
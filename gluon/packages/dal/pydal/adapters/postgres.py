@@ -1,5 +1,8 @@
 import re
 import os.path
+import weakref
+from collections import OrderedDict
+from uuid import uuid4
 from .._compat import PY2, with_metaclass, iterkeys, to_unicode, long
 from .._globals import IDENTITY, THREAD_LOCAL
 from ..drivers import psycopg2_adapt
@@ -7,6 +10,13 @@ from .base import SQLAdapter
 from ..utils import split_uri_args
 from . import AdapterMeta, adapters, with_connection, with_connection_or_raise
 
+#: names of the prepared statements of each connection by compile key,
+#: in least recently used order
+PREPARED_STATEMENTS = weakref.WeakKeyDictionary()
+
+#: LIMIT/OFFSET at the end of a compiled SELECT
+REGEX_LIMITBY = re.compile(r" LIMIT (\d+) OFFSET (\d+)(?= FOR UPDATE;$|;$)")
+
 
 class PostgreMeta(AdapterMeta):
     def __call__(cls, *args, **kwargs):
@@ -33,6 +43,7 @@ class Postgre(with_metaclass(PostgreMeta, SQLAdapter)):
     dbengine = "postgres"
     drivers = ("psycopg2",)
     support_distributed_transaction = True
+    bulk_insert_returning = True
 
     REGEX_URI = (
         "^(?P<user>[^:@]+)(:(?P<password>[^@]*))?"
@@ -176,6 +187,162 @@ class Postgre(with_metaclass(PostgreMeta, SQLAdapter)):
 @adapters.register_for("postgres:psycopg2")
 class PostgrePsyco(Postgre):
     drivers = ("psycopg2",)
+    # SQL types of prepared statement parameters
+    prepared_param_types = {
+        "id": "int8",
+        "big-id": "int8",
+        "integer": "int8",
+        "bigint": "int8",
+        "reference": "int8",
+        "big-reference": "int8",
+        "double": "float8",
+        "string": "text",
+        "text": "text",
+        "password": "text",
+        "upload": "text",
+        "list:string": "text",
+        "list:integer": "text",
+        "list:reference": "text",
+        "date": "date",
+        "time": "time",
+        "datetime": "timestamp",
+    }
+    # maximum number of prepared statements per connection
+    prepared_statements_size = 100
+    _prepare = None
+
+    @property
+    def prepared_statements(self):
+        """
+        The maximum number of prepared statements per connection (0 if
+        disabled), requires compile_cache
+        """
+        if not self.compile_cache:
+            return 0
+        size = self.adapter_args.get("prepared_statements")
+        if size is True:
+            size = self.prepared_statements_size
+        return size or 0
+
+    def _compiled_select(self, key, params, query, fields, args):
+        colnames, sql = super(PostgrePsyco, self)._compiled_select(
+            key, params, query, fields, args
+        )
+        if self.prepared_statements:
+            # LIMIT and OFFSET become parameters of the prepared statement,
+            # so that paging does not prepare a statement for every page
+            limitby = args[6]
+            pos = len(key) - len(args) + 6
+            pkey = key[:pos] + (bool(limitby),) + key[pos + 1 :]
+            self._prepare = (sql, key, pkey, params, limitby)
+        return colnames, sql
+
+    def _select_aux_execute(self, sql):
+        prepare, self._prepare = self._prepare, None
+        if prepare is not None and prepare[0] == sql:
+            key, pkey, params, limitby = prepare[1:]
+            name = self._prepared_statement(key, pkey, params, limitby)
+            if name:
+                literals = [self.expand(value, ftype) for value, ftype in params]
+                if limitby:
+                    lmin, lmax = limitby
+                    literals.extend(("%i" % (lmax - lmin), "%i" % lmin))
+                if literals:
+                    name = "%s(%s)" % (name, ",".join(literals))
+                self.execute("EXECUTE %s;" % name)
+                return self.cursor.fetchall()
+        return super(PostgrePsyco, self)._select_aux_execute(sql)
+
+    def _param_type(self, field_type):
+        if not isinstance(field_type, str):
+            return None
+        field_type = field_type.split(" ", 1)[0]
+        if field_type == "boolean":
+            return self.types["boolean"]
+        if field_type.startswith("decimal"):
+            return "numeric"
+        return self.prepared_param_types.get(field_type)
+
+    def _prepared_statement(self, key, pkey, params, limitby):
+        """
+        Returns the name of the prepared statement for a compiled SELECT,
+        preparing it on the current connection if necessary, or None if
+        the statement can not be prepared
+
+        Args:
+            key: the compile key of the SELECT
+            pkey: the compile key of the SELECT without limitby values
+            params: the parameters of the SELECT, as (value, field type)
+            limitby: the limitby of the SELECT
+
+        The least recently used statement is deallocated when the number
+        of prepared statements of the connection exceeds the maximum
+        """
+        compiled = self._compile_cache.get(key)
+        if compiled is None:
+            return None
+        types = [self._param_type(ftype) for value, ftype in params]
+        if None in types:
+            return None
+        connection = self.connection
+        try:
+            statements = PREPARED_STATEMENTS.get(connection)
+            if statements is None:
+                statements = PREPARED_STATEMENTS[connection] = OrderedDict()
+        except TypeError:
+            # connection does not support weak references
+            return None
+        name = statements.pop(pkey, None)
+        if name is None:
+            colnames, texts, slots = compiled
+            sql = texts[0] + "".join(
+                "$%d%s" % (slot + 1, texts[i + 1]) for i, slot in enumerate(slots)
+            )
+            if limitby:
+                lmin, lmax = limitby
+                match = REGEX_LIMITBY.search(sql)
+                if not match or match.groups() != ("%i" % (lmax - lmin), "%i" % lmin):
+                    return None
+                n = len(types)
+                sql = "%s LIMIT $%d OFFSET $%d%s" % (
+                    sql[: match.start()], n + 1, n + 2, sql[match.end() :]
+                )
+                types += ["int8", "int8"]
+            while statements and len(statements) >= self.prepared_statements:
+                self.execute("DEALLOCATE %s;" % statements.popitem(last=False)[1])
+            name = "pydal_%s" % uuid4().hex
+            if types:
+                name_args = "%s(%s)" % (name, ",".join(types))
+            else:
+                name_args = name
+            self.execute("PREPARE %s AS %s" % (name_args, sql.rstrip(";")))
+        # most recently used go last
+        statements[pkey] = name
+        return name
+
+    def close(self, action="commit", really=True):
+        # Pooled connections can be picked up by other DAL instances (with
+        # other prepared statement settings), so deallocate the prepared
+        # statements before the connection is recycled
+        connection = getattr(THREAD_LOCAL, self._connection_uname_, None)
+        statements = None
+        if connection is not None and self.pool_size:
+            try:
+                statements = PREPARED_STATEMENTS.pop(connection, None)
+            except TypeError:
+                pass
+        if statements:
+            names = list(statements.values())
+            close_action = action
+
+            def action(adapter):
+                if callable(close_action):
+                    close_action(adapter)
+                elif close_action:
+                    getattr(adapter, close_action)()
+                adapter.execute("".join("DEALLOCATE %s;" % n for n in names))
+
+        return super(PostgrePsyco, self).close(action=action, really=really)
 
     def _config_json(self):
         use_json = (
@@ -187,6 +354,13 @@ class PostgrePsyco(Postgre):
             if self.driver.__version__ >= "2.5.0":
                 self.parser = self._get_json_parser()(self)
 
+    def server_side_cursor(self, fetch_size=None):
+        # named cursors are declared on the server (requires a transaction)
+        cursor = self.connection.cursor(name="pydal_%s" % uuid4().hex)
+        if fetch_size:
+            cursor.itersize = fetch_size
+        return cursor
+
     def adapt(self, obj):
         adapted = psycopg2_adapt(obj)
         # deal with new relic Connection Wrapper (newrelic>=2.10.0.8)
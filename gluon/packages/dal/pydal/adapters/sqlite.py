@@ -37,6 +37,12 @@ class SQLite(SQLAdapter):
         if "detect_types" not in self.driver_args:
             self.driver_args["detect_types"] = self.driver.PARSE_DECLTYPES
 
+    @property
+    def bulk_insert_returning(self):
+        # RETURNING requires SQLite 3.35+
+        version = getattr(self.driver, "sqlite_version_info", (0,))
+        return version >= (3, 35, 0)
+
     def _driver_from_uri(self):
         return None
 
@@ -85,6 +85,10 @@ class ConnectionPool(object):
         """get a new cursor for the existing connection"""
         setattr(THREAD_LOCAL, self._cursors_uname_, self.connection.cursor())
 
+    def set_cursor(self, cursor):
+        """use the given cursor of the existing connection"""
+        setattr(THREAD_LOCAL, self._cursors_uname_, cursor)
+
     @property
     def cursor(self):
         """retrieve the cursor of the connection"""
@@ -149,6 +149,17 @@ class SQLDialect(CommonDialect):
     def insert_empty(self, table):
         return "INSERT INTO %s DEFAULT VALUES;" % table
 
+    def insert_many(self, table, fields, values, returning=None):
+        ret = ""
+        if returning:
+            ret = " RETURNING %s" % returning
+        return "INSERT INTO %s(%s) VALUES %s%s;" % (
+            table,
+            fields,
+            ",".join("(%s)" % v for v in values),
+            ret,
+        )
+
     def where(self, query):
         return "WHERE %s" % query
 
@@ -68,6 +68,21 @@ class SQLiteDialect(SQLDialect):
             "DELETE FROM sqlite_sequence WHERE name=%s" % tablename,
         ]
 
+    def create_index(self, name, table, expressions, unique=False, where=None):
+        uniq = " UNIQUE" if unique else ""
+        whr = ""
+        if where:
+            whr = " %s" % self.where(where)
+        with self.adapter.index_expander():
+            rv = "CREATE%s INDEX %s ON %s (%s)%s;" % (
+                uniq,
+                self.quote(name),
+                table._rname,
+                ",".join(self.expand(field) for field in expressions),
+                whr,
+            )
+        return rv
+
     def writing_alias(self, table):
         if table._dalname != table._tablename:
             raise SyntaxError("SQLite does not support UPDATE/DELETE on aliased table")
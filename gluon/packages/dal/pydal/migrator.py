@@ -336,6 +336,7 @@ class Migrator(object):
             if not fake_migrate:
                 self.adapter.create_sequence_and_triggers(query, table)
                 db.commit()
+                db._migrated.append(tablename)
                 # Postgres geom fields are added now,
                 # after the table has been created
                 for query in postcreation_fields:
@@ -560,6 +561,104 @@ class Migrator(object):
             self.save_dbt(table, sql_fields_current)
             self.log("success!\n", table)
 
+    @staticmethod
+    def index_file(table):
+        """Name of the file recording the indexes created for table"""
+        dbt = table._dbt
+        if not dbt:
+            return None
+        if dbt.endswith(".table"):
+            dbt = dbt[:-6]
+        return "%s.indexes" % dbt
+
+    def migrate_indexes(self, table, indexes, fake_migrate=False):
+        """Create or drop indexes so that they match a declaration
+
+        indexes is a list of dicts with the keys "name", "fields" (a list
+        of fields, field names or expressions) and optionally "unique" and
+        "where" (a query for a partial index). The CREATE INDEX statements
+        of the previous migration are kept in a .indexes file next to the
+        .table file of the table, and indexes are only created, dropped or
+        re-created when their statement changes; indexes created by an
+        earlier migration and no longer declared are dropped.
+
+        Returns the list of index names that were created.
+        """
+        current = {}
+        for index in indexes:
+            fields = [
+                table[f] if isinstance(f, string_types) else f
+                for f in index["fields"]
+            ]
+            kwargs = {}
+            if index.get("unique"):
+                kwargs["unique"] = True
+            if index.get("where") is not None:
+                kwargs["where"] = index["where"]
+            try:
+                sql = self.dialect.create_index(index["name"], table, fields, **kwargs)
+            except TypeError:
+                # Partial indexes not supported by the dialect, fall back
+                # to an index over all rows
+                kwargs.pop("where", None)
+                sql = self.dialect.create_index(index["name"], table, fields, **kwargs)
+            current[index["name"]] = (fields, kwargs, sql)
+
+        ifile = self.index_file(table)
+        if ifile and self.file_exists(ifile):
+            tfile = self.file_open(ifile, "rb")
+            try:
+                previous = pickle.load(tfile)
+            except EOFError:
+                previous = {}
+            self.file_close(tfile)
+        else:
+            previous = {}
+
+        created = []
+        changed = False
+        for name in list(previous):
+            if name in current and current[name][2] == previous[name]:
+                continue
+            if not fake_migrate:
+                sql = self.dialect.drop_index(name, table, True)
+                self.log(
+                    "timestamp: %s\n%s\n"
+                    % (datetime.datetime.today().isoformat(), sql),
+                    table,
+                )
+                try:
+                    self.adapter.drop_index(table, name, if_exists=True)
+                except RuntimeError as e:
+                    # Already gone
+                    self.db.logger.debug("%s" % e)
+            del previous[name]
+            changed = True
+        for name, (fields, kwargs, sql) in iteritems(current):
+            if name in previous:
+                continue
+            if not fake_migrate:
+                self.log(
+                    "timestamp: %s\n%s\n"
+                    % (datetime.datetime.today().isoformat(), sql),
+                    table,
+                )
+                try:
+                    self.adapter.create_index(table, name, *fields, **kwargs)
+                except RuntimeError as e:
+                    # Index already present (e.g. lost .indexes file)
+                    self.db.logger.debug("%s" % e)
+                else:
+                    created.append(name)
+            previous[name] = sql
+            changed = True
+        if changed and ifile:
+            tfile = self.file_open(ifile, "wb")
+            pickle.dump(previous, tfile)
+            self.file_close(tfile)
+            self.log("faked!\n" if fake_migrate else "success!\n", table)
+        return created
+
     def save_dbt(self, table, sql_fields_current):
         tfile = self.file_open(table._dbt, "wb")
         pickle.dump(sql_fields_current, tfile)
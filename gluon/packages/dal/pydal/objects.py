@@ -13,7 +13,7 @@ import shutil
 import sys
 import types
 import re
-from collections import OrderedDict
+from collections import OrderedDict, deque
 from io import TextIOWrapper
 from ._compat import (
     PY2,
@@ -990,14 +990,20 @@ class Table(Serializable, BasicStorage):
             response = self.validate_and_insert(**fields)
         return response
 
-    def bulk_insert(self, items):
+    def bulk_insert(self, items, batch_size=None):
         """
         here items is a list of dictionaries
+
+        batch_size is the max number of rows per INSERT statement (where
+        the adapter supports multi-row inserts), defaults to the
+        "bulk_insert_size" adapter argument
         """
         data = [self._fields_and_values_for_insert(item) for item in items]
         if any(f(el) for el in data for f in self._before_insert):
             return 0
-        ret = self._db._adapter.bulk_insert(self, [el.op_values() for el in data])
+        ret = self._db._adapter.bulk_insert(
+            self, [el.op_values() for el in data], batch_size=batch_size
+        )
         ret and [
             [f(el, ret[k]) for k, el in enumerate(data)] for f in self._after_insert
         ]
@@ -1224,6 +1230,11 @@ class Table(Serializable, BasicStorage):
     def drop_index(self, name, if_exists = False):
         return self._db._adapter.drop_index(self, name, if_exists)
 
+    def migrate_indexes(self, indexes, fake_migrate=False):
+        return self._db._adapter.migrator.migrate_indexes(
+            self, indexes, fake_migrate=fake_migrate
+        )
+
 
 class Select(BasicStorage):
     def __init__(self, db, query, fields, attributes):
@@ -3587,9 +3598,131 @@ class Rows(BasicRows):
         return self
 
 
+class ColumnRows(Rows):
+    """
+    A Rows object holding the parsed values of a select column-wise (as
+    returned by the `parse_columns` processor). Row objects are built
+    only when accessed, and column() returns the values of a selected
+    column without building any Row.
+
+    All other Rows methods build (and keep) the Row objects first.
+    """
+
+    def __init__(
+        self,
+        db=None,
+        records=None,
+        colnames=[],
+        compact=True,
+        rawrows=None,
+        fields=[],
+        columns=None,
+        build=None,
+        views=None,
+    ):
+        Rows.__init__(self, db, records, colnames, compact, rawrows, fields)
+        self.columns = columns
+        self._build = build
+        if records is None:
+            if views is None:
+                views = [None] * (len(columns[0]) if columns else 0)
+            self._views = views
+
+    @property
+    def records(self):
+        records = self._records
+        if records is None:
+            # build all remaining Row objects
+            records = self._views
+            for i, row in enumerate(records):
+                if row is None:
+                    records[i] = self._build([column[i] for column in self.columns])
+            self.records = records
+        return records
+
+    @records.setter
+    def records(self, records):
+        self._records = records
+        if records is not None:
+            # row views have been built or replaced
+            self.columns = self._build = self._views = None
+
+    def __repr__(self):
+        return "<ColumnRows (%s)>" % len(self)
+
+    def __len__(self):
+        if self._records is None:
+            return len(self._views)
+        return len(self._records)
+
+    def __getslice__(self, a, b):
+        if self._records is not None:
+            return Rows.__getslice__(self, a, b)
+        return self.__class__(
+            self.db,
+            colnames=self.colnames,
+            compact=self.compact,
+            fields=self.fields,
+            columns=[column[a:b] for column in self.columns],
+            build=self._build,
+            views=self._views[a:b],
+        )
+
+    def __getitem__(self, i):
+        if self._records is not None or isinstance(i, slice):
+            return Rows.__getitem__(self, i)
+        views = self._views
+        row = views[i]
+        if row is None:
+            row = views[i] = self._build([column[i] for column in self.columns])
+        keys = list(row.keys())
+        if self.compact and len(keys) == 1 and keys[0] != "_extra":
+            return row[keys[0]]
+        return row
+
+    def first(self):
+        if not len(self):
+            return None
+        return self[0]
+
+    def last(self):
+        if not len(self):
+            return None
+        return self[-1]
+
+    def column(self, column=None):
+        name = str(column) if column else self.colnames[0]
+        if self._records is not None or name not in self.colnames:
+            return Rows.column(self, column)
+        values = list(self.columns[self.colnames.index(name)])
+        # use the values of the Row objects built so far
+        for i, row in enumerate(self._views):
+            if row is not None:
+                values[i] = row[name]
+        return values
+
+    def __getstate__(self):
+        # build the Row objects
+        self.records
+        return Rows.__getstate__(self)
+
+
 @implements_iterator
 class IterRows(BasicRows):
-    def __init__(self, db, sql, fields, colnames, blob_decode, cacheable):
+    # rows fetched per round trip with stream=True if no fetch_size is given
+    STREAM_FETCH_SIZE = 2000
+
+    def __init__(
+        self,
+        db,
+        sql,
+        fields,
+        colnames,
+        blob_decode,
+        cacheable,
+        stream=False,
+        fetch_size=None,
+    ):
         self.db = db
         self.fields = fields
         self.colnames = colnames
@@ -3606,15 +3739,53 @@ class IterRows(BasicRows):
         self.last_item_id = None
         self.compact = True
         self.sql = sql
+        # rows are fetched fetch_size at a time, if given; streams are
+        # always fetched in batches, since fetchone on a server-side
+        # cursor costs one round trip per row
+        if stream and not fetch_size:
+            fetch_size = self.STREAM_FETCH_SIZE
+        self.fetch_size = fetch_size
+        self._buffer = deque()
+        adapter = self.db._adapter
+        # with stream=True use a server-side cursor (if supported), so
+        # that the result set is not buffered in the client as a whole
+        cursor = adapter.server_side_cursor(fetch_size) if stream else None
+        self.server_side = cursor is not None
+        if self.server_side:
+            adapter.set_cursor(cursor)
         # get a new cursor in order to be able to iterate without undesired behavior
         # not completely safe but better than before
-        self.cursor = self.db._adapter.cursor
-        self.db._adapter.execute(sql)
-        # give the adapter a new cursor since this one is busy
-        self.db._adapter.reset_cursor()
+        self.cursor = adapter.cursor
+        try:
+            adapter.execute(sql)
+        finally:
+            # give the adapter a new cursor since this one is busy
+            adapter.reset_cursor()
+
+    def _fetchone(self):
+        if not self.fetch_size:
+            return self.cursor.fetchone()
+        buffer = self._buffer
+        if not buffer:
+            buffer.extend(self.cursor.fetchmany(self.fetch_size))
+            if not buffer:
+                return None
+        return buffer.popleft()
+
+    def close(self):
+        """
+        Closes the cursor, server-side cursors must be closed (or consumed)
+        before the connection can be used for other queries
+        """
+        self._buffer.clear()
+        try:
+            self.cursor.close()
+        except Exception:
+            # e.g. named cursors after the end of the transaction
+            pass
 
     def __next__(self):
-        db_row = self.cursor.fetchone()
+        db_row = self._fetchone()
         if db_row is None:
             raise StopIteration
         row = self.db._adapter._parse(
@@ -3639,9 +3810,9 @@ class IterRows(BasicRows):
         return row
 
     def __iter__(self):
-        if self._head:
-            yield self._head
         try:
+            if self._head:
+                yield self._head
             row = next(self)
             while row is not None:
                 yield row
@@ -3649,6 +3820,10 @@ class IterRows(BasicRows):
         except StopIteration:
             # Iterator is over, adjust the cursor logic
             return
+        finally:
+            # release server-side cursors when exhausted or closed
+            if self.server_side:
+                self.close()
         return
 
     def first(self):
@@ -3675,7 +3850,7 @@ class IterRows(BasicRows):
 
         # fetch and drop the first key - 1 elements
         for i in xrange(n_to_drop):
-            self.cursor.fetchone()
+            self._fetchone()
         row = next(self)
         if row is None:
             raise IndexError
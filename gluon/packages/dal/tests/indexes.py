@@ -1,6 +1,10 @@
+import os
+import shutil
+import tempfile
+
 from pydal import DAL, Field
 from ._compat import unittest
-from ._adapt import DEFAULT_URI, IS_POSTGRESQL, drop
+from ._adapt import DEFAULT_URI, IS_POSTGRESQL, IS_SQLITE, drop
 
 
 class TestIndexesBasic(unittest.TestCase):
@@ -57,3 +61,59 @@ class TestIndexesWhere(unittest.TestCase):
         rv = db.tt.drop_index("idx_aa_f")
         self.assertTrue(rv)
         drop(db.tt)
+
+
+@unittest.skipUnless(IS_SQLITE, "Migration test uses a temporary SQLite database")
+class TestIndexesMigrate(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def indexes(self, db):
+        rows = db.executesql(
+            "SELECT name, sql FROM sqlite_master WHERE type='index' AND tbl_name='tt';"
+        )
+        return dict(rows)
+
+    def testRun(self):
+        db = DAL("sqlite://storage.sqlite", folder=self.folder)
+        db.define_table("tt", Field("aa"), Field("bb", "boolean"))
+        # Created tables are recorded as migrated
+        self.assertEqual(db._migrated, ["tt"])
+        declared = [
+            {"name": "tt_aa_bb__idx", "fields": ["aa", "bb"]},
+            {"name": "tt_aa_f__idx", "fields": [db.tt.aa], "where": db.tt.bb == False},
+        ]
+        created = db.tt.migrate_indexes(declared)
+        self.assertEqual(sorted(created), ["tt_aa_bb__idx", "tt_aa_f__idx"])
+        indexes = self.indexes(db)
+        self.assertEqual(sorted(indexes), ["tt_aa_bb__idx", "tt_aa_f__idx"])
+        self.assertTrue("WHERE" in indexes["tt_aa_f__idx"])
+        ifile = db._adapter.migrator.index_file(db.tt)
+        self.assertTrue(os.path.exists(ifile))
+
+        # Unchanged declaration => nothing to do
+        self.assertEqual(db.tt.migrate_indexes(declared), [])
+
+        # Changed and removed indexes are re-created and dropped
+        declared = [{"name": "tt_aa_bb__idx", "fields": ["aa"], "unique": True}]
+        self.assertEqual(db.tt.migrate_indexes(declared), ["tt_aa_bb__idx"])
+        indexes = self.indexes(db)
+        self.assertEqual(list(indexes), ["tt_aa_bb__idx"])
+        self.assertTrue("UNIQUE" in indexes["tt_aa_bb__idx"])
+
+        # Existing index without a record of it is tolerated
+        os.unlink(ifile)
+        self.assertEqual(db.tt.migrate_indexes(declared), [])
+        self.assertTrue(os.path.exists(ifile))
+
+        # Fake migration only records the declaration
+        declared.append({"name": "tt_bb__idx", "fields": ["bb"]})
+        self.assertEqual(db.tt.migrate_indexes(declared, fake_migrate=True), [])
+        self.assertFalse("tt_bb__idx" in self.indexes(db))
+
+        db.tt.drop()
+        self.assertFalse(os.path.exists(ifile))
+        db.close()
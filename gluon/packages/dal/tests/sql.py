@@ -13,7 +13,7 @@ import pickle
 from pydal._compat import basestring, StringIO, integer_types, xrange, BytesIO, to_bytes
 from pydal import DAL, Field
 from pydal.helpers.classes import SQLALL, OpRow
-from pydal.objects import Table, Expression, Row
+from pydal.objects import Table, Expression, Row, IterRows
 from ._compat import unittest
 from ._adapt import (
     DEFAULT_URI,
@@ -723,6 +723,142 @@ class TestSelect(DALtest):
         db(t1.id > 0).delete()
 
 
+class TestCompileCache(DALtest):
+    def testRun(self):
+        db = self.connect(adapter_args={"compile_cache": True})
+        db.define_table(
+            "tt",
+            Field("aa"),
+            Field("bb", "integer"),
+            Field("cc", "boolean"),
+            Field("dd", "date"),
+        )
+
+        def queries(t, a, b, c, d):
+            return [
+                (t.aa == a, {}),
+                ((t.aa == a) & (t.bb > b), {"orderby": t.bb}),
+                ((t.bb >= b) | (t.cc == c), {"limitby": (0, 10)}),
+                (t.dd < d, {"orderby": ~t.dd}),
+                (t.bb.belongs((b, b + 1, b + 2)), {}),
+                (t.aa.like("%s%%" % a), {}),
+                (t.aa != None, {"distinct": True}),
+            ]
+
+        values = [
+            ("x", 1, True, datetime.date(2020, 1, 1)),
+            ("y'z", 5, False, datetime.date(2021, 6, 30)),
+            ("x", 1, True, datetime.date(2020, 1, 1)),
+        ]
+        adapter = db._adapter
+        for value in values:
+            for query, attr in queries(db.tt, *value):
+                adapter.compile_cache = 0
+                expected = db(query)._select(db.tt.aa, db.tt.bb, **attr)
+                adapter.compile_cache = 1000
+                self.assertEqual(
+                    db(query)._select(db.tt.aa, db.tt.bb, **attr), expected
+                )
+        self.assertTrue(adapter._compile_cache)
+
+        # Compiled statements return the same records
+        db.tt.insert(aa="x", bb=1, cc=True, dd=datetime.date(2020, 1, 1))
+        db.tt.insert(aa="y", bb=2, cc=False, dd=datetime.date(2021, 1, 1))
+        for aa, bb in (("x", 1), ("y", 2), ("x", 1), ("z", None)):
+            rows = db(db.tt.aa == aa).select(db.tt.bb)
+            self.assertEqual([row.bb for row in rows], [bb] if bb else [])
+
+
+@unittest.skipUnless(IS_POSTGRESQL, "Only implemented for postgres for now")
+class TestPreparedStatements(DALtest):
+    def testRun(self):
+        db = self.connect(
+            adapter_args={"compile_cache": True, "prepared_statements": 2}
+        )
+        adapter = db._adapter
+        if not hasattr(adapter, "prepared_statements"):
+            self.skipTest("Requires psycopg2")
+        db.define_table("tt", Field("aa"), Field("bb", "integer"))
+        for i in range(5):
+            db.tt.insert(aa="x", bb=i)
+
+        def prepared():
+            return len(db.executesql("SELECT name FROM pg_prepared_statements;"))
+
+        before = prepared()
+
+        # Paging re-uses the same prepared statement
+        for page in range(3):
+            rows = db(db.tt.aa == "x").select(
+                db.tt.bb, orderby=db.tt.bb, limitby=(page * 2, page * 2 + 2)
+            )
+            self.assertEqual([r.bb for r in rows], list(range(5))[page * 2 : page * 2 + 2])
+        self.assertEqual(prepared(), before + 1)
+
+        # The least recently used statements are deallocated
+        db(db.tt.aa == "x").select(db.tt.aa)
+        db(db.tt.bb == 1).select(db.tt.aa)
+        self.assertEqual(prepared(), before + 2)
+
+
+class TestColumnRows(DALtest):
+    def testRun(self):
+        db = self.connect()
+        db.define_table(
+            "tt",
+            Field("aa"),
+            Field("bb", "integer"),
+            Field("cc", "datetime"),
+            Field("dd", filter_out=lambda v: v and v.upper()),
+            Field.Virtual("ee", lambda row: row.tt.bb * 2),
+        )
+        db.define_table("ss", Field("tt_id", "reference tt"), Field("ff", "boolean"))
+        now = datetime.datetime(2020, 1, 1, 12, 0, 0)
+        for i in range(5):
+            rid = db.tt.insert(aa="a%s" % i, bb=i, cc=now, dd="d%s" % i)
+            db.ss.insert(tt_id=rid, ff=i % 2 == 0)
+        parse_columns = db._adapter.parse_columns
+
+        # Same records as the default processor
+        for args, attr in (
+            ((db.tt.ALL,), {"orderby": db.tt.id}),
+            ((db.tt.aa, db.ss.ff), {"orderby": db.ss.id}),
+            ((db.tt.bb.sum(), db.ss.ff), {"groupby": db.ss.ff}),
+        ):
+            query = db.ss.tt_id == db.tt.id
+            rows = db(query).select(*args, **attr)
+            crows = db(query).select(*args, processor=parse_columns, **attr)
+            self.assertEqual(len(crows), len(rows))
+            self.assertEqual(crows.as_list(), rows.as_list())
+            self.assertEqual(str(crows), str(rows))
+
+        # Row objects are built on access
+        rows = db(db.tt).select(orderby=db.tt.id, processor=parse_columns)
+        self.assertEqual(rows.column(db.tt.dd), ["D%s" % i for i in range(5)])
+        self.assertEqual(rows.column("tt.cc"), [now] * 5)
+        row = rows[2]
+        self.assertEqual(row.aa, "a2")
+        self.assertEqual(row.ee, 4)
+        self.assertEqual(row.ss.select().first().ff, True)
+        self.assertIs(rows[2], row)
+        row.aa = "x"
+        self.assertEqual(rows.column(db.tt.aa)[2], "x")
+        self.assertEqual([r.bb for r in rows[1:3]], [1, 2])
+        self.assertIs(rows[1:3][1], row)
+        self.assertEqual(rows.first().id, rows[0].id)
+        self.assertEqual(rows.last().bb, 4)
+
+        # Materialized for other Rows methods and pickling
+        rows = db(db.tt).select(orderby=db.tt.id, processor=parse_columns)
+        found = rows.find(lambda r: r.bb > 2)
+        self.assertEqual([r.bb for r in found], [3, 4])
+        self.assertEqual(len(pickle.loads(pickle.dumps(rows)).records), 5)
+
+        rows = db(db.tt.id < 0).select(processor=parse_columns)
+        self.assertEqual(len(rows), 0)
+        self.assertIsNone(rows.first())
+
+
 class TestSubselect(DALtest):
     def testMethods(self):
         db = self.connect()
@@ -3506,6 +3642,18 @@ class TestBulkInsert(DALtest):
             self.assertTrue(db(t0.name == "web2py_%s" % pos).count() == 1)
         self.assertTrue(ctr == len(items))
 
+    def testBatches(self):
+        db = self.connect()
+        t0 = db.define_table("t0", Field("name"), Field("aa", "integer"))
+        items = [{"name": "web2py_%s" % pos, "aa": pos} for pos in range(0, 10, 1)]
+        items.insert(5, {"name": "web2py_only"})
+        ids = t0.bulk_insert(items, batch_size=3)
+        self.assertEqual(len(ids), len(items))
+        for rid, item in zip(ids, items):
+            row = t0(rid)
+            self.assertEqual(row.name, item["name"])
+            self.assertEqual(row.aa, item.get("aa"))
+
 
 class TestRecordVersioning(DALtest):
     def testRun(self):
@@ -3652,6 +3800,35 @@ class TestIterselect(DALtest):
         for n in names:
             self.assertEqual(next(rows).t0.name, n)
 
+    def testStream(self):
+        db = self.connect()
+        t0 = db.define_table("t0", Field("name"))
+        names = ["n%s" % i for i in range(10)]
+        for n in names:
+            t0.insert(name=n)
+
+        # Fetch in batches, with server-side cursor where supported
+        rows = db(db.t0).iterselect(orderby=db.t0.id, stream=True, fetch_size=3)
+        self.assertEqual([r.name for r in rows], names)
+
+        # Streams are fetched in batches by default
+        rows = db(db.t0).iterselect(orderby=db.t0.id, stream=True)
+        self.assertEqual(rows.fetch_size, IterRows.STREAM_FETCH_SIZE)
+        self.assertEqual([r.name for r in rows], names)
+
+        rows = db(db.t0).iterselect(orderby=db.t0.id, fetch_size=4)
+        self.assertEqual(rows[5].name, names[5])
+        self.assertEqual(rows[9].name, names[9])
+
+        # Closing the generator releases the cursor
+        rows = db(db.t0).iterselect(orderby=db.t0.id, stream=True, fetch_size=3)
+        for pos, r in enumerate(rows):
+            if pos == 4:
+                break
+        rows.close()
+        self.assertEqual(db(db.t0).count(), len(names))
+        db._adapter.test_connection()
+
     @unittest.skipIf(IS_MSSQL, "Skip mssql")
     def testMultiSelect(self):
         # Iterselect holds the cursors until all elemets have been evaluated
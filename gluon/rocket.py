@@ -1549,7 +1549,7 @@ def get_method(method):
 import sys
 import socket
 from wsgiref.headers import Headers
-from wsgiref.util import FileWrapper
+from wsgiref.util import FileWrapper as BaseFileWrapper
 
 # Import Package Modules
 # package imports removed in monolithic build
@@ -1563,6 +1563,15 @@ else:
 # Define Constants
 NEWLINE = b('\r\n')
 HEADER_RESPONSE = '''HTTP/1.1 %s\r\n%s'''
+
+
+class FileWrapper(BaseFileWrapper):
+    """wsgi.file_wrapper which the WSGIWorker sends from the current
+    position of the file, up to the Content-Length of the response;
+    zero_copy tells whether it is sent with socket.sendfile."""
+    zero_copy = hasattr(socket.socket, 'sendfile')
+
+
 BASE_ENV = {'SERVER_NAME': SERVER_NAME,
             'SCRIPT_NAME': '',  # Direct call WSGI does not need a name
             'wsgi.errors': sys.stderr,
@@ -1736,6 +1745,31 @@ class WSGIWorker(Worker):
                 # resulting in a socket error.
                 self.closeConnection = True
 
+    def send_file(self, filelike):
+        """ Send the headers and Content-Length bytes of the file, with
+        socket.sendfile (zero-copy) where available. """
+
+        self.send_headers('', None)
+
+        if self.request_method != 'HEAD' and self.size:
+            try:
+                if hasattr(self.conn.socket, 'sendfile'):
+                    self.conn.socket.sendfile(filelike, filelike.tell(), self.size)
+                else:
+                    remaining = self.size
+                    while remaining > 0:
+                        data = filelike.read(min(remaining, BUF_SIZE))
+                        if not data:
+                            break
+                        self.conn.sendall(data)
+                        remaining -= len(data)
+            except socket.timeout:
+                self.closeConnection = True
+            except socket.error:
+                # But some clients will close the connection before that
+                # resulting in a socket error.
+                self.closeConnection = True
+
     def start_response(self, status, response_headers, exc_info=None):
         """ Store the HTTP status and headers to be sent when self.write is
         called. """
@@ -1803,10 +1837,15 @@ class WSGIWorker(Worker):
             if hasattr(output, '__len__'):
                 sections = len(output)
 
-            for data in output:
-                # Don't send headers until body appears
-                if data:
-                    self.write(data, sections)
+            if isinstance(output, FileWrapper) and \
+                    'Content-Length' in self.header_set and \
+                    not self.error[0]:
+                self.send_file(output.filelike)
+            else:
+                for data in output:
+                    # Don't send headers until body appears
+                    if data:
+                        self.write(data, sections)
 
             if not self.headers_sent:
                 # Send headers if the body was empty
@@ -98,6 +98,7 @@ HEARTBEAT = 3 * SECONDS
 MAXHIBERNATION = 10
 CLEAROUT = '!clear!'
 RESULTINFILE = 'result_in_file:'
+NOTIFY_CHANNEL = 'w2p_scheduler'
 
 CALLABLETYPES = (types.LambdaType, types.FunctionType,
                  types.BuiltinFunctionType,
@@ -441,22 +442,32 @@ def _decode_dict(dct):
     return newdict
 
 
-def executor(retq, task, outq):
-    """The function used to execute tasks in the background process."""
+def executor(retq, task, outq, persistent=False):
+    """The function used to execute tasks in the background process.
+
+    Args:
+        retq: the queue for the `TaskReport`
+        task: the `Task` object
+        outq: the queue for the task output
+        persistent(bool): the process executes further tasks after this
+            one (see `ExecutorPool`), so the database connections of the
+            task have to be released
+    """
     logger.debug('    task started')
 
     class LogOutput(object):
         """Facility to log output at intervals."""
 
-        def __init__(self, out_queue):
+        def __init__(self, out_queue, persistent=False):
             self.out_queue = out_queue
+            self.persistent = persistent
             self.stdout = sys.stdout
             self.written = False
             sys.stdout = self
 
         def close(self):
             sys.stdout = self.stdout
-            if self.written:
+            if self.written and not self.persistent:
                 # see "Joining processes that use queues" section in
                 # https://docs.python.org/2/library/multiprocessing.html#programming-guidelines
                 # https://docs.python.org/3/library/multiprocessing.html#programming-guidelines
@@ -474,7 +485,8 @@ def executor(retq, task, outq):
                        'uuid': task.uuid,
                        'run_id': task.run_id
                        })
-    stdout = LogOutput(outq)
+    stdout = LogOutput(outq, persistent=persistent)
+    _env = None
     try:
         if task.app:
             from gluon.shell import env, parse_path_info
@@ -484,6 +496,8 @@ def executor(retq, task, outq):
             #logging.getLogger().setLevel(logging.WARN)
             # support for task.app like 'app/controller'
             (a, c, f) = parse_path_info(task.app)
+            # NOTE: always a new environment (request, session, auth...),
+            #       so that no state passes from one task to the next
             _env = env(a=a, c=c, import_models=True,
                        extra_request={'is_scheduler': True})
             #logging.getLogger().setLevel(level)
@@ -521,6 +535,140 @@ def executor(retq, task, outq):
         retq.put(TaskReport('FAILED', tb=tb))
     finally:
         stdout.close()
+        if persistent and _env is not None:
+            # discard uncommitted changes, as the end of the process would
+            # do, and release the connections (to the pool, if any)
+            for value in list(_env.values()):
+                if isinstance(value, DAL):
+                    try:
+                        value._adapter.close('rollback')
+                        value.close()
+                    except Exception:
+                        logger.exception('    error closing %s', value)
+
+
+def _max_rss():
+    """Peak resident memory of the current process in MB (0 if unknown)"""
+    try:
+        import resource
+    except ImportError:
+        return 0
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        # bytes rather than kilobytes
+        rss /= 1024.0
+    return rss / 1024.0
+
+
+def pooled_executor(taskq, retq, outq, max_tasks=0, max_memory=0):
+    """The function run by the persistent background processes of an
+    `ExecutorPool`.
+
+    Executes the tasks coming from `taskq` one after the other until it
+    receives None, has executed `max_tasks` tasks or has grown beyond
+    `max_memory` MB.
+    """
+    executed = 0
+    while True:
+        task = taskq.get()
+        if task is None:
+            break
+        executor(retq, task, outq, persistent=True)
+        executed += 1
+        if max_tasks and executed >= max_tasks:
+            logger.debug('    executor recycled after %s tasks', executed)
+            break
+        if max_memory and _max_rss() > max_memory:
+            logger.debug('    executor recycled after reaching %s MB',
+                         max_memory)
+            break
+
+
+class ExecutorPool(object):
+    """Pool of persistent background processes executing tasks.
+
+    Unlike the default one-process-per-task execution, the processes of
+    the pool keep the modules imported and the compiled models cached
+    from one task to the next, so a task only has to run the models to
+    build its (fresh) environment. Processes are replaced when they
+    exit (see `pooled_executor`) or are terminated (e.g. on timeout).
+
+    Tasks are still executed one at a time: more than one process only
+    keeps spares ready to replace a process which gets recycled or
+    terminated.
+
+    Args:
+        size(int): the number of processes to keep ready
+        max_tasks(int): recycle a process after it executed this many
+            tasks (0 for never)
+        max_memory(int): recycle a process once its peak memory usage
+            exceeds this many MB (0 for never)
+        use_spawn(bool): use spawn for subprocess (only useable with python3)
+    """
+
+    def __init__(self, size=1, max_tasks=0, max_memory=0, use_spawn=False):
+        self.size = max(1, size)
+        self.max_tasks = max_tasks
+        self.max_memory = max_memory
+        self.use_spawn = use_spawn
+        self.executors = []
+        self.lock = threading.RLock()
+
+    def start_executor(self):
+        """Start a new background process.
+
+        Returns:
+            a `Storage` with the process and its queues
+        """
+        if (self.use_spawn and not PY2):
+            ctx = multiprocessing.get_context('spawn')
+        else:
+            ctx = multiprocessing
+        taskq = ctx.Queue()
+        retq = ctx.Queue(maxsize=1)
+        outq = ctx.Queue()
+        process = ctx.Process(target=pooled_executor,
+                              args=(taskq, retq, outq,
+                                    self.max_tasks, self.max_memory))
+        process.start()
+        return Storage(process=process, taskq=taskq, retq=retq, outq=outq)
+
+    def acquire(self):
+        """Get the next background process, starting new processes to
+        replace the ones that have ended.
+
+        Returns:
+            a `Storage` with the process and its queues
+        """
+        with self.lock:
+            executors = []
+            for item in self.executors:
+                if item.process.is_alive():
+                    executors.append(item)
+                else:
+                    item.process.join()
+            while len(executors) < self.size:
+                executors.append(self.start_executor())
+            item = executors.pop(0)
+            executors.append(item)
+            self.executors = executors
+        return item
+
+    def close(self, timeout=5):
+        """Stop all background processes"""
+        with self.lock:
+            for item in self.executors:
+                if item.process.is_alive():
+                    try:
+                        item.taskq.put(None)
+                    except Exception:
+                        pass
+            for item in self.executors:
+                item.process.join(timeout)
+                if item.process.is_alive():
+                    item.process.terminate()
+                    item.process.join()
+            self.executors = []
 
 
 class IS_CRONLINE(object):
@@ -597,11 +745,30 @@ class Scheduler(threading.Thread):
             timezone. Remember to pass `start_time` and `stop_time` to tasks
             accordingly
         use_spawn(bool): use spawn for subprocess (only useable with python3)
+        pool_size(int): execute tasks in persistent background processes
+            (see `ExecutorPool`) that keep the modules imported and the
+            models compiled between tasks, instead of starting a new
+            process for each task. 0 (default) to start a new process for
+            each task. Tasks are executed one at a time whatever the size,
+            processes beyond the first one are spares
+        pool_max_tasks(int): with pool_size, replace a background process
+            after it executed this many tasks (0 for never)
+        pool_max_memory(int): with pool_size, replace a background process
+            once its peak memory usage exceeds this many MB (0 for never)
+        claim_batch(int): how many of the tasks assigned to the worker
+            are fetched from the queue at once, each of them is then
+            claimed with a single update when its turn comes (on
+            PostgreSQL they are all claimed when fetched)
+        listen_notify(bool): on PostgreSQL (with psycopg2), wake up idle
+            workers with LISTEN/NOTIFY when tasks are queued or assigned,
+            rather than only at the next heartbeat
     """
 
     def __init__(self, db, tasks=None, migrate=True,
                  worker_name=None, group_names=None, heartbeat=HEARTBEAT,
-                 max_empty_runs=0, discard_results=False, utc_time=False, use_spawn=False):
+                 max_empty_runs=0, discard_results=False, utc_time=False, use_spawn=False,
+                 pool_size=0, pool_max_tasks=0, pool_max_memory=0,
+                 claim_batch=1, listen_notify=False):
 
         threading.Thread.__init__(self)
         self.setDaemon(True)
@@ -640,6 +807,18 @@ class Scheduler(threading.Thread):
 
         self.define_tables(db, migrate=migrate)
         self.use_spawn = use_spawn
+        if pool_size:
+            # processes are only started when the first task gets executed
+            self.pool = ExecutorPool(pool_size,
+                                     max_tasks=pool_max_tasks,
+                                     max_memory=pool_max_memory,
+                                     use_spawn=use_spawn)
+        else:
+            self.pool = None
+        self.claim_batch = max(1, claim_batch)
+        self.prefetched = []    # tasks fetched but not yet executed
+        self.listen_notify = listen_notify
+        self.listener = None    # the connection listening for notifications
 
     def execute(self, task):
         """Start the background process.
@@ -650,6 +829,8 @@ class Scheduler(threading.Thread):
         Returns:
             a `TaskReport` object
         """
+        if self.pool is not None:
+            return self.pool_execute(task)
         outq = None
         retq = None
         if (self.use_spawn and not PY2):
@@ -682,27 +863,8 @@ class Scheduler(threading.Thread):
                 #       see "Joining processes that use queues" section in
                 # https://docs.python.org/2/library/multiprocessing.html#programming-guidelines
                 # https://docs.python.org/3/library/multiprocessing.html#programming-guidelines
-                while True:
-                    try:
-                         tout += outq.get(timeout=2)
-                    except Queue.Empty:
-                        break
-                if tout:
-                    logger.debug(' partial output: "%s"', tout)
-                    if CLEAROUT in tout:
-                        task_output = tout[
-                            tout.rfind(CLEAROUT) + len(CLEAROUT):]
-                    else:
-                        task_output += tout
-                    try:
-                        db = self.db
-                        db(db.scheduler_run.id == task.run_id).update(run_output=task_output)
-                        db.commit()
-                        tout = ''
-                        logger.debug(' partial output saved')
-                    except Exception:
-                        logger.exception(' error while saving partial output')
-                        task_output = task_output[:-len(tout)]
+                tout, task_output = self.collect_output(task, outq,
+                                                        tout, task_output)
                 p.join(timeout=run_timeout)
         except:
             logger.exception('    task stopped by general exception')
@@ -736,6 +898,116 @@ class Scheduler(threading.Thread):
         tr.output = task_output
         return tr
 
+    def pool_execute(self, task):
+        """Execute a task in a persistent background process of the pool.
+
+        Args:
+            task : a `Task` object
+
+        Returns:
+            a `TaskReport` object
+        """
+        item = self.pool.acquire()
+        retq, outq = item.retq, item.outq
+        self.process = p = item.process
+        self.process_queues = (retq, outq)
+
+        logger.debug('   task starting (pool)')
+        item.taskq.put(task)
+        start = time.time()
+
+        if task.sync_output > 0:
+            run_timeout = task.sync_output
+        else:
+            run_timeout = task.timeout
+        task_output = tout = ''
+        tr = None
+        try:
+            while True:
+                wait = run_timeout
+                if task.timeout:
+                    wait = min(wait, task.timeout - (time.time() - start))
+                    if wait <= 0:
+                        break
+                try:
+                    tr = retq.get(timeout=wait)
+                except Queue.Empty:
+                    pass
+                # NOTE: short timeout to also collect any output still
+                #       in transit when the task has completed
+                tout, task_output = self.collect_output(task, outq,
+                                                        tout, task_output,
+                                                        timeout=0.1)
+                if tr is not None:
+                    break
+                if not p.is_alive():
+                    try:
+                        tr = retq.get_nowait()
+                    except Queue.Empty:
+                        pass
+                    break
+        except:
+            logger.exception('    task stopped by general exception')
+            self.terminate_process()
+            tr = TaskReport(STOPPED)
+        else:
+            if tr is not None:
+                logger.debug('  task completed or failed')
+            elif p.is_alive():
+                logger.debug('    task timeout')
+                self.terminate_process(flush_ret=False)
+                tr = TaskReport(TIMEOUT)
+            else:
+                logger.debug('    task stopped')
+                tr = TaskReport(STOPPED)
+        # keep the idle process out of reach of terminate_process
+        self.process = None
+        result = tr.result
+        if result and result.startswith(RESULTINFILE):
+            temp_path = result.replace(RESULTINFILE, '', 1)
+            with open(temp_path) as f:
+                tr.result = f.read()
+            os.unlink(temp_path)
+        tr.output = task_output
+        return tr
+
+    def collect_output(self, task, outq, tout, task_output, timeout=2):
+        """Collect the output of the running task and save it to
+        the scheduler_run table (internal use only).
+
+        Args:
+            task: the `Task` object
+            outq: the output queue of the background process
+            tout: the output collected but not yet saved
+            task_output: the task output so far
+            timeout: how many seconds to wait for more output
+
+        Returns:
+            tuple (tout, task_output)
+        """
+        while True:
+            try:
+                 tout += outq.get(timeout=timeout)
+            except Queue.Empty:
+                break
+        if tout:
+            logger.debug(' partial output: "%s"', tout)
+            if CLEAROUT in tout:
+                task_output = tout[
+                    tout.rfind(CLEAROUT) + len(CLEAROUT):]
+            else:
+                task_output += tout
+            try:
+                db = self.db
+                db(db.scheduler_run.id == task.run_id).update(run_output=task_output)
+                db.commit()
+                tout = ''
+                logger.debug(' partial output saved')
+            except Exception:
+                logger.exception(' error while saving partial output')
+                task_output = task_output[:-len(tout)]
+        return tout, task_output
+
     _terminate_process_lock = threading.RLock()
 
     def terminate_process(self, flush_out=True, flush_ret=True):
@@ -778,6 +1050,8 @@ class Scheduler(threading.Thread):
         logger.info('die!')
         self.have_heartbeat = False
         self.terminate_process()
+        if self.pool is not None:
+            self.pool.close()
 
     def give_up(self):
         """Waits for any running task to be executed, then exits the worker
@@ -933,6 +1207,7 @@ class Scheduler(threading.Thread):
                 if is_disabled:
                     logger.debug('Someone stopped me, sleeping until better'
                                  ' times come (%s)', self.w_stats.sleep)
+                    self.release_tasks()
                     self.sleep()
                     continue
                 logger.debug('looping...')
@@ -966,10 +1241,17 @@ class Scheduler(threading.Thread):
                         logger.info('TICKER: greedy loop')
                         self.wrapped_assign_tasks()
                     logger.debug('sleeping...')
-                    self.sleep()
+                    self.wait()
         except (KeyboardInterrupt, SystemExit):
             logger.info('catched')
             self.die()
+        finally:
+            try:
+                self.release_tasks()
+            except Exception:
+                logger.exception('error releasing fetched tasks')
+            if self.pool is not None:
+                self.pool.close()
 
     def wrapped_pop_task(self):
         """Commodity function to call `pop_task` and trap exceptions.
@@ -988,21 +1270,92 @@ class Scheduler(threading.Thread):
                 db.rollback()
                 time.sleep(0.5)
 
-    def pop_task(self):
-        """Grab a task ready to be executed from the queue."""
-        now = self.now()
+    def fetch_tasks(self):
+        """Fetch up to `claim_batch` tasks assigned to this worker
+        (internal use only).
+
+        On PostgreSQL rows locked by a concurrent transaction (i.e. the
+        TICKER reassigning them) are skipped rather than waited for, and
+        the fetched tasks are claimed (set to RUNNING) in the same
+        transaction, while they are locked. On other databases each task
+        is claimed by `pop_task` when it is about to be executed.
+
+        Returns:
+            a list of scheduler_task rows
+        """
         db = self.db
         st = db.scheduler_task
         grabbed = db(
             (st.assigned_worker_name == self.worker_name) &
             (st.status == ASSIGNED)
         )
+        limitby = (0, self.claim_batch)
+        if db._adapter.dbengine == 'postgres':
+            sql = grabbed._select(st.ALL, limitby=limitby,
+                                  orderby=st.next_run_time, for_update=True)
+            sql = '%s SKIP LOCKED;' % sql.rstrip().rstrip(';')
+            tasks = db.executesql(sql, fields=st)
+            if tasks:
+                db(st.id.belongs([task.id for task in tasks])).update(
+                    status=RUNNING, last_run_time=self.now())
+                for task in tasks:
+                    task.status = RUNNING
+        else:
+            tasks = grabbed.select(limitby=limitby, orderby=st.next_run_time)
+        db.commit()
+        return list(tasks)
+
+    def release_tasks(self):
+        """Give back the tasks fetched but not executed, if they have
+        been claimed by `fetch_tasks` (internal use only)."""
+        prefetched, self.prefetched = self.prefetched, []
+        claimed = [task.id for task in prefetched if task.status == RUNNING]
+        if not claimed:
+            return
+        db = self.db
+        st = db.scheduler_task
+        db((st.id.belongs(claimed)) &
+           (st.assigned_worker_name == self.worker_name) &
+           (st.status == RUNNING)
+           ).update(status=ASSIGNED)
+        db.commit()
 
-        task = grabbed.select(limitby=(0, 1), orderby=st.next_run_time).first()
-        if task:
+    def pop_task(self):
+        """Grab a task ready to be executed from the queue.
+
+        Tasks assigned to this worker are fetched `claim_batch` at a time,
+        each of them is claimed (set to RUNNING) only when it is about to
+        be executed, and only if it is still assigned to this worker
+        (unless already claimed by `fetch_tasks`, see there).
+        """
+        now = self.now()
+        db = self.db
+        st = db.scheduler_task
+
+        task = None
+        fetched = False
+        while task is None:
+            if not self.prefetched:
+                if fetched:
+                    break
+                self.prefetched = self.fetch_tasks()
+                fetched = True
+                continue
+            task = self.prefetched.pop(0)
+            if task.status == RUNNING:
+                # claimed by fetch_tasks
+                db(st.id == task.id).update(last_run_time=now)
             # none will touch my task!
-            task.update_record(status=RUNNING, last_run_time=now)
+            elif not db((st.id == task.id) &
+                        (st.assigned_worker_name == self.worker_name) &
+                        (st.status == ASSIGNED)
+                        ).update(status=RUNNING, last_run_time=now):
+                # reassigned or stopped meanwhile
+                task = None
             db.commit()
+        if task:
+            task.status = RUNNING
+            task.last_run_time = now
             logger.debug('   work to do %s', task.id)
         else:
             logger.info('nothing to do')
@@ -1348,31 +1701,35 @@ class Scheduler(threading.Thread):
             (st.stop_time < now)
         ).update(status=EXPIRED)
 
-        # calculate dependencies
-        deps_with_no_deps = db(
-            (sd.can_visit == False) &
-            (~sd.task_child.belongs(
-                db(sd.can_visit == False)._select(sd.task_parent)
-            )
+        # calculate dependencies (only if there are pending ones)
+        if db(sd.can_visit == False).isempty():
+            no_deps = None
+        else:
+            deps_with_no_deps = db(
+                (sd.can_visit == False) &
+                (~sd.task_child.belongs(
+                    db(sd.can_visit == False)._select(sd.task_parent)
+                )
+                )
+            )._select(sd.task_child)
+            no_deps = db(
+                (st.status.belongs((QUEUED, ASSIGNED))) &
+                (
+                    (sd.id == None) | (st.id.belongs(deps_with_no_deps))
+                )
+            )._select(st.id, distinct=True, left=sd.on(
+                     (st.id == sd.task_parent) &
+                     (sd.can_visit == False)
             )
-        )._select(sd.task_child)
-        no_deps = db(
-            (st.status.belongs((QUEUED, ASSIGNED))) &
-            (
-                (sd.id == None) | (st.id.belongs(deps_with_no_deps))
             )
-        )._select(st.id, distinct=True, left=sd.on(
-                 (st.id == sd.task_parent) &
-                 (sd.can_visit == False)
-        )
-        )
 
         all_available = db(
             (st.status.belongs((QUEUED, ASSIGNED))) &
             (st.next_run_time <= now) &
-            (st.enabled == True) &
-            (st.id.belongs(no_deps))
+            (st.enabled == True)
         )
+        if no_deps is not None:
+            all_available = all_available(st.id.belongs(no_deps))
 
         limit = len(all_workers) * (50 / (len(wkgroups) or 1))
         # if there are a moltitude of tasks, let's figure out a maximum of
@@ -1388,63 +1745,85 @@ class Scheduler(threading.Thread):
         # be reassigned to other workers
         # this shuffles up things a bit, in order to give a task equal chances
         # to be executed
+        # Tasks already assigned to available workers stay where they are
+        # (and count towards the limit), so that only new tasks and the ones
+        # of busy or dead workers need to be updated
+        names = set(w['name'] for g in wkgroups.values() for w in g['workers'])
+        count = st.id.count()
+        assigned = db(
+            (st.status == ASSIGNED) &
+            (st.assigned_worker_name.belongs(list(names)))
+        ).select(st.group_name, st.assigned_worker_name, count,
+                 groupby=st.group_name | st.assigned_worker_name) \
+            if names else []
+        for row in assigned:
+            ws = wkgroups.get(row[st.group_name])
+            if ws:
+                for w in ws['workers']:
+                    if w['name'] == row[st.assigned_worker_name]:
+                        w['c'] = row[count]
 
         # let's freeze it up
         db.commit()
-        tnum = 0
+        tnum = tnew = 0
+        greedy = False
         for group in wkgroups.keys():
-            tasks = all_available(st.group_name == group).select(
-                limitby=(0, limit), orderby=st.next_run_time)
+            workers = wkgroups[group]['workers']
+            queued = sum(w['c'] for w in workers)
+            tnum += queued
+            group_limit = int(limit - queued)
+            if group_limit <= 0:
+                greedy = True
+                continue
+            tasks = all_available(
+                (st.group_name == group) &
+                ((st.status == QUEUED) |
+                 (~st.assigned_worker_name.belongs([w['name'] for w in workers])))
+            ).select(limitby=(0, group_limit), orderby=st.next_run_time)
+            greedy = greedy or len(tasks) >= group_limit
             # let's break up the queue evenly among workers
+            batches = {}
             for task in tasks:
                 tnum += 1
-                gname = task.group_name
-                ws = wkgroups.get(gname)
-                if ws:
-                    if task.broadcast:
-                        for worker in ws['workers']:
-                            new_task = db.scheduler_task.insert(
-                                application_name = task.application_name,
-                                task_name = task.task_name,
-                                group_name = task.group_name,
-                                status = ASSIGNED,
-                                broadcast = False,
-                                function_name = task.function_name,
-                                args = task.args,
-                                start_time = now,
-                                repeats = 1,
-                                retry_failed = task.retry_failed,
-                                sync_output = task.sync_output,
-                                assigned_worker_name = worker['name'])
-                        if task.period:
-                            next_run_time = now+datetime.timedelta(seconds=task.period)
-                        else:
-                            # must be cronline
-                            cron_recur = CronParser(task.cronline,
-                                    now.replace(second=0, microsecond=0))
-                            next_run_time = cron_recur.next()
-                        db(st.id == task.id).update(times_run=task.times_run+1,
-                                                    next_run_time=next_run_time,
-                                                    last_run_time=now)
-                        db.commit()
+                tnew += 1
+                if task.broadcast:
+                    for worker in workers:
+                        new_task = db.scheduler_task.insert(
+                            application_name = task.application_name,
+                            task_name = task.task_name,
+                            group_name = task.group_name,
+                            status = ASSIGNED,
+                            broadcast = False,
+                            function_name = task.function_name,
+                            args = task.args,
+                            start_time = now,
+                            repeats = 1,
+                            retry_failed = task.retry_failed,
+                            sync_output = task.sync_output,
+                            assigned_worker_name = worker['name'])
+                    if task.period:
+                        next_run_time = now+datetime.timedelta(seconds=task.period)
                     else:
-                        counter = 0
-                        myw = 0
-                        for i, w in enumerate(ws['workers']):
-                            if w['c'] < counter:
-                                myw = i
-                            counter = w['c']
-                        assigned_wn = wkgroups[gname]['workers'][myw]['name']
-                        d = dict(
-                            status=ASSIGNED,
-                            assigned_worker_name=assigned_wn
-                        )
-                        db(
-                            (st.id == task.id) &
-                            (st.status.belongs((QUEUED, ASSIGNED)))
-                        ).update(**d)
-                        wkgroups[gname]['workers'][myw]['c'] += 1
-                db.commit()
+                        # must be cronline
+                        cron_recur = CronParser(task.cronline,
+                                now.replace(second=0, microsecond=0))
+                        next_run_time = cron_recur.next()
+                    db(st.id == task.id).update(times_run=task.times_run+1,
+                                                next_run_time=next_run_time,
+                                                last_run_time=now)
+                    db.commit()
+                else:
+                    w = min(workers, key=lambda w: w['c'])
+                    batches.setdefault(w['name'], []).append(task.id)
+                    w['c'] += 1
+            for assigned_wn, ids in batches.items():
+                db(
+                    (st.id.belongs(ids)) &
+                    (st.status.belongs((QUEUED, ASSIGNED)))
+                ).update(status=ASSIGNED, assigned_worker_name=assigned_wn)
+            db.commit()
+        if tnew:
+            self.notify()
         # I didn't report tasks but I'm working nonetheless!!!!
         with self.w_stats_lock:
             if tnum > 0:
@@ -1454,7 +1833,7 @@ class Scheduler(threading.Thread):
             self.w_stats.workers = len(all_workers)
         # I'll be greedy only if tasks assigned are equal to the limit
         # (meaning there could be others ready to be assigned)
-        self.greedy = tnum >= limit
+        self.greedy = greedy
         logger.info('TICKER: workers are %s', len(all_workers))
         logger.info('TICKER: tasks are %s', tnum)
 
@@ -1463,6 +1842,64 @@ class Scheduler(threading.Thread):
         time.sleep(self.w_stats.sleep)
         # should only sleep until next available task
 
+    def notify(self):
+        """Wake up the workers listening for notifications (see
+        `listen_notify`), delivered when the current transaction commits"""
+        db = self.db
+        if self.listen_notify and db._adapter.dbengine == 'postgres':
+            db.executesql('NOTIFY %s;' % NOTIFY_CHANNEL)
+
+    def get_listener(self):
+        """Get the connection listening for notifications (internal use
+        only).
+
+        Returns:
+            a psycopg2 connection, or None if notifications are not
+            enabled or not supported
+        """
+        if self.listener is None:
+            self.listener = False
+            db = self.db
+            if self.listen_notify and db._adapter.dbengine == 'postgres':
+                try:
+                    ldb = DAL(db._uri, folder=db._adapter.folder,
+                              decode_credentials=True)
+                    conn = ldb._adapter.connection
+                    if not hasattr(conn, 'poll'):
+                        raise RuntimeError('driver %s does not support '
+                                           'notifications' %
+                                           ldb._adapter.driver_name)
+                    # after_connection leaves the connection inside a
+                    # transaction, where autocommit can not be switched on
+                    conn.commit()
+                    conn.autocommit = True
+                    conn.cursor().execute('LISTEN %s;' % NOTIFY_CHANNEL)
+                except Exception:
+                    logger.exception('cannot listen for notifications')
+                else:
+                    self.listener = conn
+        return self.listener or None
+
+    def wait(self):
+        """Sleep until the next heartbeat, or until notified of new tasks
+        to be assigned or executed"""
+        conn = self.get_listener()
+        if conn is None:
+            self.sleep()
+            return
+        import select
+        try:
+            if select.select([conn], [], [], self.w_stats.sleep)[0]:
+                conn.poll()
+                del conn.notifies[:]
+                logger.debug('woken up by notification')
+                if self.is_a_ticker:
+                    self.do_assign_tasks = True
+        except Exception:
+            logger.exception('error waiting for notifications')
+            self.listener = False
+            self.sleep()
+
     def set_worker_status(self, group_names=None, action=ACTIVE,
                           exclude=None, limit=None, worker_name=None):
         """Internal function to set worker's status."""
@@ -1582,6 +2019,7 @@ class Scheduler(threading.Thread):
                 db(
                     (db.scheduler_worker.is_ticker == True)
                 ).update(status=PICK)
+            self.notify()
         else:
             rtn.uuid = None
         return rtn
@@ -1756,6 +2194,11 @@ def main():
         "-U", "--utc-time", dest="utc_time", default=False,
         help="work with UTC timestamps"
     )
+    parser.add_option(
+        "-P", "--pool_size", dest="pool_size", default=0, type='int',
+        help="number of persistent processes executing tasks " +
+        "(default 0, i.e. a new process for each task)"
+    )
     (options, args) = parser.parse_args()
     if not options.tasks or not options.db_uri:
         print(USAGE)
@@ -1785,7 +2228,8 @@ def main():
                           group_names=group_names,
                           heartbeat=options.heartbeat,
                           max_empty_runs=options.max_empty_runs,
-                          utc_time=options.utc_time)
+                          utc_time=options.utc_time,
+                          pool_size=options.pool_size)
     signal.signal(signal.SIGTERM, lambda signum, stack_frame: sys.exit(1))
     print('starting main worker loop...')
     scheduler.loop()
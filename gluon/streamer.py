@@ -14,18 +14,31 @@ import os
 import stat
 import time
 import re
+import json
 import errno
+import hashlib
 from gluon.http import HTTP
 from gluon.utils import unlocalised_http_header_date
 from gluon.contenttype import contenttype
-from gluon._compat import PY2
+from gluon._compat import PY2, to_native
 
 
 regex_start_range = re.compile('\d+(?=\-)')
 regex_stop_range = re.compile('(?<=\-)\d+')
+regex_fingerprint = re.compile(r'^(.+)\.([0-9a-f]{10})(\.\w+)$')
 
 DEFAULT_CHUNK_SIZE = 64 * 1024
 
+# Seconds between two stat()s of the same file in static_metadata
+STAT_INTERVAL = 2
+# Maximum number of files in the metadata cache
+METADATA_CACHE_SIZE = 4096
+# Precompressed variants, in order of preference
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+_metadata = {}
+_manifests = {}
+
 def streamer(stream, chunk_size=DEFAULT_CHUNK_SIZE, bytes=None, callback=None):
     try:
         offset = 0
@@ -46,6 +59,185 @@ def streamer(stream, chunk_size=DEFAULT_CHUNK_SIZE, bytes=None, callback=None):
         if callback:
             callback()
 
+
+
+def static_metadata(static_file, refresh=False):
+    """Returns the metadata of a static file from the process-level cache
+
+    The file and its precompressed variants are stat'ed at most once
+    every STAT_INTERVAL seconds, unless `refresh` is set.
+
+    Args:
+        static_file: the path of the file
+        refresh: stat the file even if its metadata are recent
+
+    Returns:
+        a dict with the `size`, `mtime`, `last_modified` (HTTP date) and
+        strong `etag` of the file, and its fresh precompressed `variants`
+        as {content-coding: (path, size, etag)}
+
+    Raises:
+        EnvironmentError: if the file does not exist or is a directory
+    """
+    now = time.time()
+    info = _metadata.get(static_file)
+    if info and not refresh and now - info['checked'] < STAT_INTERVAL:
+        return info
+    stat_file = os.stat(static_file)
+    if stat.S_ISDIR(stat_file.st_mode):
+        raise IOError(errno.EISDIR, 'Is a directory', static_file)
+    size, mtime = stat_file.st_size, stat_file.st_mtime
+    fingerprint = None
+    if info and info['size'] == size and info['mtime'] == mtime:
+        fingerprint = info['fingerprint']
+    etag = '%x-%x' % (int(mtime), size)
+    variants = {}
+    for encoding, extension in ENCODINGS:
+        path = static_file + extension
+        try:
+            stat_variant = os.stat(path)
+        except EnvironmentError:
+            continue
+        if stat.S_ISREG(stat_variant.st_mode) and stat_variant.st_mtime >= mtime:
+            variants[encoding] = (path, stat_variant.st_size,
+                                  '"%s-%s"' % (etag, extension[1:]))
+    info = dict(checked=now,
+                size=size,
+                mtime=mtime,
+                last_modified=unlocalised_http_header_date(time.gmtime(mtime)),
+                etag='"%s"' % etag,
+                variants=variants,
+                fingerprint=fingerprint)
+    if static_file not in _metadata and len(_metadata) >= METADATA_CACHE_SIZE:
+        _metadata.clear()
+    _metadata[static_file] = info
+    return info
+
+
+def _digest(filename):
+    md5 = hashlib.md5()
+    with open(filename, 'rb') as stream:
+        for data in iter(lambda: stream.read(DEFAULT_CHUNK_SIZE), b''):
+            md5.update(data)
+    return md5.hexdigest()[:10]
+
+
+def file_fingerprint(static_file):
+    """Returns the fingerprint (10 hex digits of the MD5 of the contents)
+    of a static file, cached along with its metadata
+    """
+    info = static_metadata(static_file)
+    if info['fingerprint'] is None:
+        info['fingerprint'] = _digest(static_file)
+    return info['fingerprint']
+
+
+def fingerprinted_name(filename, fingerprint):
+    """Inserts the fingerprint before the extension of a file name,
+    e.g. 'web2py.js' -> 'web2py.0123456789.js'; names without an
+    extension are returned unchanged
+    """
+    root, extension = os.path.splitext(filename)
+    name = '%s.%s%s' % (root, fingerprint, extension)
+    return name if regex_fingerprint.match(name) else filename
+
+
+def unfingerprint(static_file):
+    """Maps a fingerprinted static file path to the actual file
+
+    Returns:
+        tuple (static_file, fingerprint), where fingerprint is None unless
+        the path carried the fingerprint of the current file contents
+        (i.e. the response can be cached forever)
+    """
+    match = regex_fingerprint.match(static_file)
+    if match:
+        try:
+            static_metadata(static_file)
+        except EnvironmentError:
+            original = match.group(1) + match.group(3)
+            try:
+                if file_fingerprint(original) == match.group(2):
+                    return original, match.group(2)
+            except EnvironmentError:
+                pass
+            return original, None
+    return static_file, None
+
+
+def build_fingerprints(static_folder, manifest='fingerprints.json'):
+    """Fingerprints all files in a static folder and writes the manifest
+    {relative path: fingerprint} to be used by URL (response.static_fingerprints)
+
+    Args:
+        static_folder: the static folder of the application
+        manifest: the manifest file name (relative to static_folder)
+
+    Returns:
+        the fingerprints
+    """
+    fingerprints = {}
+    for path, dirs, files in os.walk(static_folder):
+        dirs[:] = [d for d in dirs if not d.startswith('.')]
+        for name in files:
+            filename = os.path.join(path, name)
+            relpath = os.path.relpath(filename, static_folder).replace(os.sep, '/')
+            if name.startswith('.') or relpath == manifest or \
+               name.endswith(('.br', '.gz')) or \
+               regex_fingerprint.match(name) or \
+               fingerprinted_name(name, '0' * 10) == name:
+                continue
+            fingerprints[relpath] = _digest(filename)
+    with open(os.path.join(static_folder, manifest), 'w') as stream:
+        json.dump(fingerprints, stream, indent=1, sort_keys=True)
+    return fingerprints
+
+
+def static_fingerprints(manifest):
+    """Returns the fingerprints from a manifest written by build_fingerprints,
+    cached per process and reloaded when the manifest changes; an empty
+    dict if there is no manifest
+    """
+    try:
+        etag = static_metadata(manifest)['etag']
+    except EnvironmentError:
+        return {}
+    cached = _manifests.get(manifest)
+    if cached is None or cached[0] != etag:
+        with open(manifest, 'rb') as stream:
+            cached = _manifests[manifest] = (etag, json.loads(to_native(stream.read())))
+    return cached[1]
+
+
+def accepted_encodings(accept_encoding):
+    """Returns the set of content-codings accepted by an Accept-Encoding header"""
+    accepted = set()
+    for item in (accept_encoding or '').split(','):
+        coding, _, params = item.partition(';')
+        params = params.strip().replace(' ', '')
+        if params.startswith('q='):
+            try:
+                if float(params[2:]) == 0:
+                    continue
+            except ValueError:
+                continue
+        accepted.add(coding.strip().lower())
+    return accepted
+
+
+def etag_matches(if_none_match, etag):
+    """Checks an If-None-Match header against an ETag (weak comparison)"""
+    if if_none_match.strip() == '*':
+        return True
+    for tag in if_none_match.split(','):
+        tag = tag.strip()
+        if tag.startswith('W/'):
+            tag = tag[2:]
+        if tag == etag:
+            return True
+    return False
+
+
 def stream_file_or_304_or_206(
     static_file,
     chunk_size=DEFAULT_CHUNK_SIZE,
@@ -58,76 +250,86 @@ def stream_file_or_304_or_206(
     # if error_message is None:
     #     error_message = rewrite.THREAD_LOCAL.routes.error_message % 'invalid request'
     try:
-        if PY2:
-            open_f = file # this makes no sense but without it GAE cannot open files
-        else:
-            open_f = open
-        fp = open_f(static_file,'rb')
-    except IOError as e:
+        info = static_metadata(static_file)
+    except EnvironmentError as e:
         if e.errno == errno.EISDIR:
             raise HTTP(403, error_message, web2py_error='file is a directory')
         elif e.errno == errno.EACCES:
             raise HTTP(403, error_message, web2py_error='inaccessible file')
         else:
             raise HTTP(404, error_message, web2py_error='invalid file')
-    else:
-        fp.close()
-    stat_file = os.stat(static_file)
-    fsize = stat_file[stat.ST_SIZE]
-    modified = stat_file[stat.ST_MTIME]
-    mtime = unlocalised_http_header_date(time.gmtime(modified))
+    env = request.env if request else None
     headers.setdefault('Content-Type', contenttype(static_file))
-    headers.setdefault('Last-Modified', mtime)
+    headers.setdefault('Last-Modified', info['last_modified'])
     headers.setdefault('Pragma', 'cache')
     headers.setdefault('Cache-Control', 'private')
 
+    # select the representation: precompressed variants (.br before .gz)
+    # are served for full responses only
+    path, fsize, etag = static_file, info['size'], info['etag']
+    is_range = status == 200 and env and env.http_range
+    if info['variants'] and not 'Content-Encoding' in headers:
+        headers['Vary'] = 'Accept-Encoding'
+        if env and not is_range:
+            accepted = accepted_encodings(env.http_accept_encoding)
+            for encoding, extension in ENCODINGS:
+                if encoding in accepted and encoding in info['variants']:
+                    path, fsize, etag = info['variants'][encoding]
+                    headers['Content-Encoding'] = encoding
+                    break
+
     # if this is a normal response and not a respnse to an error page
     if status == 200:
-        if request and request.env.http_if_modified_since == mtime:
-            raise HTTP(304, **{'Content-Type': headers['Content-Type']})
-
-        elif request and request.env.http_range:
-            start_items = regex_start_range.findall(request.env.http_range)
-            if not start_items:
-                start_items = [0]
-            stop_items = regex_stop_range.findall(request.env.http_range)
-            if not stop_items or int(stop_items[0]) > fsize - 1:
-                stop_items = [fsize - 1]
-            part = (int(start_items[0]), int(stop_items[0]), fsize)
-            bytes = part[1] - part[0] + 1
-            try:
-                stream = open(static_file, 'rb')
-            except IOError as e:
-                if e.errno in (errno.EISDIR, errno.EACCES):
-                    raise HTTP(403)
-                else:
-                    raise HTTP(404)
-            stream.seek(part[0])
-            headers['Content-Range'] = 'bytes %i-%i/%i' % part
-            headers['Content-Length'] = '%i' % bytes
-            status = 206
+        headers['ETag'] = etag
+        if env and env.http_if_none_match is not None:
+            not_modified = etag_matches(env.http_if_none_match, etag)
+        else:
+            not_modified = env and env.http_if_modified_since == info['last_modified']
+        if not_modified:
+            raise HTTP(304, **dict((key, headers[key]) for key in
+                                   ('Content-Type', 'ETag', 'Cache-Control', 'Expires', 'Vary')
+                                   if key in headers))
+
+    try:
+        if PY2:
+            open_f = file # this makes no sense but without it GAE cannot open files
+        else:
+            open_f = open
+        stream = open_f(path, 'rb')
+    except IOError as e:
+        # this better not happen when returning an error page ;-)
+        if e.errno in (errno.EISDIR, errno.EACCES):
+            raise HTTP(403)
+        else:
+            raise HTTP(404)
+    # the file may have changed since it was last stat'ed
+    actual_size = os.fstat(stream.fileno()).st_size
+    if actual_size != fsize:
+        _metadata.pop(static_file, None)
+        fsize = actual_size
+        headers.pop('ETag', None)
+
+    if is_range:
+        start_items = regex_start_range.findall(env.http_range)
+        if not start_items:
+            start_items = [0]
+        stop_items = regex_stop_range.findall(env.http_range)
+        if not stop_items or int(stop_items[0]) > fsize - 1:
+            stop_items = [fsize - 1]
+        part = (int(start_items[0]), int(stop_items[0]), fsize)
+        bytes = part[1] - part[0] + 1
+        stream.seek(part[0])
+        headers['Content-Range'] = 'bytes %i-%i/%i' % part
+        headers['Content-Length'] = '%i' % bytes
+        status = 206
     # in all the other cases (not 304, not 206, but 200 or error page)
-    if status != 206:
-        enc = request.env.http_accept_encoding
-        if enc and 'gzip' in enc and not 'Content-Encoding' in headers:
-            gzipped = static_file + '.gz'
-            if os.path.isfile(gzipped) and os.path.getmtime(gzipped) >= modified:
-                static_file = gzipped
-                fsize = os.path.getsize(gzipped)
-                headers['Content-Encoding'] = 'gzip'
-                headers['Vary'] = 'Accept-Encoding'
-        try:
-            stream = open(static_file, 'rb')
-        except IOError as e:
-            # this better not happen when returning an error page ;-)
-            if e.errno in (errno.EISDIR, errno.EACCES):
-                raise HTTP(403)
-            else:
-                raise HTTP(404)
+    else:
         headers['Content-Length'] = fsize
         bytes = None
-    if request and request.env.web2py_use_wsgi_file_wrapper:
-        wrapped = request.env.wsgi_file_wrapper(stream, chunk_size)
+    # the file wrapper of Rocket sends the file with sendfile (zero-copy)
+    if env and (env.web2py_use_wsgi_file_wrapper or
+                getattr(env.wsgi_file_wrapper, 'zero_copy', False)):
+        wrapped = env.wsgi_file_wrapper(stream, chunk_size)
     else:
         wrapped = streamer(stream, chunk_size=chunk_size, bytes=bytes)
     raise HTTP(status, wrapped, **headers)
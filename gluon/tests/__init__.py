@@ -3,6 +3,7 @@ from .test_contenttype import *
 from .test_fileutils import *
 from .test_globals import *
 from .test_recfile import *
+from .test_streamer import *
 from .test_storage import *
 from .test_dal import *
 from .test_cache import *
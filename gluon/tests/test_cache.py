@@ -5,6 +5,10 @@
     Unit tests for gluon.cache
 """
 import os
+import shutil
+import tempfile
+import time
+import threading
 import unittest
 
 from gluon.storage import Storage
@@ -64,6 +68,47 @@ class TestCache(unittest.TestCase):
         cache.increment('b')
         self.assertEqual(cache('b', lambda: 'x', 100), 1)
 
+    def test_CacheInRamLimits(self):
+
+        cache = CacheInRam(Storage({'application': 'cachelimits'}))
+        cache.configure(max_entries=32)
+        cache.clear()
+        stats = cache.stats['cachelimits']
+        for i in range(64):
+            self.assertEqual(cache('k%s' % i, lambda: i, 100), i)
+        self.assertTrue(len(cache.storage) <= 32 + 16)
+        self.assertEqual(stats['entries'], len(cache.storage))
+        self.assertEqual(stats['evictions'], 64 - len(cache.storage))
+        self.assertEqual(stats['misses'], 64)
+        # most recently used keys are kept
+        self.assertEqual(cache('k63', lambda: None, 100), 63)
+        self.assertEqual(stats['hit_total'], 65)
+        # expired entries are swept
+        cache.configure(sweep_interval=100)
+        cache.clear()
+        cache('a', lambda: 1, 10)
+        cache('b', lambda: 2, None)
+        cache.storage.sweep(now=time.time() + 20)
+        self.assertEqual(cache.storage.keys(), ['b'])
+        self.assertEqual(stats['expired'], 1)
+        # size limit
+        cache.configure(max_bytes=16 * 1024)
+        for i in range(64):
+            cache('s%s' % i, lambda: 'x' * 512, 100)
+        self.assertTrue(stats['bytes'] <= 16 * 1024)
+        self.assertTrue(stats['entries'] < 64)
+        # the size of containers includes their items
+        cache.clear()
+        for i in range(64):
+            cache('l%s' % i, lambda: ['x' * 128] * 2 + ['y' * 128], 100)
+        self.assertTrue(stats['bytes'] <= 16 * 1024)
+        self.assertTrue(stats['entries'] < 64)
+        from gluon.cache import RamStorage
+        sizeof = RamStorage.sizeof
+        self.assertTrue(sizeof({'a': ['x' * 512]}) > sizeof({'a': []}) + 512)
+        cache.configure()
+        cache.clear()
+
     def test_CacheOnDisk(self):
 
         # defaults to mode='http'
@@ -93,6 +138,123 @@ class TestCache(unittest.TestCase):
         cache.increment('b')
         self.assertEqual(cache('b', lambda: 'x', 100), 1)
 
+    def test_CacheOnDiskSQLite(self):
+
+        s = Storage({'application': 'admin',
+                     'folder': 'applications/admin'})
+        cache = CacheOnDisk(s, engine='sqlite')
+        self.assertEqual(cache('a', lambda: 1, 0), 1)
+        self.assertEqual(cache('a', lambda: 2, 100), 1)
+        cache.clear('b')
+        self.assertEqual(cache('a', lambda: 2, 100), 1)
+        cache.clear('a')
+        self.assertEqual(cache('a', lambda: 2, 100), 2)
+        cache.clear()
+        self.assertEqual(cache('a', lambda: 3, 100), 3)
+        self.assertEqual(cache('a', lambda: 4, 0), 4)
+        # test persistence
+        cache = CacheOnDisk(s, engine='sqlite')
+        self.assertEqual(cache('a', lambda: 5, 100), 4)
+        # test key deletion
+        cache('a', None)
+        self.assertEqual(cache('a', lambda: 5, 100), 5)
+        # test increment
+        self.assertEqual(cache.increment('a'), 6)
+        self.assertEqual(cache('a', lambda: 1, 100), 6)
+        cache.increment('b')
+        self.assertEqual(cache('b', lambda: 'x', 100), 1)
+        # test prefix clear
+        for key in ('menu:1', 'menu:2', 'menus', 'gis:1'):
+            cache(key, lambda: key, 100)
+        cache.clear(r'menu:\d')
+        self.assertEqual(cache('menu:1', lambda: 0, 100), 0)
+        self.assertEqual(cache('menus', lambda: 0, 100), 'menus')
+        cache.clear(r'^gis|menus')
+        self.assertEqual(cache('gis:1', lambda: 0, 100), 0)
+        self.assertEqual(cache('menus', lambda: 0, 100), 0)
+        cache.clear()
+        self.assertEqual(cache.storage.keys(), [])
+        # test eviction of the least recently used entries
+        cache = CacheOnDisk(s, engine='sqlite', shards=1, max_entries=10)
+        cache.initialize()
+        for i in range(30):
+            cache.storage['k%s' % i] = (0, i)
+        cache.storage.evict(cache.storage.connection(0))
+        self.assertEqual(len(cache.storage.keys()), 10)
+        self.assertEqual(cache.storage.get('k29'), (0, 29))
+        self.assertEqual(cache.storage.get('k0'), None)
+        cache.clear()
+
+    def test_SingleFlight(self):
+        s = Storage({'application': 'admin',
+                     'folder': 'applications/admin'})
+        for cache in (CacheInRam(s), CacheOnDisk(s)):
+            cache.clear()
+            calls = []
+
+            def f():
+                calls.append(1)
+                time.sleep(0.2)
+                return len(calls)
+
+            results = []
+            threads = [threading.Thread(
+                target=lambda: results.append(cache('sf', f, 100)))
+                for i in range(5)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            self.assertEqual(results, [1] * 5)
+            self.assertEqual(len(calls), 1)
+            # expired value returned while refreshed in background
+            time.sleep(1.1)
+            self.assertEqual(cache('sf', f, 1, stale=True), 1)
+            self.assertEqual(cache('sf', f, 1, stale=True), 1)
+            time.sleep(0.5)
+            self.assertEqual(len(calls), 2)
+            self.assertEqual(cache('sf', f, 1, stale=True), 2)
+            cache.clear()
+        # the expired value is destroyed once, by the leader
+        cache = CacheInRam(s)
+        cache.clear()
+        destroyed = []
+        cache('sd', lambda: 'old', 100)
+        time.sleep(1.1)
+        threads = [threading.Thread(
+            target=lambda: cache('sd', f, 1, destroyer=destroyed.append))
+            for i in range(5)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(destroyed, ['old'])
+        cache.clear()
+
+    def test_SingleFlightConnections(self):
+        from gluon.cache import single_flight
+        folder = tempfile.mkdtemp()
+        db = DAL('sqlite://sf.db', folder=folder, check_reserved=['all'])
+        db.define_table('t_sf', Field('f_a'))
+        db.commit()
+        connections = []
+
+        def f():
+            db.t_sf.insert(f_a='refreshed')
+            connections.append(db._adapter.connection)
+
+        self.assertTrue(single_flight.in_background('sf_db', f))
+        for i in range(50):
+            if connections and not single_flight.calls:
+                break
+            time.sleep(0.1)
+        time.sleep(0.1)
+        # the connection of the background thread was committed and closed
+        self.assertEqual(db(db.t_sf).count(), 1)
+        self.assertRaises(Exception, connections[0].cursor)
+        db.close()
+        shutil.rmtree(folder)
+
     # TODO: def test_CacheAction(self):
 
     # TODO: def test_Cache(self):
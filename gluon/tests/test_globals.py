@@ -6,7 +6,11 @@
 """
 
 
+import datetime
+import os
 import re
+import shutil
+import tempfile
 import unittest
 
 from gluon.globals import Request, Response, Session
@@ -259,3 +263,237 @@ class testResponse(unittest.TestCase):
         response.meta['meta_dict'] = {'tag_name':'tag_value'}
         response.include_meta()
         self.assertEqual(response.body.getvalue(), '\n<meta tag_name="tag_value" />\n')
+
+
+class testSession(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        os.mkdir(os.path.join(self.folder, 'a'))
+        self.session_id = None
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def connect(self, lock=False):
+        from gluon.globals import current
+        request = Request(env={})
+        request.application = 'a'
+        request.folder = os.path.join(self.folder, 'a')
+        if self.session_id:
+            request.cookies['session_id_a'] = self.session_id
+        response = Response()
+        session = Session()
+        session.connect(request, response, lock=lock)
+        current.request = request
+        current.response = response
+        current.session = session
+        return request, response, session
+
+    def save(self, request, response, session):
+        from gluon.globals import current
+        current.request = request
+        current.response = response
+        current.session = session
+        return session._try_store_in_file(request, response)
+
+    def load(self):
+        request, response, session = self.connect()
+        return dict(session)
+
+    def test_db_delta(self):
+        from gluon.globals import current
+        from gluon.settings import global_settings
+        from gluon.storage import Storage
+        from gluon._compat import pickle
+        from pydal import DAL
+
+        # modified_datetime is stored in ISO format which the
+        # sqlite3 timestamp converter does not parse
+        db = DAL('sqlite:memory', driver_args={'detect_types': 0})
+        session_id = [None]
+
+        def connect(delta=True):
+            request = Request(env={})
+            request.application = 'b'
+            request.folder = os.path.join(self.folder, 'b')
+            request.now = datetime.datetime.now()
+            if session_id[0]:
+                request.cookies['session_id_b'] = session_id[0]
+            response = Response()
+            session = Session()
+            current.request = request
+            current.response = response
+            session.connect(request, response, db=db, delta=delta)
+            return request, response, session
+
+        def save(request, response, session):
+            current.request = request
+            current.response = response
+            del db._timings[:]
+            stored = session._try_store_in_db(request, response)
+            writes = [sql for sql, t in db._timings
+                      if sql.startswith(('INSERT', 'UPDATE', 'DELETE'))]
+            return stored, writes
+
+        try:
+            request, response, session = connect()
+            dtable = response.session_db_data_table
+            session.a = 1
+            session.s3 = Storage(filter={'x': 1})
+            self.assertTrue(save(request, response, session)[0])
+            session_id[0] = response.session_id
+            rows = db(dtable.id > 0).select(orderby=dtable.name)
+            self.assertEqual([r.name for r in rows], ['a', 's3'])
+            self.assertEqual(db.web2py_session_b(1).session_data, None)
+
+            # One record per key and session
+            indexes = db.executesql("SELECT name FROM sqlite_master "
+                                    "WHERE type='index' AND sql LIKE '%UNIQUE%' "
+                                    "AND tbl_name='web2py_session_b_data';")
+            self.assertEqual(indexes, [('web2py_session_b_data_key_idx',)])
+
+            # Concurrent requests adding the same key update it
+            first = connect()
+            second = connect()
+            first[2].e = 1
+            second[2].e = 2
+            self.assertTrue(save(*first)[0])
+            self.assertTrue(save(*second)[0])
+            rows = db(dtable.name == 'e').select(dtable.value)
+            self.assertEqual(len(rows), 1)
+            request, response, session = connect()
+            self.assertEqual(session.e, 2)
+            del session.e
+            self.assertTrue(save(request, response, session)[0])
+
+            # Key inserted by a concurrent request between update and insert
+            request, response, session = connect()
+            session.f = 2
+            insert = dtable.insert
+            def concurrent_insert(**fields):
+                insert(**dict(fields, value=Session._dumps_value(1)))
+                return insert(**fields)
+            dtable.insert = concurrent_insert
+            try:
+                self.assertTrue(save(request, response, session)[0])
+            finally:
+                del dtable.insert
+            rows = db(dtable.name == 'f').select(dtable.value)
+            self.assertEqual(len(rows), 1)
+            request, response, session = connect()
+            self.assertEqual(session.f, 2)
+            del session.f
+            self.assertTrue(save(request, response, session)[0])
+
+            # Sessions stored per key start empty without delta
+            request, response, session = connect(delta=False)
+            self.assertEqual(response.session_id, session_id[0])
+            self.assertFalse(response.session_new)
+            self.assertFalse('a' in session)
+
+            # Only changed keys are written
+            request, response, session = connect()
+            self.assertEqual(session.a, 1)
+            self.assertEqual(session.s3.filter, {'x': 1})
+            session.s3.filter['x'] = 2
+            stored, writes = save(request, response, session)
+            self.assertTrue(stored)
+            writes = [sql for sql in writes if 'web2py_session_b_data' in sql]
+            self.assertEqual(len(writes), 1)
+            self.assertTrue(writes[0].startswith('UPDATE'))
+
+            # Unchanged sessions are not written
+            request, response, session = connect()
+            self.assertEqual(session.s3.filter, {'x': 2})
+            self.assertEqual(save(request, response, session), (False, []))
+
+            # Removed keys are deleted
+            request, response, session = connect()
+            del session.a
+            session.b = [1, 2]
+            self.assertTrue(save(request, response, session)[0])
+            rows = db(dtable.id > 0).select(orderby=dtable.name)
+            self.assertEqual([r.name for r in rows], ['b', 's3'])
+            request, response, session = connect()
+            self.assertEqual(session.b, [1, 2])
+            self.assertFalse('a' in session)
+
+            # Sessions stored as a whole are converted
+            record_id = db.web2py_session_b.insert(
+                unique_key='k',
+                session_data=pickle.dumps({'c': 3}, pickle.HIGHEST_PROTOCOL))
+            session_id[0] = '%s:k' % record_id
+            request, response, session = connect()
+            self.assertEqual(session.c, 3)
+            session.d = 4
+            self.assertTrue(save(request, response, session)[0])
+            self.assertEqual(db.web2py_session_b(record_id).session_data, None)
+            request, response, session = connect()
+            self.assertEqual((session.c, session.d), (3, 4))
+
+            # Clear removes the data
+            session.clear()
+            self.assertTrue(db(dtable.session_id == record_id).isempty())
+        finally:
+            global_settings.db_sessions.discard('b')
+            db.close()
+
+    def test_unlocked_sessions(self):
+        request, response, session = self.connect()
+        session.x = 1
+        self.assertTrue(self.save(request, response, session))
+        self.session_id = response.session_id
+
+        # Concurrent requests do not hold a lock
+        r1 = self.connect()
+        r2 = self.connect()
+        self.assertEqual(r1[2].x, 1)
+        self.assertFalse(r1[1].session_file)
+        self.assertFalse(r2[1].session_locked)
+
+        # Changes to different keys are merged
+        r1[2].a = 1
+        r2[2].b = 2
+        del r2[2].x
+        self.assertTrue(self.save(*r1))
+        self.assertTrue(self.save(*r2))
+        data = self.load()
+        self.assertEqual(data['a'], 1)
+        self.assertEqual(data['b'], 2)
+        self.assertFalse('x' in data)
+
+        # Changes to the same key are rejected
+        r1 = self.connect()
+        r2 = self.connect()
+        r1[2].a = 3
+        r2[2].a = 4
+        r2[2].c = 5
+        self.assertTrue(self.save(*r1))
+        self.assertFalse(self.save(*r2))
+        data = self.load()
+        self.assertEqual(data['a'], 3)
+        self.assertFalse('c' in data)
+
+        # ...except for internal keys, last one wins
+        r1 = self.connect()
+        r2 = self.connect()
+        r1[2]['_formkey[f]'] = ['k1']
+        r2[2]['_formkey[f]'] = ['k2']
+        self.assertTrue(self.save(*r1))
+        self.assertTrue(self.save(*r2))
+        self.assertEqual(self.load()['_formkey[f]'], ['k2'])
+
+        # Forgotten sessions are not saved
+        r1 = self.connect()
+        r1[2].forget(r1[1])
+        r1[2].a = 6
+        self.assertFalse(self.save(*r1))
+        self.assertEqual(self.load()['a'], 3)
+
+        # Locked and unlocked requests can be mixed
+        r1 = self.connect(lock=True)
+        self.assertTrue(r1[1].session_locked)
+        r1[2].a = 7
+        self.assertTrue(self.save(*r1))
+        self.assertEqual(self.load()['a'], 7)
@@ -48,6 +48,21 @@ class TestBareHelpers(unittest.TestCase):
         response.static_version_urls = True
         self.assertEqual(URL('a', 'static', 'design.css'), '/a/static/_1.2.3/design.css')
 
+    def test_StaticFingerprintURL(self):
+        response = Storage()
+        response.static_fingerprints = {'design.css': '0123456789',
+                                        'js/web2py.js': 'abcdef0123'}
+        from gluon.globals import current
+        current.response = response
+        self.assertEqual(URL('a', 'static', 'design.css'), '/a/static/design.0123456789.css')
+        self.assertEqual(URL('a', 'static', 'js/web2py.js'), '/a/static/js/web2py.abcdef0123.js')
+        self.assertEqual(URL('a', 'static', 'js', args=('web2py.js',)), '/a/static/js/web2py.abcdef0123.js')
+        self.assertEqual(URL('a', 'static', 'other.css'), '/a/static/other.css')
+        response.static_version = '1.2.3'
+        response.static_version_urls = True
+        self.assertEqual(URL('a', 'static', 'design.css'), '/a/static/_1.2.3/design.0123456789.css')
+        del current.response
+
     def test_URL(self):
         self.assertEqual(URL('a', 'c', 'f', args='1'), '/a/c/f/1')
         self.assertEqual(URL('a', 'c', 'f', args=('1', '2')), '/a/c/f/1/2')
@@ -9,6 +9,7 @@ import glob
 import datetime
 import sys
 import shutil
+import json
 
 from gluon.storage import Storage
 from gluon.languages import TranslatorFactory
@@ -600,6 +601,202 @@ class TestsForSchedulerAPIs(BaseTestScheduler):
         self.assertEqual(set(rtn.keys()), set(['scheduler_run', 'scheduler_task', 'result']))
 
 
+class TestsForTaskClaiming(BaseTestScheduler):
+
+    def add_worker(self, s, name, status='ACTIVE'):
+        self.db.scheduler_worker.insert(
+            worker_name=name, status='ACTIVE', group_names=['main'],
+            first_heartbeat=s.now(), last_heartbeat=s.now(),
+            worker_stats={'status': status})
+
+    def testBatchPop(self):
+        s = Scheduler(self.db, worker_name='w1', claim_batch=3)
+        st = self.db.scheduler_task
+        ids = [s.queue_task('foo').id for i in range(4)]
+        self.db(st.id.belongs(ids)).update(status='ASSIGNED',
+                                           assigned_worker_name='w1')
+        self.db.commit()
+        task = s.pop_task()
+        self.assertEqual(task.task_id, ids[0])
+        # the others have been fetched, but not claimed
+        self.assertEqual(len(s.prefetched), 2)
+        statuses = [st(i).status for i in ids]
+        self.assertEqual(statuses, ['RUNNING', 'ASSIGNED', 'ASSIGNED', 'ASSIGNED'])
+        # a prefetched task that is no longer assigned to the worker is skipped
+        self.db(st.id == ids[1]).update(assigned_worker_name='w2')
+        self.db.commit()
+        task = s.pop_task()
+        self.assertEqual(task.task_id, ids[2])
+        self.assertEqual(st(ids[1]).status, 'ASSIGNED')
+        task = s.pop_task()
+        self.assertEqual(task.task_id, ids[3])
+        self.assertEqual(s.pop_task(), None)
+
+    def testIncrementalAssign(self):
+        s = Scheduler(self.db, worker_name='w1')
+        st = self.db.scheduler_task
+        self.add_worker(s, 'w1')
+        self.add_worker(s, 'w2')
+        self.add_worker(s, 'w3', status='RUNNING')
+        kept = s.queue_task('foo').id
+        moved = s.queue_task('foo').id
+        queued = [s.queue_task('foo').id for i in range(3)]
+        self.db(st.id == kept).update(status='ASSIGNED',
+                                      assigned_worker_name='w2')
+        self.db(st.id == moved).update(status='ASSIGNED',
+                                       assigned_worker_name='w3')
+        self.db.commit()
+        s.assign_tasks()
+        self.db.commit()
+        # tasks of idle workers are kept, the ones of busy workers moved
+        self.assertEqual(st(kept).assigned_worker_name, 'w2')
+        self.assertTrue(st(moved).assigned_worker_name in ('w1', 'w2'))
+        workers = [st(i).assigned_worker_name for i in queued + [moved]]
+        self.assertEqual(set(workers), set(['w1', 'w2']))
+        # evenly distributed
+        counts = sorted(self.db((st.status == 'ASSIGNED') &
+                                (st.assigned_worker_name == w)).count()
+                        for w in ('w1', 'w2'))
+        self.assertEqual(counts, [2, 3])
+        self.assertEqual(s.w_stats.queue, 5)
+
+    def testReleaseTasks(self):
+        s = Scheduler(self.db, worker_name='w1', claim_batch=3)
+        st = self.db.scheduler_task
+        ids = [s.queue_task('foo').id for i in range(3)]
+        self.db(st.id.belongs(ids)).update(status='ASSIGNED',
+                                           assigned_worker_name='w1')
+        self.db.commit()
+        # as claimed by fetch_tasks on PostgreSQL
+        tasks = s.fetch_tasks()
+        self.db(st.id.belongs(ids)).update(status='RUNNING')
+        self.db.commit()
+        for task in tasks:
+            task.status = 'RUNNING'
+        s.prefetched = tasks
+        # a claimed task is executed without claiming it again
+        task = s.pop_task()
+        self.assertEqual(task.task_id, ids[0])
+        self.assertEqual(st(ids[0]).status, 'RUNNING')
+        # the others are given back when the worker stops
+        s.release_tasks()
+        self.assertEqual(s.prefetched, [])
+        statuses = [st(i).status for i in ids]
+        self.assertEqual(statuses, ['RUNNING', 'ASSIGNED', 'ASSIGNED'])
+
+
+class FakeListenerConnection(object):
+    """Behaves like a psycopg2 connection after DAL's after_connection,
+    i.e. inside a transaction"""
+
+    def __init__(self):
+        self.in_transaction = True
+        self._autocommit = False
+        self.executed = []
+
+    def poll(self):
+        pass
+
+    def commit(self):
+        self.in_transaction = False
+
+    def get_autocommit(self):
+        return self._autocommit
+
+    def set_autocommit(self, value):
+        if self.in_transaction:
+            raise RuntimeError('set_session cannot be used inside a transaction')
+        self._autocommit = value
+
+    autocommit = property(get_autocommit, set_autocommit)
+
+    def cursor(self):
+        return self
+
+    def execute(self, sql):
+        self.executed.append(sql)
+
+
+class TestsForNotifications(BaseTestScheduler):
+
+    def testListener(self):
+        import gluon.scheduler
+        conn = FakeListenerConnection()
+        adapter = Storage(connection=conn, driver_name='psycopg2')
+        dal = gluon.scheduler.DAL
+        gluon.scheduler.DAL = lambda *args, **kwargs: Storage(_adapter=adapter)
+        self.db._adapter.dbengine = 'postgres'
+        try:
+            s = Scheduler(self.db, listen_notify=True)
+            listener = s.get_listener()
+        finally:
+            gluon.scheduler.DAL = dal
+            del self.db._adapter.dbengine
+        self.assertTrue(listener is conn)
+        self.assertTrue(conn.autocommit)
+        self.assertEqual(conn.executed, ['LISTEN %s;' % gluon.scheduler.NOTIFY_CHANNEL])
+
+
+class TestsForExecutorPool(BaseTestScheduler):
+
+    def exec_task(self, s, function, args='[]', timeout=10, app=None):
+        from gluon.scheduler import Task
+        run_id = self.db.scheduler_run.insert(status='RUNNING')
+        self.db.commit()
+        task = Task(app, function, timeout, args=args,
+                    task_id=1, uuid='pooled', run_id=run_id, sync_output=0)
+        return s.execute(task)
+
+    def testPoolExecute(self):
+        s = Scheduler(self.db, pool_size=1, pool_max_tasks=2)
+        try:
+            tr = self.exec_task(s, 'lambda: str(os.getpid())')
+            self.assertEqual(tr.status, 'COMPLETED')
+            first = tr.result
+            # the process is re-used...
+            tr = self.exec_task(s, 'lambda: str(os.getpid())')
+            self.assertEqual(tr.result, first)
+            # ...until it has executed pool_max_tasks tasks
+            tr = self.exec_task(s, 'lambda: str(os.getpid())')
+            self.assertNotEqual(tr.result, first)
+            # failures are reported without losing the process
+            tr = self.exec_task(s, 'int', args='["foo"]')
+            self.assertEqual(tr.status, 'FAILED')
+            self.assertTrue('ValueError' in tr.tb)
+            # timed out tasks have their process replaced
+            tr = self.exec_task(s, 'time.sleep', args='[5]', timeout=1)
+            self.assertEqual(tr.status, 'TIMEOUT')
+            tr = self.exec_task(s, 'str', args='[12]')
+            self.assertEqual(tr.status, 'COMPLETED')
+            self.assertEqual(tr.result, '12')
+        finally:
+            s.pool.close()
+        self.assertEqual(s.pool.executors, [])
+
+    def testPoolEnvironment(self):
+        models = os.path.join('applications', test_app_name, 'models')
+        for fname in glob.glob(os.path.join(models, '*.py')):
+            os.unlink(fname)
+        with open(os.path.join(models, 'pooled.py'), 'w') as f:
+            f.write("import os\n"
+                    "def pooled_state():\n"
+                    "    previous = session.pooled\n"
+                    "    session.pooled = True\n"
+                    "    return [os.getpid(), previous]\n")
+        s = Scheduler(self.db, pool_size=1)
+        try:
+            results = []
+            for i in range(2):
+                tr = self.exec_task(s, 'pooled_state', app=test_app_name, timeout=60)
+                self.assertEqual(tr.status, 'COMPLETED', tr.tb)
+                results.append(json.loads(tr.result))
+            # same process, but no state passed from one task to the next
+            self.assertEqual(results[0][0], results[1][0])
+            self.assertEqual(results[1][1], None)
+        finally:
+            s.pool.close()
+
+
 class testForSchedulerRunnerBase(BaseTestScheduler):
 
     def inner_teardown(self):
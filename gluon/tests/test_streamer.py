@@ -0,0 +1,184 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+    Unit tests for gluon.streamer
+"""
+import gzip
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+from gluon import streamer
+from gluon.http import HTTP
+from gluon.storage import Storage
+from gluon.streamer import stream_file_or_304_or_206, static_metadata, \
+    fingerprinted_name, unfingerprint, build_fingerprints, static_fingerprints
+
+
+class TestStreamer(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.filename = os.path.join(self.folder, 'web2py.js')
+        self.data = b'var web2py = {};\n' * 100
+        with open(self.filename, 'wb') as f:
+            f.write(self.data)
+        streamer._metadata.clear()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+        streamer._metadata.clear()
+
+    def stream(self, filename=None, **env):
+        request = Storage(env=Storage(env))
+        headers = {}
+        try:
+            stream_file_or_304_or_206(filename or self.filename,
+                                      request=request, headers=headers)
+        except HTTP as e:
+            body = e.body
+            if body is not None and not isinstance(body, str):
+                body = b''.join(body)
+            return e.status, e.headers, body
+
+    def test_stream(self):
+        status, headers, body = self.stream()
+        self.assertEqual(status, 200)
+        self.assertEqual(body, self.data)
+        self.assertEqual(headers['Content-Length'], len(self.data))
+        self.assertEqual(headers['Content-Type'], 'application/javascript')
+        etag = headers['ETag']
+        self.assertTrue(etag.startswith('"') and etag.endswith('"'))
+        # If-None-Match
+        status, headers, body = self.stream(http_if_none_match=etag)
+        self.assertEqual(status, 304)
+        self.assertEqual(headers['ETag'], etag)
+        status, headers, body = self.stream(http_if_none_match='"x", W/%s' % etag)
+        self.assertEqual(status, 304)
+        status, headers, body = self.stream(http_if_none_match='*')
+        self.assertEqual(status, 304)
+        # If-None-Match takes precedence over If-Modified-Since
+        last_modified = static_metadata(self.filename)['last_modified']
+        status, headers, body = self.stream(http_if_none_match='"x"',
+                                            http_if_modified_since=last_modified)
+        self.assertEqual(status, 200)
+        status, headers, body = self.stream(http_if_modified_since=last_modified)
+        self.assertEqual(status, 304)
+        # Range
+        status, headers, body = self.stream(http_range='bytes=4-9')
+        self.assertEqual(status, 206)
+        self.assertEqual(body, self.data[4:10])
+        self.assertEqual(headers['Content-Range'], 'bytes 4-9/%s' % len(self.data))
+        # Errors
+        status, headers, body = self.stream(os.path.join(self.folder, 'missing.js'))
+        self.assertEqual(status, 404)
+        status, headers, body = self.stream(self.folder)
+        self.assertEqual(status, 403)
+
+    def test_precompressed(self):
+        with gzip.open(self.filename + '.gz', 'wb') as f:
+            f.write(self.data)
+        shutil.copy(self.filename + '.gz', self.filename + '.br')
+        status, headers, body = self.stream(http_accept_encoding='gzip, deflate, br')
+        self.assertEqual(headers['Content-Encoding'], 'br')
+        self.assertEqual(headers['Vary'], 'Accept-Encoding')
+        self.assertTrue(headers['ETag'].endswith('-br"'))
+        status, headers, body = self.stream(http_accept_encoding='gzip, br;q=0')
+        self.assertEqual(headers['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.GzipFile(fileobj=io.BytesIO(body)).read(), self.data)
+        status, headers, body = self.stream(http_accept_encoding='gzip',
+                                            http_if_none_match=headers['ETag'])
+        self.assertEqual(status, 304)
+        status, headers, body = self.stream()
+        self.assertFalse('Content-Encoding' in headers)
+        self.assertEqual(body, self.data)
+        # ranges are served from the identity representation
+        status, headers, body = self.stream(http_accept_encoding='gzip', http_range='bytes=0-3')
+        self.assertFalse('Content-Encoding' in headers)
+        self.assertEqual(body, self.data[:4])
+        # stale variants are ignored
+        mtime = os.path.getmtime(self.filename)
+        os.utime(self.filename + '.br', (mtime - 10, mtime - 10))
+        streamer._metadata.clear()
+        status, headers, body = self.stream(http_accept_encoding='br')
+        self.assertFalse('Content-Encoding' in headers)
+
+    def test_file_wrapper(self):
+        from gluon.rocket import FileWrapper, WSGIWorker
+
+        class Socket(object):
+            def __init__(self):
+                self.data = b''
+
+            def sendall(self, data):
+                self.data += data
+
+        class Worker(WSGIWorker):
+            def __init__(self, size):
+                self.conn = Socket()
+                self.conn.socket = self.conn
+                self.request_method = 'GET'
+                self.size = size
+
+            def send_headers(self, data, sections):
+                pass
+
+        request = Storage(env=Storage(http_range='bytes=4-9',
+                                      wsgi_file_wrapper=FileWrapper))
+        try:
+            stream_file_or_304_or_206(self.filename, request=request, headers={})
+        except HTTP as e:
+            status, headers, body = e.status, e.headers, e.body
+        self.assertEqual(status, 206)
+        self.assertEqual(isinstance(body, FileWrapper), FileWrapper.zero_copy)
+        # without socket.sendfile only Content-Length bytes are sent
+        stream = open(self.filename, 'rb')
+        try:
+            stream.seek(4)
+            worker = Worker(int(headers['Content-Length']))
+            worker.send_file(stream)
+        finally:
+            stream.close()
+        self.assertEqual(worker.conn.data, self.data[4:10])
+
+    def test_metadata_cache(self):
+        info = static_metadata(self.filename)
+        self.assertTrue(static_metadata(self.filename) is info)
+        with open(self.filename, 'ab') as f:
+            f.write(b'// more\n')
+        # within STAT_INTERVAL the cached metadata are used, but the
+        # response still has the length of the file being sent
+        status, headers, body = self.stream()
+        self.assertEqual(headers['Content-Length'], len(self.data) + 8)
+        self.assertFalse('ETag' in headers)
+        self.assertEqual(static_metadata(self.filename)['size'], len(self.data) + 8)
+
+    def test_fingerprints(self):
+        fingerprint = streamer.file_fingerprint(self.filename)
+        self.assertEqual(len(fingerprint), 10)
+        name = fingerprinted_name('web2py.js', fingerprint)
+        self.assertEqual(name, 'web2py.%s.js' % fingerprint)
+        self.assertEqual(fingerprinted_name('README', fingerprint), 'README')
+        self.assertEqual(unfingerprint(os.path.join(self.folder, name)),
+                         (self.filename, fingerprint))
+        self.assertEqual(unfingerprint(os.path.join(self.folder, 'web2py.0123456789.js')),
+                         (self.filename, None))
+        self.assertEqual(unfingerprint(self.filename), (self.filename, None))
+        # manifest
+        os.mkdir(os.path.join(self.folder, 'css'))
+        with open(os.path.join(self.folder, 'css', 'web2py.css'), 'w') as f:
+            f.write('body {}')
+        shutil.copy(self.filename, self.filename + '.gz')
+        fingerprints = build_fingerprints(self.folder)
+        self.assertEqual(sorted(fingerprints), ['css/web2py.css', 'web2py.js'])
+        self.assertEqual(fingerprints['web2py.js'], fingerprint)
+        manifest = os.path.join(self.folder, 'fingerprints.json')
+        self.assertEqual(static_fingerprints(manifest), fingerprints)
+        self.assertEqual(static_fingerprints(os.path.join(self.folder, 'missing.json')), {})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -39,6 +39,7 @@ NOTE: They should be preceeded by web2py command line option "-A" to be passed t
 from __future__ import with_statement
 
 from gluon import current
+from gluon.globals import Session
 from gluon.storage import Storage
 from gluon._compat import pickle
 
@@ -145,12 +146,23 @@ class SessionDb(object):
 
     def delete(self):
         table = current.response.session_db_table
+        dtable = current.response.session_db_data_table
+        if dtable:
+            table._db(dtable.session_id == self.row.id).delete()
         self.row.delete_record()
         table._db.commit()
 
     def get(self):
         session = Storage()
-        session.update(pickle.loads(self.row.session_data))
+        dtable = current.response.session_db_data_table
+        if dtable and not self.row.session_data:
+            # Stored per key (delta)
+            rows = dtable._db(dtable.session_id == self.row.id).select(
+                dtable.name, dtable.value)
+            for row in rows:
+                session[row.name] = Session._loads_value(row.value)
+        else:
+            session.update(pickle.loads(self.row.session_data))
         return session
 
     def last_visit_default(self):